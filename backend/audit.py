@@ -0,0 +1,220 @@
+"""Write-behind audit log of user-visible changes.
+
+Handlers call ``record_audit`` (see ``dependencies.py``), which only puts the
+event on a bounded in-memory queue. A background writer drains it with
+``insert_many`` whenever ``batch_size`` events are waiting or
+``flush_interval`` seconds have passed since the oldest one arrived, so a
+request never waits on an audit write.
+
+When the queue is full, ``record`` waits up to ``enqueue_timeout`` for the
+writer to make room. This is backpressure on the request that
+overproduced. An event that still does not fit is dropped and counted in
+``audit_events_total{outcome="dropped"}``, never raised to the caller.
+``stop`` flushes everything still buffered, so a clean shutdown loses
+nothing. Until ``start`` is called, for example in CLI tools, events are
+written straight through.
+
+Entries carry a ``created_at`` date with a TTL index, so Mongo expires them
+after ``retention_days``. ``query`` pages through a user's entries newest
+first with an opaque keyset cursor.
+"""
+import asyncio
+import base64
+import logging
+import os
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Queued by stop() behind the last event so the writer drains before exiting
+_STOP = object()
+
+
+def _encode_cursor(entry: dict) -> str:
+    raw = f"{entry['created_at'].isoformat()}|{entry['id']}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def _decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        created_at, _, entry_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").partition("|")
+        return datetime.fromisoformat(created_at), entry_id
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+
+
+class AuditLog:
+    """Buffers audit events and writes them to Mongo in batches"""
+
+    def __init__(self, collection, batch_size: int = 100, flush_interval: float = 1.0,
+                 max_queue: int = 10_000, enqueue_timeout: float = 0.05, retention_days: int = 365):
+        self.collection = collection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.enqueue_timeout = enqueue_timeout
+        self.retention_days = retention_days
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._indexed = False
+
+    @classmethod
+    def from_env(cls, db) -> "AuditLog":
+        return cls(
+            db.audit_logs,
+            batch_size=int(os.environ.get('AUDIT_BATCH_SIZE', '100')),
+            flush_interval=float(os.environ.get('AUDIT_FLUSH_INTERVAL_SECONDS', '1')),
+            max_queue=int(os.environ.get('AUDIT_MAX_QUEUE', '10000')),
+            enqueue_timeout=float(os.environ.get('AUDIT_ENQUEUE_TIMEOUT_SECONDS', '0.05')),
+            retention_days=int(os.environ.get('AUDIT_RETENTION_DAYS', '365')),
+        )
+
+    async def ensure_indexes(self):
+        if not self._indexed:
+            await self.collection.create_index("created_at", expireAfterSeconds=self.retention_days * 86400)
+            await self.collection.create_index([("user_id", 1), ("created_at", -1), ("id", -1)])
+            await self.collection.create_index([("user_id", 1), ("entity_type", 1), ("entity_id", 1), ("created_at", -1)])
+            self._indexed = True
+
+    @staticmethod
+    def entry(user_id: str, action: str, entity_type: str, entity_id: str, details: Optional[dict] = None) -> dict:
+        now = datetime.now(timezone.utc)
+        entry = {
+            "id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "action": action,
+            "entity_type": entity_type,
+            "entity_id": entity_id,
+            "timestamp": now.isoformat(),
+            "created_at": now
+        }
+        if details:
+            entry["details"] = details
+        return entry
+
+    # ---------- Writing ----------
+
+    async def record(self, user_id: str, action: str, entity_type: str, entity_id: str,
+                     details: Optional[dict] = None):
+        entry = self.entry(user_id, action, entity_type, entity_id, details)
+        if self._task is None:
+            await self._write([entry], outcome="direct")
+            return
+        try:
+            self._queue.put_nowait(entry)
+        except asyncio.QueueFull:
+            try:
+                await asyncio.wait_for(self._queue.put(entry), self.enqueue_timeout)
+            except asyncio.TimeoutError:
+                metrics.AUDIT_EVENTS_TOTAL.inc(outcome="dropped")
+                logger.warning(f"Audit queue full, dropped {action} on {entity_type} {entity_id}")
+                return
+        metrics.AUDIT_EVENTS_TOTAL.inc(outcome="queued")
+        metrics.AUDIT_QUEUE_DEPTH.set(self._queue.qsize())
+
+    async def _write(self, batch: List[dict], outcome: str = "written"):
+        start = time.perf_counter()
+        try:
+            await self.collection.insert_many(batch, ordered=False)
+        except Exception as e:
+            metrics.AUDIT_FLUSH_DURATION.observe(time.perf_counter() - start, outcome="error")
+            metrics.AUDIT_EVENTS_TOTAL.inc(len(batch), outcome="dropped")
+            logger.error(f"Writing {len(batch)} audit event(s) failed: {str(e)}")
+            return
+        metrics.AUDIT_FLUSH_DURATION.observe(time.perf_counter() - start, outcome="success")
+        metrics.AUDIT_BATCH_SIZE.observe(len(batch))
+        metrics.AUDIT_EVENTS_TOTAL.inc(len(batch), outcome=outcome)
+
+    def _take(self, batch: List[dict]) -> bool:
+        """Move queued events into ``batch``; True once the stop marker was reached"""
+        while len(batch) < self.batch_size and not self._queue.empty():
+            entry = self._queue.get_nowait()
+            if entry is _STOP:
+                return True
+            batch.append(entry)
+        return False
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        try:
+            await self.ensure_indexes()
+        except Exception as e:
+            logger.error(f"Creating audit log indexes failed: {str(e)}")
+        stopping = False
+        while not stopping:
+            first = await self._queue.get()
+            if first is _STOP:
+                break
+            batch = [first]
+            deadline = loop.time() + self.flush_interval
+            stopping = self._take(batch)
+            while not stopping and len(batch) < self.batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    entry = await asyncio.wait_for(self._queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                if entry is _STOP:
+                    stopping = True
+                else:
+                    batch.append(entry)
+                    stopping = self._take(batch)
+            metrics.AUDIT_QUEUE_DEPTH.set(self._queue.qsize())
+            await self._write(batch)
+
+    async def flush(self):
+        """Write everything buffered now"""
+        while self._queue is not None and not self._queue.empty():
+            batch = []
+            self._take(batch)
+            if batch:
+                await self._write(batch)
+        metrics.AUDIT_QUEUE_DEPTH.set(0)
+
+    def start(self):
+        if self._task is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Let the writer finish its batch, then flush whatever is still queued"""
+        if self._task is None:
+            return
+        task, self._task = self._task, None
+        # Events recorded from here on are written straight through
+        await self._queue.put(_STOP)
+        await task
+        await self.flush()
+
+    # ---------- Reading ----------
+
+    async def query(self, user_id: str, limit: int = 50, cursor: Optional[str] = None,
+                    entity_type: Optional[str] = None, entity_id: Optional[str] = None,
+                    action: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+        """One page of a user's entries, newest first; returns (entries, next_cursor)"""
+        query = {"user_id": user_id}
+        for field, value in (("entity_type", entity_type), ("entity_id", entity_id), ("action", action)):
+            if value:
+                query[field] = value
+        if cursor:
+            created_at, entry_id = _decode_cursor(cursor)
+            query["$or"] = [
+                {"created_at": {"$lt": created_at}},
+                {"created_at": created_at, "id": {"$lt": entry_id}},
+            ]
+        entries = await self.collection.find(query, {"_id": 0}).sort(
+            [("created_at", -1), ("id", -1)]
+        ).limit(limit + 1).to_list(limit + 1)
+        next_cursor = _encode_cursor(entries[limit - 1]) if len(entries) > limit else None
+        page = entries[:limit]
+        for entry in page:
+            # "timestamp" carries the same instant as an ISO string
+            del entry["created_at"]
+        return page, next_cursor
@@ -0,0 +1,185 @@
+"""Circuit breaker with an adaptive timeout for slow upstream providers.
+
+``CircuitBreaker`` keeps a rolling window of recent call outcomes and
+latencies. When the failure ratio (errors, timeouts and slow calls) over the
+window crosses a threshold the breaker opens and calls fail fast with
+``CircuitOpenError`` until a cool-down passes; a few half-open probe calls
+then decide whether it closes again.
+
+Each call runs under a timeout derived from the p95 latency of recent
+completed calls, clamped between a floor and a ceiling, so a provider that
+is merely slow does not hold requests open indefinitely.
+"""
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Optional, Tuple
+
+import metrics
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the provider while the breaker is open"""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"Circuit '{name}' is open")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class RollingWindow:
+    """Call outcomes and latencies observed over the last ``window_seconds``"""
+
+    def __init__(self, window_seconds: float, max_samples: int = 1000, clock=time.monotonic):
+        self.window_seconds = window_seconds
+        self.clock = clock
+        # (timestamp, failed, latency or None for calls that never finished)
+        self._samples: Deque[Tuple[float, bool, Optional[float]]] = deque(maxlen=max_samples)
+
+    def _trim(self):
+        cutoff = self.clock() - self.window_seconds
+        while self._samples and self._samples[0][0] < cutoff:
+            self._samples.popleft()
+
+    def record(self, failed: bool, latency: Optional[float]):
+        self._samples.append((self.clock(), failed, latency))
+
+    def clear(self):
+        self._samples.clear()
+
+    def counts(self) -> Tuple[int, int]:
+        self._trim()
+        failed = sum(1 for _, f, _ in self._samples if f)
+        return len(self._samples), failed
+
+    def latency_percentile(self, pct: float) -> Optional[Tuple[float, int]]:
+        """Nearest-rank percentile of completed call latencies and the sample count"""
+        self._trim()
+        latencies = sorted(lat for _, _, lat in self._samples if lat is not None)
+        if not latencies:
+            return None
+        rank = max(1, math.ceil(pct / 100 * len(latencies)))
+        return latencies[rank - 1], len(latencies)
+
+
+class CircuitBreaker:
+    """Rolling-window circuit breaker with a p95-based adaptive timeout"""
+
+    def __init__(self, name: str, failure_ratio: float = 0.5, min_calls: int = 10,
+                 window_seconds: float = 60.0, open_seconds: float = 30.0, half_open_calls: int = 1,
+                 slow_call_seconds: Optional[float] = None, timeout_min: float = 10.0,
+                 timeout_max: float = 90.0, timeout_multiplier: float = 2.0, timeout_min_samples: int = 20,
+                 clock=time.monotonic):
+        self.name = name
+        self.failure_ratio = failure_ratio
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self.slow_call_seconds = slow_call_seconds
+        self.timeout_min = timeout_min
+        self.timeout_max = timeout_max
+        self.timeout_multiplier = timeout_multiplier
+        self.timeout_min_samples = timeout_min_samples
+        self.clock = clock
+        self.window = RollingWindow(window_seconds, clock=clock)
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self._probes = 0
+        metrics.CIRCUIT_BREAKER_STATE.set(STATE_VALUES[CLOSED], breaker=name)
+        metrics.CIRCUIT_BREAKER_TIMEOUT.set(timeout_max, breaker=name)
+
+    @classmethod
+    def from_env(cls, name: str, prefix: str) -> "CircuitBreaker":
+        slow = os.environ.get(f'{prefix}_SLOW_CALL_SECONDS')
+        return cls(
+            name,
+            failure_ratio=float(os.environ.get(f'{prefix}_BREAKER_FAILURE_RATIO', '0.5')),
+            min_calls=int(os.environ.get(f'{prefix}_BREAKER_MIN_CALLS', '10')),
+            window_seconds=float(os.environ.get(f'{prefix}_BREAKER_WINDOW_SECONDS', '60')),
+            open_seconds=float(os.environ.get(f'{prefix}_BREAKER_OPEN_SECONDS', '30')),
+            half_open_calls=int(os.environ.get(f'{prefix}_BREAKER_HALF_OPEN_CALLS', '1')),
+            slow_call_seconds=float(slow) if slow else None,
+            timeout_min=float(os.environ.get(f'{prefix}_TIMEOUT_MIN_SECONDS', '10')),
+            timeout_max=float(os.environ.get(f'{prefix}_TIMEOUT_MAX_SECONDS', '90')),
+            timeout_multiplier=float(os.environ.get(f'{prefix}_TIMEOUT_P95_MULTIPLIER', '2')),
+        )
+
+    # ---------- State ----------
+
+    def _transition(self, state: str):
+        if state == self.state:
+            return
+        metrics.CIRCUIT_BREAKER_TRANSITIONS_TOTAL.inc(breaker=self.name, from_state=self.state, to_state=state)
+        metrics.CIRCUIT_BREAKER_STATE.set(STATE_VALUES[state], breaker=self.name)
+        self.state = state
+        self._probes = 0
+        if state == OPEN:
+            self.opened_at = self.clock()
+        elif state == CLOSED:
+            self.window.clear()
+
+    def retry_after(self) -> float:
+        return max(0.0, self.opened_at + self.open_seconds - self.clock())
+
+    def allows_calls(self) -> bool:
+        """Whether a call made now would reach the provider rather than fail fast"""
+        if self.state == OPEN:
+            return self.retry_after() <= 0
+        return self.state == CLOSED or self._probes < self.half_open_calls
+
+    def _admit(self):
+        if self.state == OPEN:
+            if self.retry_after() > 0:
+                raise CircuitOpenError(self.name, self.retry_after())
+            self._transition(HALF_OPEN)
+        if self.state == HALF_OPEN:
+            if self._probes >= self.half_open_calls:
+                raise CircuitOpenError(self.name, self.open_seconds)
+            self._probes += 1
+
+    def current_timeout(self) -> float:
+        """p95 of recent completed call latencies times a multiplier, clamped to [min, max]"""
+        observed = self.window.latency_percentile(95)
+        if observed is None or observed[1] < self.timeout_min_samples:
+            return self.timeout_max
+        return min(self.timeout_max, max(self.timeout_min, observed[0] * self.timeout_multiplier))
+
+    def record(self, failed: bool, latency: Optional[float]):
+        if latency is not None and self.slow_call_seconds and latency > self.slow_call_seconds:
+            failed = True
+        if self.state == HALF_OPEN:
+            self._transition(OPEN if failed else CLOSED)
+            return
+        self.window.record(failed, latency)
+        metrics.CIRCUIT_BREAKER_TIMEOUT.set(self.current_timeout(), breaker=self.name)
+        total, failures = self.window.counts()
+        if total >= self.min_calls and failures / total >= self.failure_ratio:
+            self._transition(OPEN)
+
+    # ---------- Calls ----------
+
+    async def call(self, fn: Callable[[], Awaitable], timeout: Optional[float] = None):
+        """Run ``fn()`` under the breaker and the adaptive timeout"""
+        self._admit()
+        timeout = timeout or self.current_timeout()
+        start = self.clock()
+        try:
+            result = await asyncio.wait_for(fn(), timeout=timeout)
+        except asyncio.CancelledError:
+            # The caller went away; that says nothing about the provider
+            if self.state == HALF_OPEN:
+                self._probes = max(0, self._probes - 1)
+            raise
+        except Exception:
+            self.record(True, None)
+            raise
+        self.record(False, self.clock() - start)
+        return result
@@ -0,0 +1,161 @@
+"""Negotiated response compression.
+
+``CompressionMiddleware`` compresses complete (non-streaming) responses with
+brotli or gzip depending on the client's ``Accept-Encoding``. Small bodies,
+already-encoded responses and binary content types are passed through, and
+bodies above ``offload_size`` are compressed in a worker thread so large
+payloads never stall the event loop.
+
+``precompress`` builds the encoded variants of a payload once so cached
+artifacts (ledger exports) can be served repeatedly without compression CPU;
+``encoded_response`` picks the right variant for a request.
+
+Brotli is optional: without the ``brotli`` package only gzip is offered.
+"""
+import asyncio
+import gzip
+import os
+from typing import Dict, Iterable, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import Response
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "text/",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+)
+
+MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', '1024'))
+GZIP_LEVEL = int(os.environ.get('COMPRESSION_GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.environ.get('COMPRESSION_BROTLI_QUALITY', '4'))
+OFFLOAD_SIZE = int(os.environ.get('COMPRESSION_OFFLOAD_SIZE', str(64 * 1024)))
+
+
+def available_encodings() -> tuple:
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def negotiate_encoding(accept_encoding: str, offered: Iterable[str] = None) -> Optional[str]:
+    """Pick the best offered encoding allowed by an Accept-Encoding header"""
+    offered = tuple(available_encodings() if offered is None else offered)
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[token] = q
+    best, best_q = None, 0.0
+    for encoding in offered:
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compress(data: bytes, encoding: str, gzip_level: int = GZIP_LEVEL, brotli_quality: int = BROTLI_QUALITY) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=brotli_quality)
+    if encoding == "gzip":
+        return gzip.compress(data, compresslevel=gzip_level, mtime=0)
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+
+def precompress(data: bytes) -> Dict[str, bytes]:
+    """All encoded variants of a payload, using maximum compression since it is done once"""
+    variants = {"identity": data, "gzip": compress(data, "gzip", gzip_level=9)}
+    if brotli is not None:
+        variants["br"] = compress(data, "br", brotli_quality=11)
+    return variants
+
+
+def encoded_response(variants: Dict[str, bytes], accept_encoding: str, media_type: str,
+                     headers: Optional[Dict[str, str]] = None) -> Response:
+    """Serve the precompressed variant matching the request's Accept-Encoding"""
+    offered = [e for e in ("br", "gzip") if e in variants]
+    encoding = negotiate_encoding(accept_encoding, offered)
+    response_headers = dict(headers or {})
+    response_headers["Vary"] = "Accept-Encoding"
+    if encoding:
+        response_headers["Content-Encoding"] = encoding
+        return Response(content=variants[encoding], media_type=media_type, headers=response_headers)
+    return Response(content=variants["identity"], media_type=media_type, headers=response_headers)
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing complete responses with brotli or gzip"""
+
+    def __init__(self, app, minimum_size: int = MIN_SIZE, offload_size: int = OFFLOAD_SIZE,
+                 gzip_level: int = GZIP_LEVEL, brotli_quality: int = BROTLI_QUALITY):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.offload_size = offload_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            headers = MutableHeaders(raw=start_message["headers"])
+            if (
+                message.get("more_body", False)
+                or len(body) < self.minimum_size
+                or "content-encoding" in headers
+                or not headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
+            ):
+                # Streaming, small, already encoded or binary: send untouched
+                passthrough = True
+                await send(start_message)
+                await send(message)
+                return
+
+            if len(body) >= self.offload_size:
+                compressed = await asyncio.to_thread(
+                    compress, body, encoding, self.gzip_level, self.brotli_quality
+                )
+            else:
+                compressed = compress(body, encoding, self.gzip_level, self.brotli_quality)
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(compressed))
+            headers.add_vary_header("Accept-Encoding")
+            await send(start_message)
+            await send({"type": "http.response.body", "body": compressed})
+
+        await self.app(scope, receive, send_wrapper)
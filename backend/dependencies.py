@@ -0,0 +1,95 @@
+"""Request dependencies shared by the routers: the authenticated user, and the audit and event hooks"""
+import functools
+import logging
+from datetime import datetime, timezone
+from typing import Optional
+
+from fastapi import Cookie, HTTPException, Request
+
+from lazy import lazy_import
+from resources import resources
+from tokens import InvalidToken, looks_like_jwt
+from tracing import traced
+
+logger = logging.getLogger(__name__)
+
+passlib_context = lazy_import("passlib.context")
+
+db = resources.db
+token_service = resources.token_service
+
+
+@functools.lru_cache(maxsize=None)
+def get_pwd_context():
+    """Password hashing context, built on first use"""
+    return passlib_context.CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+@traced("auth.get_current_user")
+async def get_current_user_from_token(token: str) -> dict:
+    """Get user from an access token (verified locally) or a session token"""
+    if token_service and looks_like_jwt(token):
+        try:
+            return token_service.verify_access(token)
+        except InvalidToken as e:
+            raise HTTPException(status_code=401, detail=str(e))
+    try:
+        # Find session in database
+        session = await db.user_sessions.find_one({"session_token": token}, {"_id": 0})
+        if not session:
+            raise HTTPException(status_code=401, detail="Invalid session")
+        
+        # Check expiry
+        expires_at = session["expires_at"]
+        if isinstance(expires_at, str):
+            expires_at = datetime.fromisoformat(expires_at)
+        if expires_at.tzinfo is None:
+            expires_at = expires_at.replace(tzinfo=timezone.utc)
+        if expires_at < datetime.now(timezone.utc):
+            raise HTTPException(status_code=401, detail="Session expired")
+        
+        # Get user
+        user = await db.users.find_one({"user_id": session["user_id"]}, {"_id": 0})
+        if not user:
+            raise HTTPException(status_code=401, detail="User not found")
+        
+        return user
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error verifying session: {str(e)}")
+        raise HTTPException(status_code=401, detail="Invalid session")
+
+async def get_current_user(
+    request: Request,
+    session_token: Optional[str] = Cookie(None)
+) -> dict:
+    """Get current user from cookie or Authorization header"""
+    # Try cookie first
+    if session_token:
+        return await get_current_user_from_token(session_token)
+    
+    # Try Authorization header
+    auth_header = request.headers.get('Authorization')
+    if auth_header and auth_header.startswith('Bearer '):
+        token = auth_header.split(' ')[1]
+        return await get_current_user_from_token(token)
+    
+    raise HTTPException(status_code=401, detail="Not authenticated")
+
+async def load_user_record(user: dict) -> dict:
+    """Full user document; users authenticated by access token carry only its claims"""
+    if not user.get("stateless"):
+        return user
+    record = await db.users.find_one({"user_id": user["user_id"]}, {"_id": 0})
+    if not record:
+        raise HTTPException(status_code=401, detail="User not found")
+    return {**record, "session_id": user["session_id"]}
+
+async def record_audit(user_id: str, action: str, entity_type: str, entity_id: str, details: Optional[dict] = None):
+    """Queue an entry for the audit log; the request never waits on the write"""
+    await resources.audit_log.record(user_id, action, entity_type, entity_id, details)
+
+async def publish_event(user_id: str, event_type: str, data: Optional[dict] = None):
+    """Notify the user's open /events streams"""
+    await resources.events.publish(user_id, event_type, data)
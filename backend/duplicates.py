@@ -0,0 +1,131 @@
+"""Duplicate purchase bill detection.
+
+The same supplier invoice photographed twice would count twice in every
+purchase and input-tax figure built on ``db.bills``. After extraction, an
+upload is checked against the user's bills by its ``match`` key (seller
+GSTIN plus normalised invoice number, see reconcile.py). A bill with the
+same key is a duplicate if its total is within tolerance and its invoice
+date is within a few days. Suppliers that restart numbering every
+financial year therefore do not trigger false alarms. The lookup is one
+probe of the ``(user_id, match.gstin, match.serial, match.invoice)`` index.
+
+Suspected duplicates are held in ``db.suspected_duplicates`` instead of
+being inserted, until the user keeps or discards them. Held uploads expire
+after ``DUPLICATE_HOLD_DAYS``, after which the sweeper deletes their files
+as orphans.
+
+``scan`` finds duplicates already in ``db.bills`` with one aggregation
+over the same key.
+"""
+import logging
+import os
+from datetime import date, datetime, timezone
+from typing import List, Optional
+
+from postprocess import parse_date
+from reconcile import backfill_match_fields, bill_match_fields
+
+logger = logging.getLogger(__name__)
+
+_CANDIDATE_PROJECTION = {
+    "_id": 0, "id": 1, "file_name": 1, "upload_date": 1,
+    "extracted_data.invoice_number": 1, "extracted_data.invoice_date": 1, "extracted_data.total_amount": 1,
+}
+
+
+class DuplicateDetector:
+    """Finds bills that repeat an invoice already in the user's books"""
+
+    def __init__(self, db, amount_tolerance: float = 1.0, date_window_days: int = 3, hold_days: int = 30):
+        self.db = db
+        self.amount_tolerance = amount_tolerance
+        self.date_window_days = date_window_days
+        self.hold_days = hold_days
+
+    @classmethod
+    def from_env(cls, db) -> "DuplicateDetector":
+        return cls(
+            db,
+            amount_tolerance=float(os.environ.get('DUPLICATE_AMOUNT_TOLERANCE', '1.0')),
+            date_window_days=int(os.environ.get('DUPLICATE_DATE_WINDOW_DAYS', '3')),
+            hold_days=int(os.environ.get('DUPLICATE_HOLD_DAYS', '30')),
+        )
+
+    async def ensure_indexes(self):
+        try:
+            await self.db.suspected_duplicates.create_index([("user_id", 1), ("held_at", -1)])
+            await self.db.suspected_duplicates.create_index("id", unique=True)
+            await self.db.suspected_duplicates.create_index("held_at", expireAfterSeconds=self.hold_days * 86400)
+        except Exception as e:
+            logger.error(f"Creating duplicate indexes failed: {str(e)}")
+
+    def same_invoice(self, a: Optional[dict], b: Optional[dict]) -> bool:
+        """Whether two bills with the same match key agree on total and date"""
+        a, b = a or {}, b or {}
+        totals = a.get("total_amount"), b.get("total_amount")
+        if None not in totals and abs(totals[0] - totals[1]) > self.amount_tolerance:
+            return False
+        dates = parse_date(a.get("invoice_date")), parse_date(b.get("invoice_date"))
+        if None not in dates:
+            days = abs((date.fromisoformat(dates[0]) - date.fromisoformat(dates[1])).days)
+            if days > self.date_window_days:
+                return False
+        return True
+
+    async def find_duplicate(self, user_id: str, extracted_data: dict,
+                             exclude_id: Optional[str] = None) -> Optional[dict]:
+        """The bill an extraction repeats, or None"""
+        match = bill_match_fields(extracted_data)
+        if match is None:
+            return None
+        candidates = await self.db.bills.find({
+            "user_id": user_id,
+            "match.gstin": match["gstin"],
+            "match.serial": match["serial"],
+            "match.invoice": match["invoice"],
+        }, _CANDIDATE_PROJECTION).to_list(None)
+        for candidate in candidates:
+            if candidate["id"] != exclude_id and self.same_invoice(extracted_data, candidate.get("extracted_data")):
+                return candidate
+        return None
+
+    async def hold(self, bill: dict, duplicate_of: str) -> dict:
+        """Set a bill aside as a suspected duplicate instead of storing it"""
+        held = {**bill, "duplicate_of": duplicate_of, "held_at": datetime.now(timezone.utc)}
+        await self.db.suspected_duplicates.insert_one(held)
+        return held
+
+    async def scan(self, user_id: str) -> List[dict]:
+        """Groups of bills already stored that repeat one invoice, earliest upload first"""
+        await backfill_match_fields(self.db, user_id)
+        pipeline = [
+            {"$match": {"user_id": user_id, "match": {"$ne": None}}},
+            {"$group": {
+                "_id": {"gstin": "$match.gstin", "invoice": "$match.invoice"},
+                "count": {"$sum": 1},
+                "bills": {"$push": {
+                    "id": "$id",
+                    "upload_date": "$upload_date",
+                    "invoice_number": "$extracted_data.invoice_number",
+                    "invoice_date": "$extracted_data.invoice_date",
+                    "total_amount": "$extracted_data.total_amount",
+                }},
+            }},
+            {"$match": {"count": {"$gt": 1}}},
+        ]
+        groups = []
+        async for group in self.db.bills.aggregate(pipeline, allowDiskUse=True):
+            originals: List[dict] = []
+            for bill in sorted(group["bills"], key=lambda b: b.get("upload_date") or ""):
+                original = next((o for o in originals if self.same_invoice(o["bill"], bill)), None)
+                if original is None:
+                    originals.append({"bill": bill, "duplicates": []})
+                else:
+                    original["duplicates"].append(bill["id"])
+            groups.extend({
+                "gstin": group["_id"]["gstin"],
+                "invoice_number": o["bill"].get("invoice_number"),
+                "original": o["bill"]["id"],
+                "duplicates": o["duplicates"],
+            } for o in originals if o["duplicates"])
+        return sorted(groups, key=lambda g: (g["gstin"], g["invoice_number"] or ""))
@@ -0,0 +1,263 @@
+"""Per-user change notifications for the ``/events`` Server-Sent Events stream.
+
+Handlers call ``EventHub.publish(user_id, type, data)`` after a write. The
+hub has two delivery modes:
+
+* ``local``: events go straight to this process's subscribers. This is
+  enough for one worker against a standalone Mongo.
+* ``changestream``: events are inserted into ``db.events``, and each process
+  runs one change stream on that collection. Every worker therefore sees
+  every event, whichever worker handled the write. The stream remembers its
+  resume token and picks up where it stopped after an error. This mode
+  needs a replica set. ``auto`` (the default) picks it when the server
+  reports one.
+
+Every event carries an ObjectId as its SSE ``id``. A reconnecting client
+sends it back as ``Last-Event-ID``, and gets the events it missed:
+
+* in ``changestream`` mode, from ``db.events`` (kept for ``retention_seconds``),
+  so the reconnect may land on any worker. Delivery across a reconnect is
+  at least once;
+* in ``local`` mode, from a short per-user ring buffer.
+
+If the gap cannot be filled, the client is sent a ``resync`` event and should
+refetch.
+
+Each connection holds only a small bounded queue. A client that falls behind
+loses its backlog and gets ``resync`` instead. A single task writes
+heartbeats to every idle connection, so an idle stream costs no timer of its
+own.
+"""
+import asyncio
+import logging
+import os
+from collections import deque
+from datetime import datetime, timezone, timedelta
+from typing import AsyncIterator, Deque, Dict, List, Optional, Set
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo.errors import OperationFailure
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Queue markers: write a keep-alive comment / end the stream
+HEARTBEAT = object()
+CLOSE = object()
+
+CHANGE_STREAM_HISTORY_LOST = 286
+
+
+class Subscriber:
+    """One SSE connection's bounded queue of pending events"""
+
+    def __init__(self, user_id: str, buffer_size: int):
+        self.user_id = user_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=buffer_size)
+
+    def offer(self, item):
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            if item is HEARTBEAT:
+                return  # a full queue already keeps the connection alive
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            if item is CLOSE:
+                self.queue.put_nowait(CLOSE)
+                return
+            # Too slow to keep up: drop the backlog and ask the client to refetch
+            self.queue.put_nowait(resync_event())
+            metrics.EVENTS_DROPPED_TOTAL.inc(reason="overflow")
+
+
+def resync_event() -> dict:
+    return {"type": "resync", "data": {}}
+
+
+class EventHub:
+    """Fans out per-user events to the SSE connections of this process"""
+
+    def __init__(self, db, mode: str = "auto", buffer_size: int = 64, heartbeat_seconds: float = 15,
+                 replay_limit: int = 100, retention_seconds: int = 3600):
+        self.db = db
+        self.mode = mode
+        self.buffer_size = buffer_size
+        self.heartbeat_seconds = heartbeat_seconds
+        self.replay_limit = replay_limit
+        self.retention_seconds = retention_seconds
+        self._subscribers: Dict[str, Set[Subscriber]] = {}
+        self._recent: Dict[str, Deque[dict]] = {}
+        self._resume_token = None
+        self._tasks: List[asyncio.Task] = []
+        # Every id this process generates sorts after this one
+        self._epoch = ObjectId()
+
+    @classmethod
+    def from_env(cls, db) -> "EventHub":
+        return cls(
+            db,
+            mode=os.environ.get('EVENTS_BACKEND', 'auto').lower(),
+            buffer_size=int(os.environ.get('EVENTS_BUFFER_SIZE', '64')),
+            heartbeat_seconds=float(os.environ.get('EVENTS_HEARTBEAT_SECONDS', '15')),
+            replay_limit=int(os.environ.get('EVENTS_REPLAY_LIMIT', '100')),
+            retention_seconds=int(os.environ.get('EVENTS_RETENTION_SECONDS', '3600')),
+        )
+
+    # ---------- Publishing ----------
+
+    async def publish(self, user_id: str, event_type: str, data: Optional[dict] = None):
+        """Notify the user's open streams; never raises into the calling handler"""
+        event = {
+            "_id": ObjectId(),
+            "user_id": user_id,
+            "type": event_type,
+            "data": data or {},
+            "created_at": datetime.now(timezone.utc),
+        }
+        metrics.EVENTS_PUBLISHED_TOTAL.inc(type=event_type)
+        if self.mode != "changestream":
+            self._dispatch(event)
+            return
+        try:
+            await self.db.events.insert_one(event)
+        except Exception as e:
+            logger.error(f"Publishing {event_type} event failed: {str(e)}")
+
+    def _dispatch(self, event: dict):
+        if self.mode != "changestream":
+            recent = self._recent.setdefault(event["user_id"], deque(maxlen=self.replay_limit))
+            recent.append(event)
+        for subscriber in self._subscribers.get(event["user_id"], ()):
+            subscriber.offer(event)
+
+    # ---------- Subscribing ----------
+
+    def subscribe(self, user_id: str) -> Subscriber:
+        subscriber = Subscriber(user_id, self.buffer_size)
+        self._subscribers.setdefault(user_id, set()).add(subscriber)
+        metrics.SSE_CONNECTIONS.inc()
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        subscribers = self._subscribers.get(subscriber.user_id)
+        if subscribers is not None:
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._subscribers[subscriber.user_id]
+        metrics.SSE_CONNECTIONS.dec()
+
+    async def missed(self, user_id: str, last_event_id: str) -> List[dict]:
+        """Events after ``last_event_id``, or a single resync event when the gap cannot be filled"""
+        try:
+            last = ObjectId(last_event_id)
+        except (InvalidId, TypeError):
+            return [resync_event()]
+        if self.mode == "changestream":
+            if last.generation_time < datetime.now(timezone.utc) - timedelta(seconds=self.retention_seconds):
+                return [resync_event()]
+            # Ids from different workers are only ordered to the second, so replay from the start
+            # of that second; the client may see an event twice but never misses one
+            since = ObjectId.from_datetime(last.generation_time)
+            events = await self.db.events.find(
+                {"user_id": user_id, "_id": {"$gte": since, "$ne": last}}
+            ).sort("_id", 1).limit(self.replay_limit + 1).to_list(self.replay_limit + 1)
+            return [resync_event()] if len(events) > self.replay_limit else events
+        if last < self._epoch:
+            # Seen by an earlier incarnation of this process; its buffer is gone
+            return [resync_event()]
+        recent = self._recent.get(user_id, ())
+        newer = [event for event in recent if event["_id"] > last]
+        if newer and len(newer) == len(recent) == recent.maxlen:
+            # The ring has wrapped past the client's position
+            return [resync_event()]
+        return newer
+
+    async def follow(self, user_id: str, last_event_id: Optional[str] = None) -> AsyncIterator:
+        """The events missed since ``last_event_id``, then live events and heartbeats until closed"""
+        # Subscribing before reading the backlog leaves no gap between the two
+        subscriber = self.subscribe(user_id)
+        try:
+            replayed = set()
+            if last_event_id:
+                for event in await self.missed(user_id, last_event_id):
+                    if "_id" in event:
+                        replayed.add(event["_id"])
+                    yield event
+            while True:
+                item = await subscriber.queue.get()
+                if item is CLOSE:
+                    break
+                # Ids are not ordered across workers within a second, so skip exactly the
+                # events the replay already sent instead of everything sorting before them
+                if isinstance(item, dict) and item.get("_id") in replayed:
+                    replayed.discard(item["_id"])
+                    continue
+                yield item
+        finally:
+            self.unsubscribe(subscriber)
+
+    # ---------- Background tasks ----------
+
+    async def _detect_mode(self) -> str:
+        try:
+            hello = await self.db.client.admin.command("hello")
+        except Exception:
+            return "local"
+        return "changestream" if hello.get("setName") else "local"
+
+    def _broadcast(self, item):
+        for subscribers in list(self._subscribers.values()):
+            for subscriber in list(subscribers):
+                subscriber.offer(item)
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_seconds)
+            self._broadcast(HEARTBEAT)
+
+    async def _watch(self):
+        pipeline = [{"$match": {"operationType": "insert"}}]
+        while True:
+            try:
+                async with self.db.events.watch(pipeline, resume_after=self._resume_token) as stream:
+                    async for change in stream:
+                        self._resume_token = stream.resume_token
+                        self._dispatch(change["fullDocument"])
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as e:
+                if e.code != CHANGE_STREAM_HISTORY_LOST:
+                    logger.error(f"Event change stream failed, resuming: {str(e)}")
+                    await asyncio.sleep(1)
+                    continue
+                # The oplog no longer reaches our resume token: start over and tell every client
+                logger.warning("Event change stream history lost, restarting from now")
+                self._resume_token = None
+                self._broadcast(resync_event())
+            except Exception as e:
+                logger.error(f"Event change stream failed, resuming: {str(e)}")
+                await asyncio.sleep(1)
+
+    async def start(self):
+        if self.mode == "auto":
+            self.mode = await self._detect_mode()
+        logger.info(f"Event delivery mode: {self.mode}")
+        if self.mode == "changestream":
+            try:
+                await self.db.events.create_index("created_at", expireAfterSeconds=self.retention_seconds)
+                await self.db.events.create_index([("user_id", 1), ("_id", 1)])
+            except Exception as e:
+                logger.error(f"Creating event indexes failed: {str(e)}")
+            self._tasks.append(asyncio.create_task(self._watch()))
+        self._tasks.append(asyncio.create_task(self._heartbeat()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # Wake every open stream so its response ends with the worker
+        self._broadcast(CLOSE)
@@ -0,0 +1,117 @@
+"""Rendered ledger exports and GST returns, cached per user until their bills or invoices change.
+
+Two interchangeable backends share one async interface:
+
+* ``ExportCache`` is an LRU held in this process. Invalidations are only seen
+  by the worker that made them.
+* ``MongoExportCache`` keeps entries and per-user generations in Mongo, so an
+  invalidation on one worker is seen by every worker and node at once.
+
+Both are keyed by a per-user generation counter. ``invalidate`` bumps it, and
+an export rendered before the bump can never be served after it.
+"""
+import os
+from collections import OrderedDict
+from datetime import datetime, timezone, timedelta
+from typing import Dict, Optional
+
+from bson import Binary
+
+
+class ExportCache:
+    """LRU of rendered exports per user, stored precompressed"""
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, Dict[str, bytes]]" = OrderedDict()
+        self._generations: Dict[str, int] = {}
+
+    async def generation(self, user_id: str) -> int:
+        return self._generations.get(user_id, 0)
+
+    async def get(self, user_id: str, export_format: str) -> Optional[Dict[str, bytes]]:
+        key = (user_id, export_format, await self.generation(user_id))
+        variants = self._entries.get(key)
+        if variants is not None:
+            self._entries.move_to_end(key)
+        return variants
+
+    async def put(self, user_id: str, export_format: str, generation: int, variants: Dict[str, bytes]):
+        if generation != await self.generation(user_id):
+            return
+        self._entries[(user_id, export_format, generation)] = variants
+        self._entries.move_to_end((user_id, export_format, generation))
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def invalidate(self, user_id: str):
+        self._generations[user_id] = self._generations.get(user_id, 0) + 1
+        for key in [k for k in self._entries if k[0] == user_id]:
+            del self._entries[key]
+
+
+class MongoExportCache:
+    """Export cache shared through Mongo.
+
+    ``db.export_generations`` holds one counter per user and
+    ``db.export_cache`` one document per (user, format) tagged with the
+    generation it was rendered at. Entries expire after ``ttl_seconds`` and
+    exports larger than ``max_bytes`` are not cached, keeping documents well
+    under Mongo's 16 MB limit.
+    """
+
+    def __init__(self, db, ttl_seconds: int = 3600, max_bytes: int = 8 * 1024 * 1024):
+        self.entries = db.export_cache
+        self.generations = db.export_generations
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._indexed = False
+
+    async def _ensure_indexes(self):
+        if not self._indexed:
+            await self.entries.create_index("expires_at", expireAfterSeconds=0)
+            await self.entries.create_index("user_id")
+            self._indexed = True
+
+    async def generation(self, user_id: str) -> int:
+        doc = await self.generations.find_one({"_id": user_id})
+        return doc["generation"] if doc else 0
+
+    async def get(self, user_id: str, export_format: str) -> Optional[Dict[str, bytes]]:
+        doc = await self.entries.find_one({"_id": f"{user_id}:{export_format}"})
+        if doc is None or doc["generation"] != await self.generation(user_id):
+            return None
+        return {encoding: bytes(body) for encoding, body in doc["variants"].items()}
+
+    async def put(self, user_id: str, export_format: str, generation: int, variants: Dict[str, bytes]):
+        if sum(len(body) for body in variants.values()) > self.max_bytes:
+            return
+        await self._ensure_indexes()
+        # An entry written after a concurrent invalidation carries the old
+        # generation, so get() never serves it
+        await self.entries.replace_one(
+            {"_id": f"{user_id}:{export_format}"},
+            {
+                "user_id": user_id,
+                "generation": generation,
+                "variants": {encoding: Binary(body) for encoding, body in variants.items()},
+                "expires_at": datetime.now(timezone.utc) + timedelta(seconds=self.ttl_seconds),
+            },
+            upsert=True,
+        )
+
+    async def invalidate(self, user_id: str):
+        await self.generations.update_one({"_id": user_id}, {"$inc": {"generation": 1}}, upsert=True)
+        await self.entries.delete_many({"user_id": user_id})
+
+
+def create_export_cache(db):
+    """Export cache selected by EXPORT_CACHE_BACKEND (memory or mongo, default SHARED_STATE_BACKEND)"""
+    backend = os.environ.get('EXPORT_CACHE_BACKEND', os.environ.get('SHARED_STATE_BACKEND', 'memory')).lower()
+    if backend == 'mongo':
+        return MongoExportCache(
+            db,
+            ttl_seconds=int(os.environ.get('EXPORT_CACHE_TTL_SECONDS', '3600')),
+            max_bytes=int(os.environ.get('EXPORT_CACHE_MAX_BYTES', str(8 * 1024 * 1024))),
+        )
+    return ExportCache(int(os.environ.get('EXPORT_CACHE_SIZE', '256')))
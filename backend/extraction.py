@@ -0,0 +1,298 @@
+"""Routing bill extraction across several vision models.
+
+``ExtractionRouter`` tries models in tier order, cheapest and fastest first,
+and escalates to the next tier only when a result is not good enough: its
+``confidence_score`` is below a threshold or ``validate_extraction`` finds
+that the GST figures do not add up. The best result seen is returned even
+when no tier is fully satisfied; only when every tier fails outright does
+the router raise ``ExtractionDeferred``.
+
+Latency-sensitive callers can ask for a hedged first attempt: when the first
+tier has not answered by its observed p95 latency, the same image is sent to
+the next tier and the first usable answer wins. With a single tier there is
+nothing to hedge with, so the request is sent once.
+
+Each model has its own ``CircuitBreaker`` and adaptive timeout, and per-model
+calls, latency, cost, acceptance and agreement with stronger models are
+exported through ``metrics`` and ``ExtractionRouter.stats()``.
+
+The router is provider-agnostic: it is given a ``call(spec, image_base64)``
+coroutine returning parsed bill data, so it can be exercised with local stub
+providers.
+"""
+import asyncio
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import metrics
+from circuitbreaker import CircuitBreaker, CircuitOpenError
+from postprocess import AMOUNT_FIELDS, is_valid_gstin, reconciliation_issues
+
+DEFAULT_MODELS = "openai:gpt-5.2"
+
+
+class ExtractionDeferred(Exception):
+    """No vision model is available; store the bill and extract it later"""
+
+
+@dataclass(frozen=True)
+class ModelSpec:
+    provider: str
+    model: str
+    cost_per_call: float = 0.0
+
+    @property
+    def name(self) -> str:
+        return f"{self.provider}:{self.model}"
+
+
+def parse_model_specs(spec: Optional[str]) -> List[ModelSpec]:
+    """Parse "openai:gpt-5-mini@0.002,openai:gpt-5.2@0.01" (cheapest first) into model specs"""
+    specs = []
+    for item in (spec or DEFAULT_MODELS).split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, cost = item.partition("@")
+        provider, _, model = name.partition(":")
+        specs.append(ModelSpec(provider.strip(), model.strip(), float(cost) if cost else 0.0))
+    if not specs:
+        raise ValueError("At least one extraction model must be configured")
+    return specs
+
+
+def validate_extraction(data, tolerance: float = 1.0) -> List[str]:
+    """Consistency problems in extracted bill figures; an empty list means the bill adds up"""
+    values = {key: getattr(data, key, None) for key in AMOUNT_FIELDS + ("products",)}
+    issues = reconciliation_issues(values, tolerance)
+    seller_gstin = getattr(data, "seller_gstin", None)
+    if seller_gstin and not is_valid_gstin(seller_gstin):
+        issues.append("invalid seller_gstin")
+    return issues
+
+
+@dataclass
+class Attempt:
+    spec: ModelSpec
+    data: Any = None
+    error: Optional[str] = None
+    latency: float = 0.0
+    issues: List[str] = field(default_factory=list)
+    accepted: bool = False
+    hedged: bool = False
+
+    @property
+    def rank(self):
+        return (self.accepted, -len(self.issues), getattr(self.data, "confidence_score", 0.0) or 0.0)
+
+
+@dataclass
+class RoutedExtraction:
+    data: Any
+    model: str
+    attempts: List[Attempt]
+
+    @property
+    def best(self) -> Attempt:
+        return next(a for a in self.attempts if a.data is self.data)
+
+    @property
+    def accepted(self) -> bool:
+        return self.best.accepted
+
+    @property
+    def escalated(self) -> bool:
+        return len(self.attempts) > 1
+
+    @property
+    def issues(self) -> List[str]:
+        return self.best.issues
+
+    def summary(self) -> Dict[str, Any]:
+        """Compact record of how the extraction was produced, stored on the bill"""
+        return {
+            "model": self.model,
+            "attempts": [a.spec.name for a in self.attempts],
+            "issues": self.issues,
+        }
+
+
+@dataclass
+class ModelStats:
+    calls: int = 0
+    failures: int = 0
+    accepted: int = 0
+    cost: float = 0.0
+    latency_total: float = 0.0
+    compared: int = 0
+    agreed: int = 0
+
+    def snapshot(self, breaker: CircuitBreaker) -> Dict[str, Any]:
+        p95 = breaker.window.latency_percentile(95)
+        completed = self.calls - self.failures
+        return {
+            "calls": self.calls,
+            "failures": self.failures,
+            "acceptance_rate": round(self.accepted / completed, 4) if completed else None,
+            "agreement_rate": round(self.agreed / self.compared, 4) if self.compared else None,
+            "avg_latency_s": round(self.latency_total / completed, 4) if completed else None,
+            "p95_latency_s": round(p95[0], 4) if p95 else None,
+            "cost": round(self.cost, 6),
+            "breaker": breaker.state,
+            "timeout_s": breaker.current_timeout(),
+        }
+
+
+class ExtractionRouter:
+    """Cheap-first, escalate-on-doubt routing over a list of vision models"""
+
+    def __init__(self, call: Callable[[ModelSpec, str], Awaitable[Any]], tiers: List[ModelSpec],
+                 min_confidence: float = 0.8, hedge_delay: Optional[float] = None,
+                 breaker_factory: Callable[[ModelSpec], CircuitBreaker] = None):
+        self.call = call
+        self.tiers = list(tiers)
+        self.min_confidence = min_confidence
+        self.hedge_delay = hedge_delay
+        breaker_factory = breaker_factory or (lambda spec: CircuitBreaker(f"llm:{spec.name}"))
+        self.breakers = {spec: breaker_factory(spec) for spec in self.tiers}
+        self._stats = {spec: ModelStats() for spec in self.tiers}
+
+    @classmethod
+    def from_env(cls, call) -> "ExtractionRouter":
+        hedge_delay = os.environ.get('EXTRACTION_HEDGE_DELAY_SECONDS')
+        return cls(
+            call,
+            parse_model_specs(os.environ.get('EXTRACTION_MODELS')),
+            min_confidence=float(os.environ.get('EXTRACTION_MIN_CONFIDENCE', '0.8')),
+            hedge_delay=float(hedge_delay) if hedge_delay else None,
+            breaker_factory=lambda spec: CircuitBreaker.from_env(f"llm:{spec.name}", "LLM"),
+        )
+
+    def available(self) -> bool:
+        """Whether any model would accept a call right now"""
+        return any(breaker.allows_calls() for breaker in self.breakers.values())
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {spec.name: self._stats[spec].snapshot(self.breakers[spec]) for spec in self.tiers}
+
+    # ---------- Attempts ----------
+
+    async def _attempt(self, spec: ModelSpec, image_base64: str) -> Attempt:
+        breaker = self.breakers[spec]
+        stats = self._stats[spec]
+        attempt = Attempt(spec)
+        start = time.perf_counter()
+        try:
+            attempt.data = await breaker.call(lambda: self.call(spec, image_base64))
+        except CircuitOpenError as e:
+            attempt.error = str(e)
+            metrics.LLM_EXTRACTION_TOTAL.inc(model=spec.name, outcome="circuit_open")
+            return attempt
+        except asyncio.TimeoutError:
+            attempt.error = "timeout"
+        except Exception as e:
+            attempt.error = str(e) or type(e).__name__
+        attempt.latency = time.perf_counter() - start
+        stats.calls += 1
+        stats.cost += spec.cost_per_call
+        metrics.LLM_MODEL_COST_TOTAL.inc(spec.cost_per_call, model=spec.name)
+
+        if attempt.data is None:
+            stats.failures += 1
+            outcome = "timeout" if attempt.error == "timeout" else "error"
+            metrics.LLM_EXTRACTION_DURATION.observe(attempt.latency, model=spec.name, outcome=outcome)
+            metrics.LLM_EXTRACTION_TOTAL.inc(model=spec.name, outcome=outcome)
+            return attempt
+
+        stats.latency_total += attempt.latency
+        attempt.issues = validate_extraction(attempt.data)
+        confidence = getattr(attempt.data, "confidence_score", 0.0) or 0.0
+        attempt.accepted = confidence >= self.min_confidence and not attempt.issues
+        if attempt.accepted:
+            stats.accepted += 1
+        outcome = "accepted" if attempt.accepted else ("invalid" if attempt.issues else "low_confidence")
+        metrics.LLM_EXTRACTION_DURATION.observe(attempt.latency, model=spec.name, outcome=outcome)
+        metrics.LLM_EXTRACTION_TOTAL.inc(model=spec.name, outcome=outcome)
+        return attempt
+
+    def _hedge_delay_for(self, spec: ModelSpec) -> float:
+        if self.hedge_delay is not None:
+            return self.hedge_delay
+        observed = self.breakers[spec].window.latency_percentile(95)
+        return observed[0] if observed else self.breakers[spec].current_timeout() / 2
+
+    async def _hedged(self, primary: ModelSpec, backup: ModelSpec, image_base64: str) -> Attempt:
+        """Send to ``primary``; if it is slower than its p95, race it against ``backup``"""
+        first = asyncio.create_task(self._attempt(primary, image_base64))
+        done, _ = await asyncio.wait({first}, timeout=self._hedge_delay_for(primary))
+        if done:
+            return first.result()
+        if not self.breakers[backup].allows_calls():
+            return await first
+
+        second = asyncio.create_task(self._attempt(backup, image_base64))
+        pending = {first, second}
+        result = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    attempt = task.result()
+                    if result is None or (attempt.data is not None and result.data is None):
+                        result = attempt
+                if result.data is not None:
+                    break
+        finally:
+            for task in pending:
+                task.cancel()
+            # Let the loser unwind (its breaker releases a half-open probe) before returning
+            await asyncio.gather(*pending, return_exceptions=True)
+        result.hedged = True
+        # The losing task may have been cancelled, so it has no result to compare against
+        metrics.LLM_HEDGES_TOTAL.inc(winner="backup" if result.spec == backup else "primary")
+        return result
+
+    # ---------- Routing ----------
+
+    async def extract(self, image_base64: str, hedge: bool = False) -> RoutedExtraction:
+        """Extract with the cheapest adequate model; raises ExtractionDeferred if none answered"""
+        attempts: List[Attempt] = []
+        index = 0
+        while index < len(self.tiers):
+            spec = self.tiers[index]
+            if hedge and not attempts and index + 1 < len(self.tiers):
+                # A second copy to the same model would double its cost and load for little gain
+                attempt = await self._hedged(spec, self.tiers[index + 1], image_base64)
+            else:
+                attempt = await self._attempt(spec, image_base64)
+            attempts.append(attempt)
+            index = self.tiers.index(attempt.spec) + 1
+            if attempt.accepted:
+                break
+            if index < len(self.tiers):
+                reason = "error" if attempt.data is None else ("invalid" if attempt.issues else "low_confidence")
+                metrics.LLM_ESCALATIONS_TOTAL.inc(model=attempt.spec.name, reason=reason)
+
+        answered = [a for a in attempts if a.data is not None]
+        if not answered:
+            raise ExtractionDeferred("; ".join(f"{a.spec.name}: {a.error}" for a in attempts) or "no model available")
+        best = max(answered, key=lambda a: a.rank)
+        self._record_agreement(answered, best)
+        return RoutedExtraction(best.data, best.spec.name, attempts)
+
+    def _record_agreement(self, answered: List[Attempt], best: Attempt):
+        """Score cheaper models against the result that was finally used"""
+        if not best.accepted:
+            return
+        for attempt in answered:
+            if attempt is best:
+                continue
+            ours = getattr(attempt.data, "total_amount", None) or 0.0
+            theirs = getattr(best.data, "total_amount", None) or 0.0
+            agreed = abs(ours - theirs) <= max(1.0, abs(theirs) * 0.005)
+            stats = self._stats[attempt.spec]
+            stats.compared += 1
+            stats.agreed += int(agreed)
+            metrics.LLM_MODEL_AGREEMENT_TOTAL.inc(model=attempt.spec.name, agreed=str(agreed).lower())
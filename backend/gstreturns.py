@@ -0,0 +1,256 @@
+"""GSTR-1 and GSTR-3B returns in the GST portal's JSON format.
+
+GSTR-1 (outward supplies) is built from ``db.invoices``:
+
+* ``b2b``: invoices to registered customers, grouped by customer GSTIN;
+* ``b2cs``: supplies to unregistered customers, summed by supply type and
+  rate. Invoices record no place of supply for unregistered customers, so
+  these are reported against the business's own state;
+* ``hsn``: line items summed by HSN code, unit and rate.
+
+GSTR-3B takes its outward totals from the same invoices. Its eligible
+input-tax credit comes from the tax on extracted purchase bills that name a
+seller GSTIN.
+
+Every figure is computed by an aggregation pipeline. Only per-group totals,
+or the B2B invoice rows the return itself lists, come back to the worker,
+so the cost does not grow with line items. Periods are calendar months in
+IST (``MMYYYY``, the portal's ``fp``). Invoices are dated by ``invoice_date``
+and bills by ``upload_date``, the day they entered the books.
+"""
+import logging
+from datetime import datetime, timezone, timedelta
+from typing import Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+IST = timezone(timedelta(hours=5, minutes=30))
+
+# Rates a return may carry; computed rates are snapped to the nearest one
+GST_RATES = (0.0, 0.1, 0.25, 1.0, 1.5, 3.0, 5.0, 6.0, 7.5, 12.0, 18.0, 28.0)
+
+# Invoice units to GST unit quantity codes
+UQC_CODES = {
+    "pcs": "PCS", "nos": "NOS", "no": "NOS", "kg": "KGS", "kgs": "KGS", "g": "GMS", "gm": "GMS",
+    "gms": "GMS", "l": "LTR", "ltr": "LTR", "ml": "MLT", "m": "MTR", "mtr": "MTR", "box": "BOX",
+    "set": "SET", "pair": "PRS", "dozen": "DOZ", "doz": "DOZ", "bag": "BAG", "bottle": "BTL",
+}
+
+# An invoice's tax as a fraction of its taxable value
+_TAX_SHARE = {"$cond": [{"$gt": ["$subtotal", 0]}, {"$divide": ["$total_gst", "$subtotal"]}, 0]}
+# Its rate in tenths of a percent; $round is avoided so older servers can run it
+_RATE_BUCKET = {"$trunc": {"$add": [{"$multiply": [_TAX_SHARE, 1000]}, 0.5]}}
+_HAS_GSTIN = {"$nin": [None, ""]}
+
+
+def _share_of(field: str) -> dict:
+    return {"$cond": [{"$gt": ["$subtotal", 0]}, {"$divide": [f"${field}", "$subtotal"]}, 0]}
+
+
+def parse_period(period: str) -> Tuple[str, str]:
+    """UTC ISO bounds [start, end) of a ``MMYYYY`` return period"""
+    if len(period) != 6 or not period.isdigit() or not 1 <= int(period[:2]) <= 12:
+        raise ValueError("Period must be MMYYYY, e.g. 042025")
+    month, year = int(period[:2]), int(period[2:])
+    start = datetime(year, month, 1, tzinfo=IST)
+    end = datetime(year + month // 12, month % 12 + 1, 1, tzinfo=IST)
+    return start.astimezone(timezone.utc).isoformat(), end.astimezone(timezone.utc).isoformat()
+
+
+def snap_rate(bucket) -> float:
+    """Nearest GST rate to a rate bucket in tenths of a percent"""
+    rate = (bucket or 0) / 10
+    return min(GST_RATES, key=lambda candidate: abs(candidate - rate))
+
+
+def money(value) -> float:
+    return round(value or 0.0, 2)
+
+
+def filing_date(iso_date: str) -> str:
+    return datetime.fromisoformat(iso_date).astimezone(IST).strftime("%d-%m-%Y")
+
+
+async def ensure_indexes(db):
+    try:
+        await db.invoices.create_index([("user_id", 1), ("invoice_date", 1)])
+        await db.bills.create_index([("user_id", 1), ("upload_date", 1)])
+    except Exception as e:
+        logger.error(f"Creating return indexes failed: {str(e)}")
+
+
+# ---------- GSTR-1 ----------
+
+async def _b2b(db, match: dict) -> list:
+    pipeline = [
+        {"$match": {**match, "customer_gstin": _HAS_GSTIN}},
+        {"$sort": {"customer_gstin": 1, "invoice_date": 1}},
+        {"$project": {
+            "_id": 0, "customer_gstin": 1, "invoice_number": 1, "invoice_date": 1, "total_amount": 1,
+            "subtotal": 1, "igst": 1, "cgst": 1, "sgst": 1, "rate": _RATE_BUCKET,
+        }},
+    ]
+    parties: Dict[str, list] = {}
+    async for invoice in db.invoices.aggregate(pipeline, allowDiskUse=True):
+        ctin = invoice["customer_gstin"].strip().upper()
+        parties.setdefault(ctin, []).append({
+            "inum": invoice["invoice_number"],
+            "idt": filing_date(invoice["invoice_date"]),
+            "val": money(invoice.get("total_amount")),
+            "pos": ctin[:2],
+            "rchrg": "N",
+            "inv_typ": "R",
+            "itms": [{"num": 1, "itm_det": {
+                "rt": snap_rate(invoice.get("rate")),
+                "txval": money(invoice.get("subtotal")),
+                "iamt": money(invoice.get("igst")),
+                "camt": money(invoice.get("cgst")),
+                "samt": money(invoice.get("sgst")),
+                "csamt": 0.0,
+            }}],
+        })
+    return [{"ctin": ctin, "inv": invoices} for ctin, invoices in parties.items()]
+
+
+async def _b2cs(db, match: dict, state_code: str) -> list:
+    pipeline = [
+        {"$match": {**match, "customer_gstin": {"$in": [None, ""]}}},
+        {"$group": {
+            "_id": {"inter": {"$gt": ["$igst", 0]}, "rate": _RATE_BUCKET},
+            "txval": {"$sum": "$subtotal"},
+            "iamt": {"$sum": "$igst"},
+            "camt": {"$sum": "$cgst"},
+            "samt": {"$sum": "$sgst"},
+        }},
+    ]
+    rows: Dict[tuple, dict] = {}
+    async for group in db.invoices.aggregate(pipeline):
+        supply = "INTER" if group["_id"]["inter"] else "INTRA"
+        rate = snap_rate(group["_id"]["rate"])
+        row = rows.setdefault((supply, rate), {
+            "sply_ty": supply, "pos": state_code, "typ": "OE", "rt": rate,
+            "txval": 0.0, "iamt": 0.0, "camt": 0.0, "samt": 0.0, "csamt": 0.0,
+        })
+        for field in ("txval", "iamt", "camt", "samt"):
+            row[field] += group[field] or 0.0
+    return [{**row, **{f: money(row[f]) for f in ("txval", "iamt", "camt", "samt")}}
+            for _, row in sorted(rows.items())]
+
+
+async def _hsn(db, match: dict) -> dict:
+    pipeline = [
+        {"$match": match},
+        {"$project": {
+            "items": 1,
+            "rate": _RATE_BUCKET,
+            "igst_share": _share_of("igst"),
+            "cgst_share": _share_of("cgst"),
+            "sgst_share": _share_of("sgst"),
+        }},
+        {"$unwind": "$items"},
+        {"$group": {
+            "_id": {
+                "hsn": {"$ifNull": ["$items.hsn_code", ""]},
+                "unit": {"$toLower": {"$ifNull": ["$items.unit", "pcs"]}},
+                "rate": "$rate",
+            },
+            "qty": {"$sum": "$items.quantity"},
+            "txval": {"$sum": "$items.amount"},
+            "iamt": {"$sum": {"$multiply": ["$items.amount", "$igst_share"]}},
+            "camt": {"$sum": {"$multiply": ["$items.amount", "$cgst_share"]}},
+            "samt": {"$sum": {"$multiply": ["$items.amount", "$sgst_share"]}},
+        }},
+    ]
+    rows: Dict[tuple, dict] = {}
+    async for group in db.invoices.aggregate(pipeline, allowDiskUse=True):
+        key = (
+            str(group["_id"]["hsn"]).strip(),
+            UQC_CODES.get(group["_id"]["unit"].strip(), "OTH"),
+            snap_rate(group["_id"]["rate"]),
+        )
+        row = rows.setdefault(key, {"qty": 0.0, "txval": 0.0, "iamt": 0.0, "camt": 0.0, "samt": 0.0})
+        for field in row:
+            row[field] += group[field] or 0.0
+    return {"data": [
+        {
+            "num": num,
+            "hsn_sc": hsn,
+            "uqc": uqc,
+            "rt": rate,
+            "qty": round(row["qty"], 3),
+            **{field: money(row[field]) for field in ("txval", "iamt", "camt", "samt")},
+            "csamt": 0.0,
+        }
+        for num, ((hsn, uqc, rate), row) in enumerate(sorted(rows.items()), start=1)
+    ]}
+
+
+async def build_gstr1(db, user_id: str, gstin: str, period: str) -> dict:
+    start, end = parse_period(period)
+    match = {"user_id": user_id, "invoice_date": {"$gte": start, "$lt": end}}
+    return {
+        "gstin": gstin,
+        "fp": period,
+        "b2b": await _b2b(db, match),
+        "b2cs": await _b2cs(db, match, gstin[:2]),
+        "hsn": await _hsn(db, match),
+    }
+
+
+# ---------- GSTR-3B ----------
+
+def _tax(iamt=0.0, camt=0.0, samt=0.0, **extra) -> dict:
+    return {**extra, "iamt": money(iamt), "camt": money(camt), "samt": money(samt), "csamt": 0.0}
+
+
+async def _sum_one(collection, pipeline: list) -> dict:
+    totals = await collection.aggregate(pipeline).to_list(1)
+    return totals[0] if totals else {}
+
+
+async def build_gstr3b(db, user_id: str, gstin: str, period: str) -> dict:
+    start, end = parse_period(period)
+    outward = await _sum_one(db.invoices, [
+        {"$match": {"user_id": user_id, "invoice_date": {"$gte": start, "$lt": end}}},
+        {"$group": {
+            "_id": None,
+            "txval": {"$sum": "$subtotal"},
+            "iamt": {"$sum": "$igst"},
+            "camt": {"$sum": "$cgst"},
+            "samt": {"$sum": "$sgst"},
+        }},
+    ])
+    # Only bills from registered sellers carry creditable tax
+    itc = await _sum_one(db.bills, [
+        {"$match": {
+            "user_id": user_id,
+            "upload_date": {"$gte": start, "$lt": end},
+            "ocr_status": "completed",
+            "extracted_data.seller_gstin": _HAS_GSTIN,
+        }},
+        {"$group": {
+            "_id": None,
+            "iamt": {"$sum": {"$ifNull": ["$extracted_data.igst", 0]}},
+            "camt": {"$sum": {"$ifNull": ["$extracted_data.cgst", 0]}},
+            "samt": {"$sum": {"$ifNull": ["$extracted_data.sgst", 0]}},
+        }},
+    ])
+    available = _tax(itc.get("iamt"), itc.get("camt"), itc.get("samt"))
+    return {
+        "gstin": gstin,
+        "ret_period": period,
+        "sup_details": {
+            "osup_det": _tax(outward.get("iamt"), outward.get("camt"), outward.get("samt"),
+                             txval=money(outward.get("txval"))),
+            "osup_zero": {"txval": 0.0, "iamt": 0.0, "csamt": 0.0},
+            "osup_nil_exmp": {"txval": 0.0},
+            "isup_rev": _tax(txval=0.0),
+            "osup_nongst": {"txval": 0.0},
+        },
+        "itc_elg": {
+            "itc_avl": [_tax(ty=ty) for ty in ("IMPG", "IMPS", "ISRC", "ISD")] + [{"ty": "OTH", **available}],
+            "itc_rev": [_tax(ty="RUL"), _tax(ty="OTH")],
+            "itc_net": dict(available),
+            "itc_inelg": [_tax(ty="RUL"), _tax(ty="OTH")],
+        },
+    }
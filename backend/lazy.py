@@ -0,0 +1,98 @@
+"""Deferred imports for heavy optional dependencies.
+
+Most requests never export a workbook, take a payment or run an extraction,
+so paying for openpyxl, razorpay, PIL or the LLM SDK on every worker boot
+only slows cold starts and autoscaling. ``lazy_import`` returns a module
+proxy that imports the real module on first attribute access:
+
+    openpyxl = lazy_import("openpyxl")
+    ...
+    wb = openpyxl.Workbook()      # imported here, once
+
+``warm_up`` imports every registered module on a worker thread, so a server
+can start accepting traffic first and take the import cost off the request
+path shortly afterwards. Import durations are exported as
+``lazy_import_seconds``.
+"""
+import asyncio
+import importlib
+import logging
+import threading
+import time
+from typing import Dict, Iterable, Optional
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class LazyModule:
+    """Stands in for a module until one of its attributes is used"""
+
+    def __init__(self, name: str):
+        self.__dict__["_name"] = name
+        self.__dict__["_module"] = None
+        self.__dict__["_lock"] = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._module is not None
+
+    def load(self):
+        module = self._module
+        if module is None:
+            with self._lock:
+                module = self._module
+                if module is None:
+                    start = time.perf_counter()
+                    module = importlib.import_module(self._name)
+                    metrics.LAZY_IMPORT_SECONDS.set(time.perf_counter() - start, module=self._name)
+                    self.__dict__["_module"] = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self.load(), attr, value)
+
+    def __repr__(self):
+        return f"<lazy module {self._name!r} ({'loaded' if self.loaded else 'not loaded'})>"
+
+
+_REGISTRY: Dict[str, LazyModule] = {}
+
+
+def lazy_import(name: str) -> LazyModule:
+    """Shared proxy for ``name``; nothing is imported until it is used"""
+    if name not in _REGISTRY:
+        _REGISTRY[name] = LazyModule(name)
+    return _REGISTRY[name]
+
+
+def registered() -> Dict[str, bool]:
+    """Registered module names and whether each has been imported yet"""
+    return {name: module.loaded for name, module in _REGISTRY.items()}
+
+
+async def warm_up(names: Optional[Iterable[str]] = None, delay: float = 0.0) -> Dict[str, float]:
+    """Import registered modules off the event loop; returns seconds spent per module"""
+    if delay:
+        await asyncio.sleep(delay)
+    loop = asyncio.get_running_loop()
+    timings = {}
+    for name in list(names or _REGISTRY):
+        module = lazy_import(name)
+        if module.loaded:
+            continue
+        start = time.perf_counter()
+        try:
+            await loop.run_in_executor(None, module.load)
+        except ImportError as e:
+            logger.warning(f"Warm-up could not import {name}: {str(e)}")
+            continue
+        timings[name] = round(time.perf_counter() - start, 4)
+    if timings:
+        logger.info(f"Warm-up imported {len(timings)} module(s) in {sum(timings.values()):.2f}s: "
+                    + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in timings.items()))
+    return timings
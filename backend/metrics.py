@@ -0,0 +1,412 @@
+"""Prometheus-style metrics for the API.
+
+A small, dependency-free implementation of counters, gauges and histograms
+with labels, rendered in the Prometheus text exposition format on
+``/metrics``. Values are per worker process; scrape every worker (or run a
+single worker per container) when deploying multiple processes.
+
+Instrumentation provided here:
+
+* ``MetricsMiddleware`` - request latency histograms per route template,
+  request counts by status and in-flight gauges,
+* ``MongoCommandMetrics`` - a pymongo command listener timing every Mongo
+  operation per collection and command,
+* ``timed`` - a helper to time arbitrary blocks into a histogram.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from pymongo import monitoring
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # label key -> [bucket counts..., sum, count]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    def count(self, **labels) -> float:
+        state = self._values.get(self._key(labels))
+        return state[-1] if state else 0.0
+
+    def samples(self):
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        lines = []
+        for key, state in items:
+            cumulative = 0.0
+            for bound, bucket_count in zip(self.buckets, state):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {_format_value(cumulative)}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(state[-2])}")
+            lines.append(f"{self.name}_count{labels} {_format_value(state[-1])}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, documentation, labelnames=()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(m.render() for m in metrics) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# ---------- HTTP ----------
+
+HTTP_REQUEST_DURATION = REGISTRY.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template",
+    ("method", "route", "status"),
+)
+HTTP_REQUESTS_IN_PROGRESS = REGISTRY.gauge(
+    "http_requests_in_progress", "HTTP requests currently being served", ("method",),
+)
+
+# ---------- Startup ----------
+
+LAZY_IMPORT_SECONDS = REGISTRY.gauge(
+    "lazy_import_seconds", "Time taken to import a lazily loaded dependency", ("module",),
+)
+
+# ---------- MongoDB ----------
+
+MONGO_COMMAND_DURATION = REGISTRY.histogram(
+    "mongo_command_duration_seconds", "MongoDB command latency by collection and command",
+    ("collection", "command", "outcome"),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+
+# ---------- Bill extraction ----------
+
+LLM_EXTRACTION_DURATION = REGISTRY.histogram(
+    "llm_extraction_duration_seconds", "Latency of LLM bill extraction calls", ("model", "outcome"),
+)
+LLM_EXTRACTION_TOTAL = REGISTRY.counter(
+    "llm_extraction_total", "LLM bill extraction calls by model and outcome", ("model", "outcome"),
+)
+LLM_MODEL_COST_TOTAL = REGISTRY.counter(
+    "llm_model_cost_total", "Estimated spend on extraction calls per model", ("model",),
+)
+LLM_ESCALATIONS_TOTAL = REGISTRY.counter(
+    "llm_escalations_total", "Extractions escalated past a model, by reason", ("model", "reason"),
+)
+LLM_HEDGES_TOTAL = REGISTRY.counter(
+    "llm_hedges_total", "Hedged extraction requests by which request won", ("winner",),
+)
+LLM_MODEL_AGREEMENT_TOTAL = REGISTRY.counter(
+    "llm_model_agreement_total", "Whether a model's total matched the accepted extraction", ("model", "agreed"),
+)
+LLM_REQUEST_BYTES = REGISTRY.counter(
+    "llm_request_bytes_total", "Base64 image bytes sent to the LLM", (),
+)
+LLM_RESPONSE_BYTES = REGISTRY.counter(
+    "llm_response_bytes_total", "Response bytes received from the LLM", (),
+)
+IMAGE_PROCESSING_DURATION = REGISTRY.histogram(
+    "image_processing_duration_seconds", "Time spent preparing uploads for extraction", ("file_type",),
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+IMAGE_PAYLOAD_BYTES = REGISTRY.histogram(
+    "image_payload_bytes", "Encoded image size sent for extraction by preprocessing profile", ("profile",),
+    buckets=(25_000, 50_000, 100_000, 200_000, 400_000, 800_000, 1_600_000, 3_200_000),
+)
+REEXTRACTION_BILLS_TOTAL = REGISTRY.counter(
+    "reextraction_bills_total", "Bills handled by bulk re-extraction by outcome", ("outcome",),
+)
+IMAGE_PROFILE_FALLBACKS_TOTAL = REGISTRY.counter(
+    "image_profile_fallbacks_total", "Extractions retried at full fidelity after a doubtful compact result", (),
+)
+
+
+# ---------- Admission control ----------
+
+RATE_LIMITED_TOTAL = REGISTRY.counter(
+    "rate_limited_total", "Requests rejected by a rate limiter", ("limiter", "plan"),
+)
+ADMISSION_REJECTED_TOTAL = REGISTRY.counter(
+    "admission_rejected_total", "Bill extractions rejected for lack of capacity", ("reason",),
+)
+EXTRACTIONS_IN_PROGRESS = REGISTRY.gauge(
+    "extractions_in_progress", "Bill extractions currently holding an admission slot", (),
+)
+
+PAYMENT_GATEWAY_DURATION = REGISTRY.histogram(
+    "payment_gateway_duration_seconds", "Latency of Razorpay API calls", ("operation", "outcome"),
+)
+PAYMENT_GATEWAY_IN_FLIGHT = REGISTRY.gauge(
+    "payment_gateway_in_flight", "Razorpay API calls queued or running on the gateway thread pool", (),
+)
+PAYMENT_WEBHOOKS_TOTAL = REGISTRY.counter(
+    "payment_webhooks_total", "Razorpay webhook deliveries by event and outcome", ("event", "outcome"),
+)
+
+CIRCUIT_BREAKER_STATE = REGISTRY.gauge(
+    "circuit_breaker_state", "Circuit breaker state (0 closed, 1 half open, 2 open)", ("breaker",),
+)
+CIRCUIT_BREAKER_TRANSITIONS_TOTAL = REGISTRY.counter(
+    "circuit_breaker_transitions_total", "Circuit breaker state changes", ("breaker", "from_state", "to_state"),
+)
+CIRCUIT_BREAKER_TIMEOUT = REGISTRY.gauge(
+    "circuit_breaker_timeout_seconds", "Current adaptive timeout applied to calls", ("breaker",),
+)
+
+# ---------- Audit log ----------
+
+AUDIT_EVENTS_TOTAL = REGISTRY.counter(
+    "audit_events_total", "Audit events by outcome (queued, written, direct, dropped)", ("outcome",),
+)
+AUDIT_QUEUE_DEPTH = REGISTRY.gauge(
+    "audit_queue_depth", "Audit events buffered and not yet written", (),
+)
+AUDIT_FLUSH_DURATION = REGISTRY.histogram(
+    "audit_flush_duration_seconds", "Time spent writing one batch of audit events", ("outcome",),
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+AUDIT_BATCH_SIZE = REGISTRY.histogram(
+    "audit_batch_size", "Audit events written per insert_many", (),
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000),
+)
+
+# ---------- Events ----------
+
+SSE_CONNECTIONS = REGISTRY.gauge(
+    "sse_connections", "Open /events streams on this worker", (),
+)
+EVENTS_PUBLISHED_TOTAL = REGISTRY.counter(
+    "events_published_total", "Change events published by type", ("type",),
+)
+EVENTS_DROPPED_TOTAL = REGISTRY.counter(
+    "events_dropped_total", "Event backlogs dropped in favour of a resync, by reason", ("reason",),
+)
+
+# ---------- Reconciliation ----------
+
+RECONCILIATION_ITEMS_TOTAL = REGISTRY.counter(
+    "reconciliation_items_total", "GSTR-2B reconciliation outcomes by status", ("status",),
+)
+
+@contextmanager
+def timed(histogram: Histogram, **labels):
+    """Observe the wall time of the enclosed block"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - start, **labels)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency per route template and in-flight requests"""
+
+    def __init__(self, app, exclude_paths: Iterable[str] = ("/metrics",)):
+        self.app = app
+        self.exclude_paths = set(exclude_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exclude_paths:
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status_code = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_code[0] = message["status"]
+            await send(message)
+
+        HTTP_REQUESTS_IN_PROGRESS.inc(method=method)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_REQUESTS_IN_PROGRESS.dec(method=method)
+            # FastAPI stores the matched route in the scope; use its template so
+            # /bills/{bill_id} is one series rather than one per bill
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            HTTP_REQUEST_DURATION.observe(
+                time.perf_counter() - start,
+                method=method, route=route_path, status=str(status_code[0]),
+            )
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """pymongo command listener timing operations per collection"""
+
+    IGNORED_COMMANDS = {"isMaster", "ismaster", "hello", "ping", "saslStart", "saslContinue", "endSessions"}
+
+    def __init__(self):
+        self._pending: Dict[Tuple, Tuple[str, str]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _event_key(event) -> Tuple:
+        return (event.connection_id, event.request_id)
+
+    def started(self, event):
+        if event.command_name in self.IGNORED_COMMANDS:
+            return
+        if event.command_name == "getMore":
+            collection = event.command.get("collection")
+        else:
+            collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = "_none"
+        with self._lock:
+            self._pending[self._event_key(event)] = (collection, event.command_name)
+
+    def _finish(self, event, outcome: str):
+        with self._lock:
+            pending = self._pending.pop(self._event_key(event), None)
+        if pending is None:
+            return
+        collection, command = pending
+        MONGO_COMMAND_DURATION.observe(
+            event.duration_micros / 1_000_000,
+            collection=collection, command=command, outcome=outcome,
+        )
+
+    def succeeded(self, event):
+        self._finish(event, "success")
+
+    def failed(self, event):
+        self._finish(event, "failure")
@@ -0,0 +1,164 @@
+"""Request and response models for the API"""
+from typing import Any, Dict, List, Literal, Optional
+
+from pydantic import BaseModel, EmailStr, Field
+
+class UserBase(BaseModel):
+    email: EmailStr
+    name: str
+    picture: Optional[str] = None
+    language_preference: str = "en"
+    business_name: Optional[str] = None
+    business_gstin: Optional[str] = None
+    business_address: Optional[str] = None
+    business_phone: Optional[str] = None
+    business_logo: Optional[str] = None
+
+class UserResponse(BaseModel):
+    user_id: str
+    email: str
+    name: str
+    picture: Optional[str] = None
+    language_preference: str
+    business_name: Optional[str] = None
+    business_gstin: Optional[str] = None
+    business_logo: Optional[str] = None
+    subscription_plan: str = "free"
+    created_at: str
+
+class UserProfileUpdate(BaseModel):
+    name: Optional[str] = None
+    language_preference: Optional[str] = None
+    business_name: Optional[str] = None
+    business_gstin: Optional[str] = None
+    business_address: Optional[str] = None
+    business_phone: Optional[str] = None
+    whatsapp_expense_number: Optional[str] = None
+    business_logo: Optional[str] = None
+
+class RefreshRequest(BaseModel):
+    refresh_token: Optional[str] = None
+
+class GoogleSessionRequest(BaseModel):
+    session_id: str
+
+class BillExtractedSummary(BaseModel):
+    """Extracted bill data without the product lines, for list views"""
+    seller_gstin: Optional[str] = None
+    seller_name: Optional[str] = None
+    buyer_gstin: Optional[str] = None
+    buyer_name: Optional[str] = None
+    invoice_number: Optional[str] = None
+    invoice_date: Optional[str] = None
+    subtotal: Optional[float] = None
+    cgst: Optional[float] = None
+    sgst: Optional[float] = None
+    igst: Optional[float] = None
+    total_gst: Optional[float] = None
+    total_amount: Optional[float] = None
+    confidence_score: float = 0.0
+
+class BillExtractedData(BillExtractedSummary):
+    products: List[Dict[str, Any]] = []
+
+class BillSummaryResponse(BaseModel):
+    id: str
+    user_id: str
+    file_name: str
+    file_type: str
+    upload_date: str
+    ocr_status: str
+    extracted_data: Optional[BillExtractedSummary] = None
+    updated_seq: int = 0
+
+class BillResponse(BillSummaryResponse):
+    extracted_data: Optional[BillExtractedData] = None
+
+class ReextractionRequest(BaseModel):
+    max_confidence: Optional[float] = None
+    since: Optional[str] = None
+    until: Optional[str] = None
+    deferred_only: bool = False
+
+class CustomerBase(BaseModel):
+    name: str
+    gstin: Optional[str] = None
+    email: Optional[EmailStr] = None
+    phone: Optional[str] = None
+    address: Optional[str] = None
+
+class CustomerResponse(CustomerBase):
+    id: str
+    user_id: str
+    total_purchases: float = 0.0
+    created_at: str
+    updated_seq: int = 0
+
+class ProductBase(BaseModel):
+    name: str
+    hsn_code: Optional[str] = None
+    unit: str = "pcs"
+    default_price: float = 0.0
+
+class ProductResponse(ProductBase):
+    id: str
+    user_id: str
+    created_at: str
+    updated_seq: int = 0
+
+class InvoiceItem(BaseModel):
+    product_name: str
+    hsn_code: Optional[str] = None
+    quantity: float
+    unit: str = "pcs"
+    rate: float
+    amount: float
+
+class InvoiceCreate(BaseModel):
+    customer_id: Optional[str] = None
+    customer_name: str
+    customer_gstin: Optional[str] = None
+    customer_address: Optional[str] = None
+    items: List[InvoiceItem]
+    notes: Optional[str] = None
+
+class InvoiceResponse(BaseModel):
+    id: str
+    user_id: str
+    invoice_number: str
+    invoice_date: str
+    customer_name: str
+    customer_gstin: Optional[str] = None
+    items: List[InvoiceItem]
+    subtotal: float
+    cgst: float
+    sgst: float
+    igst: float
+    total_gst: float
+    total_amount: float
+    created_at: str
+    updated_seq: int = 0
+
+class DashboardStats(BaseModel):
+    total_bills: int
+    total_customers: int
+    total_sales: float
+    total_gst: float
+    monthly_sales: float
+    monthly_gst: float
+    recent_bills: List[BillSummaryResponse]
+
+class SubscriptionOrder(BaseModel):
+    plan: str
+    billing_cycle: str = "monthly"
+
+class SyncChange(BaseModel):
+    collection: Literal["bills", "customers", "products", "invoices"]
+    op: Literal["upsert", "delete"]
+    id: str = Field(..., min_length=1, max_length=64)
+    # Version the client's edit started from; None for records created offline, or to delete unconditionally
+    base_seq: Optional[int] = None
+    data: Dict[str, Any] = {}
+
+class SyncPushRequest(BaseModel):
+    changes: List[SyncChange] = Field(..., max_length=200)
@@ -0,0 +1,222 @@
+"""Razorpay access off the event loop, and idempotent plan activation.
+
+The Razorpay SDK makes blocking ``requests`` calls. ``PaymentGateway`` runs
+them on a small dedicated thread pool over one pooled ``requests.Session``
+with connect and read timeouts, so a slow gateway response holds a worker
+thread rather than the event loop. The SDK and its client are loaded on the
+first gateway call. Signature checks are plain HMAC-SHA256 and run inline.
+
+Plans are activated by ``activate_order``, which both the client-side
+``/subscription/verify`` call and the ``/subscription/webhook`` endpoint
+use. Every activation carries an idempotency key: the webhook event id, or
+the payment id for client verification. The key is recorded on the order's
+document in ``db.transactions``. Whichever path arrives first upgrades the
+plan, and redeliveries are acknowledged without side effects.
+
+``base_url`` points the client at a local stub gateway for tests (see
+``tests/perf/stubs.py``).
+"""
+import asyncio
+import functools
+import hashlib
+import hmac
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Tuple
+
+import metrics
+from lazy import lazy_import
+
+razorpay = lazy_import("razorpay")
+requests = lazy_import("requests")
+
+logger = logging.getLogger(__name__)
+
+# Webhook events that mean money was received for an order, and ones that mean it failed
+PAID_EVENTS = ("payment.captured", "order.paid")
+FAILED_EVENTS = ("payment.failed",)
+
+
+class GatewayTimeout(Exception):
+    """Razorpay did not answer within the configured timeout"""
+
+
+def _signature_matches(secret: str, message: bytes, signature: Optional[str]) -> bool:
+    expected = hmac.new(secret.encode("utf-8"), message, hashlib.sha256).hexdigest()
+    return bool(signature) and hmac.compare_digest(expected, signature)
+
+
+class PaymentGateway:
+    """Razorpay client whose blocking calls run on a bounded thread pool"""
+
+    def __init__(self, key_id: str, key_secret: str, webhook_secret: Optional[str] = None,
+                 base_url: Optional[str] = None, connect_timeout: float = 3.0, read_timeout: float = 10.0,
+                 max_workers: int = 4):
+        self.key_id = key_id
+        self.key_secret = key_secret
+        self.webhook_secret = webhook_secret
+        self.base_url = base_url
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_workers = max_workers
+        self.session = None
+        self._client = None
+        self._client_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="razorpay")
+
+    @property
+    def client(self):
+        """Razorpay SDK client, built on first use"""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    session = requests.Session()
+                    # Every SDK call gets the (connect, read) timeout unless it passes its own
+                    session.request = functools.partial(session.request, timeout=self.timeout)
+                    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers)
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    options = {"base_url": self.base_url} if self.base_url else {}
+                    self.session = session
+                    self._client = razorpay.Client(session=session, auth=(self.key_id, self.key_secret), **options)
+        return self._client
+
+    @classmethod
+    def from_env(cls) -> Optional["PaymentGateway"]:
+        """Gateway configured from RAZORPAY_* variables, or None when no key is set"""
+        key_id = os.environ.get('RAZORPAY_KEY_ID', '')
+        if not key_id:
+            return None
+        return cls(
+            key_id,
+            os.environ.get('RAZORPAY_KEY_SECRET', ''),
+            webhook_secret=os.environ.get('RAZORPAY_WEBHOOK_SECRET') or None,
+            base_url=os.environ.get('RAZORPAY_BASE_URL') or None,
+            connect_timeout=float(os.environ.get('RAZORPAY_CONNECT_TIMEOUT_SECONDS', '3')),
+            read_timeout=float(os.environ.get('RAZORPAY_READ_TIMEOUT_SECONDS', '10')),
+            max_workers=int(os.environ.get('RAZORPAY_MAX_WORKERS', '4')),
+        )
+
+    async def _run(self, operation: str, fn):
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        outcome = "success"
+        metrics.PAYMENT_GATEWAY_IN_FLIGHT.inc()
+        try:
+            return await loop.run_in_executor(self._executor, fn)
+        except requests.Timeout as e:
+            outcome = "timeout"
+            raise GatewayTimeout(str(e)) from e
+        except Exception:
+            outcome = "error"
+            raise
+        finally:
+            metrics.PAYMENT_GATEWAY_IN_FLIGHT.dec()
+            metrics.PAYMENT_GATEWAY_DURATION.observe(time.perf_counter() - start, operation=operation, outcome=outcome)
+
+    async def create_order(self, amount: int, currency: str = "INR", receipt: Optional[str] = None,
+                           notes: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        data = {"amount": amount, "currency": currency, "payment_capture": 1}
+        if receipt:
+            data["receipt"] = receipt
+        if notes:
+            data["notes"] = notes
+        return await self._run("order.create", lambda: self.client.order.create(data))
+
+    def verify_payment_signature(self, order_id: str, payment_id: str, signature: Optional[str]) -> bool:
+        """Checkout signature: HMAC of "order_id|payment_id" with the key secret"""
+        return _signature_matches(self.key_secret, f"{order_id}|{payment_id}".encode("utf-8"), signature)
+
+    def verify_webhook_signature(self, body: bytes, signature: Optional[str]) -> bool:
+        """Webhook signature: HMAC of the raw request body with the webhook secret"""
+        return bool(self.webhook_secret) and _signature_matches(self.webhook_secret, body, signature)
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        if self.session is not None:
+            self.session.close()
+
+
+# ==================== Activation ====================
+
+async def activate_order(db, order_id: str, payment_id: str, idempotency_key: str, source: str,
+                         user_id: Optional[str] = None, amount: Optional[int] = None,
+                         audit=None) -> Tuple[str, Optional[dict]]:
+    """Mark an order paid and upgrade its user's plan, at most once per idempotency key.
+
+    Returns ``(outcome, transaction)`` where outcome is one of "activated",
+    "already_active", "duplicate", "amount_mismatch" or "not_found".
+    ``audit`` (the server's ``record_audit``) is called once, on activation.
+    """
+    query = {"order_id": order_id}
+    if user_id:
+        query["user_id"] = user_id
+    transaction = await db.transactions.find_one(query, {"_id": 0})
+    if transaction is None:
+        return "not_found", None
+    if idempotency_key in transaction.get("idempotency_keys", []):
+        return "duplicate", transaction
+    if amount is not None and amount != transaction.get("amount"):
+        logger.warning(f"Payment {payment_id} for order {order_id} has amount {amount}, "
+                       f"expected {transaction.get('amount')}")
+        return "amount_mismatch", transaction
+
+    if transaction.get("status") != "completed":
+        # Setting the plan is idempotent, so it goes first: a crash before the transaction
+        # is marked completed is repaired by the gateway's next delivery
+        await db.users.update_one(
+            {"user_id": transaction["user_id"]},
+            {"$set": {"subscription_plan": transaction["plan"]}}
+        )
+    result = await db.transactions.update_one(
+        {**query, "status": {"$ne": "completed"}},
+        {"$set": {
+            "status": "completed",
+            "payment_id": payment_id,
+            "activated_by": source,
+            "completed_at": datetime.now(timezone.utc).isoformat(),
+        }, "$addToSet": {"idempotency_keys": idempotency_key}},
+    )
+    if result.modified_count:
+        if audit:
+            await audit(transaction["user_id"], "activate_subscription", "transaction", transaction["id"], {
+                "plan": transaction["plan"], "payment_id": payment_id, "source": source,
+            })
+        return "activated", transaction
+    await db.transactions.update_one(query, {"$addToSet": {"idempotency_keys": idempotency_key}})
+    return "already_active", transaction
+
+
+async def record_failed_payment(db, order_id: str, payment_id: str, idempotency_key: str,
+                                reason: Optional[str] = None) -> str:
+    """Note a failed attempt on an order that has not been paid; customers may retry checkout"""
+    result = await db.transactions.update_one(
+        {"order_id": order_id, "status": {"$ne": "completed"}, "idempotency_keys": {"$ne": idempotency_key}},
+        {"$set": {"status": "failed", "payment_id": payment_id, "failure_reason": reason},
+         "$addToSet": {"idempotency_keys": idempotency_key}},
+    )
+    return "recorded" if result.modified_count else "ignored"
+
+
+async def handle_webhook(db, body: bytes, event_id: Optional[str], audit=None) -> str:
+    """Apply a verified Razorpay webhook body; returns the outcome for the response and metrics"""
+    event = json.loads(body)
+    name = event.get("event", "")
+    payment = ((event.get("payload") or {}).get("payment") or {}).get("entity") or {}
+    order_id, payment_id = payment.get("order_id"), payment.get("id")
+    # Razorpay sends a stable X-Razorpay-Event-Id across retries; fall back to the body digest
+    key = f"event:{event_id or hashlib.sha256(body).hexdigest()}"
+
+    if name in PAID_EVENTS and order_id and payment_id:
+        outcome, _ = await activate_order(db, order_id, payment_id, key, source="webhook",
+                                          amount=payment.get("amount"), audit=audit)
+    elif name in FAILED_EVENTS and order_id:
+        outcome = await record_failed_payment(db, order_id, payment_id, key, payment.get("error_description"))
+    else:
+        outcome = "ignored"
+    metrics.PAYMENT_WEBHOOKS_TOTAL.inc(event=name or "unknown", outcome=outcome)
+    return outcome
@@ -0,0 +1,419 @@
+"""Tolerant parsing, normalisation and scoring of LLM bill extractions.
+
+A vision call is slow and paid for, so a reply that is almost JSON should
+not be thrown away. ``process_response`` runs these steps:
+
+1. Finds the JSON object in the reply, whether it is fenced, prefixed with
+   prose or cut off mid-way. Common defects are repaired: trailing commas,
+   comments, single quotes, Python literals, bare keys, Indian-grouped
+   numbers and unterminated strings or brackets.
+2. Normalises amounts such as ``"₹1,23,456.00"``, ``"Rs. 450/-"`` or
+   ``"(1,200)"`` to floats, dates to ISO ``YYYY-MM-DD`` and GSTINs to
+   upper case, fixing OCR letter/digit confusions when the checksum then
+   passes.
+3. Reconciles subtotal + CGST + SGST + IGST against ``total_amount``,
+   filling a single missing figure when the others determine it.
+4. Computes ``confidence_score`` from the model's own estimate and the
+   evidence of the previous steps, so a consistent bill is not sent for a
+   costly retry just because the model under-reported its confidence.
+"""
+import json
+import re
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+AMOUNT_FIELDS = ("subtotal", "cgst", "sgst", "igst", "total_gst", "total_amount")
+TEXT_FIELDS = ("seller_gstin", "seller_name", "buyer_gstin", "buyer_name", "invoice_number")
+PRODUCT_NUMBERS = ("quantity", "rate", "amount")
+
+# ==================== JSON repair ====================
+
+_GROUPED_NUMBER = re.compile(r"(?:₹|Rs\.?|INR)?\s*[-+]?\d{1,3}(?:,\d{2,3})+(?:\.\d+)?(?:/-)?", re.I)
+_PLAIN_NUMBER = re.compile(r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+_LITERALS = {"null": "null", "none": "null", "nan": "null", "undefined": "null", "true": "true", "false": "false"}
+
+
+def _json_region(response: str) -> str:
+    """The part of a reply that should hold the JSON object"""
+    text = response.strip()
+    # str.find rather than a lazy regex: the fence is scanned once, not per character
+    fence = text.find("```")
+    if fence >= 0:
+        start = fence + 3
+        if text.startswith(("json", "JSON"), start):
+            start += 4
+        end = text.find("```", start)
+        fenced = text[start:] if end < 0 else text[start:end]
+        if "{" in fenced:
+            text = fenced
+    start = text.find("{")
+    if start < 0:
+        raise ValueError("No JSON object in response")
+    return text[start:]
+
+
+def _sanitize(text: str, repairs: List[str]) -> str:
+    """Rewrite near-JSON into JSON in one pass, closing anything left open"""
+    out: List[str] = []
+    stack: List[List[str]] = []  # [bracket, phase] where phase is "key" or "value" for objects
+    last_key_start = -1
+    i, n = 0, len(text)
+
+    def phase() -> Optional[str]:
+        return stack[-1][1] if stack and stack[-1][0] == "{" else None
+
+    def strip_trailing_comma():
+        while out and out[-1].isspace():
+            out.pop()
+        if out and out[-1] == ",":
+            out.pop()
+            repairs.append("trailing comma")
+
+    while i < n:
+        c = text[i]
+        if c in "\"'":
+            quote, j, chars = c, i + 1, []
+            while j < n and text[j] != quote:
+                if text[j] == "\\" and j + 1 < n:
+                    chars.append(text[j:j + 2])
+                    j += 2
+                    continue
+                if text[j] == "\n":
+                    chars.append("\\n")
+                elif quote == "'" and text[j] == '"':
+                    chars.append('\\"')
+                else:
+                    chars.append(text[j])
+                j += 1
+            if quote == "'":
+                repairs.append("single quotes")
+            if j >= n:
+                repairs.append("unterminated string")
+            if phase() == "key":
+                last_key_start = len(out)
+            out.append('"' + "".join(chars) + '"')
+            i = j + 1
+            continue
+        if c == "/" and i + 1 < n and text[i + 1] in "/*":
+            end = text.find("\n", i) if text[i + 1] == "/" else text.find("*/", i + 2)
+            i = n if end < 0 else end + (1 if text[i + 1] == "/" else 2)
+            repairs.append("comment")
+            continue
+        if c in "{[":
+            stack.append([c, "key" if c == "{" else "value"])
+            last_key_start = -1
+            out.append(c)
+        elif c in "}]":
+            strip_trailing_comma()
+            if stack:
+                stack.pop()
+                out.append(c)
+                if not stack:
+                    if text[i + 1:].strip():
+                        repairs.append("trailing text")
+                    break
+        elif c == ":":
+            if stack and stack[-1][0] == "{":
+                stack[-1][1] = "value"
+            out.append(c)
+        elif c == ",":
+            if stack and stack[-1][0] == "{":
+                stack[-1][1] = "key"
+                # Only a key started after this comma may be dropped as incomplete
+                last_key_start = -1
+            out.append(c)
+        elif c.isspace():
+            out.append(c)
+        else:
+            # Bare token: number, literal, unquoted key or unquoted value
+            grouped = _GROUPED_NUMBER.match(text, i) if phase() == "value" else None
+            if grouped:
+                # 1,23,456.00 is not a JSON number; keep it whole as a string for parse_amount
+                out.append(json.dumps(grouped.group()))
+                repairs.append("grouped number")
+                i = grouped.end()
+                continue
+            number = _PLAIN_NUMBER.match(text, i)
+            if number and phase() != "key":
+                out.append(number.group())
+                i = number.end()
+                continue
+            j = i
+            while j < n and text[j] not in ",:}]\n" and not (phase() == "key" and text[j].isspace()):
+                j += 1
+            token = text[i:j].strip()
+            literal = _LITERALS.get(token.lower())
+            if literal and phase() != "key":
+                if literal != token:
+                    repairs.append("non-JSON literal")
+                out.append(literal)
+            else:
+                if phase() == "key":
+                    last_key_start = len(out)
+                    repairs.append("bare key")
+                else:
+                    repairs.append("bare value")
+                out.append(json.dumps(token))
+            i = j
+            continue
+        i += 1
+
+    if stack:
+        repairs.append("truncated")
+        strip_trailing_comma()
+        tail = "".join(out).rstrip()
+        if tail.endswith(":"):
+            out = list(tail) + ["null"]
+        elif phase() == "key" and last_key_start >= 0 and not tail.endswith(("{", ",")):
+            # A key with no value: drop it and any comma before it
+            out = out[:last_key_start]
+            strip_trailing_comma()
+        for bracket, _ in reversed(stack):
+            out.append("}" if bracket == "{" else "]")
+    return "".join(out)
+
+
+def parse_json_tolerant(response: str) -> Tuple[Dict[str, Any], List[str]]:
+    """Parse the JSON object in an LLM reply, repairing it if needed; returns (data, repairs)"""
+    region = _json_region(response)
+    try:
+        data = json.loads(region)
+        repairs: List[str] = []
+    except json.JSONDecodeError:
+        repairs = []
+        data = json.loads(_sanitize(region, repairs))
+    if not isinstance(data, dict):
+        raise ValueError("Response JSON is not an object")
+    return data, sorted(set(repairs))
+
+
+# ==================== Normalisation ====================
+
+_CURRENCY = re.compile(r"(₹|rs\.?|inr|/-|\s)", re.I)
+
+
+def parse_amount(value: Any) -> Optional[float]:
+    """Amounts like 1234.5, "₹1,23,456.00", "Rs. 450/-", "(1,200.00)" or "12.5%" as floats"""
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = _CURRENCY.sub("", str(value)).rstrip("%")
+    if not text or text.lower() in _LITERALS:
+        return None
+    negative = text.startswith("(") and text.endswith(")")
+    text = text.strip("()")
+    if re.fullmatch(r"\d{1,3}(\.\d{3})*,\d{1,2}", text):
+        text = text.replace(".", "").replace(",", ".")  # European 1.234,50
+    text = text.replace(",", "")
+    try:
+        amount = float(text)
+    except ValueError:
+        return None
+    return -amount if negative else amount
+
+
+_DATE_FORMATS = (
+    "%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y", "%d/%m/%y", "%d-%m-%y", "%d.%m.%y",
+    "%d %b %Y", "%d-%b-%Y", "%d-%b-%y", "%d %B %Y", "%b %d, %Y", "%B %d, %Y", "%d %b, %Y",
+    "%Y/%m/%d",
+)
+
+
+def parse_date(value: Any) -> Optional[str]:
+    """Dates in the formats seen on Indian bills as ISO YYYY-MM-DD; day-first when ambiguous"""
+    if value is None:
+        return None
+    if isinstance(value, (date, datetime)):
+        return value.strftime("%Y-%m-%d")
+    text = re.sub(r"\s+", " ", str(value).strip()).replace("Sept", "Sep")
+    text = re.sub(r"(\d)(st|nd|rd|th)\b", r"\1", text)
+    try:
+        return datetime.fromisoformat(text).strftime("%Y-%m-%d")
+    except ValueError:
+        pass
+    for fmt in _DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).strftime("%Y-%m-%d")
+        except ValueError:
+            continue
+    return None
+
+
+# ==================== GSTIN ====================
+
+_GSTIN_CHARS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+_GSTIN_SHAPE = re.compile(r"^\d{2}[A-Z]{5}\d{4}[A-Z][1-9A-Z]Z[0-9A-Z]$")
+# Positions that must be digits / letters in a GSTIN, for OCR confusion repair
+_DIGIT_POSITIONS = {0, 1, 7, 8, 9, 10}
+_LETTER_POSITIONS = {2, 3, 4, 5, 6, 11}
+_TO_DIGIT = {"O": "0", "D": "0", "Q": "0", "I": "1", "L": "1", "Z": "2", "S": "5", "B": "8", "G": "6"}
+_TO_LETTER = {v: k for k, v in {"O": "0", "I": "1", "Z": "2", "S": "5", "B": "8", "G": "6"}.items()}
+
+
+def gstin_check_char(gstin14: str) -> str:
+    """Checksum character for the first 14 characters of a GSTIN"""
+    total = 0
+    for i, char in enumerate(gstin14):
+        product = _GSTIN_CHARS.index(char) * (2 if i % 2 else 1)
+        total += product // 36 + product % 36
+    return _GSTIN_CHARS[(36 - total % 36) % 36]
+
+
+def is_valid_gstin(gstin: Optional[str]) -> bool:
+    if not gstin or not _GSTIN_SHAPE.match(gstin):
+        return False
+    state = int(gstin[:2])
+    return (1 <= state <= 38 or state in (97, 99)) and gstin_check_char(gstin[:14]) == gstin[14]
+
+
+def normalize_gstin(value: Any) -> Tuple[Optional[str], bool]:
+    """Upper-cased GSTIN with OCR confusions fixed where that makes it valid; returns (gstin, valid)"""
+    if not value:
+        return None, False
+    gstin = re.sub(r"[^0-9A-Za-z]", "", str(value)).upper()
+    if is_valid_gstin(gstin):
+        return gstin, True
+    if len(gstin) == 15:
+        chars = list(gstin)
+        for i, char in enumerate(chars):
+            if i in _DIGIT_POSITIONS:
+                chars[i] = _TO_DIGIT.get(char, char)
+            elif i in _LETTER_POSITIONS:
+                chars[i] = _TO_LETTER.get(char, char)
+        chars[13] = "Z" if chars[13] == "2" else chars[13]
+        repaired = "".join(chars)
+        if is_valid_gstin(repaired):
+            return repaired, True
+    return gstin, False
+
+
+# ==================== Reconciliation ====================
+
+def _close(a: float, b: float, tolerance: float) -> bool:
+    return abs(a - b) <= max(tolerance, abs(b) * 0.005)
+
+
+def reconciliation_issues(values: Dict[str, Any], tolerance: float = 1.0) -> List[str]:
+    """Arithmetic inconsistencies between the bill's figures; empty when everything adds up"""
+    issues = []
+    subtotal = values.get("subtotal")
+    cgst = values.get("cgst") or 0.0
+    sgst = values.get("sgst") or 0.0
+    igst = values.get("igst") or 0.0
+    total_gst = values.get("total_gst")
+    total_amount = values.get("total_amount")
+
+    if total_amount is None:
+        issues.append("missing total_amount")
+    if total_gst is not None and not _close(cgst + sgst + igst, total_gst, tolerance):
+        issues.append("cgst + sgst + igst does not match total_gst")
+    if subtotal is not None and total_amount is not None and not _close(subtotal + cgst + sgst + igst, total_amount, tolerance):
+        issues.append("subtotal + taxes does not match total_amount")
+    if igst and (cgst or sgst):
+        issues.append("both IGST and CGST/SGST charged")
+    if not _close(cgst, sgst, tolerance):
+        issues.append("cgst and sgst differ")
+
+    amounts = [p.get("amount") for p in values.get("products") or [] if isinstance(p, dict)]
+    if subtotal is not None and amounts and all(isinstance(a, (int, float)) for a in amounts):
+        if not _close(sum(amounts), subtotal, tolerance * max(1, len(amounts))):
+            issues.append("product amounts do not add up to subtotal")
+    return issues
+
+
+def _fill_missing(values: Dict[str, Any], repairs: List[str]):
+    """Derive a single missing figure when the rest of the bill determines it"""
+    taxes = [values.get(k) for k in ("cgst", "sgst", "igst")]
+    if values.get("total_gst") is None and any(t is not None for t in taxes):
+        values["total_gst"] = round(sum(t or 0.0 for t in taxes), 2)
+        repairs.append("derived total_gst")
+    subtotal, total_gst, total = values.get("subtotal"), values.get("total_gst"), values.get("total_amount")
+    if total is None and subtotal is not None and total_gst is not None:
+        values["total_amount"] = round(subtotal + total_gst, 2)
+        repairs.append("derived total_amount")
+    elif subtotal is None and total is not None and total_gst is not None:
+        values["subtotal"] = round(total - total_gst, 2)
+        repairs.append("derived subtotal")
+    elif subtotal is None and total is None and values.get("products"):
+        amounts = [p.get("amount") for p in values["products"]]
+        if amounts and all(isinstance(a, float) for a in amounts):
+            values["subtotal"] = round(sum(amounts), 2)
+            repairs.append("derived subtotal")
+
+
+# ==================== Pipeline ====================
+
+@dataclass
+class ProcessedExtraction:
+    data: Dict[str, Any]
+    confidence: float
+    model_confidence: Optional[float]
+    issues: List[str] = field(default_factory=list)
+    repairs: List[str] = field(default_factory=list)
+
+
+def normalize_extraction(raw: Dict[str, Any], repairs: Optional[List[str]] = None) -> ProcessedExtraction:
+    """Normalise field formats, reconcile the figures and compute a confidence score"""
+    repairs = list(repairs or [])
+    data: Dict[str, Any] = {}
+    checks: List[bool] = [not repairs]
+
+    for key in TEXT_FIELDS:
+        value = raw.get(key)
+        data[key] = (str(value).strip() or None) if value is not None else None
+    for key in ("seller_gstin", "buyer_gstin"):
+        gstin, valid = normalize_gstin(data[key])
+        if valid and gstin != (data[key] or "").upper():
+            repairs.append(f"corrected {key}")
+        data[key] = gstin
+        if gstin is not None:
+            checks.append(valid)
+    for key in AMOUNT_FIELDS:
+        data[key] = parse_amount(raw.get(key))
+        if raw.get(key) is not None and data[key] is not None and not isinstance(raw.get(key), (int, float)):
+            repairs.append(f"normalised {key}")
+
+    raw_date = raw.get("invoice_date")
+    data["invoice_date"] = parse_date(raw_date)
+    if raw_date and data["invoice_date"] is None:
+        data["invoice_date"] = str(raw_date)
+        checks.append(False)
+    elif raw_date:
+        checks.append(True)
+
+    products = []
+    for item in raw.get("products") or []:
+        if not isinstance(item, dict):
+            continue
+        product = dict(item)
+        for key in PRODUCT_NUMBERS:
+            if key in product:
+                product[key] = parse_amount(product[key])
+        if product.get("amount") is None and product.get("quantity") is not None and product.get("rate") is not None:
+            product["amount"] = round(product["quantity"] * product["rate"], 2)
+        if product.get("hsn_code") is not None:
+            product["hsn_code"] = "".join(str(product["hsn_code"]).split())
+        products.append(product)
+    data["products"] = products
+
+    _fill_missing(data, repairs)
+    issues = reconciliation_issues(data)
+    checks.append(data.get("total_amount") is not None)
+    checks.append(bool(data.get("invoice_number")))
+    checks.extend([not issues] * 2)  # arithmetic agreement is the strongest evidence
+
+    model_confidence = parse_amount(raw.get("confidence_score"))
+    if model_confidence is not None:
+        model_confidence = min(1.0, max(0.0, model_confidence))
+    evidence = sum(checks) / len(checks)
+    confidence = evidence if model_confidence is None else 0.4 * model_confidence + 0.6 * evidence
+    data["confidence_score"] = round(confidence, 3)
+    return ProcessedExtraction(data, data["confidence_score"], model_confidence, issues, sorted(set(repairs)))
+
+
+def process_response(response: str) -> ProcessedExtraction:
+    """Parse, repair, normalise and score a raw LLM extraction reply"""
+    raw, repairs = parse_json_tolerant(response)
+    return normalize_extraction(raw, repairs)
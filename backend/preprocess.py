@@ -0,0 +1,233 @@
+"""Adaptive image preprocessing for vision extraction.
+
+Bill photos are usually far larger than the model needs to read them.
+``prepare_image`` makes the payload as small as the content allows:
+
+* applies the EXIF orientation and flattens transparency onto white
+* crops to the document, whether it is a photo on a darker surface or a
+  scan with wide margins
+* straightens skewed pages with a projection-profile search
+* drops colour when the page is effectively black-and-white
+* downscales until text lines are about ``target_line_px`` tall, within the
+  profile's bounds, and encodes a JPEG at the profile's quality
+
+Two profiles are provided. ``compact`` is the adaptive default. ``full``
+reproduces the original fixed 2048 px / q85 conversion and is used as a
+fallback when the compact payload does not produce a confident extraction.
+Only Pillow is required, and it is imported on first use.
+"""
+from __future__ import annotations
+
+import io
+import statistics
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from lazy import lazy_import
+
+Image = lazy_import("PIL.Image")
+ImageChops = lazy_import("PIL.ImageChops")
+ImageFilter = lazy_import("PIL.ImageFilter")
+ImageOps = lazy_import("PIL.ImageOps")
+
+
+@dataclass(frozen=True)
+class Profile:
+    name: str
+    max_edge: int
+    quality: int
+    min_edge: int = 0
+    target_line_px: Optional[float] = None
+    adaptive: bool = False
+
+
+PROFILES: Dict[str, Profile] = {
+    "compact": Profile("compact", max_edge=1600, quality=60, min_edge=1000, target_line_px=20, adaptive=True),
+    "full": Profile("full", max_edge=2048, quality=85),
+}
+
+
+def profile_setting(variable: str, value: str, allow_empty: bool = False) -> str:
+    """Check a profile name read from ``variable``; raises ValueError for unknown profiles"""
+    if value in PROFILES or (allow_empty and value == ""):
+        return value
+    raise ValueError(f"{variable} must be one of {', '.join(sorted(PROFILES))}, got {value!r}")
+
+
+@dataclass
+class PreparedImage:
+    data: bytes
+    profile: str
+    width: int
+    height: int
+    original_bytes: int
+    grayscale: bool = False
+    cropped: bool = False
+    deskew_angle: float = 0.0
+
+    def summary(self) -> dict:
+        return {
+            "profile": self.profile,
+            "payload_bytes": len(self.data),
+            "original_bytes": self.original_bytes,
+            "width": self.width,
+            "height": self.height,
+            "grayscale": self.grayscale,
+            "cropped": self.cropped,
+            "deskew_angle": self.deskew_angle,
+        }
+
+
+def load_image(content: bytes) -> Image.Image:
+    """Open an upload as upright RGB, flattening transparency onto white"""
+    img = ImageOps.exif_transpose(Image.open(io.BytesIO(content)))
+    if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+        img = img.convert("RGBA")
+        background = Image.new("RGB", img.size, "white")
+        background.paste(img, mask=img.getchannel("A"))
+        return background
+    return img.convert("RGB") if img.mode != "RGB" else img
+
+
+def _thumbnail(img: Image.Image, size: int) -> Image.Image:
+    small = img.copy()
+    small.thumbnail((size, size), Image.Resampling.BILINEAR)
+    return small
+
+
+def _border_median(gray: Image.Image) -> int:
+    w, h = gray.size
+    strips = [(0, 0, w, 2), (0, h - 2, w, h), (0, 0, 2, h), (w - 2, 0, w, h)]
+    values = [v for box in strips for v in gray.crop(box).tobytes()]
+    return int(statistics.median(values))
+
+
+def autocrop(img: Image.Image, threshold: int = 40, margin: float = 0.02,
+             min_area: float = 0.2) -> Tuple[Image.Image, bool]:
+    """Crop to whatever differs from the border colour: paper on a table, or ink on a margin"""
+    small = _thumbnail(img.convert("L"), 512)
+    background = _border_median(small)
+    diff = ImageChops.difference(small, Image.new("L", small.size, background))
+    mask = diff.point(lambda v: 255 if v > threshold else 0).filter(ImageFilter.MedianFilter(3))
+    bbox = mask.getbbox()
+    if not bbox:
+        return img, False
+    sx, sy = img.width / small.width, img.height / small.height
+    pad = margin * max(img.size)
+    box = (
+        max(0, int(bbox[0] * sx - pad)),
+        max(0, int(bbox[1] * sy - pad)),
+        min(img.width, int(bbox[2] * sx + pad)),
+        min(img.height, int(bbox[3] * sy + pad)),
+    )
+    area = (box[2] - box[0]) * (box[3] - box[1]) / (img.width * img.height)
+    if area > 0.95 or area < min_area:
+        return img, False
+    return img.crop(box), True
+
+
+def _ink_mask(gray: Image.Image) -> Image.Image:
+    """Dark strokes as white on black"""
+    return ImageOps.autocontrast(gray).point(lambda v: 255 if v < 128 else 0)
+
+
+def _row_profile(ink: Image.Image) -> List[float]:
+    """Mean ink per pixel row"""
+    return list(ink.resize((1, ink.height), Image.Resampling.BOX).tobytes())
+
+
+def _profile_score(ink: Image.Image, angle: float) -> float:
+    rows = _row_profile(ink.rotate(angle, resample=Image.Resampling.NEAREST, fillcolor=0))
+    mean = sum(rows) / len(rows)
+    return sum((v - mean) ** 2 for v in rows)
+
+
+def estimate_skew(gray: Image.Image, max_angle: float = 5.0) -> float:
+    """Rotation in degrees that best lines text up horizontally"""
+    small = _thumbnail(gray, 800)
+    # Score the interior only so page edges and leftover background do not dominate
+    inset_x, inset_y = small.width // 10, small.height // 10
+    ink = _ink_mask(small.crop((inset_x, inset_y, small.width - inset_x, small.height - inset_y)))
+    baseline = _profile_score(ink, 0.0)
+    if baseline == 0:
+        return 0.0
+    coarse = [a / 2 for a in range(int(-max_angle * 2), int(max_angle * 2) + 1)]
+    best = max(coarse, key=lambda a: _profile_score(ink, a))
+    fine = [best + d / 8 for d in range(-4, 5)]
+    best = max(fine, key=lambda a: _profile_score(ink, a))
+    # Only rotate when it clearly sharpens the row profile
+    return round(best, 2) if abs(best) >= 0.25 and _profile_score(ink, best) > baseline * 1.05 else 0.0
+
+
+def estimate_line_height(gray: Image.Image) -> Optional[float]:
+    """Median height in pixels of text lines, measured on a thumbnail and scaled back"""
+    small = _thumbnail(gray, 1000)
+    rows = _row_profile(_ink_mask(small))
+    peak = max(rows) if rows else 0
+    if peak == 0:
+        return None
+    runs, run = [], 0
+    for value in rows:
+        if value > peak * 0.1:
+            run += 1
+        elif run:
+            runs.append(run)
+            run = 0
+    runs = [r for r in runs if r >= 2]
+    if len(runs) < 3:
+        return None
+    return statistics.median(runs) * gray.height / small.height
+
+
+def is_effectively_grayscale(img: Image.Image, chroma: int = 40, fraction: float = 0.01) -> bool:
+    """True when fewer than ``fraction`` of pixels carry noticeable colour"""
+    small = _thumbnail(img, 256)
+    r, g, b = small.split()
+    spread = ImageChops.subtract(ImageChops.lighter(ImageChops.lighter(r, g), b),
+                                 ImageChops.darker(ImageChops.darker(r, g), b))
+    histogram = spread.histogram()
+    return sum(histogram[chroma:]) / (small.width * small.height) < fraction
+
+
+def _target_edge(img: Image.Image, profile: Profile, line_height: Optional[float]) -> int:
+    long_edge = max(img.size)
+    target = profile.max_edge
+    if profile.target_line_px and line_height:
+        target = min(profile.max_edge, max(profile.min_edge, int(long_edge * profile.target_line_px / line_height)))
+    return min(target, long_edge)
+
+
+def prepare_image(content: bytes, profile: Profile) -> PreparedImage:
+    """Crop, straighten, simplify and shrink a bill image for the vision model"""
+    img = load_image(content)
+    cropped, grayscale, angle = False, False, 0.0
+    line_height = None
+    if profile.adaptive:
+        img, cropped = autocrop(img)
+        gray = img.convert("L")
+        angle = estimate_skew(gray)
+        if angle:
+            img = img.rotate(angle, resample=Image.Resampling.BICUBIC, expand=True, fillcolor="white")
+            gray = img.convert("L")
+        grayscale = is_effectively_grayscale(img)
+        if grayscale:
+            img = gray
+        line_height = estimate_line_height(gray)
+
+    target = _target_edge(img, profile, line_height)
+    if max(img.size) > target:
+        ratio = target / max(img.size)
+        img = img.resize(tuple(max(1, int(dim * ratio)) for dim in img.size), Image.Resampling.LANCZOS)
+
+    buffered = io.BytesIO()
+    img.save(buffered, format="JPEG", quality=profile.quality, optimize=profile.adaptive)
+    return PreparedImage(
+        data=buffered.getvalue(),
+        profile=profile.name,
+        width=img.width,
+        height=img.height,
+        original_bytes=len(content),
+        grayscale=grayscale,
+        cropped=cropped,
+        deskew_angle=angle,
+    )
@@ -0,0 +1,223 @@
+"""Rate limiting and admission control for expensive endpoints.
+
+* ``RateLimiter`` is a token bucket keyed by user, with bucket size and refill
+  rate chosen by the user's ``subscription_plan``. Bucket state lives in a
+  pluggable store: ``InMemoryBucketStore`` for a single process or
+  ``MongoBucketStore`` to share limits across workers and nodes.
+* ``AdmissionController`` caps how many bill extractions run at once and how
+  many may wait for a slot, so overload turns into fast 503s with
+  ``Retry-After`` instead of an unbounded queue.
+"""
+import asyncio
+import math
+import os
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone, timedelta
+from typing import Dict, Optional, Tuple
+
+from fastapi import HTTPException
+from pymongo import ReturnDocument
+
+import metrics
+
+
+@dataclass(frozen=True)
+class BucketLimit:
+    capacity: float
+    refill_per_second: float
+
+
+# Upload limits per plan: burst size and sustained uploads per minute
+DEFAULT_PLAN_LIMITS = {
+    "free": BucketLimit(capacity=5, refill_per_second=5 / 60),
+    "pro": BucketLimit(capacity=20, refill_per_second=30 / 60),
+    "business": BucketLimit(capacity=40, refill_per_second=60 / 60),
+}
+
+
+# Background re-extraction per plan, shared by all of a user's jobs: burst size and extractions per minute
+DEFAULT_REEXTRACTION_LIMITS = {
+    "free": BucketLimit(capacity=1, refill_per_second=2 / 60),
+    "pro": BucketLimit(capacity=2, refill_per_second=10 / 60),
+    "business": BucketLimit(capacity=4, refill_per_second=30 / 60),
+}
+
+
+def parse_plan_limits(spec: Optional[str],
+                      defaults: Dict[str, BucketLimit] = DEFAULT_PLAN_LIMITS) -> Dict[str, BucketLimit]:
+    """Parse "free=5:5/60,pro=20:30/60" (capacity:tokens/seconds) into limits"""
+    limits = dict(defaults)
+    if not spec:
+        return limits
+    for item in spec.split(","):
+        plan, _, value = item.strip().partition("=")
+        capacity, _, rate = value.partition(":")
+        tokens, _, seconds = rate.partition("/")
+        limits[plan.strip()] = BucketLimit(float(capacity), float(tokens) / float(seconds or 1))
+    return limits
+
+
+class InMemoryBucketStore:
+    """Token buckets held in this process"""
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+
+    async def take(self, key: str, limit: BucketLimit, cost: float = 1.0) -> Tuple[bool, float]:
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(key, (limit.capacity, now))
+        tokens = min(limit.capacity, tokens + (now - updated) * limit.refill_per_second)
+        allowed = tokens >= cost
+        if allowed:
+            tokens -= cost
+        if key not in self._buckets and len(self._buckets) >= self.max_keys:
+            # Buckets idle for an hour have refilled and carry no state worth keeping
+            self._buckets = {k: v for k, v in self._buckets.items() if now - v[1] < 3600}
+        self._buckets[key] = (tokens, now)
+        return allowed, tokens
+
+
+class MongoBucketStore:
+    """Token buckets shared through a Mongo collection.
+
+    Each take is one atomic findOneAndUpdate with an update pipeline, so
+    concurrent workers never double-spend a token.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+        self._indexed = False
+
+    async def _ensure_indexes(self):
+        if not self._indexed:
+            await self.collection.create_index("expires_at", expireAfterSeconds=0)
+            self._indexed = True
+
+    async def take(self, key: str, limit: BucketLimit, cost: float = 1.0) -> Tuple[bool, float]:
+        await self._ensure_indexes()
+        now = time.time()
+        idle_seconds = limit.capacity / limit.refill_per_second if limit.refill_per_second else 86400
+        refilled = {"$min": [
+            limit.capacity,
+            {"$add": [
+                {"$ifNull": ["$tokens", limit.capacity]},
+                {"$multiply": [{"$subtract": [now, {"$ifNull": ["$updated_at", now]}]}, limit.refill_per_second]},
+            ]},
+        ]}
+        bucket = await self.collection.find_one_and_update(
+            {"_id": key},
+            [
+                {"$set": {"tokens": refilled, "updated_at": now}},
+                {"$set": {"allowed": {"$gte": ["$tokens", cost]}}},
+                {"$set": {
+                    "tokens": {"$cond": ["$allowed", {"$subtract": ["$tokens", cost]}, "$tokens"]},
+                    "expires_at": datetime.now(timezone.utc) + timedelta(seconds=idle_seconds),
+                }},
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        return bool(bucket["allowed"]), float(bucket["tokens"])
+
+
+class RateLimiter:
+    """Per-user token bucket limits chosen by subscription plan"""
+
+    def __init__(self, store, plan_limits: Dict[str, BucketLimit], name: str = "upload"):
+        self.store = store
+        self.plan_limits = plan_limits
+        self.name = name
+
+    def limit_for(self, plan: Optional[str]) -> BucketLimit:
+        return self.plan_limits.get(plan or "free", self.plan_limits["free"])
+
+    async def check(self, user: dict, cost: float = 1.0):
+        """Spend tokens for the user or raise 429 with Retry-After"""
+        plan = user.get("subscription_plan", "free")
+        limit = self.limit_for(plan)
+        allowed, tokens = await self.store.take(f"{self.name}:{user['user_id']}", limit, cost)
+        if not allowed:
+            metrics.RATE_LIMITED_TOTAL.inc(limiter=self.name, plan=plan)
+            retry_after = math.ceil((cost - tokens) / limit.refill_per_second) if limit.refill_per_second else 60
+            raise HTTPException(
+                status_code=429,
+                detail="Too many uploads. Please wait before uploading more bills.",
+                headers={"Retry-After": str(max(1, retry_after))},
+            )
+
+
+class AdmissionController:
+    """Bounded concurrency with a bounded wait for a free slot"""
+
+    def __init__(self, max_concurrent: int, max_waiting: int, wait_timeout: float, retry_after: int = 5):
+        self.max_concurrent = max_concurrent
+        self.max_waiting = max_waiting
+        self.wait_timeout = wait_timeout
+        self.retry_after = retry_after
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._waiting = 0
+        self.in_flight = 0
+
+    def _reject(self, reason: str):
+        metrics.ADMISSION_REJECTED_TOTAL.inc(reason=reason)
+        raise HTTPException(
+            status_code=503,
+            detail="Bill processing is busy. Please retry shortly.",
+            headers={"Retry-After": str(self.retry_after)},
+        )
+
+    async def __aenter__(self):
+        if self._semaphore.locked():
+            if self._waiting >= self.max_waiting:
+                self._reject("queue_full")
+            self._waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=self.wait_timeout)
+            except asyncio.TimeoutError:
+                self._reject("wait_timeout")
+            finally:
+                self._waiting -= 1
+        else:
+            await self._semaphore.acquire()
+        self.in_flight += 1
+        metrics.EXTRACTIONS_IN_PROGRESS.set(self.in_flight)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.in_flight -= 1
+        metrics.EXTRACTIONS_IN_PROGRESS.set(self.in_flight)
+        self._semaphore.release()
+        return False
+
+
+def _bucket_store(db):
+    """Bucket store on RATE_LIMIT_BACKEND (memory or mongo, default SHARED_STATE_BACKEND)"""
+    backend = os.environ.get('RATE_LIMIT_BACKEND', os.environ.get('SHARED_STATE_BACKEND', 'memory')).lower()
+    return MongoBucketStore(db.rate_limits) if backend == 'mongo' else InMemoryBucketStore()
+
+
+def create_upload_rate_limiter(db) -> RateLimiter:
+    return RateLimiter(_bucket_store(db), parse_plan_limits(os.environ.get('UPLOAD_RATE_LIMITS')), name="upload")
+
+
+def create_reextraction_rate_limiter(db) -> RateLimiter:
+    """Pace of a user's re-extraction jobs, chosen by plan (REEXTRACTION_RATE_LIMITS)"""
+    limits = parse_plan_limits(os.environ.get('REEXTRACTION_RATE_LIMITS'), DEFAULT_REEXTRACTION_LIMITS)
+    return RateLimiter(_bucket_store(db), limits, name="reextract")
+
+
+def create_extraction_admission(workers: int = 1) -> AdmissionController:
+    """Per-worker admission; EXTRACTION_CONCURRENCY_BUDGET is split evenly across ``workers``"""
+    budget = os.environ.get('EXTRACTION_CONCURRENCY_BUDGET')
+    if budget and not os.environ.get('EXTRACTION_MAX_CONCURRENCY'):
+        max_concurrent = max(1, int(budget) // workers)
+    else:
+        max_concurrent = int(os.environ.get('EXTRACTION_MAX_CONCURRENCY', '16'))
+    return AdmissionController(
+        max_concurrent=max_concurrent,
+        max_waiting=int(os.environ.get('EXTRACTION_MAX_WAITING', str(2 * max_concurrent))),
+        wait_timeout=float(os.environ.get('EXTRACTION_WAIT_TIMEOUT', '10')),
+        retry_after=int(os.environ.get('EXTRACTION_RETRY_AFTER', '5')),
+    )
@@ -0,0 +1,407 @@
+"""Input-tax-credit reconciliation of purchase bills against a GSTR-2B file.
+
+GSTR-2B lists the invoices suppliers reported against the business. A
+``ReconciliationJob`` streams the file's B2B invoices and matches each one
+to a bill, producing one ``db.reconciliation_items`` entry per outcome:
+
+* ``matched``: same supplier and invoice, amounts within tolerance;
+* ``mismatched``: the same invoice, but taxable value, tax or date differ;
+* ``missing_in_books``: reported by the supplier, no bill found;
+* ``missing_in_2b``: a bill of the period the supplier did not report.
+
+Bills carry a ``match`` sub-document with the seller GSTIN, the invoice
+number normalised to a key (upper case, separators and leading zeros
+dropped, so ``INV/0042`` and ``inv-42`` agree) and its serial (the last
+run of digits). ``(user_id, match.gstin, match.serial, match.invoice)``
+is indexed. Rows are matched in chunks, with one indexed probe per chunk.
+A row whose key matches a bill exactly is compared directly. Otherwise a
+bill with the same supplier and serial is accepted as a fuzzy match,
+provided its amounts are within tolerance and its date is within a few
+days. Each row costs a hash lookup, so the pass is linear in the file.
+
+The file is parsed incrementally with ijson, and results go to Mongo as
+each chunk finishes. Memory therefore stays bounded by the chunk size, not
+by the number of rows.
+"""
+import asyncio
+import logging
+import os
+import re
+import uuid
+from datetime import date, datetime, timezone
+from itertools import islice
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import UpdateOne
+
+import metrics
+from gstreturns import parse_period
+from lazy import lazy_import
+from postprocess import normalize_gstin, parse_amount, parse_date
+
+ijson = lazy_import("ijson")
+
+logger = logging.getLogger(__name__)
+
+STATUSES = ("matched", "mismatched", "missing_in_books", "missing_in_2b")
+
+_INVOICE_TOKENS = re.compile(r"[A-Z]+|\d+")
+
+BILL_MATCH_PROJECTION = {
+    "_id": 0, "id": 1, "match": 1,
+    **{f"extracted_data.{f}": 1 for f in (
+        "seller_name", "invoice_number", "invoice_date", "subtotal", "cgst", "sgst", "igst", "total_gst", "total_amount"
+    )},
+}
+
+
+def invoice_keys(value) -> Optional[Tuple[str, str]]:
+    """(normalised key, serial) of an invoice number; None when it has no letters or digits"""
+    if value is None:
+        return None
+    tokens = [token.lstrip("0") or "0" if token.isdigit() else token
+              for token in _INVOICE_TOKENS.findall(str(value).upper())]
+    if not tokens:
+        return None
+    digits = [token for token in tokens if token.isdigit()]
+    return "".join(tokens), digits[-1] if digits else tokens[-1]
+
+
+def bill_match_fields(extracted_data: Optional[dict]) -> Optional[dict]:
+    """The ``match`` sub-document of a bill, or None if it lacks a seller GSTIN or invoice number"""
+    extracted_data = extracted_data or {}
+    gstin, _ = normalize_gstin(extracted_data.get("seller_gstin"))
+    keys = invoice_keys(extracted_data.get("invoice_number"))
+    if not gstin or not keys:
+        return None
+    return {"gstin": gstin, "invoice": keys[0], "serial": keys[1]}
+
+
+def book_entry(bill: dict) -> dict:
+    data = bill.get("extracted_data") or {}
+    taxes = [data.get(field) for field in ("cgst", "sgst", "igst")]
+    tax = sum(t or 0.0 for t in taxes) if any(t is not None for t in taxes) else data.get("total_gst")
+    return {
+        "bill_id": bill["id"],
+        "invoice_number": data.get("invoice_number"),
+        "date": parse_date(data.get("invoice_date")),
+        "taxable": data.get("subtotal"),
+        "tax": tax,
+        "value": data.get("total_amount"),
+    }
+
+
+async def ensure_indexes(db, retention_days: int = 30):
+    try:
+        # The invoice key lets duplicate detection probe the same index exactly
+        await db.bills.create_index([("user_id", 1), ("match.gstin", 1), ("match.serial", 1), ("match.invoice", 1)])
+        await db.reconciliation_items.create_index([("job_id", 1), ("_id", 1)])
+        await db.reconciliation_items.create_index([("job_id", 1), ("status", 1), ("_id", 1)])
+        await db.reconciliation_items.create_index([("job_id", 1), ("bill_id", 1)])
+        await db.reconciliation_items.create_index("created_at", expireAfterSeconds=retention_days * 86400)
+    except Exception as e:
+        logger.error(f"Creating reconciliation indexes failed: {str(e)}")
+
+
+async def backfill_match_fields(db, user_id: str, batch_size: int = 500) -> int:
+    """Compute ``match`` for the user's bills extracted before it was recorded"""
+    stamped = 0
+    while True:
+        bills = await db.bills.find(
+            {"user_id": user_id, "match": {"$exists": False}},
+            {"_id": 1, "extracted_data.seller_gstin": 1, "extracted_data.invoice_number": 1}
+        ).limit(batch_size).to_list(batch_size)
+        if not bills:
+            return stamped
+        await db.bills.bulk_write([
+            UpdateOne({"_id": bill["_id"]}, {"$set": {"match": bill_match_fields(bill.get("extracted_data"))}})
+            for bill in bills
+        ], ordered=False)
+        stamped += len(bills)
+
+
+# ---------- GSTR-2B parsing ----------
+
+class Gstr2bReader:
+    """Streams the B2B invoices of a GSTR-2B JSON file, one normalised row at a time"""
+
+    def __init__(self, file):
+        self.file = file
+        # The return period (MMYYYY) once the parser has passed it
+        self.period: Optional[str] = None
+
+    def rows(self) -> Iterator[dict]:
+        ctin, supplier, pending, builder = None, None, [], None
+        for prefix, event, value in ijson.parse(self.file, use_float=True):
+            if builder is not None:
+                builder.event(event, value)
+                if event == "end_map" and prefix.endswith(".inv.item"):
+                    if ctin is None:
+                        # Invoices listed before their supplier's GSTIN wait for it
+                        pending.append(builder.value)
+                    else:
+                        yield self._row(ctin, supplier, builder.value)
+                    builder = None
+                continue
+            if prefix.endswith("docdata.b2b.item") and event == "start_map":
+                ctin, supplier, pending = None, None, []
+            elif prefix.endswith("docdata.b2b.item.ctin"):
+                ctin = value
+            elif prefix.endswith("docdata.b2b.item.trdnm"):
+                supplier = value
+            elif prefix.endswith("docdata.b2b.item.inv.item") and event == "start_map":
+                builder = ijson.ObjectBuilder()
+                builder.event(event, value)
+            elif prefix.endswith("docdata.b2b.item") and event == "end_map":
+                for invoice in pending:
+                    yield self._row(ctin, supplier, invoice)
+                pending = []
+            elif prefix in ("data.rtnprd", "rtnprd"):
+                self.period = str(value)
+
+    @staticmethod
+    def _row(ctin, supplier, invoice: dict) -> dict:
+        def total(*fields):
+            if any(invoice.get(f) is not None for f in fields):
+                return sum(parse_amount(invoice.get(f)) or 0.0 for f in fields)
+            values = [parse_amount(item.get(f)) for item in invoice.get("items") or [] for f in fields]
+            return sum(v or 0.0 for v in values) if any(v is not None for v in values) else None
+
+        gstin, _ = normalize_gstin(ctin)
+        keys = invoice_keys(invoice.get("inum")) or ("", "")
+        return {
+            "gstin": gstin,
+            "supplier": supplier,
+            "invoice_number": invoice.get("inum"),
+            "key": keys[0],
+            "serial": keys[1],
+            "date": parse_date(invoice.get("dt")),
+            "taxable": total("txval"),
+            "tax": total("igst", "cgst", "sgst", "cess"),
+            "value": parse_amount(invoice.get("val")),
+            "itc_available": invoice.get("itcavl", "Y") != "N",
+        }
+
+
+# ---------- Matching ----------
+
+def _days_apart(a: Optional[str], b: Optional[str]) -> Optional[int]:
+    if not a or not b:
+        return None
+    return abs((date.fromisoformat(a) - date.fromisoformat(b)).days)
+
+
+class ReconciliationJob:
+    """One pass of a GSTR-2B file against a user's bills"""
+
+    def __init__(self, db, user_id: str, source_path: str, period: Optional[str] = None,
+                 job_id: Optional[str] = None, chunk_size: int = 1000, amount_tolerance: float = 1.0,
+                 date_window_days: int = 3):
+        self.db = db
+        self.user_id = user_id
+        self.source_path = source_path
+        self.period = period
+        self.job_id = job_id or str(uuid.uuid4())
+        self.chunk_size = chunk_size
+        self.amount_tolerance = amount_tolerance
+        self.date_window_days = date_window_days
+        self.counts = {status: 0 for status in STATUSES}
+        self.rows = 0
+
+    @classmethod
+    def from_env(cls, db, user_id: str, source_path: str, period: Optional[str] = None) -> "ReconciliationJob":
+        return cls(
+            db, user_id, source_path, period,
+            chunk_size=int(os.environ.get('RECONCILIATION_CHUNK_SIZE', '1000')),
+            amount_tolerance=float(os.environ.get('RECONCILIATION_AMOUNT_TOLERANCE', '1.0')),
+            date_window_days=int(os.environ.get('RECONCILIATION_DATE_WINDOW_DAYS', '3')),
+        )
+
+    @property
+    def jobs(self):
+        return self.db.reconciliation_jobs
+
+    @property
+    def items(self):
+        return self.db.reconciliation_items
+
+    async def create(self) -> dict:
+        job = {
+            "_id": self.job_id,
+            "user_id": self.user_id,
+            "status": "running",
+            "period": self.period,
+            "rows": 0,
+            "counts": dict(self.counts),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+        }
+        await self.jobs.insert_one(job)
+        return job
+
+    async def _checkpoint(self, **fields):
+        now = datetime.now(timezone.utc).isoformat()
+        await self.jobs.update_one({"_id": self.job_id}, {"$set": {
+            "rows": self.rows, "counts": dict(self.counts), "heartbeat_at": now, **fields
+        }})
+
+    async def run(self):
+        """Reconcile the file, then report the period's unreported bills; the source file is removed"""
+        try:
+            await backfill_match_fields(self.db, self.user_id)
+            with open(self.source_path, "rb") as source:
+                reader = Gstr2bReader(source)
+                rows = reader.rows()
+                while True:
+                    chunk = await asyncio.to_thread(lambda: list(islice(rows, self.chunk_size)))
+                    if not chunk:
+                        break
+                    await self._match_chunk(chunk)
+                    await self._checkpoint()
+            self.period = self.period or reader.period
+            if self.period:
+                await self._report_missing_in_2b()
+            await self._checkpoint(
+                status="completed", period=self.period, finished_at=datetime.now(timezone.utc).isoformat()
+            )
+        except asyncio.CancelledError:
+            await self._checkpoint(status="interrupted")
+            raise
+        except Exception as e:
+            logger.error(f"Reconciliation {self.job_id} failed: {str(e)}", exc_info=True)
+            await self._checkpoint(status="failed", error=str(e))
+        finally:
+            try:
+                os.remove(self.source_path)
+            except OSError:
+                pass
+
+    async def _claimed(self, bill_ids: List[str]) -> set:
+        """Bills already matched by an earlier chunk of this job"""
+        if not bill_ids:
+            return set()
+        items = await self.items.find(
+            {"job_id": self.job_id, "bill_id": {"$in": bill_ids}}, {"_id": 0, "bill_id": 1}
+        ).to_list(len(bill_ids))
+        return {item["bill_id"] for item in items}
+
+    def _compare(self, row: dict, book: dict, exact: bool) -> Dict[str, float]:
+        """Differences (books minus portal) that exceed the tolerances"""
+        differences = {}
+        for field in ("taxable", "tax"):
+            difference = (book[field] or 0.0) - (row[field] or 0.0)
+            if abs(difference) > self.amount_tolerance:
+                differences[field] = round(difference, 2)
+        days = _days_apart(book["date"], row["date"])
+        if days and days > (0 if exact else self.date_window_days):
+            differences["date_days"] = days
+        return differences
+
+    def _amount_gap(self, row: dict, book: dict) -> float:
+        return abs((book["taxable"] or 0.0) - (row["taxable"] or 0.0)) + abs((book["tax"] or 0.0) - (row["tax"] or 0.0))
+
+    def _match(self, row: dict, candidates: List[dict]) -> Tuple[str, Optional[str], Optional[dict], dict]:
+        """(status, match type, book entry, differences) for one portal row"""
+        exact = [book for book in candidates if book["key"] == row["key"]]
+        if exact:
+            book = min(exact, key=lambda b: self._amount_gap(row, b))
+            differences = self._compare(row, book, exact=True)
+            return ("mismatched" if differences else "matched"), "exact", book, differences
+        # A different invoice number is only trusted when everything else agrees
+        fuzzy = [
+            book for book in candidates
+            if _days_apart(book["date"], row["date"]) is not None and not self._compare(row, book, exact=False)
+        ]
+        if fuzzy:
+            book = min(fuzzy, key=lambda b: (self._amount_gap(row, b), _days_apart(b["date"], row["date"])))
+            return "matched", "fuzzy", book, {}
+        return "missing_in_books", None, None, {}
+
+    async def _match_chunk(self, chunk: List[dict]):
+        rows = [row for row in chunk if row["gstin"] and row["key"]]
+        bills = await self.db.bills.find({
+            "user_id": self.user_id,
+            "match.gstin": {"$in": sorted({row["gstin"] for row in rows})},
+            "match.serial": {"$in": sorted({row["serial"] for row in rows})},
+        }, BILL_MATCH_PROJECTION).to_list(None) if rows else []
+        claimed = await self._claimed([bill["id"] for bill in bills])
+
+        candidates: Dict[tuple, List[dict]] = {}
+        for bill in bills:
+            if bill["id"] not in claimed:
+                book = {**book_entry(bill), "key": bill["match"]["invoice"]}
+                candidates.setdefault((bill["match"]["gstin"], bill["match"]["serial"]), []).append(book)
+
+        items = []
+        now = datetime.now(timezone.utc)
+        for row in chunk:
+            pool = candidates.get((row["gstin"], row["serial"]), []) if row["gstin"] and row["key"] else []
+            status, match_type, book, differences = self._match(row, pool)
+            if book is not None:
+                pool.remove(book)  # a bill is matched at most once
+                book = {k: v for k, v in book.items() if k != "key"}
+            items.append({
+                "job_id": self.job_id,
+                "user_id": self.user_id,
+                "status": status,
+                "match_type": match_type,
+                "gstin": row["gstin"],
+                "invoice_number": row["invoice_number"],
+                "bill_id": book["bill_id"] if book else None,
+                "portal": {k: row[k] for k in ("supplier", "date", "taxable", "tax", "value", "itc_available")},
+                "books": book,
+                "differences": differences,
+                "created_at": now,
+            })
+            self.counts[status] += 1
+            metrics.RECONCILIATION_ITEMS_TOTAL.inc(status=status)
+        self.rows += len(chunk)
+        await self.items.insert_many(items, ordered=False)
+
+    async def _report_missing_in_2b(self):
+        """Record the period's creditable bills that no portal row matched"""
+        start, end = parse_period(self.period)
+        cursor = self.db.bills.find({
+            "user_id": self.user_id,
+            "upload_date": {"$gte": start, "$lt": end},
+            "ocr_status": "completed",
+            "match": {"$ne": None},
+        }, BILL_MATCH_PROJECTION).batch_size(self.chunk_size)
+        batch = []
+        async for bill in cursor:
+            batch.append(bill)
+            if len(batch) >= self.chunk_size:
+                await self._record_missing(batch)
+                batch = []
+        if batch:
+            await self._record_missing(batch)
+
+    async def _record_missing(self, bills: List[dict]):
+        claimed = await self._claimed([bill["id"] for bill in bills])
+        now = datetime.now(timezone.utc)
+        items = [{
+            "job_id": self.job_id,
+            "user_id": self.user_id,
+            "status": "missing_in_2b",
+            "match_type": None,
+            "gstin": bill["match"]["gstin"],
+            "invoice_number": (bill.get("extracted_data") or {}).get("invoice_number"),
+            "bill_id": bill["id"],
+            "portal": None,
+            "books": book_entry(bill),
+            "differences": {},
+            "created_at": now,
+        } for bill in bills if bill["id"] not in claimed]
+        if items:
+            await self.items.insert_many(items, ordered=False)
+            self.counts["missing_in_2b"] += len(items)
+            metrics.RECONCILIATION_ITEMS_TOTAL.inc(len(items), status="missing_in_2b")
+
+
+def parse_cursor(cursor: Optional[str]) -> Optional[ObjectId]:
+    if cursor is None:
+        return None
+    try:
+        return ObjectId(cursor)
+    except Exception:
+        raise ValueError("Invalid cursor")
@@ -0,0 +1,349 @@
+"""Resumable bulk re-extraction of stored bills.
+
+After a model upgrade or a prompt fix, existing bills still carry the old
+``extracted_data``. ``ReextractionJob`` walks ``db.bills`` in ``_id`` order,
+optionally filtered by confidence, upload date, user or status. For each
+bill it reads the stored original, extracts it again, and writes the result
+back with the same semantics as a bill edit: the export cache is
+invalidated and an audit log entry is written.
+
+* Progress is checkpointed to ``db.reextraction_jobs`` after every batch,
+  so an interrupted job resumes where it stopped.
+* Concurrency is bounded, and calls are paced by a token bucket so a
+  backfill never crowds out live uploads. Jobs started for a user share
+  that user's bucket, whose size is set by their plan.
+* Bills deferred because no provider answered are kept on the job and
+  tried once more after the main pass.
+* Bills edited by hand are skipped unless asked for. By default a new
+  result replaces the old one only if it is at least as confident.
+* A result is written only if the bill is still at the version the job
+  read, so an edit made while the model was answering is kept and the
+  bill is counted as skipped.
+
+Run from ``backend/`` with the server's environment:
+
+    python reextract.py --max-confidence 0.8 --since 2025-04-01 --concurrency 4 --rate 30
+    python reextract.py --resume <job_id>
+"""
+import argparse
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone, timedelta
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+import metrics
+from ratelimit import BucketLimit, InMemoryBucketStore
+from storage import key_from_locator
+from sweeper import read_original
+
+logger = logging.getLogger(__name__)
+
+OUTCOMES = ("updated", "unchanged", "skipped", "deferred", "missing_file", "failed")
+
+
+@dataclass
+class ReextractionFilter:
+    user_id: Optional[str] = None
+    max_confidence: Optional[float] = None
+    since: Optional[str] = None
+    until: Optional[str] = None
+    statuses: Tuple[str, ...] = ("completed", "deferred")
+    include_edited: bool = False
+
+    @classmethod
+    def from_doc(cls, doc: dict) -> "ReextractionFilter":
+        """The filter stored on a job document"""
+        return cls(**{**doc, "statuses": tuple(doc["statuses"])})
+
+    def query(self) -> dict:
+        query: Dict = {"ocr_status": {"$in": list(self.statuses)}}
+        if self.user_id:
+            query["user_id"] = self.user_id
+        if self.max_confidence is not None:
+            query["extracted_data.confidence_score"] = {"$lt": self.max_confidence}
+        if self.since or self.until:
+            query["upload_date"] = {}
+            if self.since:
+                query["upload_date"]["$gte"] = self.since
+            if self.until:
+                query["upload_date"]["$lt"] = self.until
+        if not self.include_edited:
+            query["edited_at"] = None
+        return query
+
+
+@dataclass
+class Progress:
+    total: int = 0
+    processed: int = 0
+    counts: Dict[str, int] = field(default_factory=lambda: {k: 0 for k in OUTCOMES})
+    started: float = field(default_factory=time.monotonic)
+
+    @property
+    def throughput(self) -> float:
+        elapsed = time.monotonic() - self.started
+        return self.processed / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def eta_seconds(self) -> Optional[float]:
+        rate = self.throughput
+        return max(0.0, (self.total - self.processed) / rate) if rate else None
+
+
+ExtractFn = Callable[[bytes, str], Awaitable[tuple]]
+# Returns False when the bill changed since it was read, leaving it untouched
+ApplyFn = Callable[[dict, object, dict, str], Awaitable[bool]]
+
+
+class ReextractionJob:
+    """One resumable pass over the bills matching a filter"""
+
+    def __init__(self, db, storage, extract: ExtractFn, apply: ApplyFn,
+                 filters: Optional[ReextractionFilter] = None, job_id: Optional[str] = None,
+                 concurrency: int = 4, rate_per_minute: float = 60, batch_size: int = 100,
+                 only_if_better: bool = True, deferred_backoff_seconds: float = 30,
+                 progress_interval_seconds: float = 10, lease_seconds: float = 300,
+                 bucket_store=None, bucket_limit: Optional[BucketLimit] = None):
+        self.db = db
+        self.storage = storage
+        self.extract = extract
+        self.apply = apply
+        self.filters = filters or ReextractionFilter()
+        self.job_id = job_id or str(uuid.uuid4())
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.only_if_better = only_if_better
+        self.deferred_backoff_seconds = deferred_backoff_seconds
+        self.progress_interval_seconds = progress_interval_seconds
+        self.lease_seconds = lease_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.progress = Progress()
+        self.last_id = None
+        self.deferred_ids = []
+        # Without a shared store the job paces only itself, at rate_per_minute
+        self._bucket = bucket_store or InMemoryBucketStore()
+        self._limit = bucket_limit or BucketLimit(capacity=max(1, concurrency), refill_per_second=rate_per_minute / 60)
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._last_report = 0.0
+        self._claimed = False
+
+    @property
+    def jobs(self):
+        return self.db.reextraction_jobs
+
+    # ---------- checkpointing ----------
+
+    async def claim(self) -> bool:
+        """Create or take over the job document; False if another runner holds a live lease"""
+        if self._claimed:
+            return True
+        now = datetime.now(timezone.utc)
+        existing = await self.jobs.find_one({"_id": self.job_id})
+        if existing:
+            if existing.get("status") == "completed":
+                return False
+            heartbeat = existing.get("heartbeat_at") or ""
+            stale = (now - timedelta(seconds=self.lease_seconds)).isoformat()
+            if existing.get("status") == "running" and heartbeat > stale and existing.get("owner") != self.owner:
+                return False
+            self.filters = ReextractionFilter.from_doc(existing["filters"])
+            self.last_id = existing.get("last_id")
+            self.deferred_ids = existing.get("deferred_ids", [])
+            self.progress.processed = existing.get("processed", 0)
+            self.progress.counts.update(existing.get("counts", {}))
+        self.progress.total = self.progress.processed + await self.db.bills.count_documents(self._query())
+        await self.jobs.update_one(
+            {"_id": self.job_id},
+            {
+                "$set": {
+                    "status": "running",
+                    "owner": self.owner,
+                    "heartbeat_at": now.isoformat(),
+                    "total": self.progress.total,
+                    "filters": asdict(self.filters),
+                    "user_id": self.filters.user_id,
+                },
+                "$setOnInsert": {"created_at": now.isoformat(), "processed": 0, "last_id": None, "deferred_ids": []},
+            },
+            upsert=True,
+        )
+        self._claimed = True
+        return True
+
+    async def _checkpoint(self, status: str = "running"):
+        await self.jobs.update_one(
+            {"_id": self.job_id, "owner": self.owner},
+            {"$set": {
+                "status": status,
+                "last_id": self.last_id,
+                "deferred_ids": self.deferred_ids,
+                "processed": self.progress.processed,
+                "counts": self.progress.counts,
+                "throughput": round(self.progress.throughput, 3),
+                "heartbeat_at": datetime.now(timezone.utc).isoformat(),
+            }},
+        )
+
+    def _query(self) -> dict:
+        query = self.filters.query()
+        if self.last_id is not None:
+            query["_id"] = {"$gt": self.last_id}
+        return query
+
+    # ---------- processing ----------
+
+    async def _throttle(self):
+        while True:
+            key = f"reextract:{self.filters.user_id}" if self.filters.user_id else self.job_id
+            allowed, tokens = await self._bucket.take(key, self._limit)
+            if allowed:
+                return
+            await asyncio.sleep((1 - tokens) / self._limit.refill_per_second)
+
+    async def _process(self, bill: dict) -> str:
+        key = bill.get("file_key") or key_from_locator(bill.get("file_path") or "")
+        content = await read_original(self.storage, key) if key else None
+        if content is None:
+            return "missing_file"
+
+        await self._throttle()
+        extracted_data, ocr_status, summary = await self.extract(content, bill.get("file_type", "image"))
+        if ocr_status == "deferred":
+            # The providers are unavailable; give them time instead of burning through the backlog
+            await asyncio.sleep(self.deferred_backoff_seconds)
+            return "deferred"
+
+        previous = (bill.get("extracted_data") or {}).get("confidence_score") or 0.0
+        if self.only_if_better and bill.get("ocr_status") == "completed" and extracted_data.confidence_score < previous:
+            return "unchanged"
+        if not await self.apply(bill, extracted_data, summary, self.job_id):
+            # Edited while the model was answering; the edit wins
+            return "skipped"
+        return "updated"
+
+    async def _process_bounded(self, bill: dict) -> str:
+        async with self._semaphore:
+            try:
+                outcome = await self._process(bill)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Re-extraction of bill {bill.get('id')} failed: {str(e)}")
+                outcome = "failed"
+        metrics.REEXTRACTION_BILLS_TOTAL.inc(outcome=outcome)
+        return outcome
+
+    async def _fetch(self, query: dict) -> list:
+        return await self.db.bills.find(
+            query,
+            {"id": 1, "user_id": 1, "file_key": 1, "file_path": 1, "file_type": 1, "ocr_status": 1,
+             "updated_seq": 1, "extracted_data.confidence_score": 1},
+        ).sort("_id", 1).limit(self.batch_size).to_list(self.batch_size)
+
+    async def _retry_deferred(self):
+        """Try the bills deferred during the main pass once more; a second deferral stands"""
+        while self.deferred_ids:
+            ids = self.deferred_ids[:self.batch_size]
+            # Bills edited or deleted since they were deferred no longer match and stay as counted
+            batch = await self._fetch({**self.filters.query(), "_id": {"$in": ids}})
+            outcomes = await asyncio.gather(*(self._process_bounded(bill) for bill in batch))
+            for outcome in outcomes:
+                self.progress.counts["deferred"] -= 1
+                self.progress.counts[outcome] += 1
+            self.deferred_ids = self.deferred_ids[len(ids):]
+            await self._checkpoint()
+            self._report()
+
+    def _report(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._last_report < self.progress_interval_seconds:
+            return
+        self._last_report = now
+        p = self.progress
+        eta = f"{p.eta_seconds:.0f}s" if p.eta_seconds is not None else "unknown"
+        counts = ", ".join(f"{k} {v}" for k, v in p.counts.items() if v)
+        logger.info(f"Re-extraction {self.job_id}: {p.processed}/{p.total} bills, "
+                    f"{p.throughput:.2f} bills/s, ETA {eta} ({counts or 'nothing yet'})")
+
+    async def run(self) -> Optional[dict]:
+        """Process every matching bill; returns the final job document, or None if not claimed"""
+        if not await self.claim():
+            logger.info(f"Re-extraction {self.job_id} is completed or running elsewhere")
+            return None
+        try:
+            while True:
+                batch = await self._fetch(self._query())
+                if not batch:
+                    break
+                outcomes = await asyncio.gather(*(self._process_bounded(bill) for bill in batch))
+                for bill, outcome in zip(batch, outcomes):
+                    self.progress.counts[outcome] += 1
+                    if outcome == "deferred":
+                        # The checkpoint moves past it, so remember it for the retry
+                        self.deferred_ids.append(bill["_id"])
+                self.progress.processed += len(batch)
+                self.last_id = batch[-1]["_id"]
+                await self._checkpoint()
+                self._report()
+            await self._retry_deferred()
+        except asyncio.CancelledError:
+            await self._checkpoint("paused")
+            raise
+        except Exception:
+            await self._checkpoint("failed")
+            raise
+        await self._checkpoint("completed")
+        self._report(force=True)
+        return await self.jobs.find_one({"_id": self.job_id})
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--resume", default=None, metavar="JOB_ID", help="continue a previous job")
+    parser.add_argument("--user-id", default=None)
+    parser.add_argument("--max-confidence", type=float, default=None,
+                        help="only bills whose confidence_score is below this")
+    parser.add_argument("--since", default=None, help="upload_date lower bound (ISO date)")
+    parser.add_argument("--until", default=None, help="upload_date upper bound (ISO date)")
+    parser.add_argument("--deferred-only", action="store_true", help="only bills stored as ocr_status deferred")
+    parser.add_argument("--include-edited", action="store_true", help="also overwrite bills edited by hand")
+    parser.add_argument("--always-replace", action="store_true", help="replace even with a less confident result")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=60, help="extractions per minute")
+    parser.add_argument("--batch-size", type=int, default=100)
+    return parser.parse_args(argv)
+
+
+async def main(argv=None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    from resources import resources
+    from routers.bills import create_reextraction_job
+
+    filters = ReextractionFilter(
+        user_id=args.user_id,
+        max_confidence=args.max_confidence,
+        since=args.since,
+        until=args.until,
+        statuses=("deferred",) if args.deferred_only else ("completed", "deferred"),
+        include_edited=args.include_edited,
+    )
+    job = create_reextraction_job(
+        filters, job_id=args.resume, concurrency=args.concurrency, rate_per_minute=args.rate,
+        batch_size=args.batch_size, only_if_better=not args.always_replace,
+    )
+    print(f"Job {job.job_id}")
+    try:
+        result = await job.run()
+    finally:
+        resources.client.close()
+    return 0 if result is not None else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(asyncio.run(main()))
@@ -0,0 +1,165 @@
+"""Process-wide resources shared by the routers, and their lifecycle.
+
+``Resources`` owns everything a worker builds once: the Mongo client, blob
+storage, token service, payment gateway, rate limiter, extraction admission,
+export cache, audit log, event hub, sync log and sweeper. It is constructed at
+import (the Mongo client connects lazily), so routers can bind to it
+directly. Background work begins in ``start()`` and is torn down in
+``close()``, both called from the app's lifespan.
+
+Multi-worker deployments run one container per worker process. The
+per-worker share of the connection and extraction budgets is derived from
+``WEB_CONCURRENCY`` (see DEPLOYMENT.md):
+
+* ``MONGO_MAX_POOL_SIZE`` sets the pool size directly, otherwise
+  ``MONGO_POOL_BUDGET`` (connections per host for the whole deployment) is
+  divided by the number of workers.
+* ``SHARED_STATE_BACKEND=mongo`` moves the upload rate limiter and export
+  cache into Mongo so every worker sees the same limits and invalidations.
+"""
+import asyncio
+import logging
+import os
+from pathlib import Path
+from typing import Set
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+import gstreturns
+import metrics
+import reconcile
+from audit import AuditLog
+from duplicates import DuplicateDetector
+from events import EventHub
+from exportcache import create_export_cache
+from lazy import warm_up
+from payments import PaymentGateway
+from ratelimit import create_upload_rate_limiter, create_reextraction_rate_limiter, create_extraction_admission
+from storage import create_storage
+from sync import SyncLog
+from sweeper import Sweeper
+from tokens import TokenService
+from tracing import tracer, MongoCommandTracer
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+logger = logging.getLogger(__name__)
+
+
+def worker_count() -> int:
+    return max(1, int(os.environ.get('WEB_CONCURRENCY', '1')))
+
+
+def mongo_pool_options(workers: int) -> dict:
+    """Motor pool settings for one worker; empty when nothing is configured (driver defaults)"""
+    options = {}
+    if os.environ.get('MONGO_MAX_POOL_SIZE'):
+        options["maxPoolSize"] = int(os.environ['MONGO_MAX_POOL_SIZE'])
+    elif os.environ.get('MONGO_POOL_BUDGET'):
+        options["maxPoolSize"] = max(1, int(os.environ['MONGO_POOL_BUDGET']) // workers)
+    if os.environ.get('MONGO_MIN_POOL_SIZE'):
+        options["minPoolSize"] = min(int(os.environ['MONGO_MIN_POOL_SIZE']), options.get("maxPoolSize", 100))
+    if os.environ.get('MONGO_MAX_IDLE_TIME_MS'):
+        options["maxIdleTimeMS"] = int(os.environ['MONGO_MAX_IDLE_TIME_MS'])
+    return options
+
+
+class Resources:
+    """Shared clients, stores and background jobs for one worker process"""
+
+    def __init__(self, client, db_name: str, uploads_dir: Path, workers: int = 1):
+        self.client = client
+        self.db = client[db_name]
+        self.workers = workers
+        self.uploads_dir = uploads_dir
+        self.uploads_dir.mkdir(parents=True, exist_ok=True)
+
+        # Blob storage for bills and logos (local sharded disk or S3-compatible)
+        self.storage = create_storage(uploads_dir)
+        # Signed access tokens (AUTH_TOKEN_MODE=jwt); None keeps database-backed sessions
+        self.jwt_secret = os.environ.get('JWT_SECRET', 'change_me_in_production')
+        self.jwt_algorithm = os.environ.get('JWT_ALGORITHM', 'HS256')
+        self.token_service = TokenService.from_env(self.db, self.jwt_secret, self.jwt_algorithm)
+        # Razorpay gateway (blocking SDK calls run on its own thread pool)
+        self.payment_gateway = PaymentGateway.from_env()
+        # Background garbage collector for orphaned uploads and expired sessions
+        self.sweeper = Sweeper.from_env(self.db, self.storage)
+        self.upload_rate_limiter = create_upload_rate_limiter(self.db)
+        self.reextraction_rate_limiter = create_reextraction_rate_limiter(self.db)
+        self.extraction_admission = create_extraction_admission(workers)
+        self.export_cache = create_export_cache(self.db)
+        # Write-behind audit trail; buffered between start() and close()
+        self.audit_log = AuditLog.from_env(self.db)
+        # Change notifications for /events, shared across workers on a replica set
+        self.events = EventHub.from_env(self.db)
+        # Version stamps and tombstones for /sync
+        self.sync_log = SyncLog(self.db)
+        # Flags re-uploaded supplier invoices before they are stored
+        self.duplicate_detector = DuplicateDetector.from_env(self.db)
+        self._tasks: Set[asyncio.Task] = set()
+
+    @classmethod
+    def from_env(cls) -> "Resources":
+        workers = worker_count()
+        pool = mongo_pool_options(workers)
+        client = AsyncIOMotorClient(
+            os.environ['MONGO_URL'],
+            event_listeners=[metrics.MongoCommandMetrics(), MongoCommandTracer()],
+            **pool
+        )
+        if pool:
+            logger.info(f"Mongo pool for this worker ({workers} worker(s)): {pool}")
+        return cls(
+            client,
+            os.environ['DB_NAME'],
+            Path(os.environ.get('UPLOADS_DIR', ROOT_DIR / 'uploads')),
+            workers=workers,
+        )
+
+    def track(self, task: asyncio.Task) -> asyncio.Task:
+        """Keep a background task referenced until it finishes; close() cancels it"""
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def start(self):
+        self.audit_log.start()
+        await self.events.start()
+        self.track(asyncio.create_task(self.sync_log.ensure_indexes()))
+        self.track(asyncio.create_task(gstreturns.ensure_indexes(self.db)))
+        self.track(asyncio.create_task(self.duplicate_detector.ensure_indexes()))
+        self.track(asyncio.create_task(self.sweeper.ensure_indexes()))
+        self.track(asyncio.create_task(reconcile.ensure_indexes(
+            self.db, int(os.environ.get('RECONCILIATION_RETENTION_DAYS', '30'))
+        )))
+        if os.environ.get('SWEEPER_ENABLED', 'true').lower() == 'true':
+            self.sweeper.start()
+        if self.token_service:
+            self.token_service.start()
+        if os.environ.get('WARMUP_ENABLED', 'true').lower() == 'true':
+            # Runs once startup has finished, so the worker accepts traffic before paying for imports
+            self.track(asyncio.create_task(
+                warm_up(delay=float(os.environ.get('WARMUP_DELAY_SECONDS', '1')))
+            ))
+
+    async def close(self):
+        # Ends open event streams so the server is not held up waiting for them
+        await self.events.stop()
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # After the tasks above, which may still record events, and before the client closes
+        await self.audit_log.stop()
+        await self.sweeper.stop()
+        if self.token_service:
+            await self.token_service.stop()
+        if self.payment_gateway:
+            self.payment_gateway.close()
+        await tracer.shutdown()
+        self.client.close()
+
+
+resources = Resources.from_env()
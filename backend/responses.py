@@ -0,0 +1,55 @@
+"""Fast response serialization for documents read back from Mongo"""
+import functools
+from typing import Dict, Optional, get_args
+
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel
+
+def _nested_model(annotation) -> Optional[type]:
+    for candidate in (annotation, *get_args(annotation)):
+        if isinstance(candidate, type) and issubclass(candidate, BaseModel):
+            return candidate
+    return None
+
+@functools.lru_cache(maxsize=None)
+def response_projection(model: type) -> Dict[str, int]:
+    """Mongo projection returning only the fields of a response model.
+
+    Nested models are projected field by field, so e.g. BillSummaryResponse
+    never reads extracted_data.products from disk.
+    """
+    projection = {"_id": 0}
+    for name, field in model.model_fields.items():
+        nested = _nested_model(field.annotation)
+        if nested is not None:
+            projection.update({f"{name}.{sub}": 1 for sub in nested.model_fields})
+        else:
+            projection[name] = 1
+    return projection
+
+@functools.lru_cache(maxsize=None)
+def _response_defaults(model: type) -> tuple:
+    return tuple(
+        (name, field.get_default(call_default_factory=True))
+        for name, field in model.model_fields.items()
+        if not field.is_required()
+    )
+
+def trusted_response(data, model: type) -> ORJSONResponse:
+    """Serialize documents we wrote ourselves straight to JSON bytes.
+
+    Read endpoints fetch documents with response_projection(model), so they
+    already have the response shape; validating each one into a Pydantic model
+    and letting FastAPI validate and encode it again through response_model is
+    pure overhead on large lists. Only missing optional fields are filled in.
+    """
+    return ORJSONResponse(content=with_defaults(data, model))
+
+def with_defaults(data, model: type):
+    """Fill in the model's optional fields missing from projected documents"""
+    defaults = dict(_response_defaults(model))
+    if not defaults:
+        return data
+    if isinstance(data, list):
+        return [{**defaults, **doc} for doc in data]
+    return {**defaults, **data}
@@ -0,0 +1 @@
+"""API routers, one module per domain, mounted under /api by server.py"""
@@ -0,0 +1,165 @@
+"""Dashboard statistics and date-range analysis"""
+import logging
+from datetime import datetime, timezone
+
+from fastapi import APIRouter, Depends, HTTPException
+
+from dependencies import get_current_user
+from models import BillSummaryResponse, DashboardStats
+from resources import resources
+from responses import response_projection
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+db = resources.db
+
+# ==================== DASHBOARD ====================
+
+@router.get("/dashboard/stats", response_model=DashboardStats)
+async def get_dashboard_stats(user: dict = Depends(get_current_user)):
+    total_bills = await db.bills.count_documents({"user_id": user['user_id']})
+    total_customers = await db.customers.count_documents({"user_id": user['user_id']})
+    
+    bills = await db.bills.find(
+        {"user_id": user['user_id']},
+        {"_id": 0, "upload_date": 1, "extracted_data.total_amount": 1, "extracted_data.total_gst": 1}
+    ).to_list(1000)
+    
+    total_sales = 0.0
+    total_gst = 0.0
+    monthly_sales = 0.0
+    monthly_gst = 0.0
+    
+    current_month = datetime.now(timezone.utc).month
+    current_year = datetime.now(timezone.utc).year
+    
+    for bill in bills:
+        data = bill.get('extracted_data', {})
+        if data:
+            amount = data.get('total_amount', 0) or 0
+            gst = data.get('total_gst', 0) or 0
+            total_sales += amount
+            total_gst += gst
+            
+            bill_date = datetime.fromisoformat(bill['upload_date'])
+            if bill_date.month == current_month and bill_date.year == current_year:
+                monthly_sales += amount
+                monthly_gst += gst
+    
+    recent_bills_data = await db.bills.find(
+        {"user_id": user['user_id']},
+        response_projection(BillSummaryResponse)
+    ).sort("upload_date", -1).limit(5).to_list(5)
+    
+    recent_bills = [BillSummaryResponse(**bill) for bill in recent_bills_data]
+    
+    return DashboardStats(
+        total_bills=total_bills,
+        total_customers=total_customers,
+        total_sales=round(total_sales, 2),
+        total_gst=round(total_gst, 2),
+        monthly_sales=round(monthly_sales, 2),
+        monthly_gst=round(monthly_gst, 2),
+        recent_bills=recent_bills
+    )
+
+# ==================== ANALYSIS ====================
+
+@router.get("/analysis/summary")
+async def get_analysis_summary(
+    type: str,
+    start_date: str,
+    end_date: str,
+    user: dict = Depends(get_current_user)
+):
+    """Get analysis summary for selected data type and date range"""
+    try:
+        # Parse dates
+        start = datetime.fromisoformat(start_date).replace(tzinfo=timezone.utc)
+        end = datetime.fromisoformat(end_date).replace(hour=23, minute=59, second=59, tzinfo=timezone.utc)
+        
+        result = {
+            "total_amount": 0.0,
+            "count": 0,
+            "breakdown": {}
+        }
+        
+        if type == "invoices":
+            # Query invoices
+            invoices = await db.invoices.find({
+                "user_id": user['user_id'],
+                "invoice_date": {
+                    "$gte": start.isoformat(),
+                    "$lte": end.isoformat()
+                }
+            }, {"_id": 0}).to_list(1000)
+            
+            result["count"] = len(invoices)
+            result["total_amount"] = sum(inv.get("total_amount", 0) for inv in invoices)
+            
+            # Daily breakdown
+            daily_map = {}
+            customer_map = {}
+            for inv in invoices:
+                date_key = inv["invoice_date"][:10]
+                daily_map[date_key] = daily_map.get(date_key, {"total": 0, "count": 0})
+                daily_map[date_key]["total"] += inv.get("total_amount", 0)
+                daily_map[date_key]["count"] += 1
+                
+                customer = inv.get("customer_name", "Unknown")
+                customer_map[customer] = customer_map.get(customer, {"total": 0, "count": 0})
+                customer_map[customer]["total"] += inv.get("total_amount", 0)
+                customer_map[customer]["count"] += 1
+            
+            result["breakdown"]["daily"] = [
+                {"date": date, "total": data["total"], "count": data["count"]}
+                for date, data in sorted(daily_map.items())
+            ]
+            result["breakdown"]["by_customer"] = [
+                {"customer": cust, "total": data["total"], "count": data["count"]}
+                for cust, data in sorted(customer_map.items(), key=lambda x: x[1]["total"], reverse=True)
+            ][:10]  # Top 10
+            
+        elif type == "bills":
+            # Query bills (purchases/ledger)
+            bills = await db.bills.find({
+                "user_id": user['user_id'],
+                "upload_date": {
+                    "$gte": start.isoformat(),
+                    "$lte": end.isoformat()
+                }
+            }, {"_id": 0}).to_list(1000)
+            
+            result["count"] = len(bills)
+            
+            # Calculate total from extracted data
+            daily_map = {}
+            for bill in bills:
+                extracted = bill.get("extracted_data", {})
+                amount = extracted.get("total_amount", 0) or 0
+                result["total_amount"] += amount
+                
+                date_key = bill["upload_date"][:10]
+                daily_map[date_key] = daily_map.get(date_key, {"total": 0, "count": 0})
+                daily_map[date_key]["total"] += amount
+                daily_map[date_key]["count"] += 1
+            
+            result["breakdown"]["daily"] = [
+                {"date": date, "total": data["total"], "count": data["count"]}
+                for date, data in sorted(daily_map.items())
+            ]
+            
+        elif type == "expenses":
+            # Query expenses (placeholder - returns empty for now)
+            # This will be implemented when expense feature is fully built
+            result["count"] = 0
+            result["total_amount"] = 0.0
+            result["breakdown"]["daily"] = []
+            result["breakdown"]["by_category"] = []
+        
+        return result
+        
+    except Exception as e:
+        logger.error(f"Error in analysis: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Analysis error: {str(e)}")
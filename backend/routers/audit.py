@@ -0,0 +1,31 @@
+"""The user's audit trail"""
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+
+from dependencies import get_current_user
+from resources import resources
+
+router = APIRouter()
+
+audit_log = resources.audit_log
+
+
+@router.get("/audit")
+async def get_audit_log(
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    entity_type: Optional[str] = None,
+    entity_id: Optional[str] = None,
+    action: Optional[str] = None,
+    user: dict = Depends(get_current_user)
+):
+    """Audit entries newest first; pass next_cursor back as cursor for the next page"""
+    try:
+        entries, next_cursor = await audit_log.query(
+            user['user_id'], limit=limit, cursor=cursor,
+            entity_type=entity_type, entity_id=entity_id, action=action
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"entries": entries, "next_cursor": next_cursor}
@@ -0,0 +1,282 @@
+"""Sign-in, sessions and the user's profile"""
+import io
+import logging
+import os
+import uuid
+from datetime import datetime, timezone, timedelta
+from typing import Optional
+
+import httpx
+from fastapi import APIRouter, Cookie, Depends, File, HTTPException, Response, UploadFile
+
+from dependencies import get_current_user, load_user_record, record_audit
+from lazy import lazy_import
+from models import GoogleSessionRequest, RefreshRequest, UserProfileUpdate, UserResponse
+from resources import resources
+from tokens import InvalidToken
+
+Image = lazy_import("PIL.Image")
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+db = resources.db
+storage = resources.storage
+token_service = resources.token_service
+export_cache = resources.export_cache
+
+# Emergent Auth session-data endpoint
+EMERGENT_AUTH_URL = os.environ.get(
+    'EMERGENT_AUTH_URL',
+    'https://demobackend.emergentagent.com/auth/v1/env/oauth/session-data'
+)
+
+def set_auth_cookies(response: Response, access_token: str, max_age: int, refresh_token: Optional[str] = None):
+    response.set_cookie(
+        key="session_token",
+        value=access_token,
+        httponly=True,
+        secure=False,  # Set to True in production with HTTPS
+        samesite="lax",
+        path="/",
+        max_age=max_age
+    )
+    if refresh_token:
+        response.set_cookie(
+            key="refresh_token",
+            value=refresh_token,
+            httponly=True,
+            secure=False,
+            samesite="lax",
+            path="/api/auth",
+            max_age=token_service.refresh_ttl_seconds
+        )
+
+@router.post("/auth/google-session")
+async def process_google_session(session_req: GoogleSessionRequest, response: Response):
+    """Process Google session_id and create user session"""
+    try:
+        logger.info(f"Processing Google session: {session_req.session_id[:20]}...")
+        
+        # Call Emergent Auth API to get user data
+        async with httpx.AsyncClient() as client:
+            auth_response = await client.get(
+                EMERGENT_AUTH_URL,
+                headers={"X-Session-ID": session_req.session_id},
+                timeout=10.0
+            )
+            
+            logger.info(f"Emergent Auth API response status: {auth_response.status_code}")
+            
+            if auth_response.status_code != 200:
+                logger.error(f"Emergent Auth API error: {auth_response.text}")
+                raise HTTPException(
+                    status_code=400, 
+                    detail=f"Invalid session ID or authentication failed: {auth_response.text}"
+                )
+            
+            user_data = auth_response.json()
+            logger.info(f"User data received for: {user_data.get('email', 'unknown')}")
+        
+        # Validate required fields
+        if not user_data.get('email'):
+            raise HTTPException(status_code=400, detail="No email in user data")
+        if not user_data.get('session_token'):
+            raise HTTPException(status_code=400, detail="No session token in user data")
+        
+        # Check if user exists
+        existing_user = await db.users.find_one({"email": user_data["email"]}, {"_id": 0})
+        
+        if existing_user:
+            user_id = existing_user["user_id"]
+            logger.info(f"Existing user found: {user_id}")
+            # Update user info
+            await db.users.update_one(
+                {"user_id": user_id},
+                {"$set": {
+                    "name": user_data.get("name", existing_user.get("name")),
+                    "picture": user_data.get("picture"),
+                    "updated_at": datetime.now(timezone.utc).isoformat()
+                }}
+            )
+        else:
+            # Create new user with custom user_id
+            user_id = f"user_{uuid.uuid4().hex[:12]}"
+            logger.info(f"Creating new user: {user_id}")
+            new_user = {
+                "user_id": user_id,
+                "email": user_data["email"],
+                "name": user_data.get("name", user_data["email"].split('@')[0]),
+                "picture": user_data.get("picture"),
+                "language_preference": "en",
+                "subscription_plan": "free",
+                "bill_count": 0,
+                "created_at": datetime.now(timezone.utc).isoformat()
+            }
+            await db.users.insert_one(new_user)
+        
+        # Delete old sessions for this user
+        if token_service:
+            await token_service.revoke_user(user_id)
+        await db.user_sessions.delete_many({"user_id": user_id})
+        
+        # Get full user data
+        user = await db.users.find_one({"user_id": user_id}, {"_id": 0})
+        await record_audit(user_id, "login", "user", user_id, {"new_user": existing_user is None})
+        
+        if token_service:
+            # Short-lived signed access token plus a rotating refresh token
+            session_id, refresh_token, _ = await token_service.create_session(user_id)
+            session_token = token_service.issue_access(user, session_id)
+            set_auth_cookies(response, session_token, token_service.access_ttl_seconds, refresh_token)
+            logger.info(f"Token session created for user: {user_id}")
+            return {
+                "user": UserResponse(**user),
+                "session_token": session_token,
+                "refresh_token": refresh_token,
+                "expires_in": token_service.access_ttl_seconds,
+                "message": "Authentication successful"
+            }
+        
+        # Create session
+        session_token = user_data["session_token"]
+        expires_at = datetime.now(timezone.utc) + timedelta(days=7)
+        
+        session_doc = {
+            "user_id": user_id,
+            "session_token": session_token,
+            "expires_at": expires_at.isoformat(),
+            "created_at": datetime.now(timezone.utc).isoformat()
+        }
+        await db.user_sessions.insert_one(session_doc)
+        logger.info(f"Session created for user: {user_id}")
+        
+        # Set httpOnly cookie
+        set_auth_cookies(response, session_token, 7 * 24 * 60 * 60)  # 7 days
+        
+        logger.info(f"Authentication successful for: {user['email']}")
+        
+        return {
+            "user": UserResponse(**user),
+            "session_token": session_token,
+            "message": "Authentication successful"
+        }
+        
+    except httpx.RequestError as e:
+        logger.error(f"Error calling Emergent Auth API: {str(e)}")
+        raise HTTPException(
+            status_code=503, 
+            detail="Authentication service unavailable. Please try again later."
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error processing Google session: {str(e)}", exc_info=True)
+        raise HTTPException(
+            status_code=500, 
+            detail=f"Authentication error: {str(e)}"
+        )
+
+@router.get("/auth/me", response_model=UserResponse)
+async def get_me(user: dict = Depends(get_current_user)):
+    """Get current user info"""
+    return UserResponse(**await load_user_record(user))
+
+@router.post("/auth/refresh")
+async def refresh_access_token(
+    response: Response,
+    session_req: Optional[RefreshRequest] = None,
+    refresh_token: Optional[str] = Cookie(None)
+):
+    """Exchange a refresh token for a new access token (AUTH_TOKEN_MODE=jwt)"""
+    if not token_service:
+        raise HTTPException(status_code=404, detail="Token refresh is not enabled")
+    token = (session_req.refresh_token if session_req else None) or refresh_token
+    if not token:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    try:
+        user_id, session_id, new_refresh_token = await token_service.rotate(token)
+    except InvalidToken as e:
+        raise HTTPException(status_code=401, detail=str(e))
+    
+    # Claims are re-read here, so plan changes reach the next access token
+    user = await db.users.find_one({"user_id": user_id}, {"_id": 0})
+    if not user:
+        raise HTTPException(status_code=401, detail="User not found")
+    access_token = token_service.issue_access(user, session_id)
+    set_auth_cookies(response, access_token, token_service.access_ttl_seconds, new_refresh_token)
+    return {
+        "session_token": access_token,
+        "refresh_token": new_refresh_token,
+        "expires_in": token_service.access_ttl_seconds
+    }
+
+@router.post("/auth/logout")
+async def logout(
+    response: Response,
+    user: dict = Depends(get_current_user),
+    session_token: Optional[str] = Cookie(None)
+):
+    """Logout user"""
+    if user.get("session_id") and token_service:
+        await token_service.revoke([user["session_id"]])
+    elif session_token:
+        await db.user_sessions.delete_one({"session_token": session_token})
+    await record_audit(user['user_id'], "logout", "user", user['user_id'])
+    
+    response.delete_cookie(key="session_token", path="/")
+    response.delete_cookie(key="refresh_token", path="/api/auth")
+    return {"message": "Logged out successfully"}
+
+@router.post("/auth/upload-logo")
+async def upload_logo(
+    file: UploadFile = File(...),
+    user: dict = Depends(get_current_user)
+):
+    """Upload business logo"""
+    allowed_types = ['image/jpeg', 'image/jpg', 'image/png', 'image/webp']
+    if file.content_type not in allowed_types:
+        raise HTTPException(status_code=400, detail="Invalid file type. Only JPG, PNG, and WEBP are allowed.")
+    
+    try:
+        file_content = await file.read()
+        
+        # Optimize and resize image
+        img = Image.open(io.BytesIO(file_content))
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        
+        # Resize to max 400x400 for logo
+        max_size = 400
+        img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+        
+        # Save optimized logo
+        logo_key = f"logo_{user['user_id']}.jpg"
+        buffered = io.BytesIO()
+        img.save(buffered, format='JPEG', quality=90, optimize=True)
+        await storage.put(logo_key, buffered.getvalue(), content_type='image/jpeg')
+        
+        # Update user profile with logo path
+        logo_url = f"/uploads/{logo_key}"
+        await db.users.update_one(
+            {"user_id": user['user_id']},
+            {"$set": {"business_logo": logo_url}}
+        )
+        await record_audit(user['user_id'], "upload_logo", "user", user['user_id'])
+        
+        return {"message": "Logo uploaded successfully", "logo_url": logo_url}
+        
+    except Exception as e:
+        logger.error(f"Error uploading logo: {str(e)}")
+        raise HTTPException(status_code=500, detail="Error uploading logo")
+
+@router.put("/auth/profile")
+async def update_profile(profile: UserProfileUpdate, user: dict = Depends(get_current_user)):
+    """Update user profile"""
+    update_data = profile.model_dump(exclude_unset=True)
+    await db.users.update_one({"user_id": user['user_id']}, {"$set": update_data})
+    if 'business_gstin' in update_data:
+        # Cached returns are filed under the old GSTIN
+        await export_cache.invalidate(user['user_id'])
+    await record_audit(user['user_id'], "update_profile", "user", user['user_id'], {"fields": sorted(update_data)})
+    return {"message": "Profile updated successfully"}
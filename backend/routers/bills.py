@@ -0,0 +1,505 @@
+"""Bill upload and extraction, bill CRUD and bulk re-extraction"""
+import asyncio
+import base64
+import logging
+import os
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, List, Literal, Optional, Union
+
+from fastapi import APIRouter, Depends, File, HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+
+import metrics
+from dependencies import get_current_user, load_user_record, publish_event, record_audit
+from extraction import ExtractionRouter, ExtractionDeferred, ModelSpec, RoutedExtraction
+from lazy import lazy_import
+from models import BillExtractedData, BillResponse, BillSummaryResponse, ReextractionRequest
+from postprocess import process_response
+from preprocess import PROFILES, prepare_image, profile_setting
+from reconcile import bill_match_fields
+from reextract import ReextractionJob, ReextractionFilter
+from resources import resources
+from responses import response_projection, trusted_response
+from storage import key_from_locator
+from tracing import tracer, traced
+
+llm_chat = lazy_import("emergentintegrations.llm.chat")
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+db = resources.db
+storage = resources.storage
+upload_rate_limiter = resources.upload_rate_limiter
+reextraction_rate_limiter = resources.reextraction_rate_limiter
+extraction_admission = resources.extraction_admission
+export_cache = resources.export_cache
+sync_log = resources.sync_log
+duplicate_detector = resources.duplicate_detector
+
+EXTRACTION_SYSTEM_MESSAGE = """You are an expert Indian GST bill data extractor. Extract all relevant information from the bill image and return it as a JSON object. 
+            Extract: seller_gstin, seller_name, buyer_gstin, buyer_name, invoice_number, invoice_date, products (array with name, hsn_code, quantity, rate, amount), subtotal, cgst, sgst, igst, total_gst, total_amount.
+            If any field is not found, use null. Also provide a confidence_score (0-1) based on image quality and data clarity.
+            Return ONLY valid JSON, no markdown or extra text."""
+
+def parse_extraction_response(response: str) -> BillExtractedData:
+    """Parse an LLM reply into bill data, repairing malformed JSON and scoring its consistency"""
+    processed = process_response(response)
+    if processed.repairs:
+        logger.info(f"Repaired extraction response: {', '.join(processed.repairs)}")
+    return BillExtractedData(**processed.data)
+
+async def call_vision_model(spec: ModelSpec, image_base64: str) -> BillExtractedData:
+    """Extract bill data with a single vision model"""
+    emergent_key = os.environ.get('EMERGENT_LLM_KEY')
+    if not emergent_key:
+        raise Exception("EMERGENT_LLM_KEY not found")
+    
+    chat = llm_chat.LlmChat(
+        api_key=emergent_key,
+        session_id=str(uuid.uuid4()),
+        system_message=EXTRACTION_SYSTEM_MESSAGE
+    ).with_model(spec.provider, spec.model)
+    
+    image_content = llm_chat.ImageContent(image_base64=image_base64)
+    user_message = llm_chat.UserMessage(
+        text="Extract all GST bill information from this image and return as JSON.",
+        file_contents=[image_content]
+    )
+    
+    metrics.LLM_REQUEST_BYTES.inc(len(image_base64))
+    response = await chat.send_message(user_message)
+    metrics.LLM_RESPONSE_BYTES.inc(len(response.encode('utf-8')))
+    
+    try:
+        return parse_extraction_response(response)
+    except ValueError:
+        # Nothing salvageable in the reply: score it zero so the router escalates
+        logger.error(f"Failed to parse JSON response from {spec.name}: {response}")
+        return BillExtractedData(confidence_score=0.0)
+
+extraction_router = ExtractionRouter.from_env(call_vision_model)
+HEDGE_UPLOAD_EXTRACTIONS = os.environ.get('EXTRACTION_HEDGE_UPLOADS', 'true').lower() == 'true'
+
+@traced("llm.extract_bill_data")
+async def extract_bill_data(image_base64: str, hedge: bool = False) -> RoutedExtraction:
+    """Extract bill data with the cheapest adequate model; raises ExtractionDeferred if none answered"""
+    try:
+        return await extraction_router.extract(image_base64, hedge=hedge)
+    except ExtractionDeferred as e:
+        logger.error(f"Error extracting bill data: {str(e)}")
+        raise
+
+# Checked at import so a mistyped profile stops startup instead of failing every upload
+IMAGE_PROFILE = profile_setting('IMAGE_PROFILE', os.environ.get('IMAGE_PROFILE', 'compact'))
+IMAGE_FALLBACK_PROFILE = profile_setting(
+    'IMAGE_FALLBACK_PROFILE', os.environ.get('IMAGE_FALLBACK_PROFILE', 'full'), allow_empty=True
+)
+
+async def extract_bill_or_defer(file_content: bytes, file_type: str, hedge: bool = False):
+    """Extract bill data as (data, ocr_status, extraction summary); status is "deferred" when no model is available"""
+    if not extraction_router.available():
+        # Every breaker is open: fail fast without spending time on image conversion
+        return BillExtractedData(confidence_score=0.0), "deferred", None
+    image_base64, preprocessing = await asyncio.to_thread(prepare_payload, file_content, file_type, IMAGE_PROFILE)
+    try:
+        routed = await extract_bill_data(image_base64, hedge=hedge)
+    except ExtractionDeferred as e:
+        logger.warning(f"Deferring bill extraction: {e}")
+        return BillExtractedData(confidence_score=0.0), "deferred", None
+    
+    if not routed.accepted and file_type == 'image' and IMAGE_FALLBACK_PROFILE not in ('', IMAGE_PROFILE):
+        # The smaller payload may have lost detail the model needed; retry once at higher fidelity
+        metrics.IMAGE_PROFILE_FALLBACKS_TOTAL.inc()
+        retry_base64, retry_preprocessing = await asyncio.to_thread(
+            prepare_payload, file_content, file_type, IMAGE_FALLBACK_PROFILE
+        )
+        try:
+            retry = await extract_bill_data(retry_base64)
+            if retry.best.rank > routed.best.rank:
+                routed, preprocessing = retry, retry_preprocessing
+        except ExtractionDeferred as e:
+            logger.warning(f"Fallback extraction failed, keeping first result: {e}")
+    
+    summary = routed.summary()
+    summary["preprocessing"] = preprocessing
+    return routed.data, "completed", summary
+
+@traced("image.prepare_payload")
+def prepare_payload(file_content: bytes, file_type: str, profile: str = IMAGE_PROFILE):
+    """Preprocess an upload for the vision model; returns the base64 payload and what was done to it"""
+    try:
+        with metrics.timed(metrics.IMAGE_PROCESSING_DURATION, file_type=file_type.lower()):
+            if file_type.lower() == 'pdf':
+                payload = file_content
+                preprocessing = {"profile": "pdf", "payload_bytes": len(file_content), "original_bytes": len(file_content)}
+            else:
+                prepared = prepare_image(file_content, PROFILES[profile])
+                payload = prepared.data
+                preprocessing = prepared.summary()
+        metrics.IMAGE_PAYLOAD_BYTES.observe(len(payload), profile=preprocessing["profile"])
+        return base64.b64encode(payload).decode('utf-8'), preprocessing
+    except Exception as e:
+        logger.error(f"Error converting file to base64: {str(e)}")
+        raise
+
+def convert_to_base64(file_content: bytes, file_type: str) -> str:
+    """Convert image or PDF to base64 using the configured preprocessing profile"""
+    return prepare_payload(file_content, file_type)[0]
+
+def bill_event(bill_id: str, ocr_status: Optional[str], extracted_data: Optional[dict]) -> dict:
+    """Payload of bill.* events: enough for a dashboard to adjust its totals"""
+    extracted_data = extracted_data or {}
+    return {
+        "id": bill_id,
+        "ocr_status": ocr_status,
+        "total_amount": extracted_data.get('total_amount'),
+        "total_gst": extracted_data.get('total_gst')
+    }
+
+async def upsert_customer_from_bill(user_id: str, extracted_data: BillExtractedData):
+    """Create the bill's buyer as a customer or add to their purchase total"""
+    existing_customer = await db.customers.find_one({
+        "user_id": user_id,
+        "name": extracted_data.buyer_name
+    }, {"_id": 0})
+    
+    if not existing_customer:
+        customer = {
+            "id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "name": extracted_data.buyer_name,
+            "gstin": extracted_data.buyer_gstin,
+            "total_purchases": extracted_data.total_amount or 0.0,
+            "created_at": datetime.now(timezone.utc).isoformat()
+        }
+        await sync_log.insert("customers", customer)
+    else:
+        await sync_log.update(
+            "customers", user_id, existing_customer['id'],
+            {"$inc": {"total_purchases": extracted_data.total_amount or 0.0}}
+        )
+
+async def check_bill_limit(user: dict):
+    """Refuse another bill once a free user has stored 20"""
+    if user.get('subscription_plan') == 'free':
+        user = await load_user_record(user)
+    if user.get('subscription_plan') == 'free' and user.get('bill_count', 0) >= 20:
+        raise HTTPException(status_code=403, detail="Free plan limit reached. Upgrade to Pro for unlimited uploads.")
+
+async def store_bill(bill: dict, extracted_data: BillExtractedData):
+    """Add an extracted bill to the user's books"""
+    user_id = bill['user_id']
+    await sync_log.insert("bills", bill)
+    await export_cache.invalidate(user_id)
+    await record_audit(user_id, "upload_bill", "bill", bill['id'], {"ocr_status": bill['ocr_status']})
+    await publish_event(user_id, "bill.created", bill_event(bill['id'], bill['ocr_status'], bill['extracted_data']))
+    
+    await db.users.update_one(
+        {"user_id": user_id},
+        {"$inc": {"bill_count": 1}}
+    )
+    
+    if extracted_data.buyer_name:
+        with tracer.span("customer.upsert"):
+            await upsert_customer_from_bill(user_id, extracted_data)
+
+@router.post("/bills/upload", response_model=BillResponse)
+async def upload_bill(
+    file: UploadFile = File(...),
+    user: dict = Depends(get_current_user)
+):
+    """Upload and process bill"""
+    await check_bill_limit(user)
+    
+    allowed_types = ['image/jpeg', 'image/jpg', 'image/png', 'application/pdf']
+    if file.content_type not in allowed_types:
+        raise HTTPException(status_code=400, detail="Invalid file type. Only JPG, PNG, and PDF are allowed.")
+    
+    # Only uploads that would be processed spend a token
+    await upload_rate_limiter.check(user)
+    
+    try:
+        with tracer.span("upload.read_file"):
+            file_content = await file.read()
+        file_type = 'pdf' if file.content_type == 'application/pdf' else 'image'
+        
+        file_id = str(uuid.uuid4())
+        file_ext = file.filename.split('.')[-1] if '.' in file.filename else 'jpg'
+        file_key = f"{file_id}.{file_ext}"
+        # Take an extraction slot before storing anything so a busy 503 leaves no orphaned file
+        async with extraction_admission:
+            with tracer.span("storage.put", file_key=file_key, size_bytes=len(file_content)):
+                file_path = await storage.put(file_key, file_content, content_type=file.content_type)
+            
+            # Uploads are interactive, so hedge slow first attempts
+            extracted_data, ocr_status, extraction = await extract_bill_or_defer(
+                file_content, file_type, hedge=HEDGE_UPLOAD_EXTRACTIONS
+            )
+        
+        bill = {
+            "id": file_id,
+            "user_id": user['user_id'],
+            "file_name": file.filename,
+            "file_key": file_key,
+            "file_path": file_path,
+            "file_type": file_type,
+            "upload_date": datetime.now(timezone.utc).isoformat(),
+            "ocr_status": ocr_status,
+            "extracted_data": extracted_data.model_dump(),
+            "match": bill_match_fields(extracted_data.model_dump()),
+            "extraction": extraction
+        }
+        
+        with tracer.span("bill.duplicate_check"):
+            original = await duplicate_detector.find_duplicate(user['user_id'], bill['extracted_data'])
+        if original:
+            # Held rather than stored, so the invoice is not counted twice
+            await duplicate_detector.hold(bill, original['id'])
+            await record_audit(user['user_id'], "hold_duplicate_bill", "bill", file_id, {"duplicate_of": original['id']})
+            # detail stays a string like every other error; the ids ride alongside it
+            return JSONResponse(status_code=409, content={
+                "detail": "This bill looks like a duplicate of one already uploaded",
+                "suspect_id": file_id,
+                "duplicate_of": original['id']
+            })
+        
+        await store_bill(bill, extracted_data)
+        return BillResponse(**bill)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error processing bill: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error processing bill: {str(e)}")
+
+@router.get("/bills", response_model=Union[List[BillSummaryResponse], List[BillResponse]])
+async def get_bills(
+    skip: int = 0,
+    limit: int = 50,
+    view: Literal["summary", "full"] = "summary",
+    user: dict = Depends(get_current_user)
+):
+    """Get all bills for user; product lines are only included with view=full"""
+    model = BillResponse if view == "full" else BillSummaryResponse
+    bills = await db.bills.find(
+        {"user_id": user['user_id']},
+        response_projection(model)
+    ).sort("upload_date", -1).skip(skip).limit(limit).to_list(limit)
+    return trusted_response(bills, model)
+
+@router.get("/bills/{bill_id}", response_model=BillResponse)
+async def get_bill(bill_id: str, user: dict = Depends(get_current_user)):
+    """Get single bill"""
+    bill = await db.bills.find_one({"id": bill_id, "user_id": user['user_id']}, response_projection(BillResponse))
+    if not bill:
+        raise HTTPException(status_code=404, detail="Bill not found")
+    return trusted_response(bill, BillResponse)
+
+async def edit_bill(user_id: str, bill_id: str, extracted_data: BillExtractedData,
+                    base_seq: Optional[int] = None) -> Optional[int]:
+    """Store a hand correction; returns the bill's new version, or None if it is gone or has changed"""
+    if 'products' in extracted_data.model_fields_set:
+        update = {"extracted_data": extracted_data.model_dump()}
+    else:
+        # Edits made from a summary view carry no product lines; keep the stored ones
+        update = {f"extracted_data.{k}": v for k, v in extracted_data.model_dump(exclude={'products'}).items()}
+    update["match"] = bill_match_fields(extracted_data.model_dump())
+    # Marks the bill as hand-corrected so bulk re-extraction leaves it alone
+    update["edited_at"] = datetime.now(timezone.utc).isoformat()
+    seq = await sync_log.update("bills", user_id, bill_id, {"$set": update}, base_seq)
+    if seq is None:
+        return None
+    await export_cache.invalidate(user_id)
+    
+    await record_audit(user_id, "update_bill", "bill", bill_id)
+    await publish_event(user_id, "bill.updated", bill_event(bill_id, None, extracted_data.model_dump()))
+    return seq
+
+async def remove_bill(user_id: str, bill_id: str, base_seq: Optional[int] = None) -> bool:
+    """Delete a bill and its stored file; False if it is gone or has changed"""
+    bill = await db.bills.find_one({"id": bill_id, "user_id": user_id, **sync_log.guard(base_seq)}, {"_id": 0})
+    if not bill:
+        return False
+    
+    file_key = bill.get('file_key') or key_from_locator(bill['file_path'])
+    await storage.delete(file_key)
+    
+    await sync_log.delete("bills", user_id, bill_id)
+    await export_cache.invalidate(user_id)
+    await record_audit(user_id, "delete_bill", "bill", bill_id, {"file_name": bill.get('file_name')})
+    await publish_event(user_id, "bill.deleted", bill_event(bill_id, bill.get('ocr_status'), bill.get('extracted_data')))
+    return True
+
+@router.put("/bills/{bill_id}")
+async def update_bill(
+    bill_id: str,
+    extracted_data: BillExtractedData,
+    user: dict = Depends(get_current_user)
+):
+    """Update bill extracted data"""
+    if await edit_bill(user['user_id'], bill_id, extracted_data) is None:
+        raise HTTPException(status_code=404, detail="Bill not found")
+    return {"message": "Bill updated successfully"}
+
+@router.delete("/bills/{bill_id}")
+async def delete_bill(bill_id: str, user: dict = Depends(get_current_user)):
+    """Delete bill"""
+    if not await remove_bill(user['user_id'], bill_id):
+        raise HTTPException(status_code=404, detail="Bill not found")
+    return {"message": "Bill deleted successfully"}
+
+# ==================== RE-EXTRACTION ====================
+
+reextraction_tasks: Dict[str, asyncio.Task] = {}
+
+async def apply_reextraction(bill: dict, extracted_data: BillExtractedData, summary: dict, job_id: str) -> bool:
+    """Store a re-extracted result the way a bill edit is stored; False if the bill changed since it was read"""
+    seq = await sync_log.update("bills", bill['user_id'], bill['id'], {"$set": {
+        "extracted_data": extracted_data.model_dump(),
+        "match": bill_match_fields(extracted_data.model_dump()),
+        "ocr_status": "completed",
+        "extraction": summary,
+        "reextracted_at": datetime.now(timezone.utc).isoformat()
+    }}, base_seq=bill.get('updated_seq') or 0)
+    if seq is None:
+        return False
+    await export_cache.invalidate(bill['user_id'])
+    await record_audit(bill['user_id'], "reextract_bill", "bill", bill['id'], {
+        "job_id": job_id,
+        "previous_confidence": (bill.get('extracted_data') or {}).get('confidence_score'),
+        "confidence": extracted_data.confidence_score,
+        "model": summary.get('model') if summary else None
+    })
+    await publish_event(bill['user_id'], "bill.updated", bill_event(bill['id'], "completed", extracted_data.model_dump()))
+    return True
+
+async def extract_admitted(file_content: bytes, file_type: str):
+    """extract_bill_or_defer under the upload admission slots; a busy worker defers the bill"""
+    try:
+        async with extraction_admission:
+            return await extract_bill_or_defer(file_content, file_type)
+    except HTTPException as e:
+        if e.status_code != 503:
+            raise
+        return BillExtractedData(confidence_score=0.0), "deferred", None
+
+def create_reextraction_job(filters: ReextractionFilter, job_id: Optional[str] = None,
+                            plan: Optional[str] = None, **kwargs) -> ReextractionJob:
+    """A job whose extractions share admission with uploads; with a plan, it is paced by the user's plan limit"""
+    if plan is not None:
+        kwargs = {"bucket_store": reextraction_rate_limiter.store,
+                  "bucket_limit": reextraction_rate_limiter.limit_for(plan), **kwargs}
+    return ReextractionJob(
+        db, storage, extract_admitted, apply_reextraction,
+        filters=filters, job_id=job_id,
+        **{
+            "concurrency": int(os.environ.get('REEXTRACTION_CONCURRENCY', '2')),
+            "rate_per_minute": float(os.environ.get('REEXTRACTION_RATE_PER_MINUTE', '30')),
+            **kwargs
+        }
+    )
+
+def _job_response(job: dict) -> dict:
+    return {
+        "job_id": job['_id'],
+        "status": job.get('status'),
+        "total": job.get('total', 0),
+        "processed": job.get('processed', 0),
+        "counts": job.get('counts', {}),
+        "throughput": job.get('throughput'),
+        "created_at": job.get('created_at'),
+        "heartbeat_at": job.get('heartbeat_at')
+    }
+
+@router.post("/bills/reextract")
+async def start_reextraction(request: ReextractionRequest, user: dict = Depends(get_current_user)):
+    """Re-extract the user's stored bills in the background"""
+    active = await db.reextraction_jobs.find_one(
+        {"user_id": user['user_id'], "status": {"$in": ["running", "paused", "failed"]}},
+        sort=[("created_at", -1)]
+    )
+    if active and active['_id'] in reextraction_tasks:
+        raise HTTPException(status_code=409, detail="A re-extraction is already running")
+    
+    filters = ReextractionFilter(
+        user_id=user['user_id'],
+        max_confidence=request.max_confidence,
+        since=request.since,
+        until=request.until,
+        statuses=("deferred",) if request.deferred_only else ("completed", "deferred")
+    )
+    # An interrupted job with the same filters is resumed from its checkpoint rather than
+    # restarted; different filters start a new job, since resuming would keep the old ones
+    resume = active is not None and ReextractionFilter.from_doc(active['filters']) == filters
+    job = create_reextraction_job(
+        filters, job_id=active['_id'] if resume else None, plan=user.get('subscription_plan', 'free')
+    )
+    if not await job.claim():
+        raise HTTPException(status_code=409, detail="A re-extraction is already running")
+    
+    task = resources.track(asyncio.create_task(job.run()))
+    reextraction_tasks[job.job_id] = task
+    await record_audit(user['user_id'], "start_reextraction", "reextraction_job", job.job_id)
+    task.add_done_callback(lambda _: reextraction_tasks.pop(job.job_id, None))
+    return _job_response(await db.reextraction_jobs.find_one({"_id": job.job_id}))
+
+@router.get("/bills/reextract/{job_id}")
+async def get_reextraction(job_id: str, user: dict = Depends(get_current_user)):
+    """Progress of a re-extraction job"""
+    job = await db.reextraction_jobs.find_one({"_id": job_id, "user_id": user['user_id']})
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return _job_response(job)
+
+# ==================== DUPLICATES ====================
+
+def _held_response(held: dict) -> dict:
+    return {
+        "suspect_id": held['id'],
+        "duplicate_of": held['duplicate_of'],
+        "file_name": held.get('file_name'),
+        "upload_date": held.get('upload_date'),
+        "extracted_data": held.get('extracted_data'),
+        "held_at": held['held_at'].isoformat()
+    }
+
+@router.get("/bills/duplicates/held")
+async def get_held_duplicates(limit: int = 50, user: dict = Depends(get_current_user)):
+    """Uploads set aside as suspected duplicates, newest first"""
+    held = await db.suspected_duplicates.find(
+        {"user_id": user['user_id']},
+        {"_id": 0, "extracted_data.products": 0}
+    ).sort("held_at", -1).limit(limit).to_list(limit)
+    return [_held_response(h) for h in held]
+
+@router.get("/bills/duplicates/scan")
+async def scan_duplicates(user: dict = Depends(get_current_user)):
+    """Stored bills that repeat an invoice already in the books"""
+    return {"groups": await duplicate_detector.scan(user['user_id'])}
+
+@router.post("/bills/duplicates/{suspect_id}/keep", response_model=BillResponse)
+async def keep_duplicate(suspect_id: str, user: dict = Depends(get_current_user)):
+    """Store a held upload as an ordinary bill"""
+    await check_bill_limit(user)
+    held = await db.suspected_duplicates.find_one_and_delete(
+        {"id": suspect_id, "user_id": user['user_id']}, projection={"_id": 0}
+    )
+    if not held:
+        raise HTTPException(status_code=404, detail="Held bill not found")
+    bill = {k: v for k, v in held.items() if k not in ("duplicate_of", "held_at")}
+    await store_bill(bill, BillExtractedData(**bill['extracted_data']))
+    return BillResponse(**bill)
+
+@router.delete("/bills/duplicates/{suspect_id}")
+async def discard_duplicate(suspect_id: str, user: dict = Depends(get_current_user)):
+    """Drop a held upload and its stored file"""
+    held = await db.suspected_duplicates.find_one_and_delete(
+        {"id": suspect_id, "user_id": user['user_id']}, projection={"_id": 0, "id": 1, "file_key": 1}
+    )
+    if not held:
+        raise HTTPException(status_code=404, detail="Held bill not found")
+    await storage.delete(held['file_key'])
+    await record_audit(user['user_id'], "discard_duplicate_bill", "bill", suspect_id)
+    return {"message": "Duplicate discarded"}
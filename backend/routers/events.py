@@ -0,0 +1,48 @@
+"""Server-Sent Events stream of the user's changes"""
+import json
+import os
+from contextlib import aclosing
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header
+from fastapi.responses import StreamingResponse
+
+from dependencies import get_current_user
+from events import HEARTBEAT
+from resources import resources
+
+router = APIRouter()
+
+hub = resources.events
+
+# How long browsers wait before reconnecting a dropped stream
+EVENTS_RETRY_MS = int(os.environ.get('EVENTS_RETRY_MS', '3000'))
+
+
+def format_event(event: dict) -> str:
+    lines = [f"id: {event['_id']}"] if "_id" in event else []
+    lines.append(f"event: {event['type']}")
+    lines.append(f"data: {json.dumps(event['data'], default=str)}")
+    return "\n".join(lines) + "\n\n"
+
+
+@router.get("/events")
+async def stream_events(
+    last_event_id: Optional[str] = None,
+    last_event_id_header: Optional[str] = Header(None, alias="Last-Event-ID"),
+    user: dict = Depends(get_current_user)
+):
+    """Live bill, invoice and totals changes; reconnect with Last-Event-ID to catch up"""
+    resume_from = last_event_id_header or last_event_id
+
+    async def stream():
+        yield f"retry: {EVENTS_RETRY_MS}\n\n"
+        async with aclosing(hub.follow(user['user_id'], resume_from)) as items:
+            async for item in items:
+                yield ": ping\n\n" if item is HEARTBEAT else format_event(item)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
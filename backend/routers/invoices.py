@@ -0,0 +1,192 @@
+"""Customers, products and sales invoices"""
+import uuid
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+
+from dependencies import get_current_user, publish_event, record_audit
+from models import CustomerBase, CustomerResponse, InvoiceCreate, InvoiceResponse, ProductBase, ProductResponse
+from resources import resources
+from responses import response_projection, trusted_response
+
+router = APIRouter()
+
+db = resources.db
+sync_log = resources.sync_log
+export_cache = resources.export_cache
+
+# ==================== CUSTOMERS ====================
+
+async def insert_customer(user_id: str, customer: CustomerBase, customer_id: Optional[str] = None) -> dict:
+    customer_data = customer.model_dump()
+    customer_data.update({
+        "id": customer_id or str(uuid.uuid4()),
+        "user_id": user_id,
+        "total_purchases": 0.0,
+        "created_at": datetime.now(timezone.utc).isoformat()
+    })
+    await sync_log.insert("customers", customer_data)
+    await record_audit(user_id, "create_customer", "customer", customer_data['id'])
+    return customer_data
+
+async def update_record(kind: str, user_id: str, record_id: str, fields: dict,
+                        base_seq: Optional[int] = None) -> Optional[int]:
+    """Update a customer or product; returns its new version, or None if it is gone or has changed"""
+    seq = await sync_log.update(f"{kind}s", user_id, record_id, {"$set": fields}, base_seq)
+    if seq is not None:
+        await record_audit(user_id, f"update_{kind}", kind, record_id)
+    return seq
+
+async def delete_record(kind: str, user_id: str, record_id: str, base_seq: Optional[int] = None) -> bool:
+    """Delete a customer or product; False if it is gone or has changed"""
+    deleted = await sync_log.delete(f"{kind}s", user_id, record_id, base_seq)
+    if deleted:
+        await record_audit(user_id, f"delete_{kind}", kind, record_id)
+    return deleted
+
+@router.post("/customers", response_model=CustomerResponse)
+async def create_customer(customer: CustomerBase, user: dict = Depends(get_current_user)):
+    return CustomerResponse(**await insert_customer(user['user_id'], customer))
+
+@router.get("/customers", response_model=List[CustomerResponse])
+async def get_customers(user: dict = Depends(get_current_user)):
+    customers = await db.customers.find({"user_id": user['user_id']}, response_projection(CustomerResponse)).to_list(1000)
+    return trusted_response(customers, CustomerResponse)
+
+@router.put("/customers/{customer_id}")
+async def update_customer(
+    customer_id: str,
+    customer: CustomerBase,
+    user: dict = Depends(get_current_user)
+):
+    if await update_record("customer", user['user_id'], customer_id, customer.model_dump(exclude_unset=True)) is None:
+        raise HTTPException(status_code=404, detail="Customer not found")
+    return {"message": "Customer updated successfully"}
+
+@router.delete("/customers/{customer_id}")
+async def delete_customer(customer_id: str, user: dict = Depends(get_current_user)):
+    if not await delete_record("customer", user['user_id'], customer_id):
+        raise HTTPException(status_code=404, detail="Customer not found")
+    return {"message": "Customer deleted successfully"}
+
+# ==================== PRODUCTS ====================
+
+async def insert_product(user_id: str, product: ProductBase, product_id: Optional[str] = None) -> dict:
+    product_data = product.model_dump()
+    product_data.update({
+        "id": product_id or str(uuid.uuid4()),
+        "user_id": user_id,
+        "created_at": datetime.now(timezone.utc).isoformat()
+    })
+    await sync_log.insert("products", product_data)
+    await record_audit(user_id, "create_product", "product", product_data['id'])
+    return product_data
+
+@router.post("/products", response_model=ProductResponse)
+async def create_product(product: ProductBase, user: dict = Depends(get_current_user)):
+    return ProductResponse(**await insert_product(user['user_id'], product))
+
+@router.get("/products", response_model=List[ProductResponse])
+async def get_products(user: dict = Depends(get_current_user)):
+    products = await db.products.find({"user_id": user['user_id']}, response_projection(ProductResponse)).to_list(1000)
+    return trusted_response(products, ProductResponse)
+
+@router.put("/products/{product_id}")
+async def update_product(
+    product_id: str,
+    product: ProductBase,
+    user: dict = Depends(get_current_user)
+):
+    if await update_record("product", user['user_id'], product_id, product.model_dump(exclude_unset=True)) is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+    return {"message": "Product updated successfully"}
+
+@router.delete("/products/{product_id}")
+async def delete_product(product_id: str, user: dict = Depends(get_current_user)):
+    if not await delete_record("product", user['user_id'], product_id):
+        raise HTTPException(status_code=404, detail="Product not found")
+    return {"message": "Product deleted successfully"}
+
+# ==================== INVOICES ====================
+
+async def insert_invoice(user_id: str, invoice_data: InvoiceCreate, invoice_id: Optional[str] = None) -> dict:
+    subtotal = sum(item.amount for item in invoice_data.items)
+    
+    gst_rate = 0.18
+    
+    if invoice_data.customer_gstin:
+        igst = round(subtotal * gst_rate, 2)
+        cgst = 0.0
+        sgst = 0.0
+    else:
+        cgst = round(subtotal * (gst_rate / 2), 2)
+        sgst = round(subtotal * (gst_rate / 2), 2)
+        igst = 0.0
+    
+    total_gst = cgst + sgst + igst
+    total_amount = subtotal + total_gst
+    
+    invoice_count = await db.invoices.count_documents({"user_id": user_id})
+    invoice_number = f"INV-{user_id[:8].upper()}-{invoice_count + 1:04d}"
+    
+    invoice = {
+        "id": invoice_id or str(uuid.uuid4()),
+        "user_id": user_id,
+        "invoice_number": invoice_number,
+        "invoice_date": datetime.now(timezone.utc).isoformat(),
+        "customer_id": invoice_data.customer_id,
+        "customer_name": invoice_data.customer_name,
+        "customer_gstin": invoice_data.customer_gstin,
+        "customer_address": invoice_data.customer_address,
+        "items": [item.model_dump() for item in invoice_data.items],
+        "subtotal": subtotal,
+        "cgst": cgst,
+        "sgst": sgst,
+        "igst": igst,
+        "total_gst": total_gst,
+        "total_amount": total_amount,
+        "notes": invoice_data.notes,
+        "created_at": datetime.now(timezone.utc).isoformat()
+    }
+    
+    await sync_log.insert("invoices", invoice)
+    # Cached GST returns include this invoice's period
+    await export_cache.invalidate(user_id)
+    await record_audit(user_id, "create_invoice", "invoice", invoice['id'], {
+        "invoice_number": invoice_number,
+        "total_amount": total_amount
+    })
+    await publish_event(user_id, "invoice.created", {
+        "id": invoice['id'],
+        "invoice_number": invoice_number,
+        "total_amount": total_amount,
+        "total_gst": total_gst
+    })
+    return invoice
+
+@router.post("/invoices", response_model=InvoiceResponse)
+async def create_invoice(
+    invoice_data: InvoiceCreate,
+    user: dict = Depends(get_current_user)
+):
+    return InvoiceResponse(**await insert_invoice(user['user_id'], invoice_data))
+
+@router.get("/invoices", response_model=List[InvoiceResponse])
+async def get_invoices(
+    skip: int = 0,
+    limit: int = 50,
+    user: dict = Depends(get_current_user)
+):
+    invoices = await db.invoices.find(
+        {"user_id": user['user_id']},
+        response_projection(InvoiceResponse)
+    ).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
+    return trusted_response(invoices, InvoiceResponse)
+
+@router.get("/invoices/{invoice_id}", response_model=InvoiceResponse)
+async def get_invoice(invoice_id: str, user: dict = Depends(get_current_user)):
+    invoice = await db.invoices.find_one({"id": invoice_id, "user_id": user['user_id']}, response_projection(InvoiceResponse))
+    if not invoice:
+        raise HTTPException(status_code=404, detail="Invoice not found")
+    return trusted_response(invoice, InvoiceResponse)
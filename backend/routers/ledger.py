@@ -0,0 +1,145 @@
+"""Purchase ledger view and its Excel/CSV export"""
+import asyncio
+import csv
+import io
+from typing import Dict, List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+
+from compression import precompress, encoded_response
+from dependencies import get_current_user
+from lazy import lazy_import
+from resources import resources
+
+openpyxl = lazy_import("openpyxl")
+openpyxl_styles = lazy_import("openpyxl.styles")
+
+router = APIRouter()
+
+db = resources.db
+export_cache = resources.export_cache
+
+LEDGER_EXPORT_HEADERS = ["Date", "Customer", "Invoice No", "Products", "Subtotal", "CGST", "SGST", "IGST", "Total GST", "Total Amount"]
+
+def build_ledger_entries(bills: List[dict]) -> List[dict]:
+    """Build ledger rows from bill documents"""
+    ledger_entries = []
+    for bill in bills:
+        data = bill.get('extracted_data', {})
+        if data:
+            ledger_entries.append({
+                "date": bill['upload_date'],
+                "customer": data.get('buyer_name', 'N/A'),
+                "invoice_number": data.get('invoice_number', 'N/A'),
+                "products": len(data.get('products', [])),
+                "subtotal": data.get('subtotal', 0),
+                "cgst": data.get('cgst', 0),
+                "sgst": data.get('sgst', 0),
+                "igst": data.get('igst', 0),
+                "total_gst": data.get('total_gst', 0),
+                "total_amount": data.get('total_amount', 0)
+            })
+    return ledger_entries
+
+def build_ledger_workbook(bills: List[dict]) -> io.BytesIO:
+    """Render bill documents as an Excel ledger"""
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = "Ledger"
+    
+    ws.append(LEDGER_EXPORT_HEADERS)
+    
+    for cell in ws[1]:
+        cell.font = openpyxl_styles.Font(bold=True)
+        cell.fill = openpyxl_styles.PatternFill(start_color="0F766E", end_color="0F766E", fill_type="solid")
+        cell.alignment = openpyxl_styles.Alignment(horizontal="center")
+    
+    for bill in bills:
+        data = bill.get('extracted_data', {})
+        if data:
+            ws.append([
+                bill['upload_date'][:10],
+                data.get('buyer_name', 'N/A'),
+                data.get('invoice_number', 'N/A'),
+                len(data.get('products', [])),
+                data.get('subtotal', 0),
+                data.get('cgst', 0),
+                data.get('sgst', 0),
+                data.get('igst', 0),
+                data.get('total_gst', 0),
+                data.get('total_amount', 0)
+            ])
+    
+    excel_file = io.BytesIO()
+    wb.save(excel_file)
+    excel_file.seek(0)
+    return excel_file
+
+def build_ledger_csv(bills: List[dict]) -> bytes:
+    """Render bill documents as a CSV ledger"""
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(LEDGER_EXPORT_HEADERS)
+    for entry in build_ledger_entries(bills):
+        writer.writerow([
+            entry["date"][:10],
+            entry["customer"],
+            entry["invoice_number"],
+            entry["products"],
+            entry["subtotal"],
+            entry["cgst"],
+            entry["sgst"],
+            entry["igst"],
+            entry["total_gst"],
+            entry["total_amount"]
+        ])
+    return output.getvalue().encode('utf-8')
+
+EXPORT_MEDIA_TYPES = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "text/csv; charset=utf-8",
+}
+
+def render_ledger_export(bills: List[dict], export_format: str) -> Dict[str, bytes]:
+    if export_format == "xlsx":
+        # xlsx is already a zip archive; compressing it again gains nothing
+        return {"identity": build_ledger_workbook(bills).getvalue()}
+    return precompress(build_ledger_csv(bills))
+
+@router.get("/ledger")
+async def get_ledger(
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    customer: Optional[str] = None,
+    user: dict = Depends(get_current_user)
+):
+    """Get ledger entries"""
+    query = {"user_id": user['user_id']}
+    
+    bills = await db.bills.find(query, {"_id": 0}).sort("upload_date", -1).to_list(1000)
+    
+    return {"entries": build_ledger_entries(bills)}
+
+@router.get("/ledger/export")
+async def export_ledger(
+    request: Request,
+    format: str = "xlsx",
+    user: dict = Depends(get_current_user)
+):
+    """Export ledger to Excel or CSV"""
+    if format not in EXPORT_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="Invalid export format. Use xlsx or csv.")
+    
+    variants = await export_cache.get(user['user_id'], format)
+    if variants is None:
+        generation = await export_cache.generation(user['user_id'])
+        bills = await db.bills.find({"user_id": user['user_id']}, {"_id": 0}).sort("upload_date", -1).to_list(1000)
+        variants = await asyncio.to_thread(render_ledger_export, bills, format)
+        await export_cache.put(user['user_id'], format, generation, variants)
+    
+    return encoded_response(
+        variants,
+        request.headers.get("accept-encoding", ""),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f"attachment; filename=ledger.{format}"}
+    )
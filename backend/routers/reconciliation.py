@@ -0,0 +1,119 @@
+"""Input-tax-credit reconciliation against GSTR-2B"""
+import asyncio
+import os
+import tempfile
+from typing import Dict, Literal, Optional, Tuple
+
+from fastapi import APIRouter, Depends, File, Form, HTTPException, UploadFile
+
+from dependencies import get_current_user, record_audit
+from gstreturns import parse_period
+from reconcile import ReconciliationJob, parse_cursor
+from resources import resources
+
+router = APIRouter()
+
+db = resources.db
+
+MAX_UPLOAD_BYTES = int(os.environ.get('RECONCILIATION_MAX_UPLOAD_MB', '200')) * 1024 * 1024
+
+# Running jobs on this worker, with the user each belongs to
+reconciliation_tasks: Dict[str, Tuple[str, asyncio.Task]] = {}
+
+def _spool(source) -> Optional[str]:
+    """Copy an upload to a temporary file; None if it is over the size limit"""
+    fd, path = tempfile.mkstemp(prefix="gstr2b-", suffix=".json")
+    copied = 0
+    with os.fdopen(fd, "wb") as target:
+        while chunk := source.read(1024 * 1024):
+            copied += len(chunk)
+            if copied > MAX_UPLOAD_BYTES:
+                break
+            target.write(chunk)
+    if copied > MAX_UPLOAD_BYTES:
+        os.remove(path)
+        return None
+    return path
+
+def _job_response(job: dict) -> dict:
+    return {
+        "job_id": job['_id'],
+        "status": job.get('status'),
+        "period": job.get('period'),
+        "rows": job.get('rows', 0),
+        "counts": job.get('counts', {}),
+        "error": job.get('error'),
+        "created_at": job.get('created_at'),
+        "heartbeat_at": job.get('heartbeat_at'),
+        "finished_at": job.get('finished_at')
+    }
+
+@router.post("/reconciliation/gstr2b")
+async def start_reconciliation(
+    file: UploadFile = File(...),
+    period: Optional[str] = Form(None),
+    user: dict = Depends(get_current_user)
+):
+    """Reconcile the user's bills against a GSTR-2B JSON file in the background.
+
+    The period (MMYYYY) defaults to the file's own return period and decides
+    which bills are reported as missing from GSTR-2B.
+    """
+    if period is not None:
+        try:
+            parse_period(period)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    if any(task_user == user['user_id'] for task_user, _ in reconciliation_tasks.values()):
+        raise HTTPException(status_code=409, detail="A reconciliation is already running")
+
+    path = await asyncio.to_thread(_spool, file.file)
+    if path is None:
+        raise HTTPException(status_code=413, detail="GSTR-2B file is too large")
+
+    job = ReconciliationJob.from_env(db, user['user_id'], path, period)
+    created = await job.create()
+    task = resources.track(asyncio.create_task(job.run()))
+    reconciliation_tasks[job.job_id] = (user['user_id'], task)
+    task.add_done_callback(lambda _: reconciliation_tasks.pop(job.job_id, None))
+    await record_audit(user['user_id'], "start_reconciliation", "reconciliation_job", job.job_id,
+                       {"file_name": file.filename})
+    return _job_response(created)
+
+@router.get("/reconciliation/{job_id}")
+async def get_reconciliation(job_id: str, user: dict = Depends(get_current_user)):
+    """Progress and outcome counts of a reconciliation"""
+    job = await db.reconciliation_jobs.find_one({"_id": job_id, "user_id": user['user_id']})
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return _job_response(job)
+
+@router.get("/reconciliation/{job_id}/items")
+async def get_reconciliation_items(
+    job_id: str,
+    status: Optional[Literal["matched", "mismatched", "missing_in_books", "missing_in_2b"]] = None,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    user: dict = Depends(get_current_user)
+):
+    """Reconciled rows in the order they were produced; pass next_cursor to page on"""
+    if not await db.reconciliation_jobs.find_one({"_id": job_id, "user_id": user['user_id']}, {"_id": 1}):
+        raise HTTPException(status_code=404, detail="Job not found")
+    try:
+        after = parse_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    limit = max(1, min(limit, 500))
+
+    query = {"job_id": job_id}
+    if status:
+        query["status"] = status
+    if after is not None:
+        query["_id"] = {"$gt": after}
+    items = await db.reconciliation_items.find(
+        query, {"job_id": 0, "user_id": 0, "created_at": 0}
+    ).sort("_id", 1).limit(limit).to_list(limit)
+    next_cursor = str(items[-1]['_id']) if len(items) == limit else None
+    for item in items:
+        del item['_id']
+    return {"items": items, "next_cursor": next_cursor}
@@ -0,0 +1,52 @@
+"""GSTR-1 and GSTR-3B returns for a filing period"""
+import asyncio
+
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Request
+
+import gstreturns
+from compression import encoded_response, precompress
+from dependencies import get_current_user, load_user_record
+from resources import resources
+
+router = APIRouter()
+
+db = resources.db
+export_cache = resources.export_cache
+
+RETURN_BUILDERS = {
+    "gstr1": gstreturns.build_gstr1,
+    "gstr3b": gstreturns.build_gstr3b,
+}
+
+@router.get("/returns/{return_type}")
+async def get_return(
+    return_type: str,
+    period: str,
+    request: Request,
+    user: dict = Depends(get_current_user)
+):
+    """A return in the portal's JSON format for the period (MMYYYY); cached until bills or invoices change"""
+    if return_type not in RETURN_BUILDERS:
+        raise HTTPException(status_code=404, detail="Unknown return. Use gstr1 or gstr3b.")
+    try:
+        gstreturns.parse_period(period)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    cache_key = f"{return_type}:{period}"
+    variants = await export_cache.get(user['user_id'], cache_key)
+    if variants is None:
+        gstin = (await load_user_record(user)).get('business_gstin')
+        if not gstin:
+            raise HTTPException(status_code=400, detail="Add your business GSTIN to your profile to generate returns")
+        generation = await export_cache.generation(user['user_id'])
+        built = await RETURN_BUILDERS[return_type](db, user['user_id'], gstin.strip().upper(), period)
+        variants = await asyncio.to_thread(precompress, orjson.dumps(built))
+        await export_cache.put(user['user_id'], cache_key, generation, variants)
+
+    return encoded_response(
+        variants,
+        request.headers.get("accept-encoding", ""),
+        media_type="application/json"
+    )
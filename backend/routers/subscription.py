@@ -0,0 +1,107 @@
+"""Paid plans: Razorpay orders, checkout verification and webhooks"""
+import logging
+import uuid
+from datetime import datetime, timezone
+
+from fastapi import APIRouter, Depends, Form, HTTPException, Request
+
+import metrics
+from dependencies import get_current_user, record_audit
+from models import SubscriptionOrder
+from payments import GatewayTimeout, activate_order, handle_webhook
+from resources import resources
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+db = resources.db
+payment_gateway = resources.payment_gateway
+
+@router.post("/subscription/create-order")
+async def create_subscription_order(
+    order: SubscriptionOrder,
+    user: dict = Depends(get_current_user)
+):
+    """Create Razorpay order for subscription"""
+    if not payment_gateway:
+        raise HTTPException(status_code=500, detail="Payment gateway not configured")
+    
+    pricing = {
+        "pro": {"monthly": 49900, "yearly": 499900},
+        "business": {"monthly": 99900, "yearly": 999900}
+    }
+    
+    amount = pricing.get(order.plan, {}).get(order.billing_cycle, 0)
+    if amount == 0:
+        raise HTTPException(status_code=400, detail="Invalid plan or billing cycle")
+    
+    transaction_id = str(uuid.uuid4())
+    try:
+        razorpay_order = await payment_gateway.create_order(
+            amount, receipt=transaction_id, notes={"user_id": user['user_id'], "plan": order.plan}
+        )
+    except GatewayTimeout:
+        logger.error("Timed out creating Razorpay order")
+        raise HTTPException(status_code=504, detail="Payment gateway timed out")
+    except Exception as e:
+        logger.error(f"Error creating Razorpay order: {str(e)}")
+        raise HTTPException(status_code=500, detail="Error creating payment order")
+    
+    transaction = {
+        "id": transaction_id,
+        "user_id": user['user_id'],
+        "order_id": razorpay_order['id'],
+        "plan": order.plan,
+        "billing_cycle": order.billing_cycle,
+        "amount": amount,
+        "status": "created",
+        "idempotency_keys": [],
+        "created_at": datetime.now(timezone.utc).isoformat()
+    }
+    await db.transactions.insert_one(transaction)
+    await record_audit(user['user_id'], "create_order", "transaction", transaction_id, {
+        "plan": order.plan, "billing_cycle": order.billing_cycle, "amount": amount
+    })
+    
+    return {
+        "order_id": razorpay_order['id'],
+        "amount": amount,
+        "currency": "INR",
+        "key_id": payment_gateway.key_id
+    }
+
+@router.post("/subscription/verify")
+async def verify_subscription(
+    payment_id: str = Form(...),
+    order_id: str = Form(...),
+    signature: str = Form(...),
+    user: dict = Depends(get_current_user)
+):
+    """Verify Razorpay payment from the checkout callback; the webhook may already have activated it"""
+    if not payment_gateway:
+        raise HTTPException(status_code=500, detail="Payment gateway not configured")
+    if not payment_gateway.verify_payment_signature(order_id, payment_id, signature):
+        raise HTTPException(status_code=400, detail="Invalid payment signature")
+    
+    outcome, transaction = await activate_order(
+        db, order_id, payment_id, f"payment:{payment_id}", source="client", user_id=user['user_id'],
+        audit=record_audit
+    )
+    if outcome == "not_found":
+        raise HTTPException(status_code=404, detail="Transaction not found")
+    return {"message": "Subscription activated successfully", "plan": transaction['plan']}
+
+@router.post("/subscription/webhook")
+async def subscription_webhook(request: Request):
+    """Razorpay webhook: activates plans server-side, independent of the client round-trip"""
+    if not payment_gateway or not payment_gateway.webhook_secret:
+        raise HTTPException(status_code=503, detail="Payment webhook not configured")
+    body = await request.body()
+    if not payment_gateway.verify_webhook_signature(body, request.headers.get("X-Razorpay-Signature")):
+        metrics.PAYMENT_WEBHOOKS_TOTAL.inc(event="unknown", outcome="bad_signature")
+        raise HTTPException(status_code=400, detail="Invalid webhook signature")
+    try:
+        outcome = await handle_webhook(db, body, request.headers.get("X-Razorpay-Event-Id"), audit=record_audit)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Malformed webhook body")
+    return {"status": outcome}
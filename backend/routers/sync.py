@@ -0,0 +1,121 @@
+"""Delta sync for offline-first clients: pull changes since a version, push queued edits"""
+from functools import partial
+
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import ORJSONResponse
+
+from dependencies import get_current_user
+from models import (
+    BillExtractedData, BillResponse, CustomerBase, CustomerResponse, InvoiceCreate, InvoiceResponse,
+    ProductBase, ProductResponse, SyncChange, SyncPushRequest
+)
+from resources import resources
+from responses import response_projection, with_defaults
+from routers.bills import edit_bill, remove_bill
+from routers.invoices import delete_record, insert_customer, insert_invoice, insert_product, update_record
+
+router = APIRouter()
+
+db = resources.db
+sync_log = resources.sync_log
+
+SYNC_MODELS = {
+    "bills": BillResponse,
+    "customers": CustomerResponse,
+    "products": ProductResponse,
+    "invoices": InvoiceResponse,
+}
+SYNC_PROJECTIONS = {name: response_projection(model) for name, model in SYNC_MODELS.items()}
+
+# Records a client may create offline, with the model their data must match
+SYNC_CREATES = {
+    "customers": (CustomerBase, insert_customer),
+    "products": (ProductBase, insert_product),
+    "invoices": (InvoiceCreate, insert_invoice),
+}
+SYNC_UPDATES = {
+    "customers": CustomerBase,
+    "products": ProductBase,
+}
+
+@router.get("/sync")
+async def pull_changes(
+    since: int = Query(0, ge=0),
+    limit: int = Query(500, ge=1, le=1000),
+    user: dict = Depends(get_current_user)
+):
+    """Records changed and deleted after version ``since``; 0 returns everything.
+
+    Ask again with the returned ``version`` while ``has_more`` is set. With
+    ``reset`` the client was too far behind to be told about every deletion
+    and should replace its local copy with this snapshot.
+    """
+    result = await sync_log.changes(user['user_id'], since, limit, SYNC_PROJECTIONS)
+    for name, docs in result["changes"].items():
+        result["changes"][name] = with_defaults(docs, SYNC_MODELS[name])
+    return ORJSONResponse(content=result)
+
+async def create_change(user_id: str, change: SyncChange):
+    """Create a record under the client's id; None if that id already exists"""
+    if change.collection not in SYNC_CREATES:
+        raise ValueError("Bills are created by uploading them")
+    model, insert = SYNC_CREATES[change.collection]
+    record = model(**change.data)
+    existing = await db[change.collection].find_one({"id": change.id}, {"_id": 0, "user_id": 1})
+    if existing and existing['user_id'] != user_id:
+        raise ValueError("This id is already in use")
+    if existing:
+        # Usually a push retried after its response was lost; the stored record is returned as a conflict
+        return None
+    return (await insert(user_id, record, change.id))['updated_seq']
+
+async def apply_change(user_id: str, change: SyncChange) -> dict:
+    """Apply one queued edit; changes made on the server since ``base_seq`` are reported as a conflict"""
+    kind = change.collection[:-1]
+    result = {"collection": change.collection, "id": change.id}
+    try:
+        if change.op == "delete":
+            if change.collection == "invoices":
+                raise ValueError("Invoices cannot be deleted once issued")
+            remove = remove_bill if change.collection == "bills" else partial(delete_record, kind)
+            applied, seq = await remove(user_id, change.id, change.base_seq), None
+        elif change.base_seq is None:
+            seq = await create_change(user_id, change)
+            applied = seq is not None
+        else:
+            if change.collection == "bills":
+                seq = await edit_bill(user_id, change.id, BillExtractedData(**change.data), change.base_seq)
+            elif change.collection in SYNC_UPDATES:
+                fields = SYNC_UPDATES[change.collection](**change.data).model_dump(exclude_unset=True)
+                seq = await update_record(kind, user_id, change.id, fields, change.base_seq)
+            else:
+                raise ValueError("Invoices cannot be changed once issued")
+            applied = seq is not None
+    except ValueError as e:
+        return {**result, "status": "rejected", "detail": str(e)}
+
+    if applied:
+        return {**result, "status": "applied", "updated_seq": seq}
+    current = await db[change.collection].find_one(
+        {"id": change.id, "user_id": user_id}, SYNC_PROJECTIONS[change.collection]
+    )
+    if current is None and change.op == "delete":
+        # Already deleted, which is what the client wanted
+        return {**result, "status": "applied", "updated_seq": None}
+    return {
+        **result,
+        "status": "conflict",
+        "current": with_defaults(current, SYNC_MODELS[change.collection]) if current else None
+    }
+
+@router.post("/sync/push")
+async def push_changes(request: SyncPushRequest, user: dict = Depends(get_current_user)):
+    """Apply a batch of offline edits in order.
+
+    Each result is ``applied`` (with the record's new ``updated_seq``),
+    ``conflict`` (with the server's ``current`` record, or None if it was
+    deleted) or ``rejected`` (with a ``detail``). One failed edit does not
+    stop the rest of the batch.
+    """
+    results = [await apply_change(user['user_id'], change) for change in request.changes]
+    return ORJSONResponse(content={"results": results})
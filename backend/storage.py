@@ -0,0 +1,302 @@
+"""Blob storage backends for uploaded bills and logos.
+
+Files are addressed by a flat key such as ``{uuid}.{ext}`` or
+``logo_{user_id}.jpg``. The backend decides where the bytes actually live:
+
+* ``LocalShardedStorage`` spreads keys over two levels of hash-prefix
+  subdirectories (``ab/cd/{key}``) so no single directory grows unbounded.
+  Keys written by older versions directly into the upload root are still
+  found.
+* ``S3Storage`` talks to any S3-compatible endpoint (AWS, MinIO, ...) and can
+  hand out presigned URLs so downloads bypass the app server.
+
+All blocking I/O runs in worker threads via ``asyncio.to_thread``.
+"""
+import abc
+import asyncio
+import hashlib
+import itertools
+import logging
+import os
+from pathlib import Path
+from typing import AsyncIterator, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class BlobStorage(abc.ABC):
+    """Base interface for upload storage backends"""
+
+    name = "base"
+    supports_presigned_urls = False
+
+    @abc.abstractmethod
+    async def put(self, key: str, data: bytes, content_type: Optional[str] = None) -> str:
+        """Store bytes under key and return a backend locator for the blob"""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def get(self, key: str) -> Optional[bytes]:
+        """Return the blob content or None if it does not exist"""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def delete(self, key: str) -> bool:
+        """Delete the blob, returning True if something was removed"""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def exists(self, key: str) -> bool:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def modified_at(self, key: str) -> Optional[float]:
+        """Last modification time as a POSIX timestamp, or None if missing"""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def list_keys(self, batch_size: int = 1000) -> AsyncIterator[List[str]]:
+        """Yield stored keys in batches"""
+        raise NotImplementedError
+
+    async def presigned_url(self, key: str, expires_in: int = 3600) -> Optional[str]:
+        return None
+
+    def local_path(self, key: str) -> Optional[Path]:
+        """Filesystem path of the blob, for backends that keep files on local disk"""
+        return None
+
+
+def key_from_locator(locator: str) -> str:
+    """Recover the storage key from a stored file_path / locator value"""
+    return Path(locator).name
+
+
+def validate_key(key: str) -> str:
+    if not key or "/" in key or "\\" in key or key in (".", "..") or key.startswith("."):
+        raise ValueError(f"Invalid storage key: {key!r}")
+    return key
+
+
+class LocalShardedStorage(BlobStorage):
+    """Local disk storage with hash-prefix sharded directories"""
+
+    name = "local"
+
+    def __init__(self, root: Path, shard_depth: int = 2, shard_width: int = 2):
+        self.root = Path(root)
+        self.shard_depth = shard_depth
+        self.shard_width = shard_width
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _shard_dir(self, key: str) -> Path:
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        parts = [digest[i * self.shard_width:(i + 1) * self.shard_width] for i in range(self.shard_depth)]
+        return self.root.joinpath(*parts)
+
+    def _sharded_path(self, key: str) -> Path:
+        return self._shard_dir(validate_key(key)) / key
+
+    def local_path(self, key: str) -> Optional[Path]:
+        sharded = self._sharded_path(key)
+        if sharded.exists():
+            return sharded
+        # Files written before sharding live directly in the root
+        legacy = self.root / key
+        if legacy.is_file():
+            return legacy
+        return None
+
+    def _write(self, key: str, data: bytes) -> str:
+        path = self._sharded_path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{key}.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        # A rewrite (e.g. a new logo) must not leave a stale legacy copy behind
+        legacy = self.root / key
+        if legacy.is_file():
+            legacy.unlink()
+        return str(path)
+
+    def _read(self, key: str) -> Optional[bytes]:
+        path = self.local_path(key)
+        if path is None:
+            return None
+        return path.read_bytes()
+
+    def _delete(self, key: str) -> bool:
+        removed = False
+        for path in (self._sharded_path(key), self.root / key):
+            if path.is_file():
+                path.unlink()
+                removed = True
+        return removed
+
+    def _walk(self) -> Iterator[str]:
+        """Stored keys, one shard directory at a time, skipping temp files"""
+        pending = [self.root]
+        while pending:
+            try:
+                entries = os.scandir(pending.pop())
+            except FileNotFoundError:
+                # Shard directory removed since it was listed
+                continue
+            with entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append(entry.path)
+                    elif not entry.name.startswith("."):
+                        yield entry.name
+
+    async def put(self, key: str, data: bytes, content_type: Optional[str] = None) -> str:
+        return await asyncio.to_thread(self._write, key, data)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await asyncio.to_thread(self._read, key)
+
+    async def delete(self, key: str) -> bool:
+        return await asyncio.to_thread(self._delete, key)
+
+    async def exists(self, key: str) -> bool:
+        return await asyncio.to_thread(lambda: self.local_path(key) is not None)
+
+    async def modified_at(self, key: str) -> Optional[float]:
+        def _mtime():
+            path = self.local_path(key)
+            return path.stat().st_mtime if path is not None else None
+        return await asyncio.to_thread(_mtime)
+
+    async def list_keys(self, batch_size: int = 1000) -> AsyncIterator[List[str]]:
+        # Each batch is read in its own thread hop, so only one batch of keys is held at a time
+        keys = self._walk()
+        try:
+            while True:
+                batch = await asyncio.to_thread(lambda: list(itertools.islice(keys, batch_size)))
+                if not batch:
+                    break
+                yield batch
+        finally:
+            keys.close()
+
+
+class S3Storage(BlobStorage):
+    """S3-compatible object storage (AWS S3, MinIO, ...)"""
+
+    name = "s3"
+    supports_presigned_urls = True
+
+    def __init__(
+        self,
+        bucket: str,
+        prefix: str = "uploads/",
+        endpoint_url: Optional[str] = None,
+        region_name: Optional[str] = None,
+        access_key_id: Optional[str] = None,
+        secret_access_key: Optional[str] = None,
+        client=None,
+    ):
+        self.bucket = bucket
+        self.prefix = prefix
+        if client is None:
+            import boto3
+            from botocore.config import Config
+
+            client = boto3.client(
+                "s3",
+                endpoint_url=endpoint_url,
+                region_name=region_name,
+                aws_access_key_id=access_key_id,
+                aws_secret_access_key=secret_access_key,
+                config=Config(max_pool_connections=int(os.environ.get("S3_MAX_POOL_CONNECTIONS", "32"))),
+            )
+        self.client = client
+
+    def _object_key(self, key: str) -> str:
+        return f"{self.prefix}{validate_key(key)}"
+
+    def _put(self, key: str, data: bytes, content_type: Optional[str]) -> str:
+        extra = {"ContentType": content_type} if content_type else {}
+        self.client.put_object(Bucket=self.bucket, Key=self._object_key(key), Body=data, **extra)
+        return f"s3://{self.bucket}/{self._object_key(key)}"
+
+    def _get(self, key: str) -> Optional[bytes]:
+        try:
+            obj = self.client.get_object(Bucket=self.bucket, Key=self._object_key(key))
+        except self.client.exceptions.NoSuchKey:
+            return None
+        return obj["Body"].read()
+
+    def _head(self, key: str) -> Optional[dict]:
+        from botocore.exceptions import ClientError
+
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self._object_key(key))
+        except ClientError:
+            return None
+
+    def _exists(self, key: str) -> bool:
+        return self._head(key) is not None
+
+    def _delete(self, key: str) -> bool:
+        existed = self._exists(key)
+        self.client.delete_object(Bucket=self.bucket, Key=self._object_key(key))
+        return existed
+
+    def _list_page(self, token: Optional[str], batch_size: int):
+        params = {"Bucket": self.bucket, "Prefix": self.prefix, "MaxKeys": batch_size}
+        if token:
+            params["ContinuationToken"] = token
+        return self.client.list_objects_v2(**params)
+
+    async def put(self, key: str, data: bytes, content_type: Optional[str] = None) -> str:
+        return await asyncio.to_thread(self._put, key, data, content_type)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await asyncio.to_thread(self._get, key)
+
+    async def delete(self, key: str) -> bool:
+        return await asyncio.to_thread(self._delete, key)
+
+    async def exists(self, key: str) -> bool:
+        return await asyncio.to_thread(self._exists, key)
+
+    async def modified_at(self, key: str) -> Optional[float]:
+        head = await asyncio.to_thread(self._head, key)
+        return head["LastModified"].timestamp() if head else None
+
+    async def list_keys(self, batch_size: int = 1000) -> AsyncIterator[List[str]]:
+        token = None
+        while True:
+            page = await asyncio.to_thread(self._list_page, token, batch_size)
+            keys = [obj["Key"][len(self.prefix):] for obj in page.get("Contents", [])]
+            if keys:
+                yield keys
+            if not page.get("IsTruncated"):
+                break
+            token = page.get("NextContinuationToken")
+
+    async def presigned_url(self, key: str, expires_in: int = 3600) -> Optional[str]:
+        return await asyncio.to_thread(
+            self.client.generate_presigned_url,
+            "get_object",
+            Params={"Bucket": self.bucket, "Key": self._object_key(key)},
+            ExpiresIn=expires_in,
+        )
+
+
+def create_storage(uploads_dir: Path) -> BlobStorage:
+    """Build the storage backend selected by STORAGE_BACKEND (local or s3)"""
+    backend = os.environ.get("STORAGE_BACKEND", "local").lower()
+    if backend == "s3":
+        logger.info("Using S3 storage backend")
+        return S3Storage(
+            bucket=os.environ["S3_BUCKET"],
+            prefix=os.environ.get("S3_PREFIX", "uploads/"),
+            endpoint_url=os.environ.get("S3_ENDPOINT_URL") or None,
+            region_name=os.environ.get("S3_REGION") or None,
+            access_key_id=os.environ.get("S3_ACCESS_KEY_ID") or None,
+            secret_access_key=os.environ.get("S3_SECRET_ACCESS_KEY") or None,
+        )
+    return LocalShardedStorage(uploads_dir)
@@ -0,0 +1,322 @@
+"""Background garbage collector for uploads and sessions.
+
+The sweeper periodically:
+
+* backfills ``file_key`` on bills created before storage keys were recorded,
+* backfills the ``match`` key duplicate detection probes on older bills,
+* deletes stored files that no bill, held duplicate or business logo
+  references any more (e.g. when ``upload_bill`` failed after writing to
+  storage),
+* deletes expired ``user_sessions``,
+* prunes old delta-sync tombstones, raising each user's sync floor,
+* optionally moves cold bill originals to gzip-compressed storage. This is
+  skipped on backends that serve files through presigned URLs, which hand
+  out the original key; tier those with the bucket's lifecycle rules.
+
+Work is done in small batches with a pause between batches so the sweeper
+never competes with request traffic, and a Mongo lease makes sure only one
+worker process sweeps at a time.
+"""
+import asyncio
+import gzip
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timezone, timedelta
+from typing import Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from reconcile import bill_match_fields
+from storage import BlobStorage, key_from_locator
+
+logger = logging.getLogger(__name__)
+
+COLD_SUFFIX = ".gz"
+
+
+class Sweeper:
+    """Rate-limited reconciliation of storage, bills and sessions"""
+
+    def __init__(
+        self,
+        db,
+        storage: BlobStorage,
+        interval_seconds: float = 3600,
+        batch_size: int = 200,
+        batch_pause_seconds: float = 0.5,
+        orphan_grace_seconds: float = 3600,
+        tier_after_days: Optional[int] = None,
+        lease_seconds: float = 1800,
+        tombstone_retention_days: int = 90,
+    ):
+        self.db = db
+        self.storage = storage
+        self.interval_seconds = interval_seconds
+        self.batch_size = batch_size
+        self.batch_pause_seconds = batch_pause_seconds
+        self.orphan_grace_seconds = orphan_grace_seconds
+        self.tier_after_days = tier_after_days
+        if tier_after_days and storage.supports_presigned_urls:
+            # Downloads redirect to the original key, which tiering would delete
+            logger.warning("Cold tiering is not supported with presigned URL storage; skipping it")
+            self.tier_after_days = None
+        self.lease_seconds = lease_seconds
+        self.tombstone_retention_days = tombstone_retention_days
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_env(cls, db, storage: BlobStorage) -> "Sweeper":
+        tier_after_days = os.environ.get('SWEEPER_TIER_AFTER_DAYS')
+        return cls(
+            db,
+            storage,
+            interval_seconds=float(os.environ.get('SWEEPER_INTERVAL_SECONDS', '3600')),
+            batch_size=int(os.environ.get('SWEEPER_BATCH_SIZE', '200')),
+            batch_pause_seconds=float(os.environ.get('SWEEPER_BATCH_PAUSE_SECONDS', '0.5')),
+            orphan_grace_seconds=float(os.environ.get('SWEEPER_ORPHAN_GRACE_SECONDS', '3600')),
+            tier_after_days=int(tier_after_days) if tier_after_days else None,
+            tombstone_retention_days=int(os.environ.get('SYNC_TOMBSTONE_RETENTION_DAYS', '90')),
+        )
+
+    async def ensure_indexes(self):
+        """Indexes behind the sweep probes, which otherwise scan whole collections"""
+        try:
+            await self.db.bills.create_index("file_key")
+            await self.db.suspected_duplicates.create_index("file_key")
+            await self.db.users.create_index("business_logo", sparse=True)
+            await self.db.user_sessions.create_index("expires_at")
+        except Exception as e:
+            logger.error(f"Creating sweeper indexes failed: {str(e)}")
+
+    # ---------- scheduling ----------
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run_forever())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run_forever(self):
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            try:
+                if await self._acquire_lease():
+                    await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Sweeper run failed: {str(e)}", exc_info=True)
+
+    async def _acquire_lease(self) -> bool:
+        """Take the cluster-wide sweeper lease if it is free or expired"""
+        now = datetime.now(timezone.utc)
+        try:
+            lease = await self.db.job_locks.find_one_and_update(
+                {"_id": "sweeper", "$or": [
+                    {"expires_at": {"$lt": now.isoformat()}},
+                    {"owner": self.owner},
+                ]},
+                {"$set": {
+                    "owner": self.owner,
+                    "expires_at": (now + timedelta(seconds=self.lease_seconds)).isoformat(),
+                }},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            # Another worker holds an unexpired lease
+            return False
+        return lease is not None and lease.get("owner") == self.owner
+
+    async def _pause(self):
+        if self.batch_pause_seconds:
+            await asyncio.sleep(self.batch_pause_seconds)
+
+    # ---------- sweep steps ----------
+
+    async def run_once(self) -> dict:
+        """Run every sweep step once and return counters"""
+        started = datetime.now(timezone.utc)
+        stats = {
+            "file_keys_backfilled": await self.backfill_file_keys(),
+            "match_keys_backfilled": await self.backfill_match_keys(),
+            "orphans_deleted": await self.delete_orphaned_files(),
+            "sessions_deleted": await self.delete_expired_sessions(),
+            "tombstones_pruned": await self.prune_sync_tombstones(),
+            "files_tiered": await self.tier_cold_originals() if self.tier_after_days else 0,
+        }
+        elapsed = (datetime.now(timezone.utc) - started).total_seconds()
+        logger.info(f"Sweeper finished in {elapsed:.1f}s: {stats}")
+        return stats
+
+    async def backfill_file_keys(self) -> int:
+        """Record file_key on bills that only carry a file_path"""
+        updated = 0
+        while True:
+            bills = await self.db.bills.find(
+                {"file_key": {"$exists": False}, "file_path": {"$exists": True}},
+                {"_id": 0, "id": 1, "file_path": 1}
+            ).limit(self.batch_size).to_list(self.batch_size)
+            if not bills:
+                return updated
+            for bill in bills:
+                await self.db.bills.update_one(
+                    {"id": bill["id"]},
+                    {"$set": {"file_key": key_from_locator(bill["file_path"])}}
+                )
+            updated += len(bills)
+            await self._pause()
+
+    async def backfill_match_keys(self) -> int:
+        """Record the duplicate-detection key on bills stored before it existed"""
+        updated = 0
+        while True:
+            bills = await self.db.bills.find(
+                {"match": {"$exists": False}},
+                {"_id": 0, "id": 1, "extracted_data.seller_gstin": 1, "extracted_data.invoice_number": 1}
+            ).limit(self.batch_size).to_list(self.batch_size)
+            if not bills:
+                return updated
+            for bill in bills:
+                await self.db.bills.update_one(
+                    {"id": bill["id"]},
+                    {"$set": {"match": bill_match_fields(bill.get("extracted_data"))}}
+                )
+            updated += len(bills)
+            await self._pause()
+
+    async def _referenced_keys(self, keys: list) -> set:
+        referenced = set()
+        bill_keys = [k for k in keys if not k.startswith("logo_")]
+        if bill_keys:
+            for collection in (self.db.bills, self.db.suspected_duplicates):
+                bills = await collection.find(
+                    {"file_key": {"$in": bill_keys}},
+                    {"_id": 0, "file_key": 1}
+                ).to_list(len(bill_keys))
+                referenced.update(b["file_key"] for b in bills)
+        logo_keys = [k for k in keys if k.startswith("logo_")]
+        if logo_keys:
+            users = await self.db.users.find(
+                {"business_logo": {"$in": [f"/uploads/{k}" for k in logo_keys]}},
+                {"_id": 0, "business_logo": 1}
+            ).to_list(len(logo_keys))
+            referenced.update(key_from_locator(u["business_logo"]) for u in users)
+        return referenced
+
+    async def delete_orphaned_files(self) -> int:
+        """Delete stored files not referenced by any bill or logo"""
+        deleted = 0
+        cutoff = datetime.now(timezone.utc).timestamp() - self.orphan_grace_seconds
+        async for keys in self.storage.list_keys(self.batch_size):
+            referenced = await self._referenced_keys(keys)
+            for key in keys:
+                if key in referenced:
+                    continue
+                # Skip recent files: an upload may still be in flight
+                mtime = await self.storage.modified_at(key)
+                if mtime is None or mtime > cutoff:
+                    continue
+                if await self.storage.delete(key):
+                    deleted += 1
+                    logger.info(f"Sweeper deleted orphaned upload: {key}")
+            await self._pause()
+        return deleted
+
+    async def delete_expired_sessions(self) -> int:
+        """Delete sessions whose expiry is in the past"""
+        deleted = 0
+        now = datetime.now(timezone.utc).isoformat()
+        while True:
+            sessions = await self.db.user_sessions.find(
+                {"expires_at": {"$lt": now}},
+                {"_id": 1}
+            ).limit(self.batch_size).to_list(self.batch_size)
+            if not sessions:
+                return deleted
+            result = await self.db.user_sessions.delete_many(
+                {"_id": {"$in": [s["_id"] for s in sessions]}}
+            )
+            deleted += result.deleted_count
+            await self._pause()
+
+    async def prune_sync_tombstones(self) -> int:
+        """Delete old sync tombstones; clients behind them must resync from scratch"""
+        pruned = 0
+        cutoff = datetime.now(timezone.utc) - timedelta(days=self.tombstone_retention_days)
+        while True:
+            tombstones = await self.db.sync_tombstones.find(
+                {"deleted_at": {"$lt": cutoff}},
+                {"_id": 1, "user_id": 1, "updated_seq": 1}
+            ).limit(self.batch_size).to_list(self.batch_size)
+            if not tombstones:
+                return pruned
+            floors = {}
+            for tombstone in tombstones:
+                floors[tombstone["user_id"]] = max(floors.get(tombstone["user_id"], 0), tombstone["updated_seq"])
+            # Raise the floor before deleting, so no client skips a deletion it never saw
+            for user_id, floor in floors.items():
+                await self.db.sync_counters.update_one({"_id": user_id}, {"$max": {"floor": floor}}, upsert=True)
+            result = await self.db.sync_tombstones.delete_many(
+                {"_id": {"$in": [t["_id"] for t in tombstones]}}
+            )
+            pruned += result.deleted_count
+            await self._pause()
+
+    async def tier_cold_originals(self) -> int:
+        """Move originals of old bills to gzip-compressed storage"""
+        tiered = 0
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=self.tier_after_days)).isoformat()
+        while True:
+            bills = await self.db.bills.find(
+                {"upload_date": {"$lt": cutoff}, "storage_tier": {"$exists": False}, "file_key": {"$exists": True}},
+                {"_id": 0, "id": 1, "file_key": 1}
+            ).limit(self.batch_size).to_list(self.batch_size)
+            if not bills:
+                return tiered
+            for bill in bills:
+                if await self._tier_bill(bill):
+                    tiered += 1
+            await self._pause()
+
+    async def _tier_bill(self, bill: dict) -> bool:
+        key = bill["file_key"]
+        data = await self.storage.get(key)
+        if data is None:
+            await self.db.bills.update_one({"id": bill["id"]}, {"$set": {"storage_tier": "missing"}})
+            return False
+        compressed = await asyncio.to_thread(gzip.compress, data, 9)
+        if len(compressed) >= len(data) * 0.9:
+            # Already-compressed formats (most JPEGs) are not worth tiering
+            await self.db.bills.update_one({"id": bill["id"]}, {"$set": {"storage_tier": "hot"}})
+            return False
+        cold_key = f"{key}{COLD_SUFFIX}"
+        cold_path = await self.storage.put(cold_key, compressed, content_type="application/gzip")
+        await self.db.bills.update_one(
+            {"id": bill["id"]},
+            {"$set": {"file_key": cold_key, "file_path": cold_path, "storage_tier": "cold"}}
+        )
+        await self.storage.delete(key)
+        return True
+
+
+async def read_original(storage: BlobStorage, key: str) -> Optional[bytes]:
+    """Read a stored original, transparently decompressing cold-tier files"""
+    data = await storage.get(key)
+    if data is None and not key.endswith(COLD_SUFFIX):
+        key = f"{key}{COLD_SUFFIX}"
+        data = await storage.get(key)
+    if data is not None and key.endswith(COLD_SUFFIX):
+        data = await asyncio.to_thread(gzip.decompress, data)
+    return data
@@ -0,0 +1,217 @@
+"""Per-user change versions for delta sync (``/sync``).
+
+Every write to a synced collection (bills, customers, products, invoices)
+stamps the document with ``updated_seq``, taken from a per-user counter in
+``db.sync_counters``. The counter only grows, so a client that remembers the
+highest version it has seen can ask for everything after it through the
+``(user_id, updated_seq)`` index.
+
+A deleted document leaves a tombstone in ``db.sync_tombstones`` with its own
+sequence number. Tombstones older than the retention period are pruned by
+the sweeper, and the counter records the highest pruned version as its
+``floor``. A client whose version is below the floor may have missed a
+deletion and must start again from a full snapshot.
+
+Writes made through ``update`` and ``delete`` can be made conditional on the
+version the client last saw (``base_seq``). An offline edit to a document
+that changed on the server in the meantime therefore does not match and is
+reported as a conflict. It is not silently overwritten.
+
+Versions are reserved before the write that uses them commits, so two
+concurrent writes can become visible out of order. Each reservation stays
+listed in the counter's ``pending`` until its write finishes. The change
+feed never goes past the lowest pending version, so a client cannot move
+its version beyond a write that is still in flight. A reservation older
+than ``pending_timeout`` seconds belongs to a write that died, and it is
+ignored.
+
+Documents written before versioning have no ``updated_seq``. They get one
+when their user's first full sync asks for them.
+"""
+import heapq
+import logging
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from itertools import islice
+from typing import Dict, Optional
+
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+SYNCED_COLLECTIONS = ("bills", "customers", "products", "invoices")
+
+
+class SyncLog:
+    """Version stamps, guarded writes and change feeds for the synced collections"""
+
+    def __init__(self, db, pending_timeout: float = 30.0):
+        self.db = db
+        self.pending_timeout = pending_timeout
+
+    async def ensure_indexes(self):
+        try:
+            for name in SYNCED_COLLECTIONS:
+                await self.db[name].create_index([("user_id", 1), ("updated_seq", 1)])
+            await self.db.sync_tombstones.create_index([("user_id", 1), ("updated_seq", 1)])
+            await self.db.sync_tombstones.create_index("deleted_at")
+        except Exception as e:
+            logger.error(f"Creating sync indexes failed: {str(e)}")
+
+    async def _reserve(self, user_id: str, count: int) -> int:
+        """Take the next ``count`` versions and list them as pending; returns the highest"""
+        while True:
+            counter = await self.db.sync_counters.find_one({"_id": user_id}, {"seq": 1})
+            current = (counter or {}).get("seq", 0)
+            entry = {"seq": current + 1, "at": time.time()}
+            if counter is None:
+                try:
+                    await self.db.sync_counters.insert_one({"_id": user_id, "seq": count, "pending": [entry]})
+                    return count
+                except DuplicateKeyError:
+                    continue
+            # Compare-and-set, so the pending entry always names the versions it took
+            result = await self.db.sync_counters.update_one(
+                {"_id": user_id, "seq": current if "seq" in counter else {"$exists": False}},
+                {"$set": {"seq": current + count}, "$push": {"pending": entry}}
+            )
+            if result.modified_count:
+                return current + count
+
+    @asynccontextmanager
+    async def next_seq(self, user_id: str, count: int = 1):
+        """Reserve ``count`` versions for the user, yielding the highest one.
+
+        The versions stay pending, holding back the change feed, until the
+        block exits.
+        """
+        seq = await self._reserve(user_id, count)
+        try:
+            yield seq
+        finally:
+            await self.db.sync_counters.update_one(
+                {"_id": user_id}, {"$pull": {"pending": {"seq": seq - count + 1}}}
+            )
+
+    async def watermark(self, user_id: str) -> int:
+        """Highest version below every write still in flight"""
+        counter = await self.db.sync_counters.find_one({"_id": user_id}) or {}
+        cutoff = time.time() - self.pending_timeout
+        pending = [entry["seq"] for entry in counter.get("pending", []) if entry["at"] >= cutoff]
+        if len(pending) < len(counter.get("pending", [])):
+            await self.db.sync_counters.update_one(
+                {"_id": user_id}, {"$pull": {"pending": {"at": {"$lt": cutoff}}}}
+            )
+        return min(pending) - 1 if pending else counter.get("seq", 0)
+
+    @staticmethod
+    def guard(base_seq: Optional[int]) -> dict:
+        """Filter matching a document only while it is still at ``base_seq``"""
+        if base_seq is None:
+            return {}
+        if base_seq == 0:
+            # Documents from before versioning are reported as version 0
+            return {"updated_seq": {"$in": [0, None]}}
+        return {"updated_seq": base_seq}
+
+    # ---------- Versioned writes ----------
+
+    async def insert(self, collection: str, doc: dict) -> int:
+        async with self.next_seq(doc["user_id"]) as seq:
+            doc["updated_seq"] = seq
+            await self.db[collection].insert_one(doc)
+        return seq
+
+    async def update(self, collection: str, user_id: str, record_id: str, update: dict,
+                     base_seq: Optional[int] = None) -> Optional[int]:
+        """Apply a Mongo update and bump the version; None if no document matched"""
+        async with self.next_seq(user_id) as seq:
+            update = {**update, "$set": {**update.get("$set", {}), "updated_seq": seq}}
+            result = await self.db[collection].update_one(
+                {"id": record_id, "user_id": user_id, **self.guard(base_seq)}, update
+            )
+        return seq if result.matched_count else None
+
+    async def delete(self, collection: str, user_id: str, record_id: str,
+                     base_seq: Optional[int] = None) -> bool:
+        """Delete a document and leave a tombstone for syncing clients"""
+        result = await self.db[collection].delete_one(
+            {"id": record_id, "user_id": user_id, **self.guard(base_seq)}
+        )
+        if not result.deleted_count:
+            return False
+        async with self.next_seq(user_id) as seq:
+            await self.db.sync_tombstones.insert_one({
+                "user_id": user_id,
+                "collection": collection,
+                "id": record_id,
+                "updated_seq": seq,
+                "deleted_at": datetime.now(timezone.utc),
+            })
+        return True
+
+    # ---------- Change feed ----------
+
+    async def backfill(self, user_id: str, batch_size: int = 500) -> int:
+        """Version the user's documents that were written before versioning"""
+        stamped = 0
+        for name in SYNCED_COLLECTIONS:
+            while True:
+                docs = await self.db[name].find(
+                    {"user_id": user_id, "updated_seq": None}, {"_id": 1}
+                ).limit(batch_size).to_list(batch_size)
+                if not docs:
+                    break
+                async with self.next_seq(user_id, len(docs)) as last:
+                    await self.db[name].bulk_write([
+                        UpdateOne({"_id": doc["_id"], "updated_seq": None}, {"$set": {"updated_seq": seq}})
+                        for seq, doc in enumerate(docs, start=last - len(docs) + 1)
+                    ], ordered=False)
+                stamped += len(docs)
+        return stamped
+
+    async def changes(self, user_id: str, since: int, limit: int, projections: Dict[str, dict]) -> dict:
+        """Up to ``limit`` changes after version ``since``, oldest first.
+
+        ``projections`` maps each synced collection to the projection its
+        documents are returned with. When ``has_more`` is set, the client
+        asks again with the returned ``version``.
+        """
+        counter = await self.db.sync_counters.find_one({"_id": user_id}) or {}
+        reset = since > 0 and since < counter.get("floor", 0)
+        if reset:
+            since = 0
+        if since == 0:
+            await self.backfill(user_id)
+
+        # Each source is read in version order, so the first `limit` of the merge
+        # is within the first `limit` of every source
+        query = {"user_id": user_id, "updated_seq": {"$gt": since, "$lte": await self.watermark(user_id)}}
+        sources = []
+        for name, projection in projections.items():
+            docs = await self.db[name].find(query, projection).sort("updated_seq", 1).limit(limit + 1).to_list(limit + 1)
+            sources.append([(doc["updated_seq"], name, doc) for doc in docs])
+        if since > 0:
+            # A fresh snapshot has nothing to delete
+            tombstones = await self.db.sync_tombstones.find(
+                query, {"_id": 0, "collection": 1, "id": 1, "updated_seq": 1}
+            ).sort("updated_seq", 1).limit(limit + 1).to_list(limit + 1)
+            sources.append([(tombstone["updated_seq"], None, tombstone) for tombstone in tombstones])
+
+        merged = list(islice(heapq.merge(*sources, key=lambda item: item[0]), limit + 1))
+        page = merged[:limit]
+        result = {
+            "version": page[-1][0] if page else since,
+            "has_more": len(merged) > limit,
+            "reset": reset,
+            "changes": {name: [] for name in projections},
+            "deleted": [],
+        }
+        for _, name, doc in page:
+            if name is None:
+                result["deleted"].append(doc)
+            else:
+                result["changes"][name].append(doc)
+        return result
@@ -0,0 +1,220 @@
+"""Stateless signed access tokens, refresh sessions and revocation.
+
+With ``AUTH_TOKEN_MODE=jwt``, a login issues two tokens:
+
+* a short-lived access token: a JWT signed with ``JWT_SECRET`` carrying
+  ``user_id``, email, plan, the refresh session id and an expiry. Requests
+  are authenticated by checking its signature locally, with no database
+  lookup.
+* an opaque refresh token backed by a document in ``db.user_sessions``. It is
+  stored as a SHA-256 digest and rotated on every use, and it mints new access
+  tokens through ``/auth/refresh``.
+
+Logging out deletes the refresh session and records its id in
+``db.revoked_sessions`` until every access token issued for it has expired.
+Each worker keeps that short list in memory and reloads it every
+``JWT_REVOCATION_REFRESH_SECONDS``. A revocation therefore takes effect at
+once on the worker that handled the logout, and within one refresh interval
+on the others.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import secrets
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+from lazy import lazy_import
+
+jwt = lazy_import("jwt")
+
+logger = logging.getLogger(__name__)
+
+
+class InvalidToken(Exception):
+    """A token that must be rejected with 401"""
+
+
+def looks_like_jwt(token: str) -> bool:
+    return token.startswith("eyJ") and token.count(".") == 2
+
+
+def _digest(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+class TokenService:
+    """Issues and verifies access tokens and manages refresh sessions for one worker"""
+
+    def __init__(self, db, secret: str, algorithm: str = "HS256", access_ttl_seconds: int = 900,
+                 refresh_ttl_seconds: int = 7 * 24 * 3600, revocation_refresh_seconds: float = 30,
+                 clock=time.time):
+        self.db = db
+        self.secret = secret
+        self.algorithm = algorithm
+        self.access_ttl_seconds = access_ttl_seconds
+        self.refresh_ttl_seconds = refresh_ttl_seconds
+        self.revocation_refresh_seconds = revocation_refresh_seconds
+        self.clock = clock
+        self._revoked: Dict[str, float] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._indexed = False
+
+    @classmethod
+    def from_env(cls, db, secret: str, algorithm: str) -> Optional["TokenService"]:
+        """Token service when AUTH_TOKEN_MODE is "jwt", otherwise None (database-backed sessions)"""
+        if os.environ.get('AUTH_TOKEN_MODE', 'session').lower() != 'jwt':
+            return None
+        if secret == 'change_me_in_production':
+            logger.warning("AUTH_TOKEN_MODE=jwt with the default JWT_SECRET; set a strong secret")
+        return cls(
+            db,
+            secret,
+            algorithm,
+            access_ttl_seconds=int(os.environ.get('JWT_ACCESS_TTL_SECONDS', '900')),
+            refresh_ttl_seconds=int(os.environ.get('JWT_REFRESH_TTL_SECONDS', str(7 * 24 * 3600))),
+            revocation_refresh_seconds=float(os.environ.get('JWT_REVOCATION_REFRESH_SECONDS', '30')),
+        )
+
+    # ---------- Access tokens ----------
+
+    def issue_access(self, user: dict, session_id: str) -> str:
+        now = int(self.clock())
+        claims = {
+            "sub": user["user_id"],
+            "email": user.get("email"),
+            "plan": user.get("subscription_plan", "free"),
+            "sid": session_id,
+            "iat": now,
+            "exp": now + self.access_ttl_seconds,
+            "typ": "access",
+        }
+        return jwt.encode(claims, self.secret, algorithm=self.algorithm)
+
+    def verify_access(self, token: str) -> dict:
+        """The request user built from a valid access token's claims"""
+        try:
+            claims = jwt.decode(
+                token, self.secret, algorithms=[self.algorithm],
+                options={"require": ["sub", "sid", "exp"], "verify_exp": False},
+            )
+        except jwt.InvalidTokenError:
+            raise InvalidToken("Invalid session")
+        if claims.get("typ") != "access":
+            raise InvalidToken("Invalid session")
+        # Expiry is checked against our own clock so tests and skewed hosts behave alike
+        if claims["exp"] < self.clock():
+            raise InvalidToken("Session expired")
+        if self.is_revoked(claims["sid"]):
+            raise InvalidToken("Session revoked")
+        return {
+            "user_id": claims["sub"],
+            "email": claims.get("email"),
+            "subscription_plan": claims.get("plan", "free"),
+            "session_id": claims["sid"],
+            "stateless": True,
+        }
+
+    # ---------- Refresh sessions ----------
+
+    def _expiry(self, seconds: float) -> datetime:
+        return datetime.fromtimestamp(self.clock() + seconds, timezone.utc)
+
+    async def create_session(self, user_id: str) -> Tuple[str, str, datetime]:
+        """New refresh session; returns (session_id, refresh_token, expires_at)"""
+        session_id = uuid.uuid4().hex
+        refresh_token = secrets.token_urlsafe(32)
+        expires_at = self._expiry(self.refresh_ttl_seconds)
+        await self.db.user_sessions.insert_one({
+            "user_id": user_id,
+            "session_id": session_id,
+            "refresh_token_hash": _digest(refresh_token),
+            "expires_at": expires_at.isoformat(),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+        })
+        return session_id, refresh_token, expires_at
+
+    async def rotate(self, refresh_token: str) -> Tuple[str, str, str]:
+        """Exchange a refresh token for a new one; returns (user_id, session_id, refresh_token)"""
+        replacement = secrets.token_urlsafe(32)
+        session = await self.db.user_sessions.find_one_and_update(
+            {"refresh_token_hash": _digest(refresh_token)},
+            {"$set": {"refresh_token_hash": _digest(replacement),
+                      "rotated_at": datetime.now(timezone.utc).isoformat()}},
+            projection={"_id": 0},
+        )
+        if not session:
+            raise InvalidToken("Invalid refresh token")
+        if session["expires_at"] < self._expiry(0).isoformat():
+            await self.db.user_sessions.delete_one({"session_id": session["session_id"]})
+            raise InvalidToken("Session expired")
+        return session["user_id"], session["session_id"], replacement
+
+    async def revoke(self, session_ids):
+        """End refresh sessions and reject their outstanding access tokens"""
+        session_ids = [sid for sid in session_ids if sid]
+        if not session_ids:
+            return
+        await self.db.user_sessions.delete_many({"session_id": {"$in": session_ids}})
+        # Access tokens outlive their session by at most one access TTL (plus clock slack)
+        until = self._expiry(self.access_ttl_seconds + 60)
+        await self._ensure_index()
+        for sid in session_ids:
+            self._revoked[sid] = until.timestamp()
+            await self.db.revoked_sessions.update_one(
+                {"session_id": sid}, {"$set": {"expires_at": until}}, upsert=True,
+            )
+
+    async def revoke_user(self, user_id: str):
+        sessions = await self.db.user_sessions.find(
+            {"user_id": user_id, "session_id": {"$exists": True}}, {"_id": 0, "session_id": 1}
+        ).to_list(1000)
+        await self.revoke([s["session_id"] for s in sessions])
+
+    # ---------- Revocation list ----------
+
+    def is_revoked(self, session_id: str) -> bool:
+        until = self._revoked.get(session_id)
+        return until is not None and until > self.clock()
+
+    async def _ensure_index(self):
+        if not self._indexed:
+            await self.db.revoked_sessions.create_index("expires_at", expireAfterSeconds=0)
+            self._indexed = True
+
+    async def refresh_revocations(self):
+        now = self.clock()
+        revoked = {}
+        async for doc in self.db.revoked_sessions.find(
+            {"expires_at": {"$gt": self._expiry(0)}}, {"_id": 0, "session_id": 1, "expires_at": 1}
+        ):
+            expires_at = doc["expires_at"]
+            if expires_at.tzinfo is None:
+                expires_at = expires_at.replace(tzinfo=timezone.utc)
+            revoked[doc["session_id"]] = expires_at.timestamp()
+        # Keep local entries the database has not caught up with yet
+        revoked.update({sid: until for sid, until in self._revoked.items() if until > now})
+        self._revoked = revoked
+
+    async def _refresh_loop(self):
+        while True:
+            try:
+                await self.refresh_revocations()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Refreshing revoked sessions failed: {str(e)}")
+            await asyncio.sleep(self.revocation_refresh_seconds)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
@@ -0,0 +1,382 @@
+"""Request-scoped tracing spans.
+
+A lightweight tracer that follows the OpenTelemetry data model: W3C
+``traceparent`` propagation, 128-bit trace ids / 64-bit span ids, and spans
+exported as OTLP/JSON ``ExportTraceServiceRequest`` documents (one batch per
+line), so exported files can be loaded by the collector's ``otlpjsonfile``
+receiver and other OTel tooling. No collector is needed: spans go to the log
+(``console``) or to a JSON-lines file (``file``). File writes run in a
+worker thread, never on the event loop.
+
+Configuration (environment):
+
+* ``TRACING_ENABLED`` - ``true`` to record spans (default ``false``)
+* ``TRACE_SAMPLE_RATIO`` - fraction of new traces to sample (default ``1.0``)
+* ``TRACING_EXPORTER`` - ``console`` or ``file`` (default ``console``)
+* ``TRACE_FILE`` - output path for the file exporter
+* ``OTEL_SERVICE_NAME`` - ``service.name`` of the exported resource
+  (default ``bizupy-backend``)
+
+The current span lives in a ``contextvars.ContextVar``; motor copies the
+context into its executor threads, so ``MongoCommandTracer`` can attach each
+Mongo command to the span of the request that issued it.
+"""
+import asyncio
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set
+
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+# OTLP SpanKind and StatusCode values
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+STATUS_CODES = {"UNSET": 0, "OK": 1, "ERROR": 2}
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    __slots__ = ("name", "kind", "trace_id", "span_id", "parent_id", "sampled", "start_ns", "end_ns",
+                 "attributes", "status", "status_message", "_tracer")
+
+    def __init__(self, tracer, name: str, trace_id: str, parent_id: Optional[str], sampled: bool,
+                 attributes: Optional[Dict[str, Any]] = None, kind: int = SPAN_KIND_INTERNAL):
+        self._tracer = tracer
+        self.name = name
+        self.kind = kind
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.status = "UNSET"
+        self.status_message = ""
+
+    def set_attribute(self, key: str, value: Any):
+        if self.sampled:
+            self.attributes[key] = value
+
+    def record_exception(self, exc: BaseException):
+        self.status = "ERROR"
+        self.status_message = f"{type(exc).__name__}: {exc}"
+
+    def end(self):
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+            if self.sampled:
+                self._tracer.export(self)
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def to_otlp(self) -> Dict[str, Any]:
+        """The span as an OTLP/JSON ``Span``"""
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": otlp_attributes(self.attributes),
+            "status": {"code": STATUS_CODES[self.status]},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        if self.status_message:
+            span["status"]["message"] = self.status_message
+        return span
+
+
+def otlp_value(value: Any) -> Dict[str, Any]:
+    """An OTLP ``AnyValue``; 64-bit integers are strings in OTLP/JSON"""
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    if isinstance(value, (list, tuple)):
+        return {"arrayValue": {"values": [otlp_value(v) for v in value]}}
+    return {"stringValue": str(value)}
+
+
+def otlp_attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [{"key": key, "value": otlp_value(value)} for key, value in attributes.items() if value is not None]
+
+
+def otlp_request(spans: List[Span], service_name: str) -> Dict[str, Any]:
+    """An OTLP/JSON ``ExportTraceServiceRequest`` carrying ``spans``"""
+    return {"resourceSpans": [{
+        "resource": {"attributes": otlp_attributes({"service.name": service_name})},
+        "scopeSpans": [{
+            "scope": {"name": __name__},
+            "spans": [span.to_otlp() for span in spans],
+        }],
+    }]}
+
+
+class ConsoleSpanExporter:
+    def export(self, request: Dict[str, Any]):
+        logger.info(f"spans {json.dumps(request, default=str)}")
+
+    def shutdown(self):
+        pass
+
+
+class FileSpanExporter:
+    """Append export requests as JSON lines to a local file"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def export(self, request: Dict[str, Any]):
+        line = json.dumps(request, default=str) + "\n"
+        # Batches may be written from several worker threads at once
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+    def shutdown(self):
+        pass
+
+
+class Tracer:
+    """Creates spans, applies head sampling and batches finished spans to an exporter"""
+
+    def __init__(self, exporter=None, sample_ratio: float = 1.0, enabled: bool = True, batch_size: int = 64,
+                 service_name: str = "bizupy-backend"):
+        self.exporter = exporter
+        self.sample_ratio = sample_ratio
+        self.enabled = enabled and exporter is not None
+        self.batch_size = batch_size
+        self.service_name = service_name
+        self._buffer: List[Span] = []
+        self._lock = threading.Lock()
+        self._exports: Set[asyncio.Task] = set()
+
+    @classmethod
+    def from_env(cls) -> "Tracer":
+        enabled = os.environ.get('TRACING_ENABLED', 'false').lower() == 'true'
+        exporter_name = os.environ.get('TRACING_EXPORTER', 'console').lower()
+        if exporter_name == 'file':
+            exporter = FileSpanExporter(os.environ.get('TRACE_FILE', 'traces.jsonl'))
+        else:
+            exporter = ConsoleSpanExporter()
+        return cls(
+            exporter=exporter,
+            sample_ratio=float(os.environ.get('TRACE_SAMPLE_RATIO', '1.0')),
+            enabled=enabled,
+            service_name=os.environ.get('OTEL_SERVICE_NAME', 'bizupy-backend'),
+        )
+
+    def _new_span(self, name: str, attributes=None, parent: Optional[Span] = None,
+                  remote_parent: Optional[str] = None, kind: int = SPAN_KIND_INTERNAL) -> Span:
+        if parent is not None:
+            return Span(self, name, parent.trace_id, parent.span_id, parent.sampled, attributes, kind)
+        parsed = parse_traceparent(remote_parent) if remote_parent else None
+        if parsed:
+            trace_id, parent_id, sampled = parsed
+            return Span(self, name, trace_id, parent_id, sampled, attributes, kind)
+        sampled = random.random() < self.sample_ratio
+        return Span(self, name, f"{random.getrandbits(128):032x}", None, sampled, attributes, kind)
+
+    def start_span(self, name: str, attributes=None, remote_parent: Optional[str] = None,
+                   kind: int = SPAN_KIND_INTERNAL) -> Optional[Span]:
+        """Start a span under the current one without making it current"""
+        if not self.enabled:
+            return None
+        return self._new_span(name, attributes, _current_span.get(), remote_parent, kind)
+
+    @contextmanager
+    def span(self, name: str, remote_parent: Optional[str] = None, kind: int = SPAN_KIND_INTERNAL, **attributes):
+        """Run the enclosed block inside a new current span"""
+        if not self.enabled:
+            yield None
+            return
+        span = self._new_span(name, attributes, _current_span.get(), remote_parent, kind)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.record_exception(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end()
+
+    def export(self, span: Span):
+        with self._lock:
+            self._buffer.append(span)
+            if len(self._buffer) < self.batch_size:
+                return
+            batch, self._buffer = self._buffer, []
+        self._export_batch(batch)
+
+    def _write(self, batch: List[Span]):
+        try:
+            self.exporter.export(otlp_request(batch, self.service_name))
+        except Exception as e:
+            logger.error(f"Error exporting spans: {str(e)}")
+
+    def _export_batch(self, batch: List[Span]):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Already off the event loop (a driver thread or a script)
+            self._write(batch)
+            return
+        task = loop.create_task(asyncio.to_thread(self._write, batch))
+        self._exports.add(task)
+        task.add_done_callback(self._exports.discard)
+
+    def flush(self):
+        with self._lock:
+            batch, self._buffer = self._buffer, []
+        if batch:
+            self._export_batch(batch)
+
+    async def shutdown(self):
+        """Export everything still buffered and wait for exports in flight"""
+        self.flush()
+        await asyncio.gather(*list(self._exports), return_exceptions=True)
+        if self.exporter is not None:
+            self.exporter.shutdown()
+
+
+def parse_traceparent(header: str):
+    """Parse a W3C traceparent header into (trace_id, parent_id, sampled)"""
+    parts = header.strip().split("-")
+    if len(parts) < 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        flags = int(parts[3][:2], 16)
+        int(parts[1], 16)
+        int(parts[2], 16)
+    except ValueError:
+        return None
+    return parts[1], parts[2], bool(flags & 1)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+tracer = Tracer.from_env()
+
+
+def traced(name: Optional[str] = None):
+    """Decorator running a sync or async function inside a span"""
+    def decorator(func):
+        span_name = name or func.__name__
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with tracer.span(span_name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with tracer.span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class TracingMiddleware:
+    """ASGI middleware opening a root span per HTTP request"""
+
+    def __init__(self, app, exclude_paths=("/metrics",)):
+        self.app = app
+        self.exclude_paths = set(exclude_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not tracer.enabled or scope["path"] in self.exclude_paths:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        remote_parent = headers.get(b"traceparent", b"").decode("latin-1") or None
+
+        with tracer.span(f"{scope['method']} {scope['path']}", remote_parent=remote_parent, kind=SPAN_KIND_SERVER,
+                         **{"http.method": scope["method"], "http.target": scope["path"]}) as span:
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start":
+                    span.set_attribute("http.status_code", message["status"])
+                    if message["status"] >= 500:
+                        span.status = "ERROR"
+                    message.setdefault("headers", [])
+                    message["headers"] = list(message["headers"]) + [
+                        (b"traceparent", span.traceparent.encode("latin-1"))
+                    ]
+                await send(message)
+
+            await self.app(scope, receive, send_wrapper)
+            route = scope.get("route")
+            if route is not None:
+                # Name the span after the route template once routing has happened
+                span.name = f"{scope['method']} {route.path}"
+                span.set_attribute("http.route", route.path)
+
+
+class MongoCommandTracer(monitoring.CommandListener):
+    """pymongo command listener recording a child span per Mongo command"""
+
+    IGNORED_COMMANDS = {"isMaster", "ismaster", "hello", "ping", "saslStart", "saslContinue", "endSessions"}
+
+    def __init__(self):
+        self._pending: Dict[tuple, Span] = {}
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        if not tracer.enabled or event.command_name in self.IGNORED_COMMANDS:
+            return
+        parent = _current_span.get()
+        if parent is None or not parent.sampled:
+            return
+        if event.command_name == "getMore":
+            collection = event.command.get("collection")
+        else:
+            collection = event.command.get(event.command_name)
+        span = tracer.start_span(f"mongo.{event.command_name}", {
+            "db.system": "mongodb",
+            "db.name": event.database_name,
+            "db.operation": event.command_name,
+            "db.mongodb.collection": collection if isinstance(collection, str) else None,
+        }, kind=SPAN_KIND_CLIENT)
+        with self._lock:
+            self._pending[(event.connection_id, event.request_id)] = span
+
+    def _finish(self, event, failure: Optional[str] = None):
+        with self._lock:
+            span = self._pending.pop((event.connection_id, event.request_id), None)
+        if span is None:
+            return
+        if failure:
+            span.status = "ERROR"
+            span.status_message = failure
+        span.end()
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        self._finish(event, str(event.failure))
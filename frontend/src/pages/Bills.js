@@ -46,13 +46,40 @@ const Bills = () => {
       toast.success('Bill uploaded and processed successfully!');
       setBills([response.data, ...bills]);
     } catch (error) {
-      const errorMsg = error.response?.data?.detail || 'Failed to upload bill';
-      toast.error(errorMsg);
+      const data = error.response?.data;
+      if (error.response?.status === 409 && data?.suspect_id) {
+        toast.warning(data.detail, {
+          duration: Infinity,
+          action: { label: 'Keep anyway', onClick: () => keepDuplicate(data.suspect_id) },
+          cancel: { label: 'Discard', onClick: () => discardDuplicate(data.suspect_id) }
+        });
+      } else {
+        toast.error(data?.detail || 'Failed to upload bill');
+      }
     } finally {
       setUploading(false);
     }
   }, [bills]);
 
+  const keepDuplicate = async (suspectId) => {
+    try {
+      const response = await api.post(`/bills/duplicates/${suspectId}/keep`);
+      setBills((current) => [response.data, ...current]);
+      toast.success('Bill kept');
+    } catch (error) {
+      toast.error(error.response?.data?.detail || 'Failed to keep bill');
+    }
+  };
+
+  const discardDuplicate = async (suspectId) => {
+    try {
+      await api.delete(`/bills/duplicates/${suspectId}`);
+      toast.success('Duplicate discarded');
+    } catch (error) {
+      toast.error('Failed to discard bill');
+    }
+  };
+
   const { getRootProps, getInputProps, isDragActive } = useDropzone({
     onDrop,
     accept: {
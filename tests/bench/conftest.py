@@ -0,0 +1,37 @@
+"""Fixtures for the CPU hot-path microbenchmarks.
+
+Run with pytest-benchmark installed:
+
+    pytest tests/bench --benchmark-storage=tests/bench/baselines \
+        --benchmark-compare=0001 --benchmark-compare-fail=mean:25%
+
+``--benchmark-save=<name>`` records a new baseline in the same storage.
+"""
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parent / "perf"))
+sys.path.insert(0, str(BENCH_DIR.parent.parent / "backend"))
+
+try:
+    import pytest_benchmark  # noqa: F401
+except ImportError:
+    collect_ignore_glob = ["test_*.py"]
+
+
+@pytest.fixture(scope="session")
+def server_module(tmp_path_factory):
+    """Import server.py with the LLM stubbed and no live Mongo connection needed"""
+    from stubs import StubLatency, install_llm_stub
+
+    os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+    os.environ.setdefault("DB_NAME", "bench")
+    os.environ.setdefault("UPLOADS_DIR", str(tmp_path_factory.mktemp("uploads")))
+    os.environ["SWEEPER_ENABLED"] = "false"
+    install_llm_stub(StubLatency())
+    import server
+    return server
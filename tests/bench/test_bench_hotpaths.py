@@ -0,0 +1,80 @@
+"""Microbenchmarks for the CPU-bound paths of the bill and ledger routers"""
+import io
+import json
+import random
+
+import pytest
+
+import models
+from seed import make_bill, make_invoice
+from stubs import synthetic_bill
+
+
+def _image_bytes(width: int, height: int, mode: str, fmt: str) -> bytes:
+    from PIL import Image, ImageDraw
+
+    img = Image.new(mode, (width, height), color="white" if mode != "L" else 255)
+    draw = ImageDraw.Draw(img)
+    for row in range(20, height - 20, 28):
+        draw.text((30, row), f"Item {row} HSN 8471 x 2 @ 1,250.00 = 2,500.00", fill="black" if mode != "L" else 0)
+    buffered = io.BytesIO()
+    img.save(buffered, format=fmt, **({"quality": 90} if fmt == "JPEG" else {}))
+    return buffered.getvalue()
+
+
+@pytest.mark.parametrize("width,height,mode,fmt", [
+    (800, 1100, "RGB", "JPEG"),
+    (1600, 2200, "RGB", "JPEG"),
+    (3000, 4000, "RGB", "JPEG"),
+    (1600, 2200, "RGBA", "PNG"),
+    (1600, 2200, "L", "PNG"),
+])
+def test_convert_to_base64_image(benchmark, server_module, width, height, mode, fmt):
+    content = _image_bytes(width, height, mode, fmt)
+    result = benchmark(server_module.bills.convert_to_base64, content, "image")
+    assert result
+
+
+def test_convert_to_base64_pdf(benchmark, server_module):
+    content = b"%PDF-1.4\n" + bytes(random.getrandbits(8) for _ in range(2_000_000))
+    assert benchmark(server_module.bills.convert_to_base64, content, "pdf")
+
+
+@pytest.mark.parametrize("products", [5, 200])
+@pytest.mark.parametrize("fenced", [True, False])
+def test_parse_extraction_response(benchmark, server_module, products, fenced):
+    body = json.dumps(synthetic_bill(products))
+    response = f"```json\n{body}\n```" if fenced else body
+    result = benchmark(server_module.bills.parse_extraction_response, response)
+    assert len(result.products) == products
+
+
+@pytest.mark.parametrize("products", [10, 1000])
+def test_bill_models_validation(benchmark, server_module, products):
+    bills = [make_bill("user_bench", products, 365) for _ in range(50)]
+
+    def validate():
+        return [models.BillResponse(**bill) for bill in bills]
+
+    assert len(benchmark(validate)) == 50
+
+
+@pytest.mark.parametrize("items", [8, 500])
+def test_invoice_response_validation(benchmark, server_module, items):
+    invoices = [make_invoice("user_bench", n, items, 365) for n in range(50)]
+
+    def validate():
+        return [models.InvoiceResponse(**inv) for inv in invoices]
+
+    assert len(benchmark(validate)) == 50
+
+
+def test_build_ledger_entries(benchmark, server_module):
+    bills = [make_bill("user_bench", 5, 365) for _ in range(10_000)]
+    assert len(benchmark(server_module.ledger.build_ledger_entries, bills)) == 10_000
+
+
+def test_build_ledger_workbook_100k(benchmark, server_module):
+    bills = [make_bill("user_bench", 1, 365) for _ in range(100_000)]
+    result = benchmark.pedantic(server_module.ledger.build_ledger_workbook, args=(bills,), rounds=1, iterations=1)
+    assert result.getbuffer().nbytes > 0
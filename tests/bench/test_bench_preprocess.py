@@ -0,0 +1,29 @@
+"""Microbenchmarks for bill image preprocessing over the synthetic corpus"""
+import pytest
+
+from image_corpus import VARIANTS, render_bill
+from stubs import synthetic_bill
+
+
+@pytest.fixture(scope="module")
+def corpus():
+    return {name: render_bill(synthetic_bill(8), **options) for name, options in VARIANTS.items()}
+
+
+@pytest.mark.parametrize("variant", list(VARIANTS))
+@pytest.mark.parametrize("profile", ["full", "compact"])
+def test_prepare_image(benchmark, corpus, variant, profile):
+    from preprocess import PROFILES, prepare_image
+
+    prepared = benchmark(prepare_image, corpus[variant], PROFILES[profile])
+    benchmark.extra_info["payload_bytes"] = len(prepared.data)
+    assert prepared.data
+
+
+@pytest.mark.parametrize("variant", list(VARIANTS))
+def test_compact_payload_is_smaller(corpus, variant):
+    from preprocess import PROFILES, prepare_image
+
+    full = prepare_image(corpus[variant], PROFILES["full"])
+    compact = prepare_image(corpus[variant], PROFILES["compact"])
+    assert len(compact.data) < len(full.data) * 0.7
@@ -0,0 +1,58 @@
+"""Read-path serialization: validated models vs trusted documents"""
+import asyncio
+from typing import List
+
+import mongomock
+import pytest
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+import models
+from responses import response_projection, trusted_response
+from seed import make_bill, make_invoice
+
+
+def _legacy_response(model, docs):
+    """What the handlers used to do: build models, then FastAPI re-validates and encodes them"""
+    field = create_response_field(name="response", type_=List[model])
+    loop = asyncio.new_event_loop()
+
+    def render():
+        content = [model(**doc) for doc in docs]
+        value = loop.run_until_complete(serialize_response(field=field, response_content=content))
+        return JSONResponse(content=jsonable_encoder(value)).body
+
+    return render
+
+
+def _projected(model, docs):
+    """The documents as the handlers read them, with dotted fields projected the way Mongo does"""
+    collection = mongomock.MongoClient().bench.docs
+    collection.insert_many([dict(doc) for doc in docs])
+    return list(collection.find({}, response_projection(model)))
+
+
+@pytest.mark.parametrize("path", ["legacy", "trusted"])
+def test_bills_list_1000(benchmark, server_module, path):
+    docs = [make_bill("user_bench", 5, 365) for _ in range(1000)]
+    model = models.BillResponse
+    if path == "legacy":
+        body = benchmark(_legacy_response(model, docs))
+    else:
+        docs = _projected(model, docs)
+        body = benchmark(lambda: trusted_response(docs, model).body)
+    assert body.startswith(b"[") and b'"products":[{' in body
+
+
+@pytest.mark.parametrize("path", ["legacy", "trusted"])
+def test_invoices_list_1000(benchmark, server_module, path):
+    docs = [make_invoice("user_bench", n, 5, 365) for n in range(1000)]
+    model = models.InvoiceResponse
+    if path == "legacy":
+        body = benchmark(_legacy_response(model, docs))
+    else:
+        docs = _projected(model, docs)
+        body = benchmark(lambda: trusted_response(docs, model).body)
+    assert body.startswith(b"[") and b'"items":[{"product_name"' in body
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""Benchmark corpus for bill image preprocessing: payload bytes vs extraction accuracy.
+
+Every image in the corpus is prepared with each preprocessing profile, and
+the payload size is reported against the legacy ``full`` conversion. With
+``--extract``, each payload is also sent through the real extraction router
+and the key fields are scored against ground truth. That mode needs
+``EMERGENT_LLM_KEY`` and the emergentintegrations SDK.
+
+The corpus is either synthetic (the default) or a directory of real bills.
+For synthetic bills the GST data is rendered into the image and used as the
+ground truth. Variants cover clean scans, skew, a photo on a dark table,
+colour stamps and 12 MP phone shots. A real corpus holds ``<name>.jpg`` or
+``<name>.png`` files, each with an optional ``<name>.json`` holding the
+expected fields.
+
+    python tests/perf/image_corpus.py
+    python tests/perf/image_corpus.py --dir ~/bills --extract --report corpus.json
+"""
+import argparse
+import asyncio
+import io
+import json
+import sys
+from pathlib import Path
+from typing import Iterator, Optional, Tuple
+
+PERF_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(PERF_DIR))
+sys.path.insert(0, str(PERF_DIR.parent.parent / "backend"))
+
+from stubs import synthetic_bill  # noqa: E402
+
+SCORED_FIELDS = ("seller_gstin", "invoice_number", "subtotal", "total_gst", "total_amount")
+
+VARIANTS = {
+    "scan": {},
+    "skewed": {"skew": 3.0},
+    "table_photo": {"skew": -2.0, "background": (70, 58, 45)},
+    "colour_stamp": {"stamp": True},
+    "large_type": {"font_size": 56},
+    "phone_12mp": {"size": (3000, 4000), "font_size": 48, "background": (90, 90, 95)},
+}
+
+
+def render_bill(bill: dict, size=(1600, 2200), font_size: int = 28, skew: float = 0.0,
+                background: Optional[tuple] = None, stamp: bool = False) -> bytes:
+    """Draw a GST bill as a JPEG photo or scan"""
+    from PIL import Image, ImageDraw, ImageFont
+
+    width, height = size
+    page = Image.new("RGB", size, "white")
+    draw = ImageDraw.Draw(page)
+    try:
+        font = ImageFont.load_default(size=font_size)
+    except TypeError:  # Pillow < 10.1 has a single fixed-size bitmap font
+        font = ImageFont.load_default()
+    lines = [
+        bill["seller_name"],
+        f"GSTIN: {bill['seller_gstin']}",
+        f"Invoice No: {bill['invoice_number']}    Date: {bill['invoice_date']}",
+        f"Bill To: {bill['buyer_name']}",
+        "",
+        "Item                HSN      Qty     Rate        Amount",
+    ]
+    for item in bill["products"]:
+        lines.append(f"{item['name']:<18}{item['hsn_code']:<9}{item['quantity']:<8}"
+                     f"{item['rate']:<12.2f}{item['amount']:.2f}")
+    lines += [
+        "",
+        f"Subtotal: {bill['subtotal']:.2f}",
+        f"CGST 9%: {bill['cgst']:.2f}    SGST 9%: {bill['sgst']:.2f}",
+        f"Total GST: {bill['total_gst']:.2f}",
+        f"Grand Total: {bill['total_amount']:.2f}",
+    ]
+    margin = width // 14
+    y = margin
+    for line in lines:
+        draw.text((margin, y), line, fill="black", font=font)
+        y += int(font_size * 1.8)
+    if stamp:
+        box = (width - margin - 360, y + 40, width - margin, y + 260)
+        draw.ellipse(box, outline=(30, 60, 200), width=8)
+        draw.text((box[0] + 80, box[1] + 90), "PAID", fill=(30, 60, 200), font=font)
+
+    if skew:
+        page = page.rotate(skew, expand=True, fillcolor="white" if background is None else background)
+    if background is not None:
+        canvas = Image.new("RGB", (int(page.width * 1.3), int(page.height * 1.2)), background)
+        canvas.paste(page, ((canvas.width - page.width) // 2, (canvas.height - page.height) // 2))
+        page = canvas
+    buffered = io.BytesIO()
+    page.save(buffered, format="JPEG", quality=92)
+    return buffered.getvalue()
+
+
+def synthetic_corpus(products: int = 8) -> Iterator[Tuple[str, bytes, dict]]:
+    for name, options in VARIANTS.items():
+        bill = synthetic_bill(products)
+        yield name, render_bill(bill, **options), bill
+
+
+def directory_corpus(directory: Path) -> Iterator[Tuple[str, bytes, Optional[dict]]]:
+    for path in sorted(directory.iterdir()):
+        if path.suffix.lower() not in (".jpg", ".jpeg", ".png"):
+            continue
+        truth_path = path.with_suffix(".json")
+        truth = json.loads(truth_path.read_text()) if truth_path.exists() else None
+        yield path.stem, path.read_bytes(), truth
+
+
+def score(extracted, truth: Optional[dict]) -> Optional[float]:
+    """Fraction of scored fields matching ground truth (amounts within 1 rupee)"""
+    if not truth:
+        return None
+    hits = 0
+    for field in SCORED_FIELDS:
+        expected, actual = truth.get(field), getattr(extracted, field, None)
+        if isinstance(expected, (int, float)) and isinstance(actual, (int, float)):
+            hits += abs(expected - actual) <= 1.0
+        else:
+            hits += str(expected or "").strip().upper() == str(actual or "").strip().upper()
+    return hits / len(SCORED_FIELDS)
+
+
+async def run(args) -> list:
+    from preprocess import PROFILES, prepare_image
+
+    router = None
+    if args.extract:
+        from extraction import ExtractionRouter
+        from routers.bills import call_vision_model
+        router = ExtractionRouter.from_env(call_vision_model)
+
+    corpus = directory_corpus(Path(args.dir)) if args.dir else synthetic_corpus()
+    rows = []
+    for name, content, truth in corpus:
+        baseline = None
+        for profile_name in args.profiles.split(","):
+            prepared = prepare_image(content, PROFILES[profile_name])
+            payload = len(prepared.data)
+            baseline = baseline or (payload if profile_name == "full" else None)
+            row = {"image": name, **prepared.summary()}
+            if router is not None:
+                import base64
+                try:
+                    routed = await router.extract(base64.b64encode(prepared.data).decode("utf-8"))
+                    row["accuracy"] = score(routed.data, truth)
+                    row["confidence"] = routed.data.confidence_score
+                    row["model"] = routed.model
+                except Exception as e:
+                    row["error"] = str(e)
+            rows.append(row)
+        for row in rows:
+            if row["image"] == name and baseline:
+                row["saved_pct"] = round(100 * (1 - row["payload_bytes"] / baseline), 1)
+    return rows
+
+
+def print_report(rows):
+    header = f"{'image':<16}{'profile':<9}{'bytes':>10}{'saved %':>9}{'size':>12}{'gray':>6}{'skew':>7}{'acc':>6}"
+    print(header)
+    print("-" * len(header))
+    for r in rows:
+        accuracy = r.get("accuracy")
+        print(f"{r['image']:<16}{r['profile']:<9}{r['payload_bytes']:>10}{r.get('saved_pct', ''):>9}"
+              f"{str(r['width']) + 'x' + str(r['height']):>12}{'y' if r['grayscale'] else 'n':>6}"
+              f"{r['deskew_angle']:>7}{'' if accuracy is None else f'{accuracy:.2f}':>6}")
+    by_profile = {}
+    for r in rows:
+        by_profile.setdefault(r["profile"], []).append(r)
+    for profile, items in by_profile.items():
+        total = sum(r["payload_bytes"] for r in items)
+        scored = [r["accuracy"] for r in items if r.get("accuracy") is not None]
+        accuracy = f", mean accuracy {sum(scored) / len(scored):.3f}" if scored else ""
+        print(f"{profile}: {total} bytes over {len(items)} images{accuracy}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dir", default=None, help="directory of real bill images with optional .json truth")
+    parser.add_argument("--profiles", default="full,compact")
+    parser.add_argument("--extract", action="store_true", help="also run extraction and score accuracy")
+    parser.add_argument("--report", default=None, help="write JSON rows to this path")
+    args = parser.parse_args(argv)
+
+    rows = asyncio.run(run(args))
+    print_report(rows)
+    if args.report:
+        Path(args.report).write_text(json.dumps(rows, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
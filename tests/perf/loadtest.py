@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""Load test for the Bizupy API against a local MongoDB and stubbed LLM.
+
+Seeds a throwaway database with synthetic users, bills and invoices, stubs
+``LlmChat`` and the Emergent Auth endpoint with configurable latency, then
+drives the API concurrently and reports throughput and p50/p95/p99 latency
+per scenario. Results are compared with ``thresholds.json``; the exit code is
+non-zero when any scenario regresses past its threshold.
+
+Examples:
+
+    python tests/perf/loadtest.py --bills 10000 --invoices 10000
+    python tests/perf/loadtest.py --mongomock --bills 2000 --scenarios dashboard,ledger
+    python tests/perf/loadtest.py --bills 1000000 --concurrency 64 --report perf.json
+
+By default requests go through an in-process ASGI transport, which measures
+server-side cost without network noise. Pass ``--base-url`` to target a
+running server seeded with the same database instead.
+"""
+import argparse
+import asyncio
+import io
+import json
+import logging
+import math
+import os
+import socket
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+
+PERF_DIR = Path(__file__).resolve().parent
+BACKEND_DIR = PERF_DIR.parent.parent / "backend"
+sys.path.insert(0, str(PERF_DIR))
+sys.path.insert(0, str(BACKEND_DIR))
+
+from stubs import StubLatency, install_llm_stub, create_auth_stub_app  # noqa: E402
+from seed import seed  # noqa: E402
+
+DEFAULT_THRESHOLDS = PERF_DIR / "thresholds.json"
+
+
+def percentile(sorted_values, pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def make_upload_image(width: int, height: int) -> bytes:
+    from PIL import Image, ImageDraw
+
+    img = Image.new("RGB", (width, height), color="white")
+    draw = ImageDraw.Draw(img)
+    for row in range(40, height - 40, 30):
+        draw.text((40, row), f"Item {row} x 2 @ 100.00 = 200.00", fill="black")
+    buffered = io.BytesIO()
+    img.save(buffered, format="JPEG", quality=85)
+    return buffered.getvalue()
+
+
+def build_scenarios(args, upload_image: bytes):
+    today = datetime.now(timezone.utc).date()
+    start = (today - timedelta(days=90)).isoformat()
+    end = today.isoformat()
+    return {
+        "dashboard": lambda c: c.get("/api/dashboard/stats"),
+        "bills": lambda c: c.get("/api/bills", params={"limit": 50}),
+        "invoices": lambda c: c.get("/api/invoices", params={"limit": 50}),
+        "customers": lambda c: c.get("/api/customers"),
+        "ledger": lambda c: c.get("/api/ledger"),
+        "export": lambda c: c.get("/api/ledger/export", params={"format": "xlsx"}),
+        "analysis": lambda c: c.get("/api/analysis/summary",
+                                    params={"type": "invoices", "start_date": start, "end_date": end}),
+        "upload": lambda c: c.post("/api/bills/upload",
+                                   files={"file": ("bill.jpg", upload_image, "image/jpeg")}),
+        "login": lambda c: c.post("/api/auth/google-session", json={"session_id": uuid.uuid4().hex}),
+    }
+
+
+async def run_scenario(name, request_fn, clients, total_requests: int, concurrency: int) -> dict:
+    latencies = []
+    errors = 0
+    statuses = {}
+    issued = 0
+
+    async def worker(worker_id: int):
+        nonlocal issued, errors
+        client = clients[worker_id % len(clients)]
+        while issued < total_requests:
+            issued += 1
+            start = time.perf_counter()
+            try:
+                response = await request_fn(client)
+                status = response.status_code
+            except Exception:
+                status = "exception"
+            latencies.append((time.perf_counter() - start) * 1000)
+            statuses[status] = statuses.get(status, 0) + 1
+            if status != 200:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "scenario": name,
+        "requests": len(latencies),
+        "errors": errors,
+        "statuses": {str(k): v for k, v in statuses.items()},
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "max_ms": round(latencies[-1], 2) if latencies else 0.0,
+    }
+
+
+def check_thresholds(results, thresholds: dict):
+    failures = []
+    for result in results:
+        limits = thresholds.get(result["scenario"], {})
+        for key, limit in limits.items():
+            if key.startswith("max_error_rate"):
+                value = result["errors"] / max(result["requests"], 1)
+                if value > limit:
+                    failures.append(f"{result['scenario']}: error rate {value:.3f} > {limit}")
+            elif key.startswith("min_"):
+                value = result.get(key[4:])
+                if value is not None and value < limit:
+                    failures.append(f"{result['scenario']}: {key[4:]} {value} < {limit}")
+            else:
+                value = result.get(key)
+                if value is not None and value > limit:
+                    failures.append(f"{result['scenario']}: {key} {value} > {limit}")
+    return failures
+
+
+def print_report(results):
+    header = f"{'scenario':<12}{'reqs':>7}{'errors':>8}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r['scenario']:<12}{r['requests']:>7}{r['errors']:>8}{r['throughput_rps']:>10}"
+              f"{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}{r['max_ms']:>10}")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_auth_stub(latency: StubLatency) -> str:
+    """Serve the Emergent Auth stub with uvicorn on a background thread"""
+    import uvicorn
+
+    port = free_port()
+    config = uvicorn.Config(create_auth_stub_app(latency), host="127.0.0.1", port=port, log_level="warning")
+    server = uvicorn.Server(config)
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}/auth/v1/env/oauth/session-data"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongo-url", default=os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--mongomock", action="store_true", help="use mongomock-motor instead of a real MongoDB")
+    parser.add_argument("--db-name", default=None, help="database to seed (default: a fresh perf_* database)")
+    parser.add_argument("--keep-db", action="store_true", help="do not drop the seeded database afterwards")
+    parser.add_argument("--skip-seed", action="store_true", help="reuse an already seeded --db-name")
+    parser.add_argument("--users", type=int, default=1)
+    parser.add_argument("--bills", type=int, default=10_000, help="bills per user")
+    parser.add_argument("--invoices", type=int, default=10_000, help="invoices per user")
+    parser.add_argument("--products-per-bill", type=int, default=5)
+    parser.add_argument("--llm-latency-ms", type=float, default=1500)
+    parser.add_argument("--llm-jitter-ms", type=float, default=500)
+    parser.add_argument("--llm-failure-rate", type=float, default=0.0)
+    parser.add_argument("--auth-latency-ms", type=float, default=150)
+    parser.add_argument("--upload-size", default="1600x2200", help="synthetic bill image WIDTHxHEIGHT")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--scenarios", default="dashboard,bills,invoices,ledger,export,analysis,upload")
+    parser.add_argument("--base-url", default=None, help="target a running server instead of in-process")
+    parser.add_argument("--thresholds", default=str(DEFAULT_THRESHOLDS))
+    parser.add_argument("--no-thresholds", action="store_true")
+    parser.add_argument("--report", default=None, help="write JSON results to this path")
+    return parser.parse_args(argv)
+
+
+async def main(argv=None) -> int:
+    args = parse_args(argv)
+    db_name = args.db_name or f"perf_{uuid.uuid4().hex[:8]}"
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    os.environ["MONGO_URL"] = args.mongo_url
+    os.environ["DB_NAME"] = db_name
+    os.environ.setdefault("EMERGENT_LLM_KEY", "stub-key")
+    os.environ["SWEEPER_ENABLED"] = "false"
+    # The upload scenario measures extraction throughput, not the per-user limiter; a run can
+    # still set UPLOAD_RATE_LIMITS to exercise it
+    os.environ.setdefault("UPLOAD_RATE_LIMITS", ",".join(
+        f"{plan}=1000000:1000000/1" for plan in ("free", "pro", "business")
+    ))
+    os.environ.setdefault("UPLOADS_DIR", str(Path("/tmp") / f"{db_name}_uploads"))
+
+    scenario_names = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    install_llm_stub(StubLatency(args.llm_latency_ms, args.llm_jitter_ms, args.llm_failure_rate),
+                     products=args.products_per_bill)
+    if "login" in scenario_names:
+        os.environ["EMERGENT_AUTH_URL"] = start_auth_stub(StubLatency(args.auth_latency_ms))
+
+    if args.mongomock:
+        import motor.motor_asyncio
+        from mongomock_motor import AsyncMongoMockClient
+        motor.motor_asyncio.AsyncIOMotorClient = AsyncMongoMockClient
+
+    import httpx
+    import server
+
+    if not args.skip_seed:
+        started = time.perf_counter()
+        users = await seed(server.db, users=args.users, bills_per_user=args.bills,
+                           invoices_per_user=args.invoices, products_per_bill=args.products_per_bill)
+        print(f"Seeded {args.users} user(s) x {args.bills} bills / {args.invoices} invoices "
+              f"in {time.perf_counter() - started:.1f}s into {db_name}")
+    else:
+        users = [{"session_token": s["session_token"]}
+                 async for s in server.db.user_sessions.find({}, {"_id": 0, "session_token": 1})]
+
+    width, height = (int(v) for v in args.upload_size.split("x"))
+    scenarios = build_scenarios(args, make_upload_image(width, height))
+
+    clients = []
+    for user in users:
+        headers = {"Authorization": f"Bearer {user['session_token']}"}
+        if args.base_url:
+            clients.append(httpx.AsyncClient(base_url=args.base_url, headers=headers, timeout=120))
+        else:
+            clients.append(httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app),
+                                             base_url="http://perf", headers=headers, timeout=120))
+
+    results = []
+    try:
+        for name in scenario_names:
+            if name not in scenarios:
+                print(f"Unknown scenario: {name}")
+                return 2
+            results.append(await run_scenario(name, scenarios[name], clients, args.requests, args.concurrency))
+    finally:
+        for client in clients:
+            await client.aclose()
+        if not args.keep_db and not args.skip_seed:
+            await server.client.drop_database(db_name)
+
+    print_report(results)
+    report = {
+        "config": {k: v for k, v in vars(args).items()},
+        "results": results,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+    }
+    if args.report:
+        Path(args.report).write_text(json.dumps(report, indent=2))
+
+    if args.no_thresholds:
+        return 0
+    thresholds = json.loads(Path(args.thresholds).read_text())
+    failures = check_thresholds(results, thresholds)
+    for failure in failures:
+        print(f"REGRESSION {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
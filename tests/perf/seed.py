@@ -0,0 +1,138 @@
+"""Synthetic data seeding for the performance suite.
+
+Documents mirror what ``backend/server.py`` writes so every endpoint sees
+realistic shapes: bills with ``extracted_data`` and product lines, invoices
+with items, customers, products and a live session per user.
+"""
+import random
+import uuid
+from datetime import datetime, timezone, timedelta
+from typing import List
+
+from stubs import synthetic_bill
+
+CHUNK_SIZE = 5000
+
+
+def _random_date(days_back: int) -> datetime:
+    return datetime.now(timezone.utc) - timedelta(seconds=random.randint(0, days_back * 86400))
+
+
+def make_bill(user_id: str, products: int, days_back: int) -> dict:
+    bill_id = str(uuid.uuid4())
+    return {
+        "id": bill_id,
+        "user_id": user_id,
+        "file_name": f"{bill_id}.jpg",
+        "file_key": f"{bill_id}.jpg",
+        "file_path": f"/tmp/{bill_id}.jpg",
+        "file_type": "image",
+        "upload_date": _random_date(days_back).isoformat(),
+        "ocr_status": "completed",
+        "extracted_data": synthetic_bill(products),
+    }
+
+
+def make_invoice(user_id: str, number: int, items: int, days_back: int) -> dict:
+    lines = []
+    for i in range(items):
+        quantity = random.randint(1, 10)
+        rate = round(random.uniform(10, 1000), 2)
+        lines.append({
+            "product_name": f"Product {i + 1}",
+            "hsn_code": f"{random.randint(1000, 9999)}",
+            "quantity": quantity,
+            "unit": "pcs",
+            "rate": rate,
+            "amount": round(quantity * rate, 2),
+        })
+    subtotal = round(sum(line["amount"] for line in lines), 2)
+    has_gstin = random.random() < 0.4
+    igst = round(subtotal * 0.18, 2) if has_gstin else 0.0
+    cgst = 0.0 if has_gstin else round(subtotal * 0.09, 2)
+    sgst = cgst
+    created = _random_date(days_back).isoformat()
+    return {
+        "id": str(uuid.uuid4()),
+        "user_id": user_id,
+        "invoice_number": f"INV-{user_id[:8].upper()}-{number:04d}",
+        "invoice_date": created,
+        "customer_id": None,
+        "customer_name": f"Customer {random.randint(1, 200)}",
+        "customer_gstin": "29ABCDE1234F1Z5" if has_gstin else None,
+        "customer_address": None,
+        "items": lines,
+        "subtotal": subtotal,
+        "cgst": cgst,
+        "sgst": sgst,
+        "igst": igst,
+        "total_gst": round(cgst + sgst + igst, 2),
+        "total_amount": round(subtotal + cgst + sgst + igst, 2),
+        "notes": None,
+        "created_at": created,
+    }
+
+
+async def _insert_chunked(collection, docs_iter):
+    batch = []
+    for doc in docs_iter:
+        batch.append(doc)
+        if len(batch) >= CHUNK_SIZE:
+            await collection.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        await collection.insert_many(batch, ordered=False)
+
+
+async def seed(db, users: int = 1, bills_per_user: int = 10_000, invoices_per_user: int = 10_000,
+               customers_per_user: int = 200, products_per_user: int = 200, products_per_bill: int = 5,
+               days_back: int = 365, plan: str = "pro") -> List[dict]:
+    """Seed synthetic users and their data; returns [{user_id, session_token}]"""
+    seeded = []
+    now = datetime.now(timezone.utc)
+    for _ in range(users):
+        user_id = f"user_{uuid.uuid4().hex[:12]}"
+        session_token = f"perf_{uuid.uuid4().hex}"
+        await db.users.insert_one({
+            "user_id": user_id,
+            "email": f"{user_id}@perf.example.com",
+            "name": "Perf User",
+            "picture": None,
+            "language_preference": "en",
+            "subscription_plan": plan,
+            "bill_count": bills_per_user,
+            "created_at": now.isoformat(),
+        })
+        await db.user_sessions.insert_one({
+            "user_id": user_id,
+            "session_token": session_token,
+            "expires_at": (now + timedelta(days=7)).isoformat(),
+            "created_at": now.isoformat(),
+        })
+        await _insert_chunked(
+            db.bills,
+            (make_bill(user_id, products_per_bill, days_back) for _ in range(bills_per_user))
+        )
+        await _insert_chunked(
+            db.invoices,
+            (make_invoice(user_id, n + 1, random.randint(1, 8), days_back) for n in range(invoices_per_user))
+        )
+        await _insert_chunked(db.customers, ({
+            "id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "name": f"Customer {n + 1}",
+            "gstin": None,
+            "total_purchases": round(random.uniform(0, 10**5), 2),
+            "created_at": now.isoformat(),
+        } for n in range(customers_per_user)))
+        await _insert_chunked(db.products, ({
+            "id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "name": f"Product {n + 1}",
+            "hsn_code": f"{random.randint(1000, 9999)}",
+            "unit": "pcs",
+            "default_price": round(random.uniform(10, 1000), 2),
+            "created_at": now.isoformat(),
+        } for n in range(products_per_user)))
+        seeded.append({"user_id": user_id, "session_token": session_token})
+    return seeded
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""Cold-start benchmark: how long a fresh worker takes to import server.py.
+
+Each run starts a new interpreter with ``-X importtime``, imports the server
+module and records the wall-clock time. It then sums the import-time
+``self`` column by top-level package, so the report shows where boot time
+goes. With ``--warm``, every lazily imported dependency is loaded
+afterwards as well. That is the cost the post-startup warm-up moves off the
+boot path.
+
+No database is contacted; the emergentintegrations SDK is stubbed when it is
+not installed.
+
+    python tests/perf/startup.py
+    python tests/perf/startup.py --runs 5 --warm --top 15 --report startup.json
+    python tests/perf/startup.py --max-seconds 1.5     # exit 1 when slower
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+PERF_DIR = Path(__file__).resolve().parent
+BACKEND_DIR = PERF_DIR.parent.parent / "backend"
+
+BOOTSTRAP = """
+import asyncio, importlib.util, json, sys, time
+sys.path[:0] = [{perf!r}, {backend!r}]
+if importlib.util.find_spec("emergentintegrations") is None:
+    from stubs import StubLatency, install_llm_stub
+    install_llm_stub(StubLatency())
+started = time.perf_counter()
+import server
+boot = time.perf_counter() - started
+warm = None
+if {warm!r}:
+    import lazy
+    started = time.perf_counter()
+    asyncio.run(lazy.warm_up())
+    warm = time.perf_counter() - started
+print(json.dumps({{"boot": boot, "warm": warm, "lazy": __import__("lazy").registered()}}))
+"""
+
+
+def run_once(warm: bool) -> dict:
+    env = {
+        **os.environ,
+        "MONGO_URL": os.environ.get("MONGO_URL", "mongodb://localhost:27017"),
+        "DB_NAME": os.environ.get("DB_NAME", "startup_bench"),
+        "EMERGENT_LLM_KEY": os.environ.get("EMERGENT_LLM_KEY", "stub-key"),
+        "SWEEPER_ENABLED": "false",
+    }
+    code = BOOTSTRAP.format(perf=str(PERF_DIR), backend=str(BACKEND_DIR), warm=warm)
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], env=env, cwd=str(BACKEND_DIR),
+                          capture_output=True, text=True, check=True)
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    by_package = defaultdict(int)
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line.split(":", 1)[1].split("|")
+        by_package[name.strip().split(".")[0]] += int(self_us)
+    result["packages"] = dict(by_package)
+    return result
+
+
+def summarize(runs: list, top: int) -> dict:
+    packages = defaultdict(list)
+    for run in runs:
+        for name, micros in run["packages"].items():
+            packages[name].append(micros / 1e6)
+    ranked = sorted(((name, statistics.median(values)) for name, values in packages.items()),
+                    key=lambda item: item[1], reverse=True)
+    warm = [r["warm"] for r in runs if r["warm"] is not None]
+    return {
+        "runs": len(runs),
+        "boot_seconds": round(statistics.median(r["boot"] for r in runs), 4),
+        "warm_up_seconds": round(statistics.median(warm), 4) if warm else None,
+        "lazy_modules": runs[-1]["lazy"],
+        "packages": [{"package": name, "seconds": round(seconds, 4)} for name, seconds in ranked[:top]],
+    }
+
+
+def print_report(summary: dict):
+    print(f"import server: {summary['boot_seconds']:.3f}s (median of {summary['runs']} runs)")
+    if summary["warm_up_seconds"] is not None:
+        print(f"warm-up of lazy modules: {summary['warm_up_seconds']:.3f}s")
+    scope = "import server and warm-up" if summary["warm_up_seconds"] is not None else "import server"
+    print(f"\nimport time by package ({scope})")
+    print(f"{'package':<28}{'seconds':>10}")
+    print("-" * 38)
+    for row in summary["packages"]:
+        print(f"{row['package']:<28}{row['seconds']:>10.4f}")
+    print("\nlazy modules loaded:", ", ".join(f"{name}={'yes' if loaded else 'no'}"
+                                            for name, loaded in summary["lazy_modules"].items()))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--warm", action="store_true", help="also time loading every lazy dependency")
+    parser.add_argument("--top", type=int, default=20, help="packages to list")
+    parser.add_argument("--max-seconds", type=float, default=None, help="fail when the median boot is slower")
+    parser.add_argument("--report", default=None, help="write the summary as JSON to this path")
+    args = parser.parse_args(argv)
+
+    summary = summarize([run_once(args.warm) for _ in range(args.runs)], args.top)
+    print_report(summary)
+    if args.report:
+        Path(args.report).write_text(json.dumps(summary, indent=2))
+    if args.max_seconds is not None and summary["boot_seconds"] > args.max_seconds:
+        print(f"\nFAIL: boot {summary['boot_seconds']:.3f}s exceeds {args.max_seconds:.3f}s")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,213 @@
+"""Stand-ins for external services used by the performance suite.
+
+* ``install_llm_stub`` registers a fake ``emergentintegrations.llm.chat``
+  module whose ``LlmChat`` answers with a synthetic GST bill after a
+  configurable delay, so uploads can be load-tested without LLM cost.
+* ``create_auth_stub_app`` is a tiny ASGI app mimicking the Emergent Auth
+  session-data endpoint; serve it with uvicorn and point ``EMERGENT_AUTH_URL``
+  at it.
+* ``create_razorpay_stub_app`` answers Razorpay order creation; point
+  ``RAZORPAY_BASE_URL`` at it. ``sign_checkout`` and ``webhook_delivery``
+  produce the signatures Razorpay would send for a payment on such an order.
+"""
+import asyncio
+import hashlib
+import hmac
+import json
+import random
+import sys
+import types
+import uuid
+
+
+class StubLatency:
+    """Latency model: fixed base plus uniform jitter, in milliseconds"""
+
+    def __init__(self, base_ms: float = 0.0, jitter_ms: float = 0.0, failure_rate: float = 0.0):
+        self.base_ms = base_ms
+        self.jitter_ms = jitter_ms
+        self.failure_rate = failure_rate
+
+    async def wait(self):
+        delay = self.base_ms + random.uniform(0, self.jitter_ms)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise RuntimeError("Stubbed upstream failure")
+
+
+def synthetic_bill(products: int = 5) -> dict:
+    items = []
+    subtotal = 0.0
+    for i in range(products):
+        quantity = random.randint(1, 20)
+        rate = round(random.uniform(10, 2000), 2)
+        amount = round(quantity * rate, 2)
+        subtotal += amount
+        items.append({
+            "name": f"Item {i + 1}",
+            "hsn_code": f"{random.randint(1000, 9999)}",
+            "quantity": quantity,
+            "rate": rate,
+            "amount": amount,
+        })
+    subtotal = round(subtotal, 2)
+    cgst = round(subtotal * 0.09, 2)
+    sgst = round(subtotal * 0.09, 2)
+    return {
+        "seller_gstin": "27AAPFU0939F1ZV",
+        "seller_name": "Stub Traders",
+        "buyer_gstin": None,
+        "buyer_name": f"Customer {random.randint(1, 200)}",
+        "invoice_number": f"INV-{random.randint(1, 10**6):06d}",
+        "invoice_date": "2025-01-15",
+        "products": items,
+        "subtotal": subtotal,
+        "cgst": cgst,
+        "sgst": sgst,
+        "igst": 0.0,
+        "total_gst": round(cgst + sgst, 2),
+        "total_amount": round(subtotal + cgst + sgst, 2),
+        "confidence_score": 0.95,
+    }
+
+
+def install_llm_stub(latency: StubLatency, products: int = 5, fenced: bool = True):
+    """Register a fake emergentintegrations package in sys.modules"""
+
+    class ImageContent:
+        def __init__(self, image_base64: str):
+            self.image_base64 = image_base64
+
+    class UserMessage:
+        def __init__(self, text: str, file_contents=None):
+            self.text = text
+            self.file_contents = file_contents or []
+
+    class LlmChat:
+        calls = 0
+
+        def __init__(self, api_key: str, session_id: str, system_message: str):
+            self.api_key = api_key
+            self.session_id = session_id
+            self.system_message = system_message
+
+        def with_model(self, provider: str, model: str):
+            self.provider = provider
+            self.model = model
+            return self
+
+        async def send_message(self, message):
+            LlmChat.calls += 1
+            await latency.wait()
+            body = json.dumps(synthetic_bill(products))
+            return f"```json\n{body}\n```" if fenced else body
+
+    package = types.ModuleType("emergentintegrations")
+    llm = types.ModuleType("emergentintegrations.llm")
+    chat = types.ModuleType("emergentintegrations.llm.chat")
+    chat.LlmChat = LlmChat
+    chat.UserMessage = UserMessage
+    chat.ImageContent = ImageContent
+    package.llm = llm
+    llm.chat = chat
+    sys.modules.update({
+        "emergentintegrations": package,
+        "emergentintegrations.llm": llm,
+        "emergentintegrations.llm.chat": chat,
+    })
+    return LlmChat
+
+
+def create_auth_stub_app(latency: StubLatency):
+    """ASGI app answering Emergent Auth session-data requests"""
+
+    async def app(scope, receive, send):
+        if scope["type"] != "http":
+            return
+        await latency.wait()
+        headers = dict(scope.get("headers") or [])
+        session_id = headers.get(b"x-session-id", b"").decode() or uuid.uuid4().hex
+        body = json.dumps({
+            "email": f"load_{session_id[:12]}@example.com",
+            "name": "Load Test",
+            "picture": None,
+            "session_token": f"stub_{uuid.uuid4().hex}",
+        }).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"application/json")],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    return app
+
+
+def create_razorpay_stub_app(latency: StubLatency):
+    """ASGI app answering Razorpay ``POST /v1/orders`` with a created order"""
+
+    async def app(scope, receive, send):
+        if scope["type"] != "http":
+            return
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        await latency.wait()
+        if scope["method"] == "POST" and scope["path"] == "/v1/orders":
+            data = json.loads(body or b"{}")
+            status, payload = 200, {
+                "id": f"order_{uuid.uuid4().hex[:14]}",
+                "entity": "order",
+                "amount": data.get("amount"),
+                "currency": data.get("currency", "INR"),
+                "receipt": data.get("receipt"),
+                "notes": data.get("notes", {}),
+                "status": "created",
+            }
+        else:
+            status, payload = 404, {"error": {"code": "BAD_REQUEST_ERROR", "description": "Not found"}}
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"application/json")],
+        })
+        await send({"type": "http.response.body", "body": json.dumps(payload).encode()})
+
+    return app
+
+
+def _hmac_hex(secret: str, message: bytes) -> str:
+    return hmac.new(secret.encode(), message, hashlib.sha256).hexdigest()
+
+
+def sign_checkout(key_secret: str, order_id: str, payment_id: str) -> str:
+    """Signature Razorpay Checkout hands the client after a successful payment"""
+    return _hmac_hex(key_secret, f"{order_id}|{payment_id}".encode())
+
+
+def webhook_delivery(webhook_secret: str, order_id: str, payment_id: str, amount: int,
+                     event: str = "payment.captured", event_id: str = None):
+    """(body, headers) for a Razorpay webhook about a payment on ``order_id``"""
+    body = json.dumps({
+        "entity": "event",
+        "event": event,
+        "contains": ["payment"],
+        "payload": {"payment": {"entity": {
+            "id": payment_id,
+            "entity": "payment",
+            "order_id": order_id,
+            "amount": amount,
+            "currency": "INR",
+            "status": "failed" if event == "payment.failed" else "captured",
+        }}},
+    }).encode()
+    headers = {
+        "X-Razorpay-Signature": _hmac_hex(webhook_secret, body),
+        "X-Razorpay-Event-Id": event_id or f"evt_{uuid.uuid4().hex[:14]}",
+        "Content-Type": "application/json",
+    }
+    return body, headers
@@ -0,0 +1,36 @@
+"""Unit tests for backend modules, run against mongomock instead of a live MongoDB.
+
+The tests drive coroutines with ``asyncio.run`` through the ``run`` fixture, and
+take a fresh in-memory database from the ``db`` fixture, which skips the test
+when ``mongomock_motor`` is not installed. Tests of the API modules import them
+through the ``server`` fixture.
+"""
+import asyncio
+import importlib
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent / "backend"))
+
+
+@pytest.fixture
+def run():
+    return asyncio.run
+
+
+@pytest.fixture
+def db():
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    return mongomock_motor.AsyncMongoMockClient()["test"]
+
+
+@pytest.fixture(scope="session")
+def server(tmp_path_factory):
+    """The server module; resources builds its lazily connecting Mongo client at import"""
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setenv("MONGO_URL", "mongodb://localhost:27017")
+        patch.setenv("DB_NAME", "unit_test")
+        patch.setenv("UPLOADS_DIR", str(tmp_path_factory.mktemp("uploads")))
+        return importlib.import_module("server")
@@ -0,0 +1,96 @@
+"""Write-behind audit log: batching, backpressure, shutdown flush and paging."""
+import asyncio
+
+import pytest
+
+from audit import AuditLog
+
+
+class CountingCollection:
+    """Wraps a collection, recording batch sizes and optionally stalling writes"""
+
+    def __init__(self, collection, stall: asyncio.Event = None):
+        self.collection = collection
+        self.stall = stall
+        self.batches = []
+
+    async def insert_many(self, docs, ordered=True):
+        if self.stall is not None:
+            await self.stall.wait()
+        self.batches.append(len(docs))
+        return await self.collection.insert_many(docs, ordered=ordered)
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+
+def test_events_are_written_in_batches_and_flushed_on_stop(run, db):
+    collection = CountingCollection(db.audit_logs)
+    audit_log = AuditLog(collection, batch_size=10, flush_interval=60)
+
+    async def scenario():
+        audit_log.start()
+        for i in range(25):
+            await audit_log.record("u1", "update_bill", "bill", f"b{i}")
+        await asyncio.sleep(0.05)
+        written_before_stop = list(collection.batches)
+        await audit_log.stop()
+        return written_before_stop, await collection.count_documents({})
+
+    written_before_stop, total = run(scenario())
+    assert written_before_stop == [10, 10]  # the size threshold, not the 60 s interval
+    assert collection.batches == [10, 10, 5]
+    assert total == 25
+
+
+def test_time_threshold_flushes_a_partial_batch(run, db):
+    collection = CountingCollection(db.audit_logs)
+    audit_log = AuditLog(collection, batch_size=100, flush_interval=0.05)
+
+    async def scenario():
+        audit_log.start()
+        await audit_log.record("u1", "create_invoice", "invoice", "i1")
+        await asyncio.sleep(0.2)
+        batches = list(collection.batches)
+        await audit_log.stop()
+        return batches
+
+    assert run(scenario()) == [1]
+
+
+def test_full_queue_applies_backpressure_then_drops(run, db):
+    stall = asyncio.Event()
+    collection = CountingCollection(db.audit_logs, stall)
+    audit_log = AuditLog(collection, batch_size=2, flush_interval=0, max_queue=2, enqueue_timeout=0.02)
+
+    async def scenario():
+        audit_log.start()
+        # The writer takes a batch and stalls on it; the queue then fills up
+        for i in range(6):
+            await audit_log.record("u1", "update_bill", "bill", f"b{i}")
+            await asyncio.sleep(0)
+        stall.set()
+        await audit_log.stop()
+        return await collection.count_documents({})
+
+    written = run(scenario())
+    assert 2 <= written < 6
+
+
+def test_query_pages_newest_first(run, db):
+    audit_log = AuditLog(db.audit_logs)
+
+    async def scenario():
+        for i in range(5):
+            await audit_log.record("u1", "update_bill", "bill", f"b{i}")
+            await asyncio.sleep(0.002)
+        await audit_log.record("u2", "update_bill", "bill", "other")
+        first, cursor = await audit_log.query("u1", limit=3)
+        second, end = await audit_log.query("u1", limit=3, cursor=cursor)
+        return first, second, end
+
+    first, second, end = run(scenario())
+    assert [e["entity_id"] for e in first + second] == ["b4", "b3", "b2", "b1", "b0"]
+    assert end is None
+    with pytest.raises(ValueError):
+        run(audit_log.query("u1", cursor="not-a-cursor"))
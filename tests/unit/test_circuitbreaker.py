@@ -0,0 +1,156 @@
+"""CircuitBreaker state transitions, rolling window and adaptive timeout on a fake clock."""
+import asyncio
+
+import pytest
+
+from circuitbreaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, RollingWindow
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+async def ok():
+    return "ok"
+
+
+async def boom():
+    raise RuntimeError("provider error")
+
+
+def breaker(clock, **kwargs):
+    options = dict(min_calls=4, failure_ratio=0.5, window_seconds=60, open_seconds=30, timeout_min=1.0,
+                   timeout_max=90.0, timeout_min_samples=5, clock=clock)
+    return CircuitBreaker("test", **{**options, **kwargs})
+
+
+def test_opens_once_failure_ratio_is_reached_over_min_calls(run):
+    clock = Clock()
+    cb = breaker(clock)
+    for failed in (True, True, True):
+        cb.record(failed, None)
+    # Three failures out of three are still below min_calls
+    assert cb.state == CLOSED
+    cb.record(False, 0.1)
+    assert cb.state == OPEN
+    assert not cb.allows_calls()
+    with pytest.raises(CircuitOpenError) as raised:
+        run(cb.call(ok))
+    assert raised.value.retry_after == 30
+
+
+def test_half_open_probe_closes_or_reopens(run):
+    clock = Clock()
+    cb = breaker(clock)
+    for _ in range(4):
+        cb.record(True, None)
+    clock.advance(30)
+    assert cb.allows_calls()
+    assert run(cb.call(ok)) == "ok"
+    assert cb.state == CLOSED
+    assert cb.window.counts() == (0, 0)
+
+    for _ in range(4):
+        cb.record(True, None)
+    clock.advance(31)
+    with pytest.raises(RuntimeError):
+        run(cb.call(boom))
+    assert cb.state == OPEN
+    assert cb.retry_after() == 30
+
+
+def test_half_open_admits_only_the_configured_probes():
+    clock = Clock()
+    cb = breaker(clock, half_open_calls=1)
+    for _ in range(4):
+        cb.record(True, None)
+    clock.advance(30)
+    cb._admit()
+    assert cb.state == HALF_OPEN
+    assert not cb.allows_calls()
+    with pytest.raises(CircuitOpenError):
+        cb._admit()
+
+
+def test_cancelled_probe_releases_its_slot(run):
+    clock = Clock()
+    cb = breaker(clock)
+    for _ in range(4):
+        cb.record(True, None)
+    clock.advance(30)
+
+    async def cancelled():
+        raise asyncio.CancelledError()
+
+    with pytest.raises(asyncio.CancelledError):
+        run(cb.call(cancelled))
+    assert cb.state == HALF_OPEN
+    assert cb.allows_calls()
+
+
+def test_failures_expire_from_the_rolling_window():
+    clock = Clock()
+    cb = breaker(clock)
+    for _ in range(3):
+        cb.record(True, None)
+    clock.advance(61)
+    cb.record(True, None)
+    cb.record(False, 0.1)
+    cb.record(False, 0.1)
+    # The first three failures fell out of the window: 1 failure in 3 calls
+    assert cb.window.counts() == (3, 1)
+    assert cb.state == CLOSED
+
+
+def test_slow_calls_count_as_failures():
+    clock = Clock()
+    cb = breaker(clock, slow_call_seconds=5.0)
+    for _ in range(4):
+        cb.record(False, 6.0)
+    assert cb.state == OPEN
+
+
+def test_timeout_follows_p95_within_bounds():
+    clock = Clock()
+    cb = breaker(clock, timeout_multiplier=2.0)
+    for latency in (1.0, 1.0, 1.0, 1.0):
+        cb.record(False, latency)
+    # Too few samples to trust: use the ceiling
+    assert cb.current_timeout() == 90.0
+    for latency in [1.0] * 15 + [4.0]:
+        cb.record(False, latency)
+    # 20 samples, nearest-rank p95 is the 19th: 1.0 s
+    assert cb.current_timeout() == 2.0
+    for latency in [4.0] * 20:
+        cb.record(False, latency)
+    assert cb.current_timeout() == 8.0
+    for latency in [100.0] * 40:
+        cb.record(False, latency)
+    assert cb.current_timeout() == 90.0
+    clock.advance(61)
+    assert cb.current_timeout() == 90.0
+
+    fast = breaker(clock, timeout_min=3.0)
+    for _ in range(10):
+        fast.record(False, 0.01)
+    assert fast.current_timeout() == 3.0
+
+
+def test_rolling_window_percentile_ignores_unfinished_calls():
+    clock = Clock()
+    window = RollingWindow(10, clock=clock)
+    window.record(True, None)
+    assert window.latency_percentile(95) is None
+    for latency in (0.3, 0.1, 0.2):
+        window.record(False, latency)
+    assert window.latency_percentile(50) == (0.2, 3)
+    assert window.counts() == (4, 1)
+    clock.advance(11)
+    assert window.counts() == (0, 0)
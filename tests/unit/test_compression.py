@@ -0,0 +1,114 @@
+"""Accept-Encoding negotiation, precompressed variants and the compression middleware."""
+import asyncio
+import gzip
+
+import pytest
+
+import compression
+from compression import CompressionMiddleware, encoded_response, negotiate_encoding, precompress
+
+JSON_BODY = b'{"bills": [' + b'{"total_amount": 1180.0}, ' * 200 + b'{}]}'
+
+
+def app_sending(body, content_type="application/json", extra_headers=(), chunks=1):
+    async def app(scope, receive, send):
+        headers = [(b"content-type", content_type.encode()), (b"content-length", str(len(body)).encode())]
+        await send({"type": "http.response.start", "status": 200, "headers": headers + list(extra_headers)})
+        size = -(-len(body) // chunks)
+        for i in range(chunks):
+            await send({"type": "http.response.body", "body": body[i * size:(i + 1) * size],
+                        "more_body": i < chunks - 1})
+    return app
+
+
+def request(app, accept_encoding=None, **options):
+    headers = [(b"accept-encoding", accept_encoding.encode())] if accept_encoding is not None else []
+    scope = {"type": "http", "method": "GET", "path": "/", "headers": headers}
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(CompressionMiddleware(app, **options)(scope, receive, send))
+    start = messages[0]
+    headers = {k.decode(): v.decode() for k, v in start["headers"]}
+    return headers, b"".join(m.get("body", b"") for m in messages[1:])
+
+
+# ---------- negotiation ----------
+
+@pytest.mark.parametrize("header, offered, expected", [
+    ("gzip, deflate, br", ("br", "gzip"), "br"),
+    ("gzip;q=1.0, br;q=0.5", ("br", "gzip"), "gzip"),
+    ("br;q=0, gzip", ("br", "gzip"), "gzip"),
+    ("*", ("br", "gzip"), "br"),
+    ("*;q=0.2, gzip;q=0", ("br", "gzip"), "br"),
+    ("identity", ("br", "gzip"), None),
+    ("gzip;q=abc", ("gzip",), None),
+    ("", ("gzip",), None),
+    ("BR", ("gzip",), None),
+])
+def test_negotiate_encoding_honours_q_values(header, offered, expected):
+    assert negotiate_encoding(header, offered) == expected
+
+
+def test_encoded_response_picks_a_variant_and_always_varies():
+    variants = precompress(JSON_BODY)
+    assert gzip.decompress(variants["gzip"]) == JSON_BODY
+    response = encoded_response(variants, "gzip", "application/json", {"Cache-Control": "private"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.headers["cache-control"] == "private"
+    assert response.body == variants["gzip"]
+
+    plain = encoded_response(variants, "identity", "application/json")
+    assert "content-encoding" not in plain.headers
+    assert plain.headers["vary"] == "Accept-Encoding"
+    assert plain.body == JSON_BODY
+
+
+# ---------- middleware ----------
+
+def test_middleware_compresses_json_and_adds_vary():
+    headers, body = request(app_sending(JSON_BODY, extra_headers=[(b"vary", b"Origin")]), "gzip")
+    assert headers["content-encoding"] == "gzip"
+    assert headers["content-length"] == str(len(body))
+    assert headers["vary"] == "Origin, Accept-Encoding"
+    assert gzip.decompress(body) == JSON_BODY
+
+
+def test_middleware_offloads_large_bodies_with_the_same_result():
+    headers, body = request(app_sending(JSON_BODY), "gzip", offload_size=len(JSON_BODY))
+    assert headers["content-encoding"] == "gzip"
+    assert gzip.decompress(body) == JSON_BODY
+
+
+@pytest.mark.parametrize("body, options", [
+    (b'{"ok": true}', {}),
+    (b"\xff\xd8" * 2048, {"content_type": "image/jpeg"}),
+    (JSON_BODY, {"extra_headers": [(b"content-encoding", b"br")]}),
+    (JSON_BODY, {"chunks": 3}),
+], ids=["small", "binary", "already-encoded", "streaming"])
+def test_middleware_passes_through_what_it_should_not_compress(body, options):
+    headers, sent = request(app_sending(body, **options), "gzip")
+    assert headers.get("content-encoding") != "gzip"
+    assert "vary" not in headers
+    assert sent == body
+
+
+def test_middleware_passes_through_without_an_acceptable_encoding():
+    headers, body = request(app_sending(JSON_BODY), None)
+    assert "content-encoding" not in headers
+    assert body == JSON_BODY
+    headers, body = request(app_sending(JSON_BODY), "identity")
+    assert body == JSON_BODY
+
+
+def test_brotli_is_offered_only_when_installed(monkeypatch):
+    monkeypatch.setattr(compression, "brotli", None)
+    assert compression.available_encodings() == ("gzip",)
+    assert negotiate_encoding("br, gzip") == "gzip"
+    assert "br" not in precompress(JSON_BODY)
@@ -0,0 +1,55 @@
+"""Duplicate bill detection: the upload-time probe and the bulk scan."""
+import pytest
+
+from duplicates import DuplicateDetector
+from reconcile import bill_match_fields
+
+
+SUPPLIER = "27AAACS0000A1Z5"
+
+
+def data(number, invoice_date, total, gstin=SUPPLIER):
+    return {"seller_gstin": gstin, "invoice_number": number, "invoice_date": invoice_date, "total_amount": total}
+
+
+def bill(bill_id, extracted, upload_date, with_match=True):
+    doc = {"id": bill_id, "user_id": "u1", "upload_date": upload_date, "extracted_data": extracted}
+    if with_match:
+        doc["match"] = bill_match_fields(extracted)
+    return doc
+
+
+@pytest.fixture
+def detector(run, db):
+    run(db.bills.insert_many([
+        bill("b1", data("INV/0042", "2025-04-01", 1180.0), "2025-04-02T05:00:00+00:00"),
+        # Same number a year later: the supplier restarted its series
+        bill("b2", data("INV/0042", "2026-04-03", 990.0), "2026-04-04T05:00:00+00:00"),
+    ]))
+    return DuplicateDetector(db)
+
+
+def test_upload_repeating_an_invoice_is_found(run, detector):
+    found = run(detector.find_duplicate("u1", data("inv-42", "01/04/2025", 1180.5)))
+    assert found["id"] == "b1"
+    assert run(detector.find_duplicate("u1", data("inv-42", "2025-04-01", 1180.5), exclude_id="b1")) is None
+
+
+def test_different_amount_date_supplier_or_user_is_not_a_duplicate(run, detector):
+    assert run(detector.find_duplicate("u1", data("INV-42", "2025-04-01", 1500.0))) is None
+    assert run(detector.find_duplicate("u1", data("INV-42", "2025-06-01", 1180.0))) is None
+    assert run(detector.find_duplicate("u1", data("INV-42", "2025-04-01", 1180.0, gstin="29AAACX0000A1Z5"))) is None
+    assert run(detector.find_duplicate("u2", data("INV-42", "2025-04-01", 1180.0))) is None
+    assert run(detector.find_duplicate("u1", data(None, "2025-04-01", 1180.0))) is None
+
+
+def test_scan_groups_stored_duplicates_under_the_earliest_upload(run, detector):
+    run(detector.db.bills.insert_many([
+        bill("b3", data("INV 42", "2025-04-01", 1180.0), "2025-04-05T05:00:00+00:00", with_match=False),
+        bill("b4", data("INV-0042", "2026-04-03", 990.0), "2026-04-06T05:00:00+00:00"),
+        bill("b5", data("INV-7", "2025-04-01", 10.0), "2025-04-06T05:00:00+00:00"),
+    ]))
+    assert run(detector.scan("u1")) == [
+        {"gstin": SUPPLIER, "invoice_number": "INV/0042", "original": "b1", "duplicates": ["b3"]},
+        {"gstin": SUPPLIER, "invoice_number": "INV/0042", "original": "b2", "duplicates": ["b4"]},
+    ]
@@ -0,0 +1,107 @@
+"""Event hub fan-out, bounded buffers and reconnect replay."""
+from events import CLOSE, HEARTBEAT, EventHub
+
+
+def drain(subscriber):
+    items = []
+    while not subscriber.queue.empty():
+        items.append(subscriber.queue.get_nowait())
+    return items
+
+
+def test_events_reach_only_the_users_streams(run):
+    hub = EventHub(db=None, mode="local")
+
+    async def scenario():
+        mine, other = hub.subscribe("u1"), hub.subscribe("u2")
+        await hub.publish("u1", "bill.created", {"id": "b1"})
+        hub._broadcast(HEARTBEAT)
+        return drain(mine), drain(other)
+
+    mine, other = run(scenario())
+    assert [item["type"] for item in mine[:1]] == ["bill.created"]
+    assert mine[1] is HEARTBEAT
+    assert other == [HEARTBEAT]
+
+
+def test_slow_stream_gets_resync_instead_of_unbounded_backlog(run):
+    hub = EventHub(db=None, mode="local", buffer_size=3)
+
+    async def scenario():
+        subscriber = hub.subscribe("u1")
+        for i in range(10):
+            await hub.publish("u1", "bill.updated", {"id": f"b{i}"})
+        hub._broadcast(CLOSE)
+        return drain(subscriber)
+
+    items = run(scenario())
+    assert len(items) <= 3
+    assert any(isinstance(item, dict) and item["type"] == "resync" for item in items)
+    assert items[-1] is CLOSE
+
+
+def test_local_replay_after_reconnect(run):
+    hub = EventHub(db=None, mode="local", replay_limit=3)
+
+    async def scenario():
+        for i in range(2):
+            await hub.publish("u1", "bill.created", {"id": f"b{i}"})
+        first = str(hub._recent["u1"][0]["_id"])
+        caught_up = await hub.missed("u1", first)
+        for i in range(2, 6):
+            await hub.publish("u1", "bill.created", {"id": f"b{i}"})
+        wrapped = await hub.missed("u1", first)
+        garbage = await hub.missed("u1", "nonsense")
+        return caught_up, wrapped, garbage
+
+    caught_up, wrapped, garbage = run(scenario())
+    assert [event["data"]["id"] for event in caught_up] == ["b1"]
+    assert [event["type"] for event in wrapped] == ["resync"]
+    assert [event["type"] for event in garbage] == ["resync"]
+
+
+def test_shared_replay_reads_the_events_collection(run, db):
+    writer, reader = EventHub(db, mode="changestream"), EventHub(db, mode="changestream")
+
+    async def scenario():
+        await writer.publish("u1", "bill.created", {"id": "b1"})
+        seen = await db.events.find_one({"data.id": "b1"})
+        await writer.publish("u1", "invoice.created", {"id": "i1"})
+        await writer.publish("u2", "bill.created", {"id": "b9"})
+        return await reader.missed("u1", str(seen["_id"]))
+
+    assert [event["data"]["id"] for event in run(scenario())] == ["i1"]
+
+
+def test_reconnect_keeps_events_from_other_workers_in_the_same_second(run, db):
+    from datetime import datetime, timezone
+
+    from bson import ObjectId
+
+    hub = EventHub(db, mode="changestream")
+    second = int(datetime.now(timezone.utc).timestamp()).to_bytes(4, "big")
+
+    def event(process, counter, name):
+        # Same second, so only the process-random bytes and the counter order these ids
+        oid = ObjectId(second + process * 5 + counter.to_bytes(3, "big"))
+        return {"_id": oid, "user_id": "u1", "type": "bill.created", "data": {"id": name},
+                "created_at": datetime.now(timezone.utc)}
+
+    last_seen, replayed, other_worker = event(b"\x05", 1, "seen"), event(b"\x05", 2, "replayed"), \
+        event(b"\x01", 9, "other")
+
+    async def scenario():
+        await db.events.insert_many([dict(last_seen), dict(replayed)])
+        items = []
+        stream = hub.follow("u1", str(last_seen["_id"]))
+        items.append(await stream.__anext__())
+        # The change stream then delivers the replayed event again and a write from another
+        # worker whose id sorts before it
+        hub._dispatch(replayed)
+        hub._dispatch(other_worker)
+        hub._broadcast(CLOSE)
+        items.extend([item async for item in stream])
+        return items
+
+    assert [item["data"]["id"] for item in run(scenario())] == ["replayed", "other"]
+    assert hub._subscribers == {}
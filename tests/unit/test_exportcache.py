@@ -0,0 +1,55 @@
+"""Export cache backends, and the per-worker share of the extraction budget."""
+from exportcache import ExportCache, MongoExportCache
+from ratelimit import create_extraction_admission
+
+
+def test_memory_cache_drops_exports_rendered_before_an_invalidation(run):
+    cache = ExportCache(max_entries=2)
+
+    async def scenario():
+        stale = await cache.generation("u1")
+        await cache.invalidate("u1")
+        await cache.put("u1", "csv", stale, {"identity": b"old"})
+        missed = await cache.get("u1", "csv")
+        await cache.put("u1", "csv", await cache.generation("u1"), {"identity": b"new"})
+        return missed, await cache.get("u1", "csv")
+
+    assert run(scenario()) == (None, {"identity": b"new"})
+
+
+def test_mongo_cache_invalidation_is_seen_by_every_worker(run, db):
+    worker_a, worker_b = MongoExportCache(db), MongoExportCache(db)
+
+    async def scenario():
+        generation = await worker_a.generation("u1")
+        await worker_a.put("u1", "csv", generation, {"identity": b"ledger", "gzip": b"\x1f\x8b"})
+        shared = await worker_b.get("u1", "csv")
+        await worker_b.invalidate("u1")
+        # A render that started before the invalidation lands afterwards
+        await worker_a.put("u1", "csv", generation, {"identity": b"stale"})
+        return shared, await worker_a.get("u1", "csv")
+
+    shared, after = run(scenario())
+    assert shared == {"identity": b"ledger", "gzip": b"\x1f\x8b"}
+    assert after is None
+
+
+def test_mongo_cache_skips_oversized_exports(run, db):
+    cache = MongoExportCache(db, max_bytes=10)
+
+    async def scenario():
+        await cache.put("u1", "xlsx", 0, {"identity": b"x" * 11})
+        return await cache.get("u1", "xlsx")
+
+    assert run(scenario()) is None
+
+
+def test_extraction_budget_is_split_across_workers(monkeypatch):
+    monkeypatch.delenv("EXTRACTION_MAX_CONCURRENCY", raising=False)
+    monkeypatch.delenv("EXTRACTION_MAX_WAITING", raising=False)
+    monkeypatch.setenv("EXTRACTION_CONCURRENCY_BUDGET", "32")
+    admission = create_extraction_admission(workers=4)
+    assert (admission.max_concurrent, admission.max_waiting) == (8, 16)
+
+    monkeypatch.setenv("EXTRACTION_MAX_CONCURRENCY", "3")
+    assert create_extraction_admission(workers=4).max_concurrent == 3
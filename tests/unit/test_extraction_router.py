@@ -0,0 +1,134 @@
+"""ExtractionRouter against local stub providers."""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from circuitbreaker import CircuitBreaker
+from extraction import ExtractionDeferred, ExtractionRouter, ModelSpec, parse_model_specs, validate_extraction
+
+CHEAP = ModelSpec("stub", "cheap", 0.001)
+STRONG = ModelSpec("stub", "strong", 0.01)
+
+
+def bill(confidence=0.95, subtotal=1000.0, cgst=90.0, sgst=90.0, igst=0.0, total=None):
+    total = subtotal + cgst + sgst + igst if total is None else total
+    return SimpleNamespace(
+        subtotal=subtotal, cgst=cgst, sgst=sgst, igst=igst, total_gst=cgst + sgst + igst,
+        total_amount=total, confidence_score=confidence,
+        products=[{"amount": subtotal / 2}, {"amount": subtotal / 2}],
+    )
+
+
+class StubProviders:
+    """Per-model canned answers, delays and failures"""
+
+    def __init__(self, answers, delays=None, failures=()):
+        self.answers = answers
+        self.delays = delays or {}
+        self.failures = set(failures)
+        self.calls = []
+
+    async def __call__(self, spec, image_base64):
+        self.calls.append(spec.model)
+        await asyncio.sleep(self.delays.get(spec.model, 0))
+        if spec.model in self.failures:
+            raise RuntimeError(f"{spec.model} unavailable")
+        return self.answers[spec.model]
+
+
+def make_router(providers, **kwargs):
+    return ExtractionRouter(
+        providers, [CHEAP, STRONG],
+        breaker_factory=lambda spec: CircuitBreaker(f"test:{spec.name}", min_calls=2, timeout_max=1.0),
+        **kwargs,
+    )
+
+
+def test_parse_model_specs():
+    specs = parse_model_specs("openai:gpt-5-mini@0.002, openai:gpt-5.2@0.01")
+    assert [s.name for s in specs] == ["openai:gpt-5-mini", "openai:gpt-5.2"]
+    assert specs[0].cost_per_call == 0.002
+    assert parse_model_specs(None)[0].name == "openai:gpt-5.2"
+
+
+def test_validate_extraction_flags_totals_that_do_not_add_up():
+    assert validate_extraction(bill()) == []
+    assert "subtotal + taxes does not match total_amount" in validate_extraction(bill(total=2000.0))
+    assert "both IGST and CGST/SGST charged" in validate_extraction(bill(igst=180.0))
+
+
+def test_confident_cheap_result_is_not_escalated():
+    providers = StubProviders({"cheap": bill(), "strong": bill()})
+    routed = asyncio.run(make_router(providers).extract("img"))
+    assert routed.model == CHEAP.name
+    assert providers.calls == ["cheap"]
+    assert not routed.escalated
+
+
+def test_low_confidence_escalates_to_stronger_model():
+    providers = StubProviders({"cheap": bill(confidence=0.4), "strong": bill()})
+    router = make_router(providers)
+    routed = asyncio.run(router.extract("img"))
+    assert routed.model == STRONG.name
+    assert providers.calls == ["cheap", "strong"]
+    assert router.stats()[CHEAP.name]["agreement_rate"] == 1.0
+
+
+def test_failed_validation_escalates():
+    providers = StubProviders({"cheap": bill(total=5000.0), "strong": bill()})
+    routed = asyncio.run(make_router(providers).extract("img"))
+    assert routed.model == STRONG.name
+    assert routed.summary()["attempts"] == [CHEAP.name, STRONG.name]
+
+
+def test_best_result_returned_when_no_model_is_satisfied():
+    providers = StubProviders({"cheap": bill(confidence=0.5), "strong": bill(confidence=0.6)})
+    routed = asyncio.run(make_router(providers).extract("img"))
+    assert routed.data.confidence_score == 0.6
+
+
+def test_provider_errors_fall_through_and_all_failing_defers():
+    providers = StubProviders({"cheap": bill(), "strong": bill()}, failures={"cheap"})
+    assert asyncio.run(make_router(providers).extract("img")).model == STRONG.name
+
+    providers = StubProviders({}, failures={"cheap", "strong"})
+    with pytest.raises(ExtractionDeferred):
+        asyncio.run(make_router(providers).extract("img"))
+
+
+def test_hedged_request_takes_the_faster_backup():
+    providers = StubProviders({"cheap": bill(), "strong": bill()}, delays={"cheap": 0.5})
+    routed = asyncio.run(make_router(providers, hedge_delay=0.05).extract("img", hedge=True))
+    assert routed.model == STRONG.name
+    assert routed.attempts[0].hedged
+
+
+def test_hedged_request_takes_the_primary_when_it_answers_first():
+    providers = StubProviders({"cheap": bill(), "strong": bill()}, delays={"cheap": 0.1, "strong": 0.5})
+    routed = asyncio.run(make_router(providers, hedge_delay=0.05).extract("img", hedge=True))
+    assert routed.model == CHEAP.name
+    assert providers.calls == ["cheap", "strong"]
+    assert routed.attempts[0].hedged
+    assert len(routed.attempts) == 1
+
+
+def test_single_tier_is_not_hedged_against_itself():
+    providers = StubProviders({"strong": bill()}, delays={"strong": 0.1})
+    router = ExtractionRouter(providers, [STRONG], hedge_delay=0.01,
+                              breaker_factory=lambda spec: CircuitBreaker(f"test:{spec.name}", timeout_max=1.0))
+    routed = asyncio.run(router.extract("img", hedge=True))
+    assert providers.calls == ["strong"]
+    assert not routed.attempts[0].hedged
+
+
+def test_stats_track_calls_cost_and_acceptance():
+    providers = StubProviders({"cheap": bill(confidence=0.3), "strong": bill()})
+    router = make_router(providers)
+    for _ in range(3):
+        asyncio.run(router.extract("img"))
+    stats = router.stats()
+    assert stats[CHEAP.name]["calls"] == 3
+    assert stats[CHEAP.name]["acceptance_rate"] == 0.0
+    assert stats[STRONG.name]["acceptance_rate"] == 1.0
+    assert stats[STRONG.name]["cost"] == pytest.approx(0.03)
@@ -0,0 +1,94 @@
+"""GSTR-1 / GSTR-3B building from invoices and bills."""
+import pytest
+
+from gstreturns import build_gstr1, build_gstr3b, parse_period, snap_rate
+
+
+GSTIN = "27AAACB1234C1Z5"
+
+
+def invoice(number, date, items, customer_gstin=None):
+    subtotal = sum(item["amount"] for item in items)
+    tax = round(subtotal * 0.18, 2)
+    inter = bool(customer_gstin)
+    return {
+        "id": number, "user_id": "u1", "invoice_number": number, "invoice_date": date,
+        "customer_gstin": customer_gstin, "items": items, "subtotal": subtotal,
+        "igst": tax if inter else 0.0, "cgst": 0.0 if inter else tax / 2, "sgst": 0.0 if inter else tax / 2,
+        "total_gst": tax, "total_amount": subtotal + tax,
+    }
+
+
+def item(hsn, amount, quantity=1, unit="pcs"):
+    return {"product_name": hsn, "hsn_code": hsn, "quantity": quantity, "unit": unit, "rate": amount, "amount": amount}
+
+
+@pytest.fixture
+def db(run, db):
+    run(db.invoices.insert_many([
+        invoice("INV-1", "2025-04-02T05:00:00+00:00", [item("3004", 100), item("3005", 33.33)], "29AAACX0000A1Z5"),
+        invoice("INV-2", "2025-04-10T05:00:00+00:00", [item("3004", 200, 2)], "29AAACX0000A1Z5"),
+        invoice("INV-3", "2025-04-11T05:00:00+00:00", [item("3004", 50, 1, "Box")]),
+        # 1 May 00:30 IST belongs to May
+        invoice("INV-4", "2025-04-30T19:00:00+00:00", [item("3004", 999)]),
+        # 1 April 01:00 IST belongs to April
+        invoice("INV-0", "2025-03-31T19:30:00+00:00", [item("3004", 10)], "27AAACY0000A1Z5"),
+    ]))
+    run(db.bills.insert_many([
+        {"user_id": "u1", "upload_date": "2025-04-05T05:00:00+00:00", "ocr_status": "completed",
+         "extracted_data": {"seller_gstin": "27AAACS0000A1Z5", "igst": 0.0, "cgst": 9.0, "sgst": 9.0}},
+        {"user_id": "u1", "upload_date": "2025-04-06T05:00:00+00:00", "ocr_status": "completed",
+         "extracted_data": {"seller_gstin": None, "igst": 50.0, "cgst": None, "sgst": None}},
+        {"user_id": "u1", "upload_date": "2025-04-07T05:00:00+00:00", "ocr_status": "deferred",
+         "extracted_data": {"seller_gstin": "27AAACS0000A1Z5", "igst": 7.0}},
+    ]))
+    return db
+
+
+def test_period_bounds_follow_ist_months():
+    assert parse_period("042025") == ("2025-03-31T18:30:00+00:00", "2025-04-30T18:30:00+00:00")
+    assert parse_period("122025")[1] == "2025-12-31T18:30:00+00:00"
+    for bad in ("2025-04", "132025", "0425"):
+        with pytest.raises(ValueError):
+            parse_period(bad)
+    assert snap_rate(180) == 18.0 and snap_rate(3) == 0.25 and snap_rate(None) == 0.0
+
+
+def test_gstr1_sections(run, db):
+    gstr1 = run(build_gstr1(db, "u1", GSTIN, "042025"))
+    assert gstr1["gstin"] == GSTIN and gstr1["fp"] == "042025"
+
+    parties = {party["ctin"]: [inv["inum"] for inv in party["inv"]] for party in gstr1["b2b"]}
+    assert parties == {"27AAACY0000A1Z5": ["INV-0"], "29AAACX0000A1Z5": ["INV-1", "INV-2"]}
+    first = gstr1["b2b"][1]["inv"][0]
+    assert first["idt"] == "02-04-2025" and first["pos"] == "29"
+    assert first["itms"][0]["itm_det"] == {
+        "rt": 18.0, "txval": 133.33, "iamt": 24.0, "camt": 0.0, "samt": 0.0, "csamt": 0.0
+    }
+
+    assert gstr1["b2cs"] == [{
+        "sply_ty": "INTRA", "pos": "27", "typ": "OE", "rt": 18.0,
+        "txval": 50.0, "iamt": 0.0, "camt": 4.5, "samt": 4.5, "csamt": 0.0,
+    }]
+
+    hsn = {(row["hsn_sc"], row["uqc"]): row for row in gstr1["hsn"]["data"]}
+    assert set(hsn) == {("3004", "PCS"), ("3004", "BOX"), ("3005", "PCS")}
+    assert hsn[("3004", "PCS")]["qty"] == 4 and hsn[("3004", "PCS")]["txval"] == 310.0
+    assert hsn[("3004", "BOX")]["camt"] == 4.5
+    assert [row["num"] for row in gstr1["hsn"]["data"]] == [1, 2, 3]
+
+
+def test_gstr3b_credits_only_registered_completed_bills(run, db):
+    gstr3b = run(build_gstr3b(db, "u1", GSTIN, "042025"))
+    assert gstr3b["ret_period"] == "042025"
+    assert gstr3b["sup_details"]["osup_det"]["txval"] == 393.33
+    other = gstr3b["itc_elg"]["itc_avl"][-1]
+    assert other == {"ty": "OTH", "iamt": 0.0, "camt": 9.0, "samt": 9.0, "csamt": 0.0}
+    assert gstr3b["itc_elg"]["itc_net"]["camt"] == 9.0
+    assert [row["ty"] for row in gstr3b["itc_elg"]["itc_avl"]] == ["IMPG", "IMPS", "ISRC", "ISD", "OTH"]
+
+
+def test_empty_period(run, db):
+    gstr1 = run(build_gstr1(db, "u1", GSTIN, "012024"))
+    assert gstr1["b2b"] == [] and gstr1["b2cs"] == [] and gstr1["hsn"] == {"data": []}
+    assert run(build_gstr3b(db, "u1", GSTIN, "012024"))["itc_elg"]["itc_net"]["iamt"] == 0.0
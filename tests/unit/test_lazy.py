@@ -0,0 +1,43 @@
+"""Lazy module proxies and the server's cold-start import set."""
+import asyncio
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from lazy import LazyModule, lazy_import, registered, warm_up
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent.parent / "backend"
+HEAVY = ("PIL", "openpyxl", "razorpay", "passlib", "emergentintegrations", "requests", "PyPDF2")
+
+
+def test_proxy_imports_on_first_attribute_access():
+    module = LazyModule("colorsys")
+    assert not module.loaded
+    assert module.rgb_to_hsv(1, 0, 0) == (0.0, 1.0, 1)
+    assert module.loaded
+    assert lazy_import("colorsys") is lazy_import("colorsys")
+
+
+def test_warm_up_imports_registered_modules_and_skips_missing_ones():
+    lazy_import("wave")
+    lazy_import("module_that_does_not_exist")
+    timings = asyncio.run(warm_up(["wave", "module_that_does_not_exist"]))
+    assert set(timings) == {"wave"}
+    assert registered()["wave"] is True
+
+
+def test_server_import_leaves_heavy_dependencies_unloaded():
+    code = (
+        "import sys; sys.modules['emergentintegrations'] = None; import server, lazy; "
+        f"print(','.join(m for m in {HEAVY!r} if sys.modules.get(m) is not None)); "
+        "print(lazy.registered().get('passlib.context'))"
+    )
+    env = {**os.environ, "MONGO_URL": "mongodb://localhost:27017", "DB_NAME": "lazy_test",
+           "SWEEPER_ENABLED": "false"}
+    proc = subprocess.run([sys.executable, "-c", code], cwd=str(BACKEND_DIR), env=env,
+                          capture_output=True, text=True, check=True)
+    loaded, passlib_registered = proc.stdout.split("\n")[:2]
+    assert loaded == ""
+    # Registered for warm-up, but the bcrypt context is only built on first use
+    assert passlib_registered == "False"
@@ -0,0 +1,142 @@
+"""Metric types, label handling and the Prometheus text exposition format."""
+import asyncio
+import re
+
+import pytest
+
+from metrics import MetricsMiddleware, Registry, timed
+
+SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})? (\S+)$')
+LABEL = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)"')
+
+
+def unescape(value):
+    return re.sub(r'\\(.)', lambda m: {"n": "\n"}.get(m.group(1), m.group(1)), value)
+
+
+def parse(text):
+    """Types and samples of a rendered registry; fails on any malformed line"""
+    assert text.endswith("\n")
+    types, samples = {}, {}
+    for line in text.splitlines():
+        if line.startswith("# HELP "):
+            continue
+        if line.startswith("# TYPE "):
+            _, _, name, kind = line.split(" ")
+            types[name] = kind
+            continue
+        match = SAMPLE.match(line)
+        assert match, f"malformed sample: {line!r}"
+        name, labels, value = match.groups()
+        pairs = LABEL.findall(labels or "")
+        assert ",".join(f'{k}="{v}"' for k, v in pairs) == (labels or ""), f"malformed labels: {line!r}"
+        key = (name, frozenset((k, unescape(v)) for k, v in pairs))
+        assert key not in samples, f"duplicate sample: {line!r}"
+        samples[key] = float(value)
+    return types, samples
+
+
+def sample(samples, name, **labels):
+    return samples[(name, frozenset(labels.items()))]
+
+
+def test_counters_and_gauges_render_per_label_set():
+    registry = Registry()
+    uploads = registry.counter("uploads_total", "Uploads by plan", ("plan",))
+    in_flight = registry.gauge("in_flight", "Requests in flight")
+    uploads.inc(plan="free")
+    uploads.inc(2, plan="pro")
+    uploads.inc(0.5, plan="pro")
+    in_flight.inc()
+    in_flight.inc()
+    in_flight.dec()
+
+    types, samples = parse(registry.render())
+    assert types == {"uploads_total": "counter", "in_flight": "gauge"}
+    assert sample(samples, "uploads_total", plan="free") == 1
+    assert sample(samples, "uploads_total", plan="pro") == 2.5
+    assert sample(samples, "in_flight") == 1
+    assert uploads.value(plan="pro") == 2.5
+    assert uploads.value(plan="business") == 0
+    in_flight.set(7)
+    assert sample(parse(registry.render())[1], "in_flight") == 7
+
+
+def test_label_values_are_escaped():
+    registry = Registry()
+    errors = registry.counter("errors_total", "Errors", ("message",))
+    message = 'bad "quote" \\ and\nnewline'
+    errors.inc(message=message)
+    _, samples = parse(registry.render())
+    assert sample(samples, "errors_total", message=message) == 1
+
+
+def test_wrong_label_names_are_rejected():
+    registry = Registry()
+    counter = registry.counter("calls_total", "Calls", ("model",))
+    with pytest.raises(ValueError):
+        counter.inc()
+    with pytest.raises(ValueError):
+        counter.inc(model="a", extra="b")
+    with pytest.raises(ValueError):
+        counter.inc(provider="a")
+
+
+def test_registering_a_name_twice_returns_the_first_metric():
+    registry = Registry()
+    first = registry.counter("calls_total", "Calls")
+    assert registry.counter("calls_total", "Calls again") is first
+    assert registry.render().count("# TYPE calls_total counter") == 1
+
+
+def test_histogram_buckets_are_cumulative_with_sum_and_count():
+    registry = Registry()
+    latency = registry.histogram("latency_seconds", "Latency", ("route",), buckets=(1.0, 0.1, 0.5))
+    for value in (0.05, 0.1, 0.3, 0.7, 2.0):
+        latency.observe(value, route="/bills")
+    latency.observe(0.2, route="/invoices")
+
+    types, samples = parse(registry.render())
+    assert types == {"latency_seconds": "histogram"}
+    buckets = {le: sample(samples, "latency_seconds_bucket", route="/bills", le=le)
+               for le in ("0.1", "0.5", "1", "+Inf")}
+    # A value equal to a bound falls into that bucket
+    assert buckets == {"0.1": 2, "0.5": 3, "1": 4, "+Inf": 5}
+    assert sample(samples, "latency_seconds_count", route="/bills") == 5
+    assert sample(samples, "latency_seconds_sum", route="/bills") == pytest.approx(3.15)
+    assert sample(samples, "latency_seconds_bucket", route="/invoices", le="0.1") == 0
+    assert sample(samples, "latency_seconds_bucket", route="/invoices", le="+Inf") == 1
+    assert latency.count(route="/bills") == 5
+
+
+def test_timed_observes_even_when_the_block_raises():
+    registry = Registry()
+    duration = registry.histogram("step_seconds", "Step time", ("step",))
+    with timed(duration, step="ok"):
+        pass
+    with pytest.raises(RuntimeError):
+        with timed(duration, step="boom"):
+            raise RuntimeError()
+    assert duration.count(step="ok") == duration.count(step="boom") == 1
+
+
+def test_middleware_records_by_route_template():
+    from metrics import HTTP_REQUEST_DURATION, HTTP_REQUESTS_IN_PROGRESS
+
+    class Route:
+        path = "/api/bills/{bill_id}"
+
+    async def app(scope, receive, send):
+        scope["route"] = Route()
+        assert HTTP_REQUESTS_IN_PROGRESS.value(method="DELETE") == 1
+        await send({"type": "http.response.start", "status": 404, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def send(message):
+        pass
+
+    before = HTTP_REQUEST_DURATION.count(method="DELETE", route="/api/bills/{bill_id}", status="404")
+    scope = {"type": "http", "method": "DELETE", "path": "/api/bills/b1", "headers": []}
+    asyncio.run(MetricsMiddleware(app)(scope, None, send))
+    assert HTTP_REQUEST_DURATION.count(method="DELETE", route="/api/bills/{bill_id}", status="404") == before + 1
+    assert HTTP_REQUESTS_IN_PROGRESS.value(method="DELETE") == 0
@@ -0,0 +1,125 @@
+"""PaymentGateway against the local Razorpay stub, and idempotent plan activation."""
+import asyncio
+import socket
+import threading
+import time
+
+import pytest
+
+from payments import GatewayTimeout, PaymentGateway, activate_order, handle_webhook
+from tests.perf.stubs import StubLatency, create_razorpay_stub_app, sign_checkout, webhook_delivery
+
+KEY_SECRET = "stub_secret"
+WEBHOOK_SECRET = "stub_webhook_secret"
+
+
+@pytest.fixture(scope="module")
+def slow_gateway_url():
+    uvicorn = pytest.importorskip("uvicorn")
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    config = uvicorn.Config(create_razorpay_stub_app(StubLatency(base_ms=300)),
+                            host="127.0.0.1", port=port, log_level="warning")
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    yield f"http://127.0.0.1:{port}"
+    server.should_exit = True
+    thread.join(timeout=5)
+
+
+def test_gateway_calls_run_off_the_event_loop(run, slow_gateway_url):
+    gateway = PaymentGateway("rzp_test", KEY_SECRET, base_url=slow_gateway_url, max_workers=4)
+
+    async def scenario():
+        ticks = 0
+        done = asyncio.Event()
+
+        async def ticker():
+            nonlocal ticks
+            while not done.is_set():
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticking = asyncio.create_task(ticker())
+        started = time.perf_counter()
+        orders = await asyncio.gather(*(gateway.create_order(49900, receipt=f"r{i}") for i in range(4)))
+        elapsed = time.perf_counter() - started
+        done.set()
+        await ticking
+        return orders, elapsed, ticks
+
+    try:
+        orders, elapsed, ticks = run(scenario())
+    finally:
+        gateway.close()
+    assert {o["receipt"] for o in orders} == {"r0", "r1", "r2", "r3"}
+    assert all(o["id"].startswith("order_") for o in orders)
+    assert elapsed < 1.0  # four 300 ms calls in parallel, not in series
+    assert ticks >= 15  # the loop kept serving other work meanwhile
+
+
+def test_gateway_read_timeout(run, slow_gateway_url):
+    gateway = PaymentGateway("rzp_test", KEY_SECRET, base_url=slow_gateway_url, read_timeout=0.05)
+    try:
+        with pytest.raises(GatewayTimeout):
+            run(gateway.create_order(49900))
+    finally:
+        gateway.close()
+
+
+def test_signatures():
+    gateway = PaymentGateway("rzp_test", KEY_SECRET, webhook_secret=WEBHOOK_SECRET)
+    try:
+        assert gateway.verify_payment_signature("order_1", "pay_1", sign_checkout(KEY_SECRET, "order_1", "pay_1"))
+        assert not gateway.verify_payment_signature("order_1", "pay_2", sign_checkout(KEY_SECRET, "order_1", "pay_1"))
+        body, headers = webhook_delivery(WEBHOOK_SECRET, "order_1", "pay_1", 49900)
+        assert gateway.verify_webhook_signature(body, headers["X-Razorpay-Signature"])
+        assert not gateway.verify_webhook_signature(body + b" ", headers["X-Razorpay-Signature"])
+        assert not gateway.verify_webhook_signature(body, None)
+    finally:
+        gateway.close()
+
+
+def test_webhook_and_client_verification_activate_once(run, db):
+
+    async def scenario():
+        await db.users.insert_one({"user_id": "u1", "subscription_plan": "free"})
+        await db.transactions.insert_one({
+            "id": "t1", "user_id": "u1", "order_id": "order_1", "plan": "pro", "amount": 49900,
+            "status": "created", "idempotency_keys": [],
+        })
+        body, headers = webhook_delivery(WEBHOOK_SECRET, "order_1", "pay_1", 49900, event_id="evt_1")
+        first = await handle_webhook(db, body, headers["X-Razorpay-Event-Id"])
+        redelivered = await handle_webhook(db, body, headers["X-Razorpay-Event-Id"])
+        client, _ = await activate_order(db, "order_1", "pay_1", "payment:pay_1", source="client", user_id="u1")
+        user = await db.users.find_one({"user_id": "u1"})
+        transaction = await db.transactions.find_one({"order_id": "order_1"})
+        return first, redelivered, client, user, transaction
+
+    first, redelivered, client, user, transaction = run(scenario())
+    assert (first, redelivered, client) == ("activated", "duplicate", "already_active")
+    assert user["subscription_plan"] == "pro"
+    assert transaction["status"] == "completed"
+    assert transaction["activated_by"] == "webhook"
+    assert sorted(transaction["idempotency_keys"]) == ["event:evt_1", "payment:pay_1"]
+
+
+def test_webhook_with_wrong_amount_does_not_activate(run, db):
+
+    async def scenario():
+        await db.users.insert_one({"user_id": "u1", "subscription_plan": "free"})
+        await db.transactions.insert_one({
+            "id": "t1", "user_id": "u1", "order_id": "order_1", "plan": "business", "amount": 99900,
+            "status": "created", "idempotency_keys": [],
+        })
+        body, headers = webhook_delivery(WEBHOOK_SECRET, "order_1", "pay_1", 100)
+        outcome = await handle_webhook(db, body, headers["X-Razorpay-Event-Id"])
+        return outcome, await db.users.find_one({"user_id": "u1"})
+
+    outcome, user = run(scenario())
+    assert outcome == "amount_mismatch"
+    assert user["subscription_plan"] == "free"
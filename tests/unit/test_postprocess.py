@@ -0,0 +1,102 @@
+"""Repair, normalisation and scoring of LLM extraction replies."""
+import pytest
+
+from postprocess import (
+    is_valid_gstin, normalize_extraction, normalize_gstin, parse_amount, parse_date, parse_json_tolerant,
+    process_response,
+)
+
+VALID_GSTIN = "27AAPFU0939F1ZV"
+
+
+@pytest.mark.parametrize("response", [
+    '```json\n{"invoice_number": "A-1", "total_amount": 118}\n```',
+    'Here is the data: {"invoice_number": "A-1", "total_amount": 118} Let me know!',
+    "{'invoice_number': 'A-1', 'total_amount': 118,}",
+    '{"invoice_number": "A-1", // from the header\n "total_amount": 118}',
+    '{invoice_number: "A-1", "total_amount": ₹118}',
+])
+def test_malformed_json_is_repaired(response):
+    data, repairs = parse_json_tolerant(response)
+    assert data["invoice_number"] == "A-1"
+    assert parse_amount(data["total_amount"]) == 118
+
+
+def test_truncated_reply_keeps_complete_fields():
+    data, repairs = parse_json_tolerant('{"seller_name": "Acme", "subtotal": 100, "products": [{"name": "Bolt", "amo')
+    assert data["seller_name"] == "Acme"
+    assert data["subtotal"] == 100
+    assert data["products"] == [{"name": "Bolt"}]
+    assert repairs
+
+
+def test_reply_cut_after_a_comma_keeps_the_last_field():
+    data, _ = parse_json_tolerant('{"a": 1, "total_amount": 500,')
+    assert data == {"a": 1, "total_amount": 500}
+    data, _ = parse_json_tolerant('{"a": 1, "total_amount": 500, "confidence_score"')
+    assert data == {"a": 1, "total_amount": 500}
+
+
+def test_reply_without_json_raises():
+    with pytest.raises(ValueError):
+        parse_json_tolerant("I could not read this image.")
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("₹1,18,000.50", 118000.5),
+    ("Rs. 2,360", 2360.0),
+    ("1.234,50", 1234.5),
+    ("(45.00)", -45.0),
+    (12, 12.0),
+    ("n/a", None),
+])
+def test_parse_amount(value, expected):
+    assert parse_amount(value) == expected
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("2025-04-03", "2025-04-03"),
+    ("03/04/2025", "2025-04-03"),
+    ("3-Apr-2025", "2025-04-03"),
+    ("03.04.25", "2025-04-03"),
+    ("sometime in April", None),
+])
+def test_parse_date_is_day_first(value, expected):
+    assert parse_date(value) == expected
+
+
+def test_gstin_checksum_and_ocr_repair():
+    assert is_valid_gstin(VALID_GSTIN)
+    assert not is_valid_gstin("27AAPFU0939F1ZA")
+    assert normalize_gstin("27AAPFUO939F1ZV") == (VALID_GSTIN, True)  # O read for 0
+    assert normalize_gstin(" 27aapfu0939f1zv ") == (VALID_GSTIN, True)
+    assert normalize_gstin("27AAPFU0939F1ZA") == ("27AAPFU0939F1ZA", False)
+
+
+def test_missing_totals_are_derived_and_reconciled():
+    processed = normalize_extraction({
+        "invoice_number": "A-1", "subtotal": "1,000", "cgst": 90, "sgst": 90,
+        "products": [{"name": "Bolt", "quantity": "10", "rate": "100"}],
+        "confidence_score": 0.9,
+    })
+    assert processed.data["total_gst"] == 180.0
+    assert processed.data["total_amount"] == 1180.0
+    assert processed.data["products"][0]["amount"] == 1000.0
+    assert processed.issues == []
+    assert "derived total_amount" in processed.repairs
+
+
+def test_confidence_combines_model_score_with_evidence():
+    consistent = process_response(
+        f'{{"invoice_number": "A-1", "invoice_date": "2025-04-03", "seller_gstin": "{VALID_GSTIN}",'
+        ' "subtotal": 1000, "cgst": 90, "sgst": 90, "total_gst": 180, "total_amount": 1180,'
+        ' "confidence_score": 0.7}'
+    )
+    inconsistent = process_response(
+        '{"invoice_number": "A-1", "subtotal": 1000, "cgst": 90, "sgst": 90, "total_gst": 180,'
+        ' "total_amount": 1500, "confidence_score": 0.95}'
+    )
+    assert consistent.confidence > 0.7
+    assert consistent.model_confidence == 0.7
+    assert "subtotal + taxes does not match total_amount" in inconsistent.issues
+    assert inconsistent.confidence < 0.8
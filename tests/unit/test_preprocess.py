@@ -0,0 +1,108 @@
+"""Image profile settings, and what prepare_image does to synthetic bill pages."""
+import io
+
+import pytest
+from PIL import Image, ImageDraw
+
+from preprocess import PROFILES, autocrop, estimate_line_height, estimate_skew, prepare_image, profile_setting
+
+
+def page(width=1200, height=1600, line=24, gap=36):
+    """A white page with full-width black bars standing in for lines of text"""
+    img = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(img)
+    y = height // 12
+    while y + line < height - height // 12:
+        draw.rectangle((width // 12, y, width - width // 12, y + line), fill="black")
+        y += line + gap
+    return img
+
+
+def on_table(img):
+    table = Image.new("RGB", (img.width + 800, img.height + 800), (90, 70, 50))
+    table.paste(img, (400, 400))
+    return table
+
+
+def skewed(img, angle):
+    return img.rotate(angle, resample=Image.Resampling.BICUBIC, expand=True, fillcolor="white")
+
+
+def encode(img):
+    buffered = io.BytesIO()
+    img.save(buffered, format="JPEG", quality=95)
+    return buffered.getvalue()
+
+
+def decode(prepared):
+    return Image.open(io.BytesIO(prepared.data))
+
+
+def test_known_profiles_are_accepted():
+    assert profile_setting("IMAGE_PROFILE", "compact") == "compact"
+    assert profile_setting("IMAGE_FALLBACK_PROFILE", "", allow_empty=True) == ""
+
+
+def test_unknown_or_empty_profile_is_rejected():
+    with pytest.raises(ValueError, match="IMAGE_PROFILE must be one of compact, full, got 'Compact'"):
+        profile_setting("IMAGE_PROFILE", "Compact")
+    with pytest.raises(ValueError):
+        profile_setting("IMAGE_PROFILE", "")
+
+
+def test_autocrop_removes_the_table_around_the_page():
+    cropped, changed = autocrop(on_table(page()))
+    assert changed
+    # Only the 2% safety margin of the table is left around the 1200 x 1600 page
+    assert 1200 <= cropped.width <= 1200 + 2 * 0.02 * 2400 + 8
+    assert 1600 <= cropped.height <= 1600 + 2 * 0.02 * 2400 + 8
+    blank = Image.new("RGB", (800, 1000), "white")
+    assert autocrop(blank) == (blank, False)
+
+
+def test_skew_is_measured_and_corrected():
+    assert estimate_skew(page().convert("L")) == 0.0
+    for angle in (3, -2):
+        assert estimate_skew(skewed(page(), angle).convert("L")) == pytest.approx(-angle, abs=0.25)
+
+    prepared = prepare_image(encode(skewed(page(), 3)), PROFILES["compact"])
+    assert prepared.deskew_angle == pytest.approx(-3, abs=0.25)
+    assert estimate_skew(decode(prepared).convert("L")) == 0.0
+
+
+def test_black_and_white_pages_are_sent_as_grayscale():
+    prepared = prepare_image(encode(page()), PROFILES["compact"])
+    assert prepared.grayscale and decode(prepared).mode == "L"
+
+    stamped = page()
+    ImageDraw.Draw(stamped).rectangle((100, 100, 500, 400), fill="red")
+    prepared = prepare_image(encode(stamped), PROFILES["compact"])
+    assert not prepared.grayscale and decode(prepared).mode == "RGB"
+
+
+@pytest.mark.parametrize("line, gap, long_edge", [
+    # Tall lines can shrink a lot, but never below min_edge
+    (80, 100, 1000),
+    # Fine print keeps as many pixels as max_edge allows
+    (8, 12, 1600),
+])
+def test_compact_scaling_stays_within_the_profile_bounds(line, gap, long_edge):
+    prepared = prepare_image(encode(page(3000, 4000, line, gap)), PROFILES["compact"])
+    assert max(prepared.width, prepared.height) == long_edge
+
+
+def test_compact_scaling_targets_the_line_height():
+    prepared = prepare_image(encode(page(2400, 3200, line=40, gap=60)), PROFILES["compact"])
+    assert 1000 < max(prepared.width, prepared.height) < 1600
+    assert estimate_line_height(decode(prepared)) == pytest.approx(PROFILES["compact"].target_line_px, abs=3)
+    assert len(prepared.data) < prepared.original_bytes
+
+
+def test_full_profile_only_downscales():
+    table = on_table(page())
+    prepared = prepare_image(encode(table), PROFILES["full"])
+    assert (prepared.width, prepared.height) == (int(2000 * 2048 / 2400), 2048)
+    assert not prepared.cropped and not prepared.grayscale and prepared.deskew_angle == 0.0
+    assert decode(prepared).mode == "RGB"
+    small = prepare_image(encode(page()), PROFILES["full"])
+    assert (small.width, small.height) == (1200, 1600)
@@ -0,0 +1,130 @@
+"""Token-bucket refill, the shared Mongo bucket store, plan limits and admission control."""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+import ratelimit
+from ratelimit import (AdmissionController, BucketLimit, InMemoryBucketStore, MongoBucketStore, RateLimiter,
+                       parse_plan_limits)
+
+
+LIMIT = BucketLimit(capacity=3, refill_per_second=0.5)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Frozen time for the bucket stores; ``clock.now`` is advanced by the tests"""
+    clock = SimpleNamespace(now=1_000_000.0)
+    monkeypatch.setattr(ratelimit, "time", SimpleNamespace(monotonic=lambda: clock.now, time=lambda: clock.now))
+    return clock
+
+
+@pytest.fixture(params=["memory", "mongo"])
+def store(request):
+    if request.param == "mongo":
+        return MongoBucketStore(request.getfixturevalue("db").rate_limits)
+    return InMemoryBucketStore()
+
+
+async def take_all(store, key, times, limit=LIMIT):
+    return [(await store.take(key, limit))[0] for _ in range(times)]
+
+
+def test_bucket_allows_a_burst_then_refills(run, store, clock):
+    assert run(take_all(store, "u1", 4)) == [True, True, True, False]
+    clock.now += 1
+    # Half a token per second: one second is not enough for another upload
+    assert run(store.take("u1", LIMIT)) == (False, 0.5)
+    clock.now += 1
+    assert run(store.take("u1", LIMIT)) == (True, 0.0)
+    clock.now += 60
+    # Refill stops at capacity
+    assert run(take_all(store, "u1", 4)) == [True, True, True, False]
+
+
+def test_buckets_are_independent_per_key(run, store, clock):
+    assert run(take_all(store, "u1", 3)) == [True, True, True]
+    assert run(store.take("u2", LIMIT)) == (True, 2.0)
+
+
+def test_mongo_store_shares_one_bucket_between_workers(run, db, clock):
+    collection = db.rate_limits
+    first, second = MongoBucketStore(collection), MongoBucketStore(collection)
+    assert run(first.take("u1", LIMIT))[0]
+    assert run(second.take("u1", LIMIT))[0]
+    assert run(first.take("u1", LIMIT))[0]
+    assert not run(second.take("u1", LIMIT))[0]
+    bucket = run(collection.find_one({"_id": "u1"}))
+    assert bucket["tokens"] == 0
+    assert "expires_at" in bucket
+
+
+def test_memory_store_drops_idle_buckets_when_full(run, clock):
+    store = InMemoryBucketStore(max_keys=2)
+    run(store.take("old", LIMIT))
+    clock.now += 3601
+    run(store.take("recent", LIMIT))
+    run(store.take("new", LIMIT))
+    assert set(store._buckets) == {"recent", "new"}
+
+
+def test_limiter_raises_429_with_retry_after(run, clock):
+    limiter = RateLimiter(InMemoryBucketStore(), parse_plan_limits("free=1:1/10"))
+    user = {"user_id": "u1", "subscription_plan": "free"}
+    run(limiter.check(user))
+    with pytest.raises(HTTPException) as raised:
+        run(limiter.check(user))
+    assert raised.value.status_code == 429
+    assert raised.value.headers["Retry-After"] == "10"
+    # Another plan has its own, larger bucket
+    run(limiter.check({"user_id": "u2", "subscription_plan": "business"}))
+
+
+def test_plan_limits_parse_with_defaults():
+    limits = parse_plan_limits("free=2:10/60, team=100:2")
+    assert limits["free"] == BucketLimit(2, 10 / 60)
+    assert limits["team"] == BucketLimit(100, 2)
+    assert limits["pro"] == ratelimit.DEFAULT_PLAN_LIMITS["pro"]
+    limiter = RateLimiter(InMemoryBucketStore(), limits)
+    assert limiter.limit_for("unknown") == limits["free"]
+    assert limiter.limit_for(None) == limits["free"]
+
+
+def test_admission_rejects_when_the_queue_is_full(run):
+    async def scenario():
+        admission = AdmissionController(max_concurrent=1, max_waiting=1, wait_timeout=1)
+        release = asyncio.Event()
+
+        async def hold():
+            async with admission:
+                await release.wait()
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        with pytest.raises(HTTPException) as raised:
+            async with admission:
+                pass
+        assert raised.value.status_code == 503
+        release.set()
+        await asyncio.gather(holder, waiter)
+        assert admission.in_flight == 0
+
+    run(scenario())
+
+
+def test_admission_rejects_after_the_wait_timeout(run):
+    async def scenario():
+        admission = AdmissionController(max_concurrent=1, max_waiting=5, wait_timeout=0.01, retry_after=7)
+        async with admission:
+            with pytest.raises(HTTPException) as raised:
+                async with admission:
+                    pass
+        assert raised.value.headers["Retry-After"] == "7"
+        async with admission:
+            assert admission.in_flight == 1
+
+    run(scenario())
@@ -0,0 +1,118 @@
+"""GSTR-2B reconciliation: invoice keys, streaming parse and matching."""
+import io
+import json
+
+import pytest
+
+from reconcile import Gstr2bReader, ReconciliationJob, bill_match_fields, invoice_keys
+
+pytest.importorskip("ijson")
+
+SUPPLIER = "27AAACS0000A1Z5"
+OTHER = "29AAACX0000A1Z5"
+
+
+def portal_invoice(number, dt, txval, tax):
+    return {"inum": number, "dt": dt, "val": txval + tax, "itcavl": "Y",
+            "items": [{"num": 1, "rt": 18, "txval": txval, "igst": tax, "cgst": 0, "sgst": 0, "cess": 0}]}
+
+
+def gstr2b(suppliers):
+    return json.dumps({"data": {"rtnprd": "042025", "docdata": {"b2b": suppliers}}}).encode()
+
+
+def bill(bill_id, gstin, number, invoice_date, subtotal, igst, upload_date="2025-04-10T05:00:00+00:00"):
+    data = {"seller_gstin": gstin, "invoice_number": number, "invoice_date": invoice_date,
+            "subtotal": subtotal, "igst": igst, "cgst": None, "sgst": None, "total_amount": subtotal + igst}
+    return {"id": bill_id, "user_id": "u1", "upload_date": upload_date, "ocr_status": "completed",
+            "extracted_data": data}
+
+
+def test_invoice_keys_ignore_case_separators_and_leading_zeros():
+    assert invoice_keys("INV/2025-26/0042") == ("INV20252642", "42")
+    assert invoice_keys("inv 2025 26 42") == invoice_keys("INV/2025-26/0042")
+    assert invoice_keys("0000") == ("0", "0")
+    assert invoice_keys("--") is None and invoice_keys(None) is None
+    assert bill_match_fields({"seller_gstin": SUPPLIER.lower(), "invoice_number": "A-007"}) == {
+        "gstin": SUPPLIER, "invoice": "A7", "serial": "7"
+    }
+    assert bill_match_fields({"seller_gstin": None, "invoice_number": "A-007"}) is None
+
+
+def test_reader_streams_rows_and_waits_for_a_late_gstin():
+    # The supplier's GSTIN comes after its invoices here
+    data = gstr2b([{"inv": [portal_invoice("B-1", "05-04-2025", 1000, 180)], "trdnm": "Acme", "ctin": SUPPLIER}])
+    reader = Gstr2bReader(io.BytesIO(data))
+    rows = list(reader.rows())
+    assert reader.period == "042025"
+    assert rows == [{
+        "gstin": SUPPLIER, "supplier": "Acme", "invoice_number": "B-1", "key": "B1", "serial": "1",
+        "date": "2025-04-05", "taxable": 1000.0, "tax": 180.0, "value": 1180.0, "itc_available": True,
+    }]
+
+
+def test_job_reports_matched_mismatched_and_missing(run, db, tmp_path):
+    data = gstr2b([
+        {"ctin": SUPPLIER, "trdnm": "Acme", "inv": [
+            portal_invoice("INV-001", "01-04-2025", 1000, 180),   # exact
+            portal_invoice("INV-002", "02-04-2025", 500, 90),     # exact key, tax differs
+            portal_invoice("SI/25/3", "03-04-2025", 200, 36),     # same serial, fuzzy
+            portal_invoice("INV-004", "04-04-2025", 300, 54),     # not in the books
+        ]},
+        {"ctin": OTHER, "inv": [portal_invoice("INV-001", "01-04-2025", 1000, 180)]},
+    ])
+
+    async def scenario():
+        await db.bills.insert_many([
+            bill("b1", SUPPLIER, "inv 1", "2025-04-01", 1000, 180.4),
+            bill("b2", SUPPLIER, "INV/0002", "2025-04-02", 500, 100),
+            bill("b3", SUPPLIER, "3", "2025-04-04", 200, 36),
+            bill("b4", SUPPLIER, "INV-009", "2025-04-09", 50, 9),
+            # Another period, so never reported as missing
+            bill("b5", SUPPLIER, "INV-010", "2025-05-01", 50, 9, upload_date="2025-05-02T05:00:00+00:00"),
+        ])
+        source = tmp_path / "gstr2b.json"
+        source.write_bytes(data)
+        job = ReconciliationJob(db, "u1", str(source), chunk_size=2)
+        await job.create()
+        await job.run()
+        return (await db.reconciliation_jobs.find_one({"_id": job.job_id}),
+                await db.reconciliation_items.find({"job_id": job.job_id}).to_list(None), source)
+
+    job, items, source = run(scenario())
+    assert job["status"] == "completed" and job["period"] == "042025" and job["rows"] == 5
+    assert job["counts"] == {"matched": 2, "mismatched": 1, "missing_in_books": 2, "missing_in_2b": 1}
+    assert not source.exists()
+
+    by_bill = {item["bill_id"]: item for item in items if item["bill_id"]}
+    assert (by_bill["b1"]["status"], by_bill["b1"]["match_type"]) == ("matched", "exact")
+    assert by_bill["b2"]["status"] == "mismatched" and by_bill["b2"]["differences"] == {"tax": 10.0}
+    assert (by_bill["b3"]["status"], by_bill["b3"]["match_type"]) == ("matched", "fuzzy")
+    assert by_bill["b4"]["status"] == "missing_in_2b" and by_bill["b4"]["portal"] is None
+    missing = sorted((item["gstin"], item["invoice_number"]) for item in items if item["status"] == "missing_in_books")
+    assert missing == [(SUPPLIER, "INV-004"), (OTHER, "INV-001")]
+
+
+def test_same_serial_with_different_amounts_is_not_a_fuzzy_match(run, db, tmp_path):
+    data = gstr2b([{"ctin": SUPPLIER, "inv": [
+        portal_invoice("B42", "01-04-2025", 1000, 180),
+        portal_invoice("C7", "01-04-2025", 100, 18),
+    ]}])
+
+    async def scenario():
+        await db.bills.insert_many([
+            bill("a42", SUPPLIER, "A42", "2025-04-01", 55000, 9900),
+            # Amounts agree but the date is unknown
+            bill("d7", SUPPLIER, "D7", None, 100, 18),
+        ])
+        source = tmp_path / "gstr2b.json"
+        source.write_bytes(data)
+        job = ReconciliationJob(db, "u1", str(source))
+        await job.create()
+        await job.run()
+        return await db.reconciliation_items.find({"job_id": job.job_id}).to_list(None)
+
+    items = run(scenario())
+    assert sorted((item["status"], item["bill_id"]) for item in items) == [
+        ("missing_in_2b", "a42"), ("missing_in_2b", "d7"), ("missing_in_books", None), ("missing_in_books", None),
+    ]
@@ -0,0 +1,173 @@
+"""ReextractionJob checkpointing and filtering against mongomock."""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from ratelimit import BucketLimit, InMemoryBucketStore
+from reextract import ReextractionFilter, ReextractionJob
+from storage import LocalShardedStorage
+from sync import SyncLog
+
+
+async def seed_bills(db, storage, count, confidence=0.3):
+    for i in range(count):
+        key = f"bill{i}.jpg"
+        await storage.put(key, b"image")
+        await db.bills.insert_one({
+            "id": f"bill{i}", "user_id": "u1", "file_key": key, "file_type": "image",
+            "upload_date": f"2025-01-{i % 28 + 1:02d}", "ocr_status": "completed",
+            "extracted_data": {"confidence_score": confidence},
+        })
+
+
+def make_job(db, storage, applied, job_id=None, filters=None, fail_after=None, defer_calls=()):
+    calls = {"n": 0}
+
+    async def extract(content, file_type):
+        calls["n"] += 1
+        if fail_after is not None and calls["n"] > fail_after:
+            raise asyncio.CancelledError()
+        if calls["n"] in defer_calls:
+            return None, "deferred", None
+        return SimpleNamespace(confidence_score=0.9), "completed", {"model": "stub"}
+
+    async def apply(bill, data, summary, job_id):
+        applied.append(bill["id"])
+        return True
+
+    return ReextractionJob(db, storage, extract, apply, filters=filters or ReextractionFilter(max_confidence=0.5),
+                           job_id=job_id, concurrency=1, rate_per_minute=60_000, batch_size=3,
+                           deferred_backoff_seconds=0)
+
+
+def test_filter_query_skips_edited_bills_by_default():
+    query = ReextractionFilter(user_id="u1", max_confidence=0.7, since="2025-01-01").query()
+    assert query["edited_at"] is None
+    assert query["extracted_data.confidence_score"] == {"$lt": 0.7}
+    assert query["upload_date"] == {"$gte": "2025-01-01"}
+    assert "edited_at" not in ReextractionFilter(include_edited=True).query()
+
+
+def test_stored_filter_compares_equal_only_to_the_same_request():
+    stored = {"user_id": "u1", "max_confidence": 0.7, "since": None, "until": None,
+              "statuses": ["completed", "deferred"], "include_edited": False}
+    assert ReextractionFilter.from_doc(stored) == ReextractionFilter(user_id="u1", max_confidence=0.7)
+    assert ReextractionFilter.from_doc(stored) != ReextractionFilter(user_id="u1", max_confidence=0.9)
+    assert ReextractionFilter.from_doc(stored) != ReextractionFilter(user_id="u1", max_confidence=0.7,
+                                                                      statuses=("deferred",))
+
+
+def test_job_resumes_from_checkpoint(run, db, tmp_path):
+    async def scenario():
+        storage = LocalShardedStorage(tmp_path)
+        await seed_bills(db, storage, 7)
+        await db.bills.insert_one({"id": "good", "user_id": "u1", "ocr_status": "completed",
+                                   "extracted_data": {"confidence_score": 0.99}})
+
+        applied = []
+        first = make_job(db, storage, applied, fail_after=4)
+        with pytest.raises(asyncio.CancelledError):
+            await first.run()
+        checkpoint = await db.reextraction_jobs.find_one({"_id": first.job_id})
+        assert checkpoint["status"] == "paused"
+        assert checkpoint["processed"] == 3
+
+        resumed = make_job(db, storage, applied, job_id=first.job_id)
+        result = await resumed.run()
+        assert result["status"] == "completed"
+        assert result["processed"] == 7
+        assert result["counts"]["updated"] == 7
+        assert "good" not in applied
+        assert await make_job(db, storage, applied, job_id=first.job_id).run() is None
+
+    run(scenario())
+
+
+def test_missing_files_and_worse_results_are_not_applied(run, db, tmp_path):
+    async def scenario():
+        storage = LocalShardedStorage(tmp_path)
+        await seed_bills(db, storage, 2, confidence=0.95)
+        await db.bills.insert_one({"id": "nofile", "user_id": "u1", "file_key": "gone.jpg",
+                                   "ocr_status": "completed", "extracted_data": {"confidence_score": 0.1}})
+        applied = []
+        result = await make_job(db, storage, applied, filters=ReextractionFilter()).run()
+        assert result["counts"]["unchanged"] == 2
+        assert result["counts"]["missing_file"] == 1
+        assert applied == []
+
+    run(scenario())
+
+
+def test_deferred_bills_are_retried_after_the_pass(run, db, tmp_path):
+    async def scenario():
+        storage = LocalShardedStorage(tmp_path)
+        await seed_bills(db, storage, 5)
+        applied = []
+        # bill1 and bill4 are deferred in the pass; bill4 is deferred again on retry
+        result = await make_job(db, storage, applied, defer_calls=(2, 5, 7)).run()
+        assert result["status"] == "completed"
+        assert result["processed"] == 5
+        assert result["counts"]["updated"] == 4
+        assert result["counts"]["deferred"] == 1
+        assert result["deferred_ids"] == []
+        assert sorted(applied) == ["bill0", "bill1", "bill2", "bill3"]
+
+    run(scenario())
+
+
+def test_bill_edited_during_extraction_is_skipped(run, db, tmp_path):
+    async def scenario():
+        storage = LocalShardedStorage(tmp_path)
+        sync_log = SyncLog(db)
+        await seed_bills(db, storage, 2)
+        await sync_log.update("bills", "u1", "bill1", {"$set": {"note": "versioned"}})
+
+        async def extract(content, file_type):
+            # The user saves a hand edit to bill1 while the model is still answering
+            if not await db.bills.find_one({"id": "bill1", "edited_at": {"$ne": None}}):
+                await sync_log.update("bills", "u1", "bill1", {"$set": {"edited_at": "now"}})
+            return SimpleNamespace(confidence_score=0.9), "completed", {}
+
+        async def apply(bill, data, summary, job_id):
+            seq = await sync_log.update("bills", bill["user_id"], bill["id"],
+                                        {"$set": {"extracted_data.confidence_score": data.confidence_score}},
+                                        base_seq=bill.get("updated_seq") or 0)
+            return seq is not None
+
+        job = ReextractionJob(db, storage, extract, apply, filters=ReextractionFilter(include_edited=True),
+                              concurrency=1, rate_per_minute=60_000)
+        result = await job.run()
+        assert result["counts"]["updated"] == 1
+        assert result["counts"]["skipped"] == 1
+        edited = await db.bills.find_one({"id": "bill1"})
+        assert edited["edited_at"] == "now"
+        assert edited["extracted_data"]["confidence_score"] == 0.3
+
+    run(scenario())
+
+
+def test_jobs_for_a_user_share_the_users_bucket(run, db, tmp_path):
+    async def scenario():
+        storage = LocalShardedStorage(tmp_path)
+        await seed_bills(db, storage, 3)
+        store = InMemoryBucketStore()
+        limit = BucketLimit(capacity=10, refill_per_second=0.001)
+        await store.take("reextract:u1", limit, cost=8)
+
+        async def extract(content, file_type):
+            return SimpleNamespace(confidence_score=0.9), "completed", {}
+
+        async def apply(bill, data, summary, job_id):
+            return True
+
+        job = ReextractionJob(db, storage, extract, apply, filters=ReextractionFilter(user_id="u1"),
+                              bucket_store=store, bucket_limit=limit)
+        # Two tokens are left in the user's bucket: the third bill has to wait for a refill
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(job.run(), timeout=0.5)
+        assert job.progress.counts["updated"] == 0
+        allowed, tokens = await store.take("reextract:u1", limit)
+        assert not allowed and tokens < 1
+
+    run(scenario())
@@ -0,0 +1,67 @@
+"""Per-worker Mongo pool sizing and the router table assembled by create_app."""
+import importlib
+import pkgutil
+
+import pytest
+
+POOL_VARIABLES = ("MONGO_MAX_POOL_SIZE", "MONGO_POOL_BUDGET", "MONGO_MIN_POOL_SIZE", "MONGO_MAX_IDLE_TIME_MS")
+
+
+@pytest.fixture
+def pool_options(server, monkeypatch):
+    from resources import mongo_pool_options
+
+    for variable in POOL_VARIABLES:
+        monkeypatch.delenv(variable, raising=False)
+
+    def options(workers, **env):
+        for variable, value in env.items():
+            monkeypatch.setenv(variable, str(value))
+        return mongo_pool_options(workers)
+    return options
+
+
+def test_unset_pool_keeps_driver_defaults(pool_options):
+    assert pool_options(4) == {}
+
+
+@pytest.mark.parametrize("budget, workers, pool", [(200, 1, 200), (200, 4, 50), (10, 3, 3), (2, 8, 1)])
+def test_budget_is_split_across_workers(pool_options, budget, workers, pool):
+    assert pool_options(workers, MONGO_POOL_BUDGET=budget) == {"maxPoolSize": pool}
+
+
+def test_explicit_pool_size_wins_over_the_budget(pool_options):
+    assert pool_options(4, MONGO_POOL_BUDGET=200, MONGO_MAX_POOL_SIZE=30) == {"maxPoolSize": 30}
+
+
+def test_min_pool_is_capped_at_the_workers_share(pool_options):
+    assert pool_options(4, MONGO_POOL_BUDGET=40, MONGO_MIN_POOL_SIZE=25, MONGO_MAX_IDLE_TIME_MS=60000) == {
+        "maxPoolSize": 10, "minPoolSize": 10, "maxIdleTimeMS": 60000,
+    }
+
+
+def test_min_pool_without_a_pool_size_is_capped_at_the_driver_default(pool_options):
+    assert pool_options(1, MONGO_MIN_POOL_SIZE=500) == {"minPoolSize": 100}
+
+
+def test_worker_count_reads_web_concurrency(server, monkeypatch):
+    from resources import worker_count
+
+    monkeypatch.setenv("WEB_CONCURRENCY", "4")
+    assert worker_count() == 4
+    monkeypatch.setenv("WEB_CONCURRENCY", "0")
+    assert worker_count() == 1
+
+
+def test_create_app_mounts_every_router_under_api(server):
+    import routers
+
+    mounted = {(method, route.path) for route in server.create_app().routes
+               for method in getattr(route, "methods", None) or ()}
+    for module_info in pkgutil.iter_modules(routers.__path__):
+        domain = importlib.import_module(f"routers.{module_info.name}")
+        expected = {(method, "/api" + route.path) for route in domain.router.routes for method in route.methods}
+        assert expected, module_info.name
+        assert expected <= mounted, module_info.name
+    assert {("GET", "/metrics"), ("GET", "/uploads/{filename}"), ("POST", "/api/bills/upload"),
+            ("GET", "/api/events"), ("POST", "/api/sync/push")} <= mounted
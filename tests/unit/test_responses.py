@@ -0,0 +1,41 @@
+"""Response-model projections: list views never read product lines."""
+import json
+
+from models import BillResponse, BillSummaryResponse
+from responses import response_projection
+
+BILL = {
+    "id": "b1", "user_id": "u1", "file_name": "bill.jpg", "file_type": "image", "upload_date": "2025-04-01",
+    "ocr_status": "completed", "file_key": "b1.jpg", "updated_seq": 3,
+    "extracted_data": {"seller_name": "Acme", "total_amount": 118.0, "confidence_score": 0.9,
+                       "products": [{"product_name": "Widget", "amount": 100.0}]},
+}
+
+
+def test_summary_projection_leaves_out_product_lines():
+    summary, full = response_projection(BillSummaryResponse), response_projection(BillResponse)
+    assert "extracted_data.products" not in summary
+    assert full["extracted_data.products"] == 1
+    assert summary["extracted_data.seller_name"] == full["extracted_data.seller_name"] == 1
+    # Projected field by field, so the whole sub-document is never requested
+    assert "extracted_data" not in summary and "extracted_data" not in full
+    assert summary["_id"] == full["_id"] == 0
+
+
+def test_bill_list_views(run, db, server, monkeypatch):
+    from routers import bills
+
+    monkeypatch.setattr(bills, "db", db)
+    run(db.bills.insert_one(dict(BILL)))
+    user = {"user_id": "u1"}
+
+    def listed(view):
+        response = run(bills.get_bills(view=view, user=user))
+        return json.loads(response.body)
+
+    [summary] = listed("summary")
+    assert "products" not in summary["extracted_data"]
+    assert summary["extracted_data"]["seller_name"] == "Acme"
+    assert "file_key" not in summary
+    [full] = listed("full")
+    assert full["extracted_data"]["products"] == BILL["extracted_data"]["products"]
@@ -0,0 +1,189 @@
+"""Blob storage backends: sharded local disk and S3 against an in-memory client."""
+import os
+from datetime import datetime, timezone
+
+import pytest
+
+from storage import BlobStorage, LocalShardedStorage, S3Storage, key_from_locator, validate_key
+
+
+async def all_keys(storage, batch_size=1000):
+    return [batch async for batch in storage.list_keys(batch_size)]
+
+
+# ---------- LocalShardedStorage ----------
+
+def test_put_writes_into_hash_prefix_shards(run, tmp_path):
+    storage = LocalShardedStorage(tmp_path)
+    locator = run(storage.put("abc.jpg", b"image"))
+    path = storage.local_path("abc.jpg")
+    assert locator == str(path)
+    assert path.parent.parent.parent == tmp_path
+    assert len(path.parent.name) == len(path.parent.parent.name) == 2
+    assert run(storage.get("abc.jpg")) == b"image"
+    assert run(storage.exists("abc.jpg"))
+    assert run(storage.get("other.jpg")) is None
+
+
+def test_legacy_flat_files_are_found_and_replaced_on_rewrite(run, tmp_path):
+    storage = LocalShardedStorage(tmp_path)
+    (tmp_path / "logo_u1.jpg").write_bytes(b"old")
+    assert storage.local_path("logo_u1.jpg") == tmp_path / "logo_u1.jpg"
+    assert run(storage.get("logo_u1.jpg")) == b"old"
+    assert run(storage.modified_at("logo_u1.jpg")) is not None
+
+    run(storage.put("logo_u1.jpg", b"new"))
+    assert not (tmp_path / "logo_u1.jpg").exists()
+    assert run(storage.get("logo_u1.jpg")) == b"new"
+    assert run(storage.delete("logo_u1.jpg"))
+    assert not run(storage.delete("logo_u1.jpg"))
+    assert run(storage.modified_at("logo_u1.jpg")) is None
+
+
+def test_put_replaces_atomically_and_leaves_no_temp_file(run, tmp_path, monkeypatch):
+    storage = LocalShardedStorage(tmp_path)
+    run(storage.put("abc.jpg", b"first"))
+
+    def crash(src, dst):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(os, "replace", crash)
+    with pytest.raises(OSError):
+        run(storage.put("abc.jpg", b"second"))
+    # A failed write never exposes a partial file under the key
+    assert run(storage.get("abc.jpg")) == b"first"
+    monkeypatch.undo()
+
+    run(storage.put("abc.jpg", b"second"))
+    assert run(storage.get("abc.jpg")) == b"second"
+    assert run(all_keys(storage)) == [["abc.jpg"]]
+
+
+def test_list_keys_skips_temp_files_and_batches(run, tmp_path):
+    storage = LocalShardedStorage(tmp_path)
+    for i in range(5):
+        run(storage.put(f"k{i}.jpg", b"x"))
+    (tmp_path / "legacy.pdf").write_bytes(b"x")
+    (tmp_path / ".k9.jpg.tmp").write_bytes(b"x")
+    batches = run(all_keys(storage, batch_size=4))
+    assert [len(batch) for batch in batches] == [4, 2]
+    assert sorted(key for batch in batches for key in batch) == ["k0.jpg", "k1.jpg", "k2.jpg", "k3.jpg", "k4.jpg",
+                                                                 "legacy.pdf"]
+
+
+def test_list_keys_reads_one_batch_at_a_time(run, tmp_path, monkeypatch):
+    storage = LocalShardedStorage(tmp_path)
+    for i in range(6):
+        run(storage.put(f"k{i}.jpg", b"x"))
+    walked = []
+    walk = storage._walk
+    monkeypatch.setattr(storage, "_walk", lambda: (walked.append(key) or key for key in walk()))
+
+    async def first_batch():
+        async for batch in storage.list_keys(batch_size=2):
+            return batch
+
+    assert len(run(first_batch())) == 2
+    assert len(walked) == 2
+
+
+def test_incomplete_backend_cannot_be_instantiated():
+    class ReadOnlyStorage(BlobStorage):
+        async def get(self, key):
+            return None
+
+    with pytest.raises(TypeError, match="put"):
+        ReadOnlyStorage()
+
+
+@pytest.mark.parametrize("key", ["", ".", "..", ".hidden", "a/b.jpg", "..\\b.jpg", "../etc/passwd"])
+def test_invalid_keys_are_rejected(run, tmp_path, key):
+    with pytest.raises(ValueError):
+        validate_key(key)
+    with pytest.raises(ValueError):
+        run(LocalShardedStorage(tmp_path).put(key, b"x"))
+
+
+def test_key_from_locator_handles_paths_and_s3_urls():
+    assert key_from_locator("/app/backend/uploads/ab/cd/abc.jpg") == "abc.jpg"
+    assert key_from_locator("uploads/abc.jpg") == "abc.jpg"
+    assert key_from_locator("s3://bucket/uploads/abc.jpg") == "abc.jpg"
+    assert key_from_locator("abc.jpg") == "abc.jpg"
+
+
+# ---------- S3Storage ----------
+
+class FakeS3Client:
+    """Just enough of the boto3 S3 client for S3Storage"""
+
+    class exceptions:
+        class NoSuchKey(Exception):
+            pass
+
+    def __init__(self):
+        self.objects = {}
+
+    def put_object(self, Bucket, Key, Body, ContentType=None):
+        self.objects[(Bucket, Key)] = (Body, ContentType, datetime.now(timezone.utc))
+
+    def get_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise self.exceptions.NoSuchKey(Key)
+        body = self.objects[(Bucket, Key)][0]
+        return {"Body": type("Body", (), {"read": lambda self: body})()}
+
+    def head_object(self, Bucket, Key):
+        from botocore.exceptions import ClientError
+
+        if (Bucket, Key) not in self.objects:
+            raise ClientError({"Error": {"Code": "404"}}, "HeadObject")
+        return {"LastModified": self.objects[(Bucket, Key)][2]}
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop((Bucket, Key), None)
+
+    def list_objects_v2(self, Bucket, Prefix, MaxKeys, ContinuationToken=None):
+        keys = sorted(k for b, k in self.objects if b == Bucket and k.startswith(Prefix))
+        start = int(ContinuationToken or 0)
+        page = keys[start:start + MaxKeys]
+        truncated = start + MaxKeys < len(keys)
+        return {"Contents": [{"Key": k} for k in page], "IsTruncated": truncated,
+                "NextContinuationToken": str(start + MaxKeys) if truncated else None}
+
+    def generate_presigned_url(self, operation, Params, ExpiresIn):
+        return f"https://s3.test/{Params['Bucket']}/{Params['Key']}?op={operation}&expires={ExpiresIn}"
+
+
+def test_s3_put_get_and_presign_under_the_prefix(run):
+    client = FakeS3Client()
+    storage = S3Storage("bills", prefix="uploads/", client=client)
+    assert run(storage.put("abc.pdf", b"pdf", content_type="application/pdf")) == "s3://bills/uploads/abc.pdf"
+    assert client.objects[("bills", "uploads/abc.pdf")][:2] == (b"pdf", "application/pdf")
+    assert run(storage.get("abc.pdf")) == b"pdf"
+    assert run(storage.get("missing.pdf")) is None
+    assert run(storage.presigned_url("abc.pdf", expires_in=60)) == \
+        "https://s3.test/bills/uploads/abc.pdf?op=get_object&expires=60"
+    assert key_from_locator("s3://bills/uploads/abc.pdf") == "abc.pdf"
+    with pytest.raises(ValueError):
+        run(storage.put("../abc.pdf", b"x"))
+
+
+def test_s3_list_keys_follows_continuation_tokens(run):
+    client = FakeS3Client()
+    storage = S3Storage("bills", client=client)
+    for i in range(5):
+        run(storage.put(f"k{i}.jpg", b"x"))
+    client.put_object(Bucket="bills", Key="elsewhere/other.jpg", Body=b"x")
+    assert run(all_keys(storage, batch_size=2)) == [["k0.jpg", "k1.jpg"], ["k2.jpg", "k3.jpg"], ["k4.jpg"]]
+
+
+def test_s3_exists_delete_and_modified_at(run):
+    pytest.importorskip("botocore")
+    storage = S3Storage("bills", client=FakeS3Client())
+    run(storage.put("abc.jpg", b"x"))
+    assert run(storage.exists("abc.jpg"))
+    assert run(storage.modified_at("abc.jpg")) is not None
+    assert run(storage.delete("abc.jpg"))
+    assert not run(storage.delete("abc.jpg"))
+    assert not run(storage.exists("abc.jpg"))
+    assert run(storage.modified_at("abc.jpg")) is None
@@ -0,0 +1,81 @@
+"""Sweeper orphan cleanup, lease and cold tiering against mongomock and local storage."""
+import os
+import time
+from datetime import datetime, timezone, timedelta
+
+from storage import LocalShardedStorage
+from sweeper import COLD_SUFFIX, Sweeper, read_original
+
+
+def age(storage, key, seconds):
+    path = storage.local_path(key)
+    then = time.time() - seconds
+    os.utime(path, (then, then))
+
+
+def make_sweeper(db, storage, **kwargs):
+    return Sweeper(db, storage, batch_pause_seconds=0, orphan_grace_seconds=3600, **kwargs)
+
+
+def test_orphans_are_deleted_only_after_the_grace_period(run, db, tmp_path):
+    storage = LocalShardedStorage(tmp_path)
+    for key in ("kept.jpg", "held.jpg", "logo_u1.jpg", "old.jpg", "fresh.jpg", "logo_gone.jpg"):
+        run(storage.put(key, b"x"))
+        age(storage, key, 7200)
+    # Still inside the grace period: an upload may be writing its bill right now
+    age(storage, "fresh.jpg", 60)
+    run(db.bills.insert_one({"id": "b1", "file_key": "kept.jpg"}))
+    run(db.suspected_duplicates.insert_one({"id": "s1", "file_key": "held.jpg"}))
+    run(db.users.insert_one({"user_id": "u1", "business_logo": "/uploads/logo_u1.jpg"}))
+
+    assert run(make_sweeper(db, storage).delete_orphaned_files()) == 2
+    assert not run(storage.exists("old.jpg"))
+    assert not run(storage.exists("logo_gone.jpg"))
+    for key in ("kept.jpg", "held.jpg", "logo_u1.jpg", "fresh.jpg"):
+        assert run(storage.exists(key))
+
+
+def test_lease_is_exclusive_until_it_expires(run, db, tmp_path):
+    storage = LocalShardedStorage(tmp_path)
+    first = make_sweeper(db, storage, lease_seconds=60)
+    second = make_sweeper(db, storage, lease_seconds=60)
+    assert run(first._acquire_lease())
+    assert not run(second._acquire_lease())
+    # The holder renews its own lease
+    assert run(first._acquire_lease())
+
+    expired = (datetime.now(timezone.utc) - timedelta(seconds=1)).isoformat()
+    run(db.job_locks.update_one({"_id": "sweeper"}, {"$set": {"expires_at": expired}}))
+    assert run(second._acquire_lease())
+    assert not run(first._acquire_lease())
+
+
+def test_old_originals_are_tiered_and_still_readable(run, db, tmp_path):
+    storage = LocalShardedStorage(tmp_path)
+    content = b"%PDF " + b"0" * 4096
+    run(storage.put("old.pdf", content))
+    old = (datetime.now(timezone.utc) - timedelta(days=400)).isoformat()
+    run(db.bills.insert_one({"id": "b1", "file_key": "old.pdf", "upload_date": old}))
+
+    assert run(make_sweeper(db, storage, tier_after_days=365).tier_cold_originals()) == 1
+    bill = run(db.bills.find_one({"id": "b1"}))
+    assert bill["file_key"] == f"old.pdf{COLD_SUFFIX}"
+    assert bill["storage_tier"] == "cold"
+    assert not run(storage.exists("old.pdf"))
+    assert run(read_original(storage, "old.pdf")) == content
+    assert run(read_original(storage, bill["file_key"])) == content
+
+
+def test_tiering_is_off_for_presigned_url_storage(db, tmp_path):
+    class PresignedStorage(LocalShardedStorage):
+        supports_presigned_urls = True
+
+    assert make_sweeper(db, PresignedStorage(tmp_path), tier_after_days=365).tier_after_days is None
+
+
+def test_sweep_probes_are_indexed(run, db, tmp_path):
+    run(make_sweeper(db, LocalShardedStorage(tmp_path)).ensure_indexes())
+    for collection, field in (("bills", "file_key"), ("suspected_duplicates", "file_key"),
+                              ("users", "business_logo"), ("user_sessions", "expires_at")):
+        indexes = run(db[collection].index_information())
+        assert any(index["key"] == [(field, 1)] for index in indexes.values()), collection
@@ -0,0 +1,110 @@
+"""Delta-sync versions: change feed paging, tombstones, guarded writes and resets."""
+from sync import SyncLog
+
+
+PROJECTIONS = {name: {"_id": 0, "id": 1, "updated_seq": 1} for name in ("bills", "customers", "products", "invoices")}
+
+
+def ids(result):
+    return {name: [doc["id"] for doc in docs] for name, docs in result["changes"].items() if docs}
+
+
+def test_changes_page_across_collections_in_version_order(run, db):
+    sync_log = SyncLog(db)
+
+    async def scenario():
+        await sync_log.insert("customers", {"id": "c1", "user_id": "u1"})
+        await sync_log.insert("products", {"id": "p1", "user_id": "u1"})
+        await sync_log.insert("invoices", {"id": "i1", "user_id": "u1"})
+        await sync_log.insert("customers", {"id": "other", "user_id": "u2"})
+        first = await sync_log.changes("u1", 0, 2, PROJECTIONS)
+        second = await sync_log.changes("u1", first["version"], 2, PROJECTIONS)
+        return first, second
+
+    first, second = run(scenario())
+    assert ids(first) == {"customers": ["c1"], "products": ["p1"]}
+    assert first["has_more"] and first["version"] == 2
+    assert ids(second) == {"invoices": ["i1"]}
+    assert not second["has_more"] and second["version"] == 3
+
+
+def test_deletes_leave_tombstones_and_stale_edits_conflict(run, db):
+    sync_log = SyncLog(db)
+
+    async def scenario():
+        seq = await sync_log.insert("customers", {"id": "c1", "user_id": "u1", "name": "A"})
+        edited = await sync_log.update("customers", "u1", "c1", {"$set": {"name": "B"}}, base_seq=seq)
+        stale = await sync_log.update("customers", "u1", "c1", {"$set": {"name": "C"}}, base_seq=seq)
+        stale_delete = await sync_log.delete("customers", "u1", "c1", base_seq=seq)
+        deleted = await sync_log.delete("customers", "u1", "c1", base_seq=edited)
+        return seq, edited, stale, stale_delete, deleted, await sync_log.changes("u1", edited, 10, PROJECTIONS)
+
+    seq, edited, stale, stale_delete, deleted, after_edit = run(scenario())
+    assert edited > seq
+    assert stale is None and stale_delete is False
+    assert deleted is True
+    assert [(t["collection"], t["id"]) for t in after_edit["deleted"]] == [("customers", "c1")]
+
+
+def test_full_sync_versions_legacy_documents(run, db):
+    sync_log = SyncLog(db)
+
+    async def scenario():
+        await db.bills.insert_many([{"id": f"b{i}", "user_id": "u1"} for i in range(3)])
+        await sync_log.insert("bills", {"id": "new", "user_id": "u1"})
+        snapshot = await sync_log.changes("u1", 0, 10, PROJECTIONS)
+        legacy = await sync_log.update("bills", "u1", "b0", {"$set": {"x": 1}}, base_seq=0)
+        return snapshot, legacy
+
+    snapshot, legacy = run(scenario())
+    assert sorted(ids(snapshot)["bills"]) == ["b0", "b1", "b2", "new"]
+    assert len({doc["updated_seq"] for doc in snapshot["changes"]["bills"]}) == 4
+    # Version 0 only guards documents that were never versioned
+    assert legacy is None
+
+
+def test_client_behind_pruned_tombstones_gets_a_reset(run, db):
+    sync_log = SyncLog(db)
+
+    async def scenario():
+        await sync_log.insert("products", {"id": "p1", "user_id": "u1"})
+        await sync_log.insert("products", {"id": "p2", "user_id": "u1"})
+        await sync_log.delete("products", "u1", "p1")
+        await db.sync_counters.update_one({"_id": "u1"}, {"$max": {"floor": 3}})
+        await db.sync_tombstones.delete_many({})
+        return await sync_log.changes("u1", 1, 10, PROJECTIONS), await sync_log.changes("u1", 3, 10, PROJECTIONS)
+
+    behind, current = run(scenario())
+    assert behind["reset"] and ids(behind) == {"products": ["p2"]}
+    assert not current["reset"] and ids(current) == {}
+
+
+def test_feed_waits_for_a_write_that_reserved_an_earlier_version(run, db):
+    sync_log = SyncLog(db)
+
+    async def scenario():
+        await sync_log.insert("customers", {"id": "c0", "user_id": "u1"})
+        async with sync_log.next_seq("u1") as slow_seq:
+            # A later version commits while the earlier one is still in flight
+            await sync_log.insert("customers", {"id": "fast", "user_id": "u1"})
+            during = await sync_log.changes("u1", 1, 10, PROJECTIONS)
+            await db.customers.insert_one({"id": "slow", "user_id": "u1", "updated_seq": slow_seq})
+        after = await sync_log.changes("u1", during["version"], 10, PROJECTIONS)
+        return during, after
+
+    during, after = run(scenario())
+    assert ids(during) == {} and during["version"] == 1
+    assert ids(after) == {"customers": ["slow", "fast"]} and after["version"] == 3
+
+
+def test_abandoned_reservations_stop_holding_the_feed_back(run, db):
+    sync_log = SyncLog(db, pending_timeout=60)
+
+    async def scenario():
+        await db.sync_counters.insert_one({"_id": "u1", "seq": 1, "pending": [{"seq": 1, "at": 0.0}]})
+        await sync_log.insert("customers", {"id": "c2", "user_id": "u1"})
+        return await sync_log.changes("u1", 0, 10, PROJECTIONS), await db.sync_counters.find_one({"_id": "u1"})
+
+    result, counter = run(scenario())
+    assert ids(result) == {"customers": ["c2"]} and result["version"] == 2
+    assert counter["pending"] == []
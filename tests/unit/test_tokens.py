@@ -0,0 +1,78 @@
+"""Signed access tokens, refresh rotation and the revocation list."""
+import asyncio
+import time
+
+import pytest
+
+from tokens import InvalidToken, TokenService, looks_like_jwt
+
+
+SECRET = "x" * 32
+USER = {"user_id": "user_1", "email": "a@example.com", "subscription_plan": "pro"}
+
+
+class Clock:
+    def __init__(self):
+        # Starts at the real time: mongomock applies TTL indexes against the wall clock
+        self.now = time.time()
+
+    def __call__(self):
+        return self.now
+
+
+def make_service(db, clock, **kwargs):
+    return TokenService(db, SECRET, access_ttl_seconds=900, clock=clock, **kwargs)
+
+
+def test_access_token_is_verified_without_the_database(db):
+    clock = Clock()
+    service = make_service(db, clock)
+    token = service.issue_access(USER, "sid1")
+
+    assert looks_like_jwt(token)
+    user = service.verify_access(token)
+    assert user == {"user_id": "user_1", "email": "a@example.com", "subscription_plan": "pro",
+                    "session_id": "sid1", "stateless": True}
+    with pytest.raises(InvalidToken):
+        make_service(db, clock).verify_access(token[:-2] + "xx")
+    clock.now += 901
+    with pytest.raises(InvalidToken, match="expired"):
+        service.verify_access(token)
+
+
+def test_refresh_token_rotates_and_old_one_is_rejected(db):
+    service = make_service(db, Clock())
+
+    async def scenario():
+        session_id, refresh, _ = await service.create_session("user_1")
+        user_id, rotated_sid, replacement = await service.rotate(refresh)
+        with pytest.raises(InvalidToken):
+            await service.rotate(refresh)
+        stored = await db.user_sessions.find_one({"session_id": session_id})
+        return session_id, user_id, rotated_sid, replacement, stored
+
+    session_id, user_id, rotated_sid, replacement, stored = asyncio.run(scenario())
+    assert (user_id, rotated_sid) == ("user_1", session_id)
+    assert replacement not in str(stored)  # only a digest is stored
+
+
+def test_revocation_reaches_other_workers_on_refresh(db):
+    clock = Clock()
+    worker_a, worker_b = make_service(db, clock), make_service(db, clock)
+
+    async def scenario():
+        session_id, refresh, _ = await worker_a.create_session("user_1")
+        token = worker_a.issue_access(USER, session_id)
+        assert worker_b.verify_access(token)["user_id"] == "user_1"
+
+        await worker_a.revoke([session_id])
+        with pytest.raises(InvalidToken, match="revoked"):
+            worker_a.verify_access(token)
+        worker_b.verify_access(token)  # not refreshed yet
+        await worker_b.refresh_revocations()
+        with pytest.raises(InvalidToken, match="revoked"):
+            worker_b.verify_access(token)
+        with pytest.raises(InvalidToken):
+            await worker_b.rotate(refresh)
+
+    asyncio.run(scenario())
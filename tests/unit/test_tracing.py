@@ -0,0 +1,151 @@
+"""Span propagation, head sampling and OTLP/JSON export."""
+import asyncio
+import json
+
+import pytest
+
+from tracing import (SPAN_KIND_INTERNAL, SPAN_KIND_SERVER, FileSpanExporter, Tracer, current_span,
+                     parse_traceparent)
+
+
+class ListExporter:
+    def __init__(self):
+        self.requests = []
+
+    def export(self, request):
+        self.requests.append(request)
+
+    def shutdown(self):
+        pass
+
+    @property
+    def spans(self):
+        return [span for request in self.requests for resource in request["resourceSpans"]
+                for scope in resource["scopeSpans"] for span in scope["spans"]]
+
+
+def make_tracer(sample_ratio=1.0, batch_size=1):
+    exporter = ListExporter()
+    return Tracer(exporter, sample_ratio=sample_ratio, batch_size=batch_size, service_name="test"), exporter
+
+
+def test_child_spans_join_the_current_trace():
+    tracer, exporter = make_tracer()
+    with tracer.span("request") as parent:
+        with tracer.span("query") as child:
+            assert current_span() is child
+            detached = tracer.start_span("mongo.find")
+        assert current_span() is parent
+    detached.end()
+    assert current_span() is None
+
+    assert child.trace_id == parent.trace_id == detached.trace_id
+    assert child.parent_id == parent.span_id
+    assert detached.parent_id == child.span_id
+    assert parent.parent_id is None
+    assert [span["name"] for span in exporter.spans] == ["query", "request", "mongo.find"]
+
+
+def test_remote_traceparent_is_continued_and_echoed():
+    tracer, _ = make_tracer(sample_ratio=0.0)
+    incoming = "00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01"
+    with tracer.span("request", remote_parent=incoming) as span:
+        pass
+    assert span.trace_id == "0af7651916cd43dd8448eb211c80319c"
+    assert span.parent_id == "b7ad6b7169203331"
+    # The caller's sampling decision wins over the local ratio
+    assert span.sampled
+    assert span.traceparent == f"00-{span.trace_id}-{span.span_id}-01"
+
+
+@pytest.mark.parametrize("header", ["", "garbage", "00-xyz-b7ad6b7169203331-01",
+                                    "00-0af7651916cd43dd8448eb211c80319c-b7ad-01"])
+def test_malformed_traceparent_starts_a_new_trace(header):
+    assert parse_traceparent(header) is None
+    tracer, _ = make_tracer()
+    with tracer.span("request", remote_parent=header or None) as span:
+        pass
+    assert span.parent_id is None
+    assert len(span.trace_id) == 32
+
+
+def test_unsampled_traces_record_and_export_nothing():
+    tracer, exporter = make_tracer(sample_ratio=0.0)
+    with tracer.span("request") as parent:
+        with tracer.span("child", size=3) as child:
+            child.set_attribute("ignored", True)
+    assert not parent.sampled and not child.sampled
+    assert child.attributes == {"size": 3}
+    assert parent.traceparent.endswith("-00")
+    assert exporter.requests == []
+
+    disabled = Tracer(ListExporter(), enabled=False)
+    with disabled.span("request") as span:
+        assert span is None
+
+
+def test_spans_are_batched_until_flushed():
+    tracer, exporter = make_tracer(batch_size=3)
+    for name in ("a", "b"):
+        with tracer.span(name):
+            pass
+    assert exporter.requests == []
+    with tracer.span("c"):
+        pass
+    assert len(exporter.requests) == 1
+    with tracer.span("d"):
+        pass
+    tracer.flush()
+    assert [len(request["resourceSpans"][0]["scopeSpans"][0]["spans"]) for request in exporter.requests] == [3, 1]
+
+
+def test_export_is_otlp_json():
+    tracer, exporter = make_tracer()
+    with pytest.raises(ValueError):
+        with tracer.span("request", kind=SPAN_KIND_SERVER, **{"http.method": "GET", "http.status_code": 500,
+                                                              "cache.hit": False, "ratio": 0.5,
+                                                              "db.collection": None}):
+            with tracer.span("child"):
+                pass
+            raise ValueError("bad input")
+
+    request = exporter.requests[-1]
+    resource = request["resourceSpans"][0]
+    assert resource["resource"]["attributes"] == [{"key": "service.name", "value": {"stringValue": "test"}}]
+    span = resource["scopeSpans"][0]["spans"][0]
+    assert span["kind"] == SPAN_KIND_SERVER
+    assert "parentSpanId" not in span
+    assert int(span["endTimeUnixNano"]) >= int(span["startTimeUnixNano"])
+    assert span["attributes"] == [
+        {"key": "http.method", "value": {"stringValue": "GET"}},
+        {"key": "http.status_code", "value": {"intValue": "500"}},
+        {"key": "cache.hit", "value": {"boolValue": False}},
+        {"key": "ratio", "value": {"doubleValue": 0.5}},
+    ]
+    assert span["status"] == {"code": 2, "message": "ValueError: bad input"}
+    assert set(span) <= {"traceId", "spanId", "parentSpanId", "name", "kind", "startTimeUnixNano",
+                         "endTimeUnixNano", "attributes", "status"}
+
+    child = exporter.requests[0]["resourceSpans"][0]["scopeSpans"][0]["spans"][0]
+    assert child["kind"] == SPAN_KIND_INTERNAL
+    assert child["parentSpanId"] == span["spanId"]
+    assert child["status"] == {"code": 0}
+
+
+def test_file_export_runs_off_the_event_loop(tmp_path):
+    path = tmp_path / "traces" / "spans.jsonl"
+    tracer = Tracer(FileSpanExporter(path), batch_size=2)
+
+    async def scenario():
+        for name in ("a", "b", "c"):
+            with tracer.span(name):
+                pass
+        # The full batch was handed to a worker thread rather than written inline
+        assert tracer._exports
+        await tracer.shutdown()
+        assert not tracer._exports
+
+    asyncio.run(scenario())
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    names = [span["name"] for line in lines for span in line["resourceSpans"][0]["scopeSpans"][0]["spans"]]
+    assert sorted(names) == ["a", "b", "c"]